@@ -0,0 +1,463 @@
+"""
+This module implements the backends running the lisp scripts of IDyOM experiments:
+SBCLBackend runs them in SBCL with IDyOM, SimulatorBackend writes simulated IDyOM outputs without SBCL,
+to test and benchmark the Python side of the pipeline (run, extract, export, plots) on any machine.
+"""
+
+import hashlib
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict, replace
+from typing import List, Literal, Union
+
+import numpy as np
+import pandas as pd
+from natsort import natsorted
+
+from py2lispIDyOM.configuration import RunModelConfiguration
+from py2lispIDyOM.notes import read_melody
+from py2lispIDyOM.ppm import entropy, get_model_options, predict_dataset
+from py2lispIDyOM.viewpoints import PREDICTED_ATTRIBUTES, predicted_viewpoints
+from py2lispIDyOM.resources import MEGABYTE, estimate_sbcl_memory, get_bytes_consed_between_gcs, get_dynamic_space_size, \
+    get_resource_governor
+from py2lispIDyOM.telemetry import PHASE_TIMINGS_FILE_NAME, run_with_resource_usage
+
+
+class Backend(ABC):
+    """
+    The interface of the backends running the lisp scripts of IDyOM experiments.
+    """
+
+    name: str = None
+
+    @abstractmethod
+    def run_script(self, experiment, lisp_script_path: str, run_model_configuration: RunModelConfiguration = None,
+                   **popen_kwargs) -> dict:
+        """
+        Run a lisp script of an experiment.
+
+        :param experiment: the experiment the script belongs to.
+        :type experiment: IDyOMExperiment
+
+        :param lisp_script_path: the path to the lisp script.
+        :type lisp_script_path: str
+
+        :param run_model_configuration: the model configuration run by the script, None if it does not run the model
+            (e.g., a script importing the datasets), defaults to None.
+        :type run_model_configuration: RunModelConfiguration
+
+        :param popen_kwargs: the keyword arguments of subprocess.Popen for the backends running a process (e.g., stdout).
+
+        :return: the resource usage of the run (see telemetry.run_with_resource_usage).
+        :rtype: dict
+        """
+        pass
+
+    def to_dict(self) -> dict:
+        """
+        Serialize the backend, to be rebuilt with get_backend (e.g., in a job of the spool folder).
+
+        :rtype: dict
+        """
+        return {'name': self.name, 'options': asdict(self)}
+
+
+@dataclass
+class SBCLBackend(Backend):
+    """
+    Run the lisp scripts in a non-interactive SBCL process, so that a lisp error makes SBCL exit with a non-zero code
+    instead of waiting in the debugger.
+
+    Every SBCL process reserves its memory and one CPU in the budget shared by the SBCL processes
+    (see resources.set_resource_budget), and waits until they fit.
+
+    :param sbcl_path: the path to the SBCL executable, defaults to 'sbcl' (found in the PATH).
+    :type sbcl_path: str
+
+    :param dynamic_space_size: the heap size of SBCL in megabytes, or 'auto' to size it from the datasets and
+        the model of each run (see resources.estimate_sbcl_memory), or None for the default of SBCL, defaults to 'auto'.
+    :type dynamic_space_size: Union[int, Literal['auto']]
+
+    :param bytes_consed_between_gcs: the nursery size of the SBCL garbage collector in bytes, defaults to None
+        (5% of the dynamic space with dynamic_space_size='auto', the default of SBCL otherwise).
+    :type bytes_consed_between_gcs: int
+    """
+
+    sbcl_path: str = 'sbcl'
+    dynamic_space_size: Union[int, Literal['auto']] = 'auto'
+    bytes_consed_between_gcs: int = None
+    name = 'sbcl'
+
+    def sbcl_command(self, lisp_script_path: str) -> List[str]:
+        """
+        The command line to run a lisp script.
+
+        :rtype: List[str]
+        """
+        command = [self.sbcl_path]
+        if type(self.dynamic_space_size) is int:
+            command += ['--dynamic-space-size', f'{self.dynamic_space_size}MB']
+        command += ['--noinform', '--non-interactive']
+        if self.bytes_consed_between_gcs is not None:
+            command += ['--eval', f'(setf (sb-ext:bytes-consed-between-gcs) {self.bytes_consed_between_gcs})']
+        return command + ['--load', lisp_script_path]
+
+    def sized_for(self, experiment, run_model_configuration: RunModelConfiguration = None):
+        """
+        Get the backend running a lisp script of an experiment, with the dynamic space sized for it
+        if dynamic_space_size is 'auto', and the memory to reserve for it in the budget:
+        the dynamic space size (as sized for it with 'auto') if it is set, else the estimated memory if the budget
+        has a memory limit, else 0.
+
+        :rtype: Tuple[SBCLBackend, int]
+        """
+        if self.dynamic_space_size == 'auto':
+            memory_bytes = estimate_sbcl_memory(experiment, run_model_configuration)
+            dynamic_space_size = get_dynamic_space_size(memory_bytes)
+            bytes_consed_between_gcs = self.bytes_consed_between_gcs
+            if bytes_consed_between_gcs is None:
+                bytes_consed_between_gcs = get_bytes_consed_between_gcs(dynamic_space_size)
+            return replace(self, dynamic_space_size=dynamic_space_size,
+                           bytes_consed_between_gcs=bytes_consed_between_gcs), dynamic_space_size * MEGABYTE
+        if self.dynamic_space_size is not None:
+            return self, self.dynamic_space_size * MEGABYTE
+        if get_resource_governor().memory_budget_bytes is not None:
+            return self, estimate_sbcl_memory(experiment, run_model_configuration)
+        return self, 0
+
+    def run_script(self, experiment, lisp_script_path: str, run_model_configuration: RunModelConfiguration = None,
+                   **popen_kwargs) -> dict:
+        """
+        :raises subprocess.CalledProcessError: if SBCL exits with a non-zero code.
+        """
+        backend, memory_bytes = self.sized_for(experiment, run_model_configuration)
+        with get_resource_governor().reserve(memory_bytes):
+            return run_with_resource_usage(backend.sbcl_command(lisp_script_path), **popen_kwargs)
+
+
+# the event attributes IDyOM writes for every note, in the order of its output files
+EVENT_ATTRIBUTES = ['vertint12', 'articulation', 'comma', 'voice', 'ornament', 'dyn', 'phrase', 'bioi', 'deltast',
+                    'accidental', 'mpitch', 'cpitch', 'barlength', 'pulses', 'tempo', 'mode', 'keysig', 'dur', 'onset']
+# the start of the names of the output files of ApproximatePPMBackend, whose outputs are not the ones of IDyOM
+APPROXIMATE_PPM_FILE_PREFIX = 'ppm-approximate-'
+
+
+class InProcessBackend(Backend, ABC):
+    """
+    The base of the backends predicting the notes of the staged MIDI and kern files in python instead of running SBCL,
+    and writing the output file IDyOM would write, with the columns of the configured target and source viewpoints,
+    models and detail.
+    """
+
+    def run_script(self, experiment, lisp_script_path: str, run_model_configuration: RunModelConfiguration = None,
+                   **popen_kwargs) -> dict:
+        if run_model_configuration is None:
+            return {}
+        start_time = time.monotonic()
+        events = self._read_events_of_folder(experiment.logger.test_dataset_exp_folder)
+        events.insert(0, 'dataset.id', run_model_configuration.required_parameters.dataset_id)
+        training_events = self._read_events_of_folder(experiment.logger.train_dataset_exp_folder)
+        output_df = self.predict_outputs(events, training_events, run_model_configuration)
+        output_path = run_model_configuration.output_parameters.output_path
+        separator = run_model_configuration.output_parameters.separator or ' '
+        output_df.to_csv(output_path + self.output_file_name(run_model_configuration), sep=separator, index=False,
+                         na_rep='NA', float_format='%.8g', quoting=3)
+        # the phase timing written by the timed lisp command of the model run
+        timings_file_path = os.path.join(os.path.dirname(lisp_script_path), PHASE_TIMINGS_FILE_NAME)
+        with open(timings_file_path, 'a') as f:
+            f.write(f'run_model {time.monotonic() - start_time:.3f}\n')
+        return {}
+
+    @staticmethod
+    def _read_events_of_folder(dataset_folder_path: str) -> pd.DataFrame:
+        if dataset_folder_path is None:
+            return None
+        melodies = [read_melody(os.path.join(dataset_folder_path, file_name))
+                    for file_name in natsorted(os.listdir(dataset_folder_path)) if file_name.endswith(('.mid', '.krn'))]
+        rows = []
+        for melody_index, melody in enumerate(melodies):
+            previous_note = None
+            for note_index, note in enumerate(melody.notes):
+                bioi = note.onset - previous_note.onset if previous_note else 0
+                deltast = note.onset - previous_note.onset - previous_note.dur if previous_note else 0
+                rows.append((melody_index + 1, note_index + 1, f'"{melody.name}"', None, 0, 0, 1, 0, None, 0,
+                             bioi, max(deltast, 0), None, None, note.cpitch, melody.barlength or 96,
+                             melody.pulses or 4, melody.tempo or 500000, melody.mode, melody.keysig,
+                             note.dur, note.onset))
+                previous_note = note
+        return pd.DataFrame(rows, columns=['melody.id', 'note.id', 'melody.name'] + EVENT_ATTRIBUTES)
+
+    @staticmethod
+    def _melody_folds(events: pd.DataFrame, run_model_configuration: RunModelConfiguration) -> pd.Series:
+        """The cross-validation fold of every event: melody i is in fold i % k (a fold of its own with k = :full)."""
+        k = run_model_configuration.training_parameters.k
+        n_melodies = events['melody.id'].max()
+        return (events['melody.id'] - 1) % (n_melodies if k == ':full' else k)
+
+    @staticmethod
+    def _sources(run_model_configuration: RunModelConfiguration) -> list:
+        required_parameters = run_model_configuration.required_parameters
+        if required_parameters.source_viewpoints == ':select':
+            return required_parameters.target_viewpoints
+        return required_parameters.source_viewpoints
+
+    @staticmethod
+    def _model_names(run_model_configuration: RunModelConfiguration) -> List[str]:
+        models = (run_model_configuration.statistical_modelling_parameters.models or ':both').strip(':+')
+        return ['ltm', 'stm'] if models == 'both' else [models]
+
+    @abstractmethod
+    def predict_events(self, events: pd.DataFrame, training_events: pd.DataFrame,
+                       run_model_configuration: RunModelConfiguration):
+        """
+        Predict the target viewpoints of the events of the test dataset.
+
+        :param events: the events of the test dataset (dataset.id, melody.id, note.id, melody.name and the event attributes).
+        :type events: pd.DataFrame
+
+        :param training_events: the events of the pretraining dataset, or None.
+        :type training_events: pd.DataFrame
+
+        :param run_model_configuration: the configuration of the model.
+        :type run_model_configuration: RunModelConfiguration
+
+        :return: the predicted events (those of the resampling indices), and for every target viewpoint, a dictionary
+            with the 'target', the 'alphabet' of the predicted attribute, the predictive 'distributions' over the alphabet
+            and the 'columns' written at detail 3 before the probability of the target (orders and weights of the models).
+        """
+        pass
+
+    def predict_outputs(self, events: pd.DataFrame, training_events: pd.DataFrame,
+                        run_model_configuration: RunModelConfiguration) -> pd.DataFrame:
+        """
+        Add the IDyOM outputs to the events of the test dataset (see predict_events).
+
+        :return: the table IDyOM writes in its output file.
+        :rtype: pd.DataFrame
+
+        :raises ValueError: if a target viewpoint is not an event attribute.
+        """
+        for target in run_model_configuration.required_parameters.target_viewpoints:
+            if target not in EVENT_ATTRIBUTES:
+                raise ValueError(f'The {self.name} backend cannot predict the target viewpoint {target}, '
+                                 f'which is not one of the event attributes {EVENT_ATTRIBUTES}')
+        events, target_predictions = self.predict_events(events, training_events, run_model_configuration)
+        events = events.reset_index(drop=True)
+        detail = run_model_configuration.output_parameters.detail
+        new_melody = events['note.id'].to_numpy() == 1
+
+        output_columns = {}
+        target_information = []
+        for target_prediction in target_predictions:
+            target, alphabet, distributions = (target_prediction[key] for key in ['target', 'alphabet', 'distributions'])
+            values = pd.to_numeric(events[PREDICTED_ATTRIBUTES.get(target, target)]).to_numpy(dtype=float)
+            probability = distributions[np.arange(len(values)), np.searchsorted(alphabet, values)]
+            target_entropy = entropy(distributions)
+            target_information.append((probability, target_entropy, distributions))
+            if detail == 3:
+                output_columns.update(target_prediction['columns'])
+            output_columns[f'{target}.probability'] = probability
+            output_columns[f'{target}.information.content'] = -np.log2(probability)
+            output_columns[f'{target}.entropy'] = target_entropy
+            if detail == 3:
+                for index, element in enumerate(alphabet):
+                    element_name = int(element) if element == int(element) else element
+                    output_columns[f'{target}.{element_name}'] = distributions[:, index]
+
+        probability = np.prod([information[0] for information in target_information], axis=0)
+        output_columns['probability'] = probability
+        output_columns['information.content'] = -np.log2(probability)
+        output_columns['entropy'] = np.sum([information[1] for information in target_information], axis=0)
+        # the Kullback-Leibler divergence from the previous distribution of the melody
+        information_gain = np.zeros(len(events))
+        for _, _, distributions in target_information:
+            previous_distributions = np.roll(distributions, 1, axis=0)
+            information_gain += (distributions * np.log2(distributions / previous_distributions)).sum(axis=1)
+        output_columns['information.gain'] = np.where(new_melody, np.nan, information_gain)
+
+        if detail == 1:
+            mean_information_content = pd.Series(output_columns['information.content']).groupby(events['melody.id']).mean()
+            melody_events = events.drop_duplicates('melody.id')
+            return pd.DataFrame({'dataset.id': melody_events['dataset.id'].to_numpy(),
+                                 'melody.id': melody_events['melody.id'].to_numpy(),
+                                 'melody.name': melody_events['melody.name'].to_numpy(),
+                                 'mean.information.content': mean_information_content.to_numpy()})
+        return pd.concat([events, pd.DataFrame(output_columns)], axis=1)
+
+    @staticmethod
+    def output_file_name(run_model_configuration: RunModelConfiguration) -> str:
+        """
+        The name of the output file, made of the parameters in the same order as in the names of IDyOM output files.
+
+        :rtype: str
+        """
+
+        def _format(value):
+            if value is None:
+                return 'nil'
+            if value is True:
+                return 't'
+            if value is False:
+                return 'nil'
+            if isinstance(value, (list, tuple)):
+                return '_'.join(_format(element) for element in value)
+            return str(value).strip(':')
+
+        parameters = run_model_configuration.get_surface_dict()
+        names = ['dataset_id', 'target_viewpoints', 'source_viewpoints', 'pretraining_id', 'resampling_indices']
+        file_name_parts = [_format(parameters[name]) for name in names] + ['melody', 'nil', _format(parameters['k']),
+                                                                           _format(parameters['models'] or ':both')]
+        for model in ['ltm', 'stm']:
+            options = get_model_options(run_model_configuration, model)
+            file_name_parts.extend(_format(options[option])
+                                   for option in ['order_bound', 'mixtures', 'update_exclusion', 'escape'])
+        file_name_parts.append(str(parameters['detail']))
+        return '-'.join(file_name_parts) + '.dat'
+
+
+@dataclass
+class SimulatorBackend(InProcessBackend):
+    """
+    Write simulated IDyOM outputs instead of running SBCL: the notes of the staged MIDI and kern files,
+    with the columns IDyOM writes for the configured target and source viewpoints, models and detail,
+    and predictive distributions which get sharper along each melody.
+    The outputs only depend on the configuration, the datasets and the seed, not on the time of the run.
+
+    Only basic viewpoints read from the music files can be targets (cpitch, onset, dur, bioi, deltast, ...).
+
+    :param seed: the seed of the simulated distributions, defaults to 0.
+    :type seed: int
+
+    :param simulated_time_per_note: the number of seconds to sleep per predicted note, to simulate the load of IDyOM,
+        defaults to 0.
+    :type simulated_time_per_note: float
+    """
+
+    seed: int = 0
+    simulated_time_per_note: float = 0
+    name = 'simulator'
+
+    def _rng(self, run_model_configuration: RunModelConfiguration, target: str) -> np.random.Generator:
+        canonical_parameters = run_model_configuration.canonical_parameters()
+        digest = hashlib.sha256(f'{self.seed} {target} {sorted(canonical_parameters.items())}'.encode()).digest()
+        return np.random.default_rng(int.from_bytes(digest[:8], 'big'))
+
+    def predict_events(self, events: pd.DataFrame, training_events: pd.DataFrame,
+                       run_model_configuration: RunModelConfiguration):
+        resampling_indices = run_model_configuration.training_parameters.resampling_indices
+        if resampling_indices is not None:
+            events = events[self._melody_folds(events, run_model_configuration).isin(resampling_indices)]
+        events = events.reset_index(drop=True)
+        if self.simulated_time_per_note:
+            time.sleep(self.simulated_time_per_note * len(events))
+        sources = self._sources(run_model_configuration)
+        model_names = self._model_names(run_model_configuration)
+
+        note_positions = events['note.id'].to_numpy()
+        new_melody = note_positions == 1
+        target_predictions = []
+        for target in run_model_configuration.required_parameters.target_viewpoints:
+            rng = self._rng(run_model_configuration, target)
+            predicted_attribute = PREDICTED_ATTRIBUTES.get(target, target)
+            source_names = [source if type(source) is str else '_'.join(source) for source in sources
+                            if target in predicted_viewpoints(source)]
+            values = pd.to_numeric(events[predicted_attribute]).to_numpy(dtype=float)
+            alphabet_values = values if training_events is None else \
+                np.concatenate([values, pd.to_numeric(training_events[predicted_attribute]).to_numpy(dtype=float)])
+            alphabet = np.unique(alphabet_values[~np.isnan(alphabet_values)])
+            distributions = self._simulate_distributions(values, alphabet, note_positions, new_melody, rng)
+
+            columns = {}
+            for model in model_names:
+                for source_name in source_names:
+                    order_bound = 8 if model == 'ltm' else 3
+                    orders = np.minimum(note_positions - 1, rng.integers(0, order_bound + 1, size=len(values)))
+                    columns[f'{target}.order.{model}.{source_name}'] = orders
+            ltm_weight = rng.uniform(0.4, 1, size=len(values))
+            model_weights = {'ltm': ltm_weight, 'stm': 1 - ltm_weight} if len(model_names) == 2 else \
+                {model_names[0]: np.ones(len(values))}
+            for model in model_names:
+                columns[f'{target}.weight.{model}'] = model_weights[model]
+            for model in model_names:
+                source_weights = rng.dirichlet(np.ones(len(source_names)), size=len(values))
+                for index, source_name in enumerate(source_names):
+                    columns[f'{target}.weight.{model}.{source_name}'] = source_weights[:, index]
+            target_predictions.append({'target': target, 'alphabet': alphabet, 'distributions': distributions,
+                                       'columns': columns})
+        return events, target_predictions
+
+    @staticmethod
+    def _simulate_distributions(values: np.ndarray, alphabet: np.ndarray, note_positions: np.ndarray,
+                                new_melody: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Distributions over the alphabet centred on the previous value of the melody, with a growing share of the mass
+        on the actual value as the melody goes on (as the short-term model learns it), and some noise.
+        """
+        previous_values = np.where(new_melody, np.nanmedian(values), np.roll(values, 1))
+        spread = max(np.nanstd(values), 1)
+        logits = -np.abs(alphabet[None, :] - previous_values[:, None]) / spread
+        learning = 0.5 + 1.5 * (1 - np.exp(-(note_positions - 1) / 10))
+        logits += (alphabet[None, :] == values[:, None]) * learning[:, None]
+        logits += rng.normal(scale=1, size=logits.shape)
+        distributions = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return distributions / distributions.sum(axis=1, keepdims=True)
+
+
+@dataclass
+class ApproximatePPMBackend(InProcessBackend):
+    """
+    Predict the notes with the python PPM models of the ppm module instead of running SBCL, for the configurations
+    of basic, derived and linked viewpoints over the event attributes, with the models, escape methods, order bounds,
+    update exclusion and mixtures of IDyOM (ppm.PPMModel). The cross-validation folds are melody i in fold i % k.
+
+    The outputs approximate the ones of IDyOM, so their file names start with 'ppm-approximate-'
+    and the cache never serves them to SBCL runs. For the experiment "21-05-22_17.05.05" of the tutorials
+    (k = 1 with pretraining, so that the folds do not matter), the orders of the contexts match the ones of IDyOM
+    for all the notes, and so do the distributions of the onsets. The distributions of the pitches match for about 97%
+    of the notes: the rest differ by the counts IDyOM keeps for the update exclusion of its short-term models,
+    on the shared nodes of its suffix trees, which the tries of the ppm module do not reproduce.
+    """
+
+    name = 'ppm-approximate'
+
+    @staticmethod
+    def output_file_name(run_model_configuration: RunModelConfiguration) -> str:
+        """
+        The name of the output file of IDyOM (see InProcessBackend.output_file_name), starting with 'ppm-approximate-'.
+
+        :rtype: str
+        """
+        return APPROXIMATE_PPM_FILE_PREFIX + InProcessBackend.output_file_name(run_model_configuration)
+
+    def predict_events(self, events: pd.DataFrame, training_events: pd.DataFrame,
+                       run_model_configuration: RunModelConfiguration):
+        training_parameters = run_model_configuration.training_parameters
+        if training_parameters.k == 1:
+            folds = np.zeros(len(events), dtype=int)
+            fold_indices = [0]
+        else:
+            folds = self._melody_folds(events, run_model_configuration).to_numpy()
+            fold_indices = list(np.unique(folds))
+        resampling_indices = training_parameters.resampling_indices
+        if resampling_indices is None:
+            resampling_indices = fold_indices
+        target_predictions = predict_dataset(events, training_events, folds, resampling_indices, run_model_configuration)
+        return events[np.isin(folds, resampling_indices)], target_predictions
+
+
+BACKENDS = {backend_class.name: backend_class
+            for backend_class in [SBCLBackend, SimulatorBackend, ApproximatePPMBackend]}
+
+
+def get_backend(name: str, options: dict = None) -> Backend:
+    """
+    Build a backend from its name ('sbcl', 'simulator' or 'ppm-approximate') and options (see Backend.to_dict).
+
+    :rtype: Backend
+
+    :raises KeyError: if there is no backend with this name.
+    """
+    if name not in BACKENDS:
+        raise KeyError(f'backend \'{name}\' is invalid. Valid backends are: {list(BACKENDS.keys())}')
+    return BACKENDS[name](**(options or {}))
@@ -0,0 +1,354 @@
+"""
+This module implements the caches of py2lispIDyOM: a cache of IDyOM outputs, so that running an identical configuration
+on identical datasets returns the previously computed outputs instead of running the IDyOM model again,
+and a cache of the long-term models shared by the experiments using the same datasets and LTM options.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from glob import glob
+
+from natsort import natsorted
+
+
+def hash_dataset_folder(folder_path: str) -> str:
+    """
+    Hash the names and contents of the files in a dataset folder.
+
+    :param folder_path: the path to the dataset folder, or None for no dataset.
+    :type folder_path: str
+
+    :return: the hexadecimal sha256 digest.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    if folder_path is None:
+        return digest.hexdigest()
+    for file_path in natsorted(glob(folder_path + '*')):
+        digest.update(os.path.basename(file_path).encode() + b'\0')
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _link_or_copy(source_path: str, destination_path: str):
+    try:
+        os.link(source_path, destination_path)
+    except OSError:  # e.g., the cache is on another file system
+        shutil.copyfile(source_path, destination_path)
+
+
+@dataclass
+class ResultCache:
+    """
+    A cache of IDyOM output files, keyed by the canonical configuration and the content of the test and pretrain datasets.
+
+    Each entry is a folder named after its key. Outputs are hardlinked into and out of the cache when possible,
+    and the least recently used entries are evicted when the cache grows beyond max_size_bytes.
+
+    :param cache_folder_path: the path to the folder of the cache.
+    :type cache_folder_path: str
+
+    :param max_size_bytes: the maximum total size of the cached outputs, defaults to None (no limit).
+    :type max_size_bytes: int
+    """
+
+    cache_folder_path: str = 'experiment_history/result_cache/'
+    max_size_bytes: int = None
+
+    def __post_init__(self):
+        if not os.path.exists(self.cache_folder_path):
+            os.makedirs(self.cache_folder_path)
+
+    def get_key(self, experiment) -> str:
+        """
+        Get the cache key of an experiment from its canonical configuration and the content of its staged datasets.
+
+        :param experiment: the experiment.
+        :type experiment: IDyOMExperiment
+
+        :rtype: str
+        """
+        digest = hashlib.sha256()
+        digest.update(experiment.idyom_config.canonical_json().encode())
+        digest.update(hash_dataset_folder(experiment.logger.test_dataset_exp_folder).encode())
+        digest.update(hash_dataset_folder(experiment.logger.train_dataset_exp_folder).encode())
+        if experiment.backend.name != 'sbcl':  # e.g., simulated outputs must not be served to SBCL runs
+            digest.update(json.dumps(experiment.backend.to_dict(), sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _entry_folder_path(self, key: str) -> str:
+        return self.cache_folder_path + key + '/'
+
+    def fetch(self, key: str, output_folder_path: str) -> bool:
+        """
+        Put the cached outputs of the key in the output folder.
+
+        :return: whether the key was found in the cache.
+        :rtype: bool
+        """
+        entry_folder_path = self._entry_folder_path(key)
+        if not os.path.isdir(entry_folder_path):
+            return False
+        for file_path in glob(entry_folder_path + '*'):
+            _link_or_copy(file_path, output_folder_path + os.path.basename(file_path))
+        os.utime(entry_folder_path)  # mark the entry as recently used
+        return True
+
+    def store(self, key: str, output_folder_path: str):
+        """
+        Put the outputs in the output folder in the cache under the key, then evict the least recently used entries
+        if the cache is too large.
+        """
+        entry_folder_path = self._entry_folder_path(key)
+        if os.path.isdir(entry_folder_path):
+            return
+        temporary_folder_path = self.cache_folder_path + '.' + key + '.' + str(os.getpid()) + '/'
+        os.makedirs(temporary_folder_path)
+        for file_path in glob(output_folder_path + '*.dat'):
+            _link_or_copy(file_path, temporary_folder_path + os.path.basename(file_path))
+        try:
+            os.rename(temporary_folder_path, entry_folder_path)
+        except OSError:  # stored concurrently by another process
+            shutil.rmtree(temporary_folder_path, ignore_errors=True)
+        self.evict()
+
+    def _entries(self) -> list:
+        """Get (last access time, size, folder path) of every entry, from the least recently used."""
+        entries = []
+        for entry_folder_path in glob(self.cache_folder_path + '*/'):
+            size = sum(os.path.getsize(file_path) for file_path in glob(entry_folder_path + '*'))
+            entries.append((os.path.getmtime(entry_folder_path), size, entry_folder_path))
+        return sorted(entries)
+
+    def size(self) -> int:
+        """The total size (in bytes) of the cached outputs."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_size_bytes."""
+        if self.max_size_bytes is None:
+            return
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_folder_path in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            shutil.rmtree(entry_folder_path, ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        """Remove all the entries of the cache."""
+        for entry_folder_path in glob(self.cache_folder_path + '*/'):
+            shutil.rmtree(entry_folder_path, ignore_errors=True)
+
+
+def _folder_size(folder_path: str) -> int:
+    size = 0
+    for root, _, file_names in os.walk(folder_path):
+        size += sum(os.path.getsize(os.path.join(root, file_name)) for file_name in file_names)
+    return size
+
+
+class EntryLock:
+    """
+    An exclusive lock on a cache entry, shared by the threads and processes using the same cache folder,
+    so that two SBCL processes never import the same dataset ID or write the same model files at the same time.
+    """
+
+    def __init__(self, lock_file_path: str):
+        self.lock_file_path = lock_file_path
+        self._file = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        self._file = open(self.lock_file_path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+@dataclass
+class LTMCacheEntry:
+    """
+    An entry of the LTM cache: the directories of the long-term models and resampling sets,
+    and the dataset IDs under which they were built (IDyOM names the cached model files after the dataset IDs).
+    """
+
+    key: str
+    folder_path: str
+    test_dataset_id: str = None
+    pretrain_dataset_id: str = None
+
+    @property
+    def model_dir(self) -> str:
+        return self.folder_path + 'models/'
+
+    @property
+    def resampling_dir(self) -> str:
+        return self.folder_path + 'resampling/'
+
+    @property
+    def entry_file_path(self) -> str:
+        return self.folder_path + 'entry.json'
+
+    def is_populated(self) -> bool:
+        """Whether the entry holds long-term models built by a previous run."""
+        return self.test_dataset_id is not None and bool(glob(self.model_dir + '*'))
+
+    def lock(self) -> EntryLock:
+        os.makedirs(self.folder_path, exist_ok=True)
+        return EntryLock(self.folder_path + '.lock')
+
+
+@dataclass
+class LTMCache:
+    """
+    A shared on-disk cache of the long-term models (LTMs) and resampling sets built by IDyOM.
+
+    Experiments with the same datasets and the same LTM options (viewpoints, k and ltmo options) share one entry,
+    so that, e.g., the points of a parameter sweep differing only in STM options train the LTMs once.
+    The entry directories are wired into the generated lisp script, together with the dataset IDs under which the
+    models were built. Hits and misses are counted in the stats file of the cache, and the least recently used entries
+    are evicted when the cache grows beyond max_size_bytes.
+
+    :param cache_folder_path: the path to the folder of the cache.
+    :type cache_folder_path: str
+
+    :param max_size_bytes: the maximum total size of the cached models and resampling sets, defaults to None (no limit).
+    :type max_size_bytes: int
+    """
+
+    cache_folder_path: str = 'experiment_history/ltm_cache/'
+    max_size_bytes: int = None
+
+    # the parameters which change the long-term models or the resampling sets
+    ltm_parameters = ('target_viewpoints', 'source_viewpoints', 'k', 'ltmo', 'ltmo_order_bound', 'ltmo_mixtures',
+                      'ltmo_update_exclusion', 'ltmo_escape')
+
+    def __post_init__(self):
+        if not os.path.exists(self.cache_folder_path):
+            os.makedirs(self.cache_folder_path)
+        self.stats_file_path = self.cache_folder_path + 'stats.json'
+        self._dataset_hashes = {}
+
+    def _hash_dataset_folder(self, folder_path: str) -> str:
+        # the staged dataset folders of an experiment do not change, so they are only hashed once
+        if folder_path not in self._dataset_hashes:
+            self._dataset_hashes[folder_path] = hash_dataset_folder(folder_path)
+        return self._dataset_hashes[folder_path]
+
+    def get_key(self, experiment) -> str:
+        """
+        Get the cache key of an experiment from its LTM options and the content of its staged datasets.
+
+        :param experiment: the experiment.
+        :type experiment: IDyOMExperiment
+
+        :rtype: str
+        """
+        canonical_parameters = experiment.idyom_config.run_model_configuration.canonical_parameters()
+        ltm_parameters = {key: canonical_parameters[key] for key in self.ltm_parameters}
+        digest = hashlib.sha256()
+        digest.update(json.dumps(ltm_parameters, sort_keys=True).encode())
+        digest.update(self._hash_dataset_folder(experiment.logger.test_dataset_exp_folder).encode())
+        digest.update(self._hash_dataset_folder(experiment.logger.train_dataset_exp_folder).encode())
+        return digest.hexdigest()
+
+    def lookup(self, experiment) -> LTMCacheEntry:
+        """
+        Get the cache entry of an experiment, which is empty if no run has populated it yet.
+
+        :rtype: LTMCacheEntry
+        """
+        key = self.get_key(experiment)
+        entry = LTMCacheEntry(key=key, folder_path=self.cache_folder_path + key + '/')
+        if os.path.exists(entry.entry_file_path):
+            with open(entry.entry_file_path, 'r') as f:
+                dataset_ids = json.load(f)
+            entry.test_dataset_id = dataset_ids['test_dataset_id']
+            entry.pretrain_dataset_id = dataset_ids['pretrain_dataset_id']
+        return entry
+
+    def record_use(self, entry: LTMCacheEntry, test_dataset_id: str, pretrain_dataset_id: str):
+        """
+        Count a hit or a miss for the entry, and save the dataset IDs the entry is (going to be) populated with.
+        Call this while holding the lock of the entry.
+        """
+        hit = entry.is_populated()
+        os.makedirs(entry.model_dir, exist_ok=True)
+        os.makedirs(entry.resampling_dir, exist_ok=True)
+        entry.test_dataset_id = test_dataset_id
+        entry.pretrain_dataset_id = pretrain_dataset_id
+        with open(entry.entry_file_path, 'w') as f:  # also marks the entry as recently used
+            json.dump({'test_dataset_id': test_dataset_id, 'pretrain_dataset_id': pretrain_dataset_id}, f)
+        with EntryLock(self.cache_folder_path + '.stats.lock'):
+            stats = self._load_stats()
+            stats['hits' if hit else 'misses'] += 1
+            with open(self.stats_file_path, 'w') as f:
+                json.dump(stats, f)
+        print(f'** LTM cache {"hit" if hit else "miss"}: {entry.folder_path} **')
+
+    def _load_stats(self) -> dict:
+        if os.path.exists(self.stats_file_path):
+            with open(self.stats_file_path, 'r') as f:
+                return json.load(f)
+        return {'hits': 0, 'misses': 0}
+
+    def _entries(self) -> list:
+        """Get (last use time, size, folder path) of every entry, from the least recently used."""
+        entries = []
+        for entry_folder_path in glob(self.cache_folder_path + '*/'):
+            entry_file_path = entry_folder_path + 'entry.json'
+            last_use = os.path.getmtime(entry_file_path) if os.path.exists(entry_file_path) else 0
+            entries.append((last_use, _folder_size(entry_folder_path), entry_folder_path))
+        return sorted(entries)
+
+    def stats(self) -> dict:
+        """
+        Get the number of hits and misses, the number of entries and the total size (in bytes) of the cache.
+
+        :rtype: dict
+        """
+        entries = self._entries()
+        return {**self._load_stats(), 'entries': len(entries), 'size_bytes': sum(size for _, size, _ in entries)}
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_size_bytes.
+        Entries in use by a running experiment are skipped.
+        """
+        if self.max_size_bytes is None:
+            return
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_folder_path in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            entry_lock = EntryLock(entry_folder_path + '.lock')
+            if entry_lock.acquire(blocking=False):
+                shutil.rmtree(entry_folder_path, ignore_errors=True)
+                entry_lock.release()
+                total_size -= size
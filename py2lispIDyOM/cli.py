@@ -0,0 +1,76 @@
+"""
+This module implements the ``py2lispidyom`` command line interface.
+
+Usage::
+
+    py2lispidyom worker experiment_history/spool/ --max-concurrent-runs 4
+    py2lispidyom status experiment_history/spool/
+"""
+
+import argparse
+import signal
+import sys
+from typing import List
+
+from py2lispIDyOM.spool import JobQueue, SpoolWorker
+
+
+def _worker(args):
+    worker = SpoolWorker(spool_folder_path=args.spool_folder_path,
+                         max_concurrent_runs=args.max_concurrent_runs,
+                         poll_interval=args.poll_interval,
+                         retry_delay=args.retry_delay,
+                         stale_after=args.stale_after)
+    # finish the running experiments, but do not claim new jobs, when asked to stop
+    previous_handlers = {signum: signal.signal(signum, lambda signum, frame: worker.stop())
+                         for signum in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        worker.run(exit_when_empty=args.exit_when_empty)
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+
+
+def _status(args):
+    queue = JobQueue(spool_folder_path=args.spool_folder_path)
+    for job_id in queue.jobs(args.state):
+        status = queue.status(job_id)
+        line = f'{job_id}  {status["state"]:<8}  attempts={status.get("attempts", 0)}'
+        if status.get('error'):
+            line += f'  error={status["error"]}'
+        print(line)
+
+
+def _spool_folder_path(path: str) -> str:
+    return path if path.endswith('/') else path + '/'
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(prog='py2lispidyom')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    worker_parser = subparsers.add_parser('worker', help='run the jobs submitted to a spool folder')
+    worker_parser.add_argument('spool_folder_path', type=_spool_folder_path)
+    worker_parser.add_argument('--max-concurrent-runs', type=int, default=1,
+                               help='the maximum number of experiments running at the same time')
+    worker_parser.add_argument('--poll-interval', type=float, default=2,
+                               help='the number of seconds between two scans of the spool folder')
+    worker_parser.add_argument('--retry-delay', type=float, default=30,
+                               help='the number of seconds before the first retry of a failed job')
+    worker_parser.add_argument('--stale-after', type=float, default=300,
+                               help='the number of seconds without heartbeat after which a running job is requeued')
+    worker_parser.add_argument('--exit-when-empty', action='store_true',
+                               help='exit once no job is pending or running')
+    worker_parser.set_defaults(function=_worker)
+
+    status_parser = subparsers.add_parser('status', help='print the status of the jobs of a spool folder')
+    status_parser.add_argument('spool_folder_path', type=_spool_folder_path)
+    status_parser.add_argument('--state', choices=['pending', 'running', 'finished', 'failed'])
+    status_parser.set_defaults(function=_status)
+
+    args = parser.parse_args(argv)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
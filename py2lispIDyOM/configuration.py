@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import datetime
+import functools
 import json
 import os
 import shutil
@@ -8,10 +9,12 @@ from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from dataclasses import field
 from glob import glob
-from typing import Literal, List, Union, Tuple, Iterable, get_type_hints
+from typing import Literal, List, Union, Tuple, Iterable, Dict, get_type_hints
 
 from natsort import natsorted
 
+from py2lispIDyOM.telemetry import time_lisp_command
+
 
 def check_recursive_typings(obj, type_expected: type) -> bool:
     type_got = type(obj)
@@ -37,6 +40,25 @@ def check_recursive_typings(obj, type_expected: type) -> bool:
     return type_correct
 
 
+def coerce_recursive_typings(obj, type_expected: type):
+    """
+    Convert the lists nested in obj to tuples where type_expected asks for a tuple (and tuples to lists where it asks
+    for a list), so that parameters read back from JSON, which has no tuples, get the type they were set with.
+    """
+    if not hasattr(type_expected, '__origin__') or not isinstance(obj, (list, tuple)):
+        return obj
+    type_origin = type_expected.__origin__
+    if type_origin in [list, tuple]:
+        arg_type = type_expected.__args__[0]
+        return type_origin(coerce_recursive_typings(obj=_, type_expected=arg_type) for _ in obj)
+    if type_origin == Union:
+        for possible_type in type_expected.__args__:
+            coerced = coerce_recursive_typings(obj=obj, type_expected=possible_type)
+            if check_recursive_typings(obj=coerced, type_expected=possible_type):
+                return coerced
+    return obj
+
+
 def get_timestamp():
     today_date = datetime.date.today()
     now_time = datetime.datetime.now()
@@ -66,6 +88,7 @@ class LispConvertable(ABC):
                 print(f'type hint for {key} not defined')
             else:
                 type_expected = type_hint_dict[key]
+                value = coerce_recursive_typings(obj=value, type_expected=type_expected)
                 type_correct = check_recursive_typings(obj=value, type_expected=type_expected)
 
                 if type_correct:
@@ -303,16 +326,18 @@ class TrainingParameters(Parameters):
         return command_k
 
     def resampling_indices_to_command(self):
-        raise NotImplementedError
+        indices = ' '.join(str(index) for index in self.resampling_indices)
+        command_resampling_indices = f':resampling-indices \'({indices})'
+        return command_resampling_indices
 
     def to_lisp_command(self) -> str:
         if self.pretraining_id:
             command = f':pretraining-ids \'({self.pretraining_id_to_command()}) {self.k_to_command()}'
-            return command
-
         else:
             command = f'{self.k_to_command()}'
-            return command
+        if self.resampling_indices is not None:
+            command = f'{command} {self.resampling_indices_to_command()}'
+        return command
 
 
 @dataclass
@@ -329,6 +354,18 @@ class BasisOption(Parameters):
         return command
 
 
+def to_plain_data(value):
+    """
+    Convert a parameter value to plain data which can be serialized to JSON: a BasisOption to its basis,
+    other Parameters to the dictionary of their fields.
+    """
+    if isinstance(value, BasisOption):
+        return to_plain_data(value.basis)
+    if isinstance(value, Parameters):
+        return {key: to_plain_data(sub_value) for key, sub_value in value.__dict__.items()}
+    return value
+
+
 @dataclass
 class ViewpointSelectionParameters(Parameters):
     """
@@ -487,6 +524,81 @@ class Configuration(LispConvertable, ABC):
     pass
 
 
+@dataclass(frozen=True)
+class ParameterSpec:
+    """
+    Where a parameter of a configuration is stored, and the type its values must have.
+
+    :param name: the name of the parameter.
+    :type name: str
+
+    :param path: the names of the attributes leading from the configuration to the Parameters object owning the parameter.
+    :type path: Tuple[str, ...]
+
+    :param type_expected: the type hint of the parameter.
+    """
+
+    name: str
+    path: Tuple[str, ...]
+    type_expected: object
+
+    def owner(self, configuration: LispConvertable) -> LispConvertable:
+        for attribute in self.path:
+            configuration = getattr(configuration, attribute)
+        return configuration
+
+    def set(self, configuration: LispConvertable, value):
+        """
+        Set the parameter of the configuration, as LispConvertable.recursive_set_attr does.
+
+        :raises TypeError: if the value does not have the expected type.
+        """
+        self.owner(configuration).__dict__[self.name] = self.validate(value)
+
+    def validate(self, value):
+        """
+        :return: the value, with the nested lists and tuples coerced to the expected types.
+
+        :raises TypeError: if the value does not have the expected type.
+        """
+        value = coerce_recursive_typings(obj=value, type_expected=self.type_expected)
+        if not check_recursive_typings(obj=value, type_expected=self.type_expected):
+            raise TypeError(f'Expect type for parameter {self.name} is {self.type_expected}, '
+                            f'but got \'{value}\' which has type {type(value)} ')
+        return value
+
+
+def _owner_path(obj: LispConvertable, key: str, path: Tuple[str, ...] = ()):
+    # the first object having the attribute, in the order recursive_set_attr looks for it
+    if hasattr(obj, key):
+        return path
+    children = [(name, value) for name, value in obj.__dict__.items() if isinstance(value, Configuration)] + \
+               [(name, value) for name, value in obj.__dict__.items() if isinstance(value, Parameters)]
+    for name, child in children:
+        child_path = _owner_path(child, key, path + (name,))
+        if child_path is not None:
+            return child_path
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_parameter_schema(configuration_class: type) -> Dict[str, ParameterSpec]:
+    """
+    Compile the parameters of a configuration class (the keywords of its set_parameters) once:
+    the path to the Parameters object owning each parameter and its type hint,
+    instead of walking the configuration tree and reading the type hints for every keyword.
+
+    :rtype: Dict[str, ParameterSpec]
+    """
+    configuration = configuration_class()
+    schema = {}
+    for name in configuration.get_surface_dict():
+        path = _owner_path(configuration, name)
+        owner = ParameterSpec(name, path, None).owner(configuration)
+        schema[name] = ParameterSpec(name, path, get_type_hints(type(owner), globalns=globals()).get(name))
+    return schema
+
+
 @dataclass(repr=False)
 class RunModelConfiguration(Configuration):
     this_exp_log_path: str = None
@@ -501,6 +613,35 @@ class RunModelConfiguration(Configuration):
     viewpoint_selection_parameters: ViewpointSelectionParameters = field(default_factory=ViewpointSelectionParameters)
     caching_parameters: CachingParameters = field(default_factory=CachingParameters)
 
+    # parameters assigned by py2lispIDyOM itself, which do not change the model outputs
+    # (nor do the path of the viewpoint selection trace and the caching of the LTMs and resampling sets by IDyOM)
+    volatile_parameters = ('output_path', 'overwrite', 'dataset_id', 'pretraining_id', 'ltmo_options', 'stmo_options',
+                           'viewpoint_selection_output', 'use_ltms_cache', 'use_resampling_set_cache')
+
+    def set_parameters(self, **kwargs):
+        """
+        Set the IDyOM model parameters, checking every keyword and the type of its value.
+
+        :raises KeyError: if a keyword is not a valid parameter.
+        :raises TypeError: if a value does not have the expected type.
+        """
+        schema = get_parameter_schema(type(self))
+        for key, value in kwargs.items():
+            if key not in schema:
+                kw2hide_in_errormsg = ['output_path', 'dataset_id', 'pretraining_id', 'stmo_options', 'ltmo_options']
+                kw2show = [ele for ele in schema.keys() if ele not in kw2hide_in_errormsg]
+                raise KeyError(f'parameter \'{key}\' is invalid. Valid parameters are: {kw2show}')
+            schema[key].set(self, value)
+
+    def canonical_parameters(self) -> dict:
+        """
+        The model parameters without the ones assigned by py2lispIDyOM (dataset IDs, output path),
+        so that two configurations producing the same model outputs have equal canonical parameters.
+        """
+        schema = get_parameter_schema(type(self))
+        return {key: to_plain_data(schema[key].owner(self).__dict__[key])
+                for key in sorted(schema) if key not in self.volatile_parameters}
+
     def to_lisp_command(self) -> str:
         # assert self.required_parameters._is_available(), self.required_parameters
         all_parameters = [
@@ -518,6 +659,39 @@ class RunModelConfiguration(Configuration):
         return command
 
 
+def render_run_model_commands(parameters_list: Iterable[dict]) -> List[str]:
+    """
+    Validate many model configurations and render the idyom:idyom call of each, e.g., for the points of a large sweep.
+    The values are validated once per parameter and value, however many configurations share them.
+
+    :param parameters_list: the parameters of each configuration (the keywords of RunModelConfiguration.set_parameters).
+    :type parameters_list: Iterable[dict]
+
+    :return: the lisp command of each configuration, in order.
+    :rtype: List[str]
+
+    :raises KeyError: if a keyword is not a valid parameter.
+    :raises TypeError: if a value does not have the expected type.
+    :raises AssertionError: if the required parameters of a configuration are missing.
+    """
+    schema = get_parameter_schema(RunModelConfiguration)
+    validated_values = {}
+    commands = []
+    for index, parameters in enumerate(parameters_list):
+        configuration = RunModelConfiguration()
+        for key, value in parameters.items():
+            value_key = (key, repr(value))
+            if value_key not in validated_values:
+                if key not in schema:
+                    raise KeyError(f'parameter \'{key}\' of configuration {index} is invalid. '
+                                   f'Valid parameters are: {list(schema)}')
+                validated_values[value_key] = schema[key].validate(value)
+            spec = schema[key]
+            spec.owner(configuration).__dict__[key] = validated_values[value_key]
+        commands.append(configuration.to_lisp_command())
+    return commands
+
+
 @dataclass
 class DatabaseConfiguration(Configuration):
     this_exp_log_path: str = None
@@ -525,6 +699,7 @@ class DatabaseConfiguration(Configuration):
     pretrain_dataset_id: str = None
     test_dataset_Name: str = 'TEST_DATASET'
     pretrain_dataset_Name: str = 'PRETRAIN_DATASET'
+    replace_existing_datasets: bool = False  # whether to delete a dataset with the same ID from the database before importing
 
     def to_lisp_command(self):
         if self.pretrain_dataset_id:
@@ -563,6 +738,8 @@ class DatabaseConfiguration(Configuration):
         non_empty_subcommands = [x for x in subcommands if x != '']
         joined_commands = ' '.join(non_empty_subcommands)
         command = f'(idyom-db:import-data {joined_commands})'
+        if self.replace_existing_datasets:
+            command = f'(ignore-errors (idyom-db:delete-dataset {ID}))\n{command}'
         return command
 
     def _get_command_import_db(self, path, dataset_name, dataset_id):
@@ -598,36 +775,75 @@ class DatabaseConfiguration(Configuration):
     #     return total_command
 
 
+@dataclass
+class CacheDirectoryConfiguration(Configuration):
+    """
+    The directories in which IDyOM saves the long-term models and the resampling sets (cross-validation folds)
+    when use_ltms_cache and use_resampling_set_cache are on. Defaults to IDyOM's own directories.
+    """
+
+    model_dir: str = None
+    resampling_dir: str = None
+
+    def to_lisp_command(self) -> str:
+        commands = []
+        if self.model_dir:
+            commands.append(f'(setf resampling::*model-dir* (ensure-directories-exist "{self.model_dir}"))')
+        if self.resampling_dir:
+            commands.append(f'(setf resampling::*resampling-dir* (ensure-directories-exist "{self.resampling_dir}"))')
+        return '\n'.join(commands)
+
+
 @dataclass
 class IDyOMConfiguration(Configuration):
     database_configuration: DatabaseConfiguration = field(default_factory=DatabaseConfiguration)
     run_model_configuration: RunModelConfiguration = field(default_factory=RunModelConfiguration)
-
-    def to_lisp_command(self) -> str:
+    cache_directory_configuration: CacheDirectoryConfiguration = field(default_factory=CacheDirectoryConfiguration)
+
+    def to_lisp_command(self, timings_file_path: str = None) -> str:
+        """
+        :param timings_file_path: if given, the wall time of each phase (start_idyom, import_datasets, run_model)
+            is appended to this file (see telemetry.read_phase_timings), defaults to None.
+        :type timings_file_path: str
+        """
         if self.run_model_configuration.training_parameters.pretraining_id:
-            commands = [
-                self.start_idyom_command(),
-                self.import_test_dataset_command(),
-                self.import_train_dataset_command(),
-                self.run_model_command(),
-                self.quit_command()
-            ]
-            total_command = '\n'.join(commands)
-            return total_command
+            import_commands = '\n'.join([self.import_test_dataset_command(), self.import_train_dataset_command()])
         else:
-            commands = [
-                self.start_idyom_command(),
-                self.import_test_dataset_command(),
-                self.run_model_command(),
-                self.quit_command()
-            ]
-            total_command = '\n'.join(commands)
-            return total_command
+            import_commands = self.import_test_dataset_command()
+        phases = [
+            ('start_idyom', self.start_idyom_command()),
+            (None, self.cache_directory_command()),
+            ('import_datasets', import_commands),
+            ('run_model', self.run_model_command()),
+            (None, self.quit_command())
+        ]
+        commands = [command if phase is None or timings_file_path is None
+                    else time_lisp_command(phase, command, timings_file_path)
+                    for phase, command in phases if command]
+        total_command = '\n'.join(commands)
+        return total_command
+
+    def canonical_json(self) -> str:
+        """
+        Serialize the configuration without the fields which change from one run to the next
+        (timestamps, dataset IDs, experiment and output paths), so that two runs of the same model on the same datasets
+        have the same canonical serialization.
+        """
+        canonical_dict = {
+            'run_model_configuration': self.run_model_configuration.canonical_parameters(),
+            'test_dataset_Name': self.database_configuration.test_dataset_Name,
+            'pretrain_dataset_Name': self.database_configuration.pretrain_dataset_Name,
+        }
+        return json.dumps(canonical_dict, sort_keys=True)
 
     def start_idyom_command(self) -> str:
         command = '(start-idyom)'
         return command
 
+    def cache_directory_command(self) -> str:
+        command = self.cache_directory_configuration.to_lisp_command()
+        return command
+
     def import_test_dataset_command(self) -> str:
         command = self.database_configuration.to_lisp_command_import_testdb()
         return command
@@ -640,6 +856,16 @@ class IDyOMConfiguration(Configuration):
         command = self.database_configuration.to_lisp_command()
         return command
 
+    def prepare_resampling_sets_command(self) -> str:
+        """
+        Create and cache the resampling sets (cross-validation folds) of the test dataset,
+        so that several IDyOM processes running different resampling indices share the same folds.
+        """
+        dataset_id = self.run_model_configuration.required_parameters.dataset_id
+        k = self.run_model_configuration.training_parameters.k
+        command = f'(resampling::get-resampling-sets {dataset_id} :k {k} :use-cache? t)'
+        return command
+
     def describe_database_command(self) -> str:
         command = '(idyom-db:describe-database)'
         return command
@@ -1,13 +1,157 @@
+import csv
+import datetime
+import functools
+import hashlib
+import json
 import os
+import re
+import sqlite3
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from dataclasses import dataclass
-from glob import glob
-from typing import List
+from typing import List, Literal
 
 import numpy as np
 import pandas as pd
 import scipy.io
+import scipy.sparse
 
-from py2lispIDyOM.extract import ExperimentInfo
+from py2lispIDyOM.extract import ExperimentInfo, get_dat_file_path, get_melody_names, getDataFrame, iter_melody_blocks
+from py2lispIDyOM.telemetry import RUN_REPORT_FILE_NAME
+
+
+# the size from which the variables cannot be written to a version 5 mat file
+MAT_V5_MAX_BYTES = 2 ** 31
+MATLAB_CLASSES = {'float64': 'double', 'float32': 'single', 'int64': 'int64', 'int32': 'int32', 'int16': 'int16',
+                  'int8': 'int8', 'uint64': 'uint64', 'uint32': 'uint32', 'uint16': 'uint16', 'uint8': 'uint8',
+                  'bool': 'logical'}
+
+
+MANIFEST_FILE_NAME = 'export_manifest.json'
+
+
+def _hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _hash_source(row_hashes: np.ndarray, options: dict) -> str:
+    """Hash the values written to an output file (see pd.util.hash_pandas_object) and the export options."""
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(row_hashes).tobytes())
+    return digest.hexdigest()
+
+
+@dataclass
+class ExportManifest:
+    """
+    The record of the files written to an export folder (export_manifest.json): the sha256 (with the size and
+    modification time) of the IDyOM output file they were exported from, for every file, the hash of the values and
+    options it was written from, its options and its checksum, size and modification time, and for every export
+    completed from this output file, its options and the files it covered.
+    A file is up to date if it was written from the same values with the same options and has not changed since
+    (its checksum is only computed again if its size or modification time changed).
+    An export is up to date if it was completed with the same options from the same output file and none of its files
+    changed since, which is checked without parsing the output file (see is_export_up_to_date).
+
+    :param export_folder_path: the path to the export folder.
+    :type export_folder_path: str
+    """
+
+    export_folder_path: str
+
+    def __post_init__(self):
+        self.manifest_file_path = self.export_folder_path + MANIFEST_FILE_NAME
+        self.dat_file_sha256 = None
+        self.dat_file_stat = None
+        self.files = {}
+        self.exports = {}
+        # the files of the current export (up to date or written), with the hash of their values and options
+        self.export_files = {}
+        if os.path.exists(self.manifest_file_path):
+            with open(self.manifest_file_path, 'r') as f:
+                manifest = json.load(f)
+            self.dat_file_sha256 = manifest['dat_file_sha256']
+            self.dat_file_stat = manifest.get('dat_file_stat')
+            self.files = manifest['files']
+            self.exports = manifest.get('exports', {})
+
+    @staticmethod
+    def _export_key(export_options: dict) -> str:
+        return json.dumps(export_options, sort_keys=True)
+
+    def _hash_dat_file(self, dat_file_path: str) -> str:
+        # the output file is only hashed again if its size or modification time changed
+        stat = os.stat(dat_file_path)
+        if self.dat_file_sha256 is not None and self.dat_file_stat == [stat.st_size, stat.st_mtime_ns]:
+            return self.dat_file_sha256
+        return _hash_file(dat_file_path)
+
+    def _is_unchanged(self, file_name: str, source_hash: str) -> bool:
+        entry = self.files.get(file_name)
+        file_path = self.export_folder_path + file_name
+        if entry is None or entry['source'] != source_hash or not os.path.exists(file_path):
+            return False
+        stat = os.stat(file_path)
+        if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+        return _hash_file(file_path) == entry['checksum']
+
+    def is_export_up_to_date(self, dat_file_path: str, export_options: dict) -> bool:
+        """
+        Whether an export with the export options was completed from the same IDyOM output file and none of its files
+        changed since, so that it can be skipped without parsing the output file.
+
+        :rtype: bool
+        """
+        export_files = self.exports.get(self._export_key(export_options))
+        if export_files is None or self._hash_dat_file(dat_file_path) != self.dat_file_sha256:
+            return False
+        return all(self._is_unchanged(file_name, source_hash) for file_name, source_hash in export_files.items())
+
+    def is_up_to_date(self, file_name: str, source_hash: str) -> bool:
+        """
+        Whether the file was written from the values and options of source_hash, and has not changed since.
+
+        :rtype: bool
+        """
+        if not self._is_unchanged(file_name, source_hash):
+            return False
+        self.export_files[file_name] = source_hash
+        return True
+
+    def record(self, file_name: str, source_hash: str, options: dict, checksum: str = None):
+        """
+        Record a file which has just been written (its checksum is computed if it is not given).
+        """
+        file_path = self.export_folder_path + file_name
+        stat = os.stat(file_path)
+        self.files[file_name] = {'source': source_hash, 'options': options,
+                                 'checksum': checksum if checksum is not None else _hash_file(file_path),
+                                 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        self.export_files[file_name] = source_hash
+
+    def save(self, dat_file_path: str, export_options: dict = None):
+        """
+        Write the manifest, with the sha256 of the IDyOM output file the files were exported from,
+        and the files of the export completed with the export options.
+        """
+        dat_file_sha256 = self._hash_dat_file(dat_file_path)
+        if dat_file_sha256 != self.dat_file_sha256:  # the other exports were completed from another output file
+            self.exports = {}
+        self.dat_file_sha256 = dat_file_sha256
+        stat = os.stat(dat_file_path)
+        self.dat_file_stat = [stat.st_size, stat.st_mtime_ns]
+        if export_options is not None:
+            self.exports[self._export_key(export_options)] = self.export_files
+        temporary_file_path = self.manifest_file_path + '.tmp'
+        with open(temporary_file_path, 'w') as f:
+            json.dump({'dat_file_sha256': self.dat_file_sha256, 'dat_file_stat': self.dat_file_stat,
+                       'files': self.files, 'exports': self.exports}, f, indent=1)
+        os.replace(temporary_file_path, self.manifest_file_path)
 
 
 @dataclass
@@ -22,16 +166,48 @@ class Export:
 
     :param melody_names: a list of melodies of which IDyOM outputs that you want to export
     :type melody_names: list(str)
+
+    :param incremental: whether export2csv and export2mat skip the files which are up to date
+        (written from the same outputs with the same options, according to the export_manifest.json file
+        of the export folder, see ExportManifest), defaults to True.
+    :type incremental: bool
     """
 
     experiment_folder_path: str
     idyom_output_keywords: List = None
     melody_names: List = None
+    incremental: bool = True
 
     def __post_init__(self):
-        self.dat_file_path = glob(self.experiment_folder_path + 'experiment_output_data_folder/*.dat')[0]
-        self.experiment_info = ExperimentInfo(experiment_folder_path=self.experiment_folder_path)
-        self.melodies_info_dict = self.experiment_info.melodies_dict
+        self.dat_file_path = get_dat_file_path(self.experiment_folder_path)
+
+    @functools.cached_property
+    def experiment_info(self) -> ExperimentInfo:
+        """The outputs of the experiment, only parsed by the exports which need the melodies as MelodyInfo."""
+        return ExperimentInfo(experiment_folder_path=self.experiment_folder_path)
+
+    @functools.cached_property
+    def melodies_info_dict(self) -> dict:
+        return self.experiment_info.melodies_dict
+
+    @functools.cached_property
+    def _outputs_df(self) -> pd.DataFrame:
+        if 'experiment_info' in self.__dict__:
+            return self.experiment_info.df
+        return getDataFrame(self.dat_file_path)
+
+    @functools.cached_property
+    def _text_outputs_df(self) -> pd.DataFrame:
+        """
+        The IDyOM outputs as in MelodyInfo (see extract.to_float): the numbers as floats and the other values
+        (e.g., NA, the quoted melody names) as they are written in the output file.
+        """
+        df = pd.read_csv(self.dat_file_path, sep=r'\s+', dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE)
+        return _melody_info_values(df)
+
+    @staticmethod
+    def _row_hashes(values) -> np.ndarray:
+        return pd.util.hash_pandas_object(values, index=False).values
 
     def _generate_export_folder(self, export_folder_name):
         """To generate a folder to store the idyom outputs in other formats (e.g., .mat, .csv)"""
@@ -79,7 +255,50 @@ class Export:
         for index, melody in selected_songs:
             self._get_single_melody_output_values_df(melody=melody)
 
-    def _export_by_keyword_2mat(self, keywords_list, selected_songs, output_path):
+    def _get_selected_outputs_df(self, df: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Get the IDyOM outputs of the selected melodies (all of them if melody_names is None) in one DataFrame,
+        with the melody.id, note.id and melody.name columns followed by the selected keywords
+        (all of them if idyom_output_keywords is None).
+        """
+        df = self._get_selected_melodies_df(df)
+        return df[self._selected_columns(df.columns.to_list())]
+
+    def _get_selected_melodies_df(self, df: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Get all the IDyOM outputs of the selected melodies (all of them if melody_names is None),
+        from the parsed output table unless df is given.
+        """
+        if df is None:
+            df = self._outputs_df
+        if self.melody_names:
+            melody_names = df['melody.name'].astype(str).str.strip('"')
+            self._check_melody_names(melody_names.unique())
+            df = df[melody_names.isin(self._unquoted_melody_names()).values]
+        return df
+
+    def _unquoted_melody_names(self) -> list:
+        # the melody names of the output table have no quotes, unlike the keys of melodies_info_dict
+        return [melody.strip('"') for melody in self.melody_names]
+
+    def _check_melody_names(self, valid_melody_names):
+        invalid_melody_names = [melody for melody in self.melody_names if melody.strip('"') not in valid_melody_names]
+        if invalid_melody_names:
+            quoted_melody_names = ['"' + melody + '"' for melody in valid_melody_names]
+            raise KeyError(f'Melodies {invalid_melody_names} are not in the experiment. '
+                           f'Valid melody names are: {quoted_melody_names}')
+
+    def _selected_columns(self, valid_keys: List[str]) -> List[str]:
+        """The melody.id, note.id and melody.name columns followed by the selected keywords (all of them if None)."""
+        if self.idyom_output_keywords is None:
+            return valid_keys
+        for keyword in self.idyom_output_keywords:
+            if keyword not in valid_keys:
+                raise KeyError(f'IDyOM output keyword \'{keyword}\' is invalid. Valid IDyOM output keys are: {valid_keys}')
+        id_columns = ['melody.id', 'note.id', 'melody.name']
+        return id_columns + [keyword for keyword in self.idyom_output_keywords if keyword not in id_columns]
+
+    def _export_by_keyword_2mat(self, keywords_list, selected_songs, output_path, manifest=None):
         """Export the idyom output data to .mat files according to the keyword list."""
 
         # Type check =====================:
@@ -89,15 +308,24 @@ class Export:
             raise TypeError(f'Argument \'keywords_list\' should be a list of strings, not {type(keywords_list)}')
 
         for i, keyword in enumerate(keywords_list):  # data_to_export is a list of list
-            keyword_output_data_in_songs = self._get_output_values_in_selected_melodies(idyom_key=keyword,
-                                                                                        selected_songs=selected_songs)
             keyword_name_pp = keyword.replace('.', '_')  # account for names like "information.content"
             keyword_name_pp = keyword_name_pp.replace('-', '')
-            scipy.io.savemat(output_path + keyword_name_pp + '.mat',
+            file_name = keyword_name_pp + '.mat'
+            options = {'export': 'mat', 'keyword': keyword}
+            source_hash = _hash_source(self._row_hashes(self._outputs_df[keyword]), options)
+            if manifest is not None and manifest.is_up_to_date(file_name, source_hash):
+                continue
+            if selected_songs is None:
+                selected_songs = list(self.melodies_info_dict.keys())
+            keyword_output_data_in_songs = self._get_output_values_in_selected_melodies(idyom_key=keyword,
+                                                                                        selected_songs=selected_songs)
+            scipy.io.savemat(output_path + file_name,
                              mdict={keyword_name_pp: np.array(keyword_output_data_in_songs)})
+            if manifest is not None:
+                manifest.record(file_name, source_hash, options)
         print('Exported data to ' + output_path)
 
-    def _export_values_of_keywords_by_melody_2mat(self, keywords_list, melody, output_path):
+    def _export_values_of_keywords_by_melody_2mat(self, keywords_list, melody, output_path, manifest=None):
         """Exports the IDyOM output values according to the keywords_list of one song to a mat file."""
         # Type check =====================:
         if isinstance(keywords_list, list):
@@ -105,26 +333,30 @@ class Export:
         else:
             raise TypeError(f'Argument \'keywords_list\' should be a list of strings, not {type(keywords_list)}')
         melody_name_pp = melody.replace('"', '')
+        melody_rows = (self._outputs_df['melody.name'] == melody_name_pp).values
         for i, keyword in enumerate(keywords_list):
-            idyom_output_data_in_song = self._get_idyom_output_for_single_melody(melody=melody, idyom_key=keyword)
             idyom_keyword_pp = keyword.replace('.', '_')  # account for names like "information.content"
             full_outfile_name = melody_name_pp + '_' + idyom_keyword_pp
             full_outfile_name = full_outfile_name.replace('-', '')
-            scipy.io.savemat(output_path + full_outfile_name + '.mat',
+            file_name = full_outfile_name + '.mat'
+            options = {'export': 'mat', 'keyword': keyword}
+            source_hash = _hash_source(self._row_hashes(self._outputs_df[keyword][melody_rows]), options)
+            if manifest is not None and manifest.is_up_to_date(file_name, source_hash):
+                continue
+            idyom_output_data_in_song = self._get_idyom_output_for_single_melody(melody=melody, idyom_key=keyword)
+            scipy.io.savemat(output_path + file_name,
                              mdict={idyom_keyword_pp: np.array(idyom_output_data_in_song)})
+            if manifest is not None:
+                manifest.record(file_name, source_hash, options)
         print('Exported data to ' + output_path)
 
-    def _export_by_song_2csv(self, melody_name, single_song_df_data: pd.DataFrame, output_path):
-        """Exports the all the IDyOM output data (df) for a single melody to csv"""
-        melody_name = melody_name.replace('"', '')
-        csv_file_path = output_path + melody_name + '.csv'
-        single_song_df_data.to_csv(path_or_buf=csv_file_path, index=False, header=True)
-
     def export2mat(self):
         """
         This function exports the IDyOM output data to mat files.
         By default, it will export the outputs according to the preset keywords specified in the idyom_output_keywords for all melodies.
         Users can also specify specific melody by passing the melody names to the melody_name param.
+        With incremental, the files which are up to date are not written again, and an export done before
+        with the same keywords and melodies from the same output file is skipped without parsing it.
 
         :return (a) mat file(s) containing the selected IDyOM output data
 
@@ -137,47 +369,975 @@ class Export:
             pass
         export_folder_path = self._generate_export_folder(export_folder_name='outputs_in_mat')
         keywords = self.idyom_output_keywords
+        manifest = ExportManifest(export_folder_path) if self.incremental else None
+        export_options = {'export': 'mat', 'keywords': keywords, 'melody_names': self.melody_names}
+        if manifest is not None and manifest.is_export_up_to_date(self.dat_file_path, export_options):
+            print('** The mat files are up to date **')
+            return
 
         if keywords:
+            if isinstance(keywords, list):
+                self._selected_columns(self._outputs_df.columns.to_list())
             if self.melody_names:
+                self._check_melody_names(self._outputs_df['melody.name'].unique())
                 for index, melody in enumerate(self.melody_names):
                     self._export_values_of_keywords_by_melody_2mat(keywords_list=keywords, melody=melody,
-                                                                   output_path=export_folder_path)
+                                                                   output_path=export_folder_path, manifest=manifest)
 
             else:
-                melody_names = list(self.melodies_info_dict.keys())
-                self._export_by_keyword_2mat(keywords_list=keywords, selected_songs=melody_names,
-                                             output_path=export_folder_path)
+                self._export_by_keyword_2mat(keywords_list=keywords, selected_songs=None,
+                                             output_path=export_folder_path, manifest=manifest)
+            if manifest is not None:
+                manifest.save(self.dat_file_path, export_options)
 
-    def export2csv(self):
+    def export2csv(self, max_workers: int = 1, float_precision: int = None, melodies_per_task: int = 100,
+                   typed: bool = False):
         """
-        This function exports the IDyOM output data to a csv files.
-        By default, this will export all properties of the chosen melodies, where each melody is in one csv file.
+        This function exports the IDyOM output data to csv files, one csv file per melody.
+        By default, this will export all properties of the chosen melodies; with idyom_output_keywords, only the
+        melody.id, note.id and melody.name columns and the selected keywords are formatted and written.
+
+        By default, the values are written as in MelodyInfo: the numbers as floats (e.g., 1.0) and the other
+        values as in the IDyOM output file (e.g., NA, "chor-001"). With typed, the values are written from the
+        output table parsed by pandas, as ExperimentInfo.df has them: the integers without decimals,
+        the missing values (NA) as empty fields and the melody names without quotes.
+
+        The rows of several melodies are formatted at once and split into their files, in max_workers processes
+        with at most two tasks per process in flight; the rows of a task are copied only when it is submitted,
+        so that the memory stays bounded on large experiments.
+        With incremental, only the melodies of which the file is not up to date are formatted and written,
+        and an export done before with the same options from the same output file is skipped without parsing it.
+
+        :param max_workers: the number of processes writing the files, defaults to 1 (no process pool).
+        :type max_workers: int
 
-        :return a csv file containing all IDyOM output data for each selected melody.
+        :param float_precision: the number of decimal places the values are rounded to (with round) before they are
+            written with their shortest representation, e.g., 0.1 rather than 0.100; defaults to None (no rounding).
+        :type float_precision: int
+
+        :param melodies_per_task: the number of melodies formatted at once, defaults to 100.
+        :type melodies_per_task: int
+
+        :param typed: whether to write the values as parsed by pandas rather than as in MelodyInfo, defaults to False.
+        :type typed: bool
+
+        :return a csv file containing the selected IDyOM output data for each selected melody.
 
         """
-        # Check idyom_output_keyword is None:
-        if self.idyom_output_keywords is not None:
-            raise ValueError(f'The argument \'idyom_output_keywords\' should be empty. '
-                             f'The current version of py2lispIDyoM only supports exporting all IDyoM outputs of selected or all melodies.')
+        export_folder_path = self._generate_export_folder(export_folder_name='outputs_in_csv')
+        manifest = ExportManifest(export_folder_path) if self.incremental else None
+        export_options = {'export': 'csv', 'keywords': self.idyom_output_keywords, 'melody_names': self.melody_names,
+                          'float_precision': float_precision, 'typed': typed}
+        if manifest is not None and manifest.is_export_up_to_date(self.dat_file_path, export_options):
+            print('** The csv files are up to date **')
+            return
+        df = self._get_selected_outputs_df(None if typed else self._text_outputs_df)
 
+        melody_starts = np.flatnonzero(np.r_[True, df['melody.id'].values[1:] != df['melody.id'].values[:-1]]) \
+            if len(df) else np.array([], dtype=np.int64)
+        melody_ends = np.r_[melody_starts[1:], len(df)]
+        source_hashes = {}
+        if manifest is not None:
+            options = {'export': 'csv', 'columns': df.columns.to_list(), 'float_precision': float_precision,
+                       'typed': typed}
+            row_hashes = self._row_hashes(df)
+            stale_melodies = []
+            for start, end in zip(melody_starts, melody_ends):
+                file_name = str(df['melody.name'].values[start]).replace('"', '') + '.csv'
+                source_hashes[file_name] = _hash_source(row_hashes[start:end], options)
+                if not manifest.is_up_to_date(file_name, source_hashes[file_name]):
+                    stale_melodies.append((start, end))
+            if len(stale_melodies) < len(melody_starts):
+                print(f'** {len(melody_starts) - len(stale_melodies)} csv files are up to date **')
         else:
-            pass
+            stale_melodies = list(zip(melody_starts, melody_ends))
 
-        export_folder_path = self._generate_export_folder(export_folder_name='outputs_in_csv')
+        # the rows of a task are copied only when it is submitted, so that at most the tasks in flight are in memory
+        tasks = (pd.concat([df.iloc[start:end] for start, end in stale_melodies[i:i + melodies_per_task]])
+                 for i in range(0, len(stale_melodies), melodies_per_task))
+        checksums = {}
+        if max_workers == 1:
+            for task_df in tasks:
+                checksums.update(_write_melody_csv_files(task_df, export_folder_path, float_precision))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                in_flight = set()
+                for task_df in tasks:
+                    if len(in_flight) >= 2 * max_workers:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            checksums.update(future.result())
+                    in_flight.add(executor.submit(_write_melody_csv_files, task_df, export_folder_path, float_precision))
+                for future in in_flight:
+                    checksums.update(future.result())
 
-        if self.melody_names:
-            for index, melody in enumerate(self.melody_names):
-                single_song_df_data = self._get_single_melody_output_values_df(melody=melody)
-                self._export_by_song_2csv(melody_name=melody, single_song_df_data=single_song_df_data,
-                                          output_path=export_folder_path)
+        if manifest is not None:
+            for file_name, checksum in checksums.items():
+                manifest.record(file_name, source_hashes[file_name], options, checksum=checksum)
+            manifest.save(self.dat_file_path, export_options)
+        print('Exported data to ' + export_folder_path)
+
+    def export2parquet(self, compression: str = 'zstd', row_group_size: int = 65536,
+                       partition_by_melody: bool = False) -> str:
+        """
+        This function exports the IDyOM output data of the selected melodies and keywords (all of them by default)
+        to a Parquet file, which needs the pyarrow package.
+        The columns are compressed, melody.name is dictionary-encoded, and the row groups are split between melodies
+        only, so that readers (e.g., pandas, DuckDB, Spark) can skip the row groups of the other melodies
+        (from the statistics of melody.id and melody.name) and read only the columns they need.
+
+        :param compression: the compression codec of the columns ('zstd', 'snappy', 'gzip', 'brotli', 'lz4' or 'none'), defaults to 'zstd'.
+        :type compression: str
 
+        :param row_group_size: the number of rows from which a row group ends at the end of the next melody
+            (1 for one row group per melody), defaults to 65536.
+        :type row_group_size: int
+
+        :param partition_by_melody: whether to write a dataset with one folder per melody (melody.name=...)
+            instead of one file, defaults to False.
+        :type partition_by_melody: bool
+
+        :return: the path to the Parquet file (or dataset folder) in the outputs_in_parquet folder.
+        :rtype: str
+
+        :raises ImportError: if pyarrow is not installed.
+        """
+        df = self._get_selected_outputs_df().copy()
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as error:
+            raise ImportError('Exporting to Parquet requires the pyarrow package (pip install pyarrow).') from error
+
+        df['melody.name'] = df['melody.name'].astype('category')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        export_folder_path = self._generate_export_folder(export_folder_name='outputs_in_parquet')
+        if partition_by_melody:
+            output_path = export_folder_path + 'outputs/'
+            pq.write_to_dataset(table, root_path=output_path, partition_cols=['melody.name'], compression=compression,
+                                existing_data_behavior='delete_matching')
         else:
-            melody_names = list(self.melodies_info_dict.keys())
-            for index, melody in enumerate(melody_names):
-                single_song_df_data = self._get_single_melody_output_values_df(melody=melody)
-                self._export_by_song_2csv(melody_name=melody, single_song_df_data=single_song_df_data,
-                                          output_path=export_folder_path)
+            output_path = export_folder_path + 'outputs.parquet'
+            # the rows of a melody are contiguous in the output file of IDyOM
+            melody_starts = np.flatnonzero(np.r_[True, df['melody.id'].values[1:] != df['melody.id'].values[:-1]])
+            row_group_starts = [0]
+            for melody_start in melody_starts[1:]:
+                if melody_start - row_group_starts[-1] >= row_group_size:
+                    row_group_starts.append(melody_start)
+            row_group_starts.append(len(df))
+            with pq.ParquetWriter(output_path, table.schema, compression=compression,
+                                  use_dictionary=['melody.name']) as writer:
+                for start, end in zip(row_group_starts[:-1], row_group_starts[1:]):
+                    writer.write_table(table.slice(start, end - start), row_group_size=end - start)
+
+        print('Exported data to ' + output_path)
+        return output_path
+
+    def export2hdf5(self, store_path: str = None, append: bool = False, compression: str = 'gzip',
+                    chunk_size: int = 16384) -> str:
+        """
+        This function exports the IDyOM output data of the selected melodies and keywords (all of them by default)
+        to an HDF5 store, which needs the h5py package.
+        Each keyword is a chunked and compressed dataset with the values of all the notes one melody after the other,
+        and melody.offsets has the index of the first note of each melody (and the number of notes at the end),
+        so that a melody of a keyword is read without reading the rest of the store (see read_hdf5_outputs).
+        The melodies also have their melody.name, melody.id and the index of their experiment
+        in the experiments dataset (melody.experiment).
+
+        With append=True, the melodies are added at the end of an existing store without rewriting it,
+        skipping the melodies of this experiment which it has already (e.g., to add the melodies appended to
+        an experiment, or the experiments of a sweep, to the same store).
+
+        :param store_path: the path to the HDF5 file, defaults to outputs.h5 in the outputs_in_hdf5 folder of the experiment.
+        :type store_path: str
+
+        :param append: whether to add the melodies to the store if it exists instead of replacing it, defaults to False.
+        :type append: bool
+
+        :param compression: the compression filter of the datasets ('gzip', 'lzf' or None), defaults to 'gzip'.
+        :type compression: str
+
+        :param chunk_size: the number of values in each chunk of the datasets, defaults to 16384.
+        :type chunk_size: int
+
+        :return: the path to the HDF5 file.
+        :rtype: str
+
+        :raises ImportError: if h5py is not installed.
+        :raises ValueError: if the keywords are not the ones of the store it is appended to.
+        """
+        df = self._get_selected_outputs_df()
+        try:
+            import h5py
+        except ImportError as error:
+            raise ImportError('Exporting to HDF5 requires the h5py package (pip install h5py).') from error
+
+        if store_path is None:
+            store_path = self._generate_export_folder(export_folder_name='outputs_in_hdf5') + 'outputs.h5'
+        keywords = [keyword for keyword in df.columns if keyword not in ['melody.id', 'melody.name']]
+        experiment_folder_path = os.path.abspath(self.experiment_folder_path)
+        string_dtype = h5py.string_dtype()
+
+        with h5py.File(store_path, 'a' if append else 'w') as store:
+            if 'melody.offsets' not in store:
+                store.attrs['keywords'] = keywords
+                store.create_dataset('experiments', shape=(0,), maxshape=(None,), dtype=string_dtype)
+                store.create_dataset('melody.offsets', data=[0], maxshape=(None,), dtype=np.int64)
+                for name, dtype in [('melody.name', string_dtype), ('melody.id', np.int64), ('melody.experiment', np.int64)]:
+                    store.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype)
+                for keyword in keywords:
+                    dtype = string_dtype if df[keyword].dtype == object else df[keyword].dtype
+                    store.create_dataset(keyword, shape=(0,), maxshape=(None,), chunks=(chunk_size,),
+                                         compression=compression, dtype=dtype)
+            elif list(store.attrs['keywords']) != keywords:
+                raise ValueError(f'The keywords {keywords} are not the keywords of the store {store_path}: '
+                                 f'{list(store.attrs["keywords"])}')
+
+            experiments = list(store['experiments'].asstr()[:])
+            if experiment_folder_path not in experiments:
+                _append_to_hdf5_dataset(store['experiments'], [experiment_folder_path])
+                experiments.append(experiment_folder_path)
+            experiment_index = experiments.index(experiment_folder_path)
+            stored_melody_names = set(store['melody.name'].asstr()[:][store['melody.experiment'][:] == experiment_index])
+            df = df[~df['melody.name'].isin(stored_melody_names)]
+
+            melody_starts = np.flatnonzero(np.r_[True, df['melody.id'].values[1:] != df['melody.id'].values[:-1]]) \
+                if len(df) else np.array([], dtype=np.int64)
+            melody_lengths = np.diff(np.r_[melody_starts, len(df)])
+            _append_to_hdf5_dataset(store['melody.offsets'], store['melody.offsets'][-1] + np.cumsum(melody_lengths))
+            _append_to_hdf5_dataset(store['melody.name'], df['melody.name'].values[melody_starts].astype(str))
+            _append_to_hdf5_dataset(store['melody.id'], df['melody.id'].values[melody_starts])
+            _append_to_hdf5_dataset(store['melody.experiment'], np.full(len(melody_starts), experiment_index))
+            for keyword in keywords:
+                values = df[keyword].values
+                _append_to_hdf5_dataset(store[keyword], values.astype(str) if values.dtype == object else values)
+
+        print('Exported data to ' + store_path)
+        return store_path
+
+    def export2sqlite(self, db_path: str, indexed_keywords: List[str] = ('information.content', 'entropy'),
+                      batch_rows: int = 50000) -> str:
+        """
+        This function exports the IDyOM output data of the selected melodies and keywords (all of them by default)
+        to a SQLite database, to which the outputs of other experiments can be added, e.g., to query the notes of
+        all the experiments of a sweep at once. The database has three tables:
+
+        - experiments: experiment_id, experiment_folder_path, dat_file_name, models and k (from the run report or the
+          compute.lisp of the experiment, e.g., ':both+' and 'full'), the parameters of the run report (JSON)
+          and the time of the export,
+        - melodies: melody_key, experiment_id, melody_id, melody_name and n_notes,
+        - notes: melody_key, note_id and a column per keyword (e.g., "information.content"), a keyword missing from
+          the database is added as a new column.
+
+        The melodies are indexed by experiment and name, the notes by melody and note, and the indexed_keywords.
+        The melodies of this experiment which the database has already are skipped.
+
+        .. code-block:: sql
+
+            SELECT experiment_folder_path, melody_name, note_id, "information.content"
+            FROM notes JOIN melodies USING (melody_key) JOIN experiments USING (experiment_id)
+            WHERE "information.content" > 10 AND models = ':both+'
+
+        :param db_path: the path to the SQLite file, created if it does not exist.
+        :type db_path: str
+
+        :param indexed_keywords: the keywords indexed in the notes table (those which are exported),
+            defaults to information.content and entropy.
+        :type indexed_keywords: typing.List[str]
+
+        :param batch_rows: the number of notes inserted by each executemany, defaults to 50000.
+        :type batch_rows: int
+
+        :return: the path to the SQLite file.
+        :rtype: str
+
+        :raises ValueError: if neither the run report nor the compute.lisp of the experiment sets the models and k.
+        """
+        df = self._get_selected_outputs_df()
+        keywords = [keyword for keyword in df.columns if keyword not in ['melody.id', 'note.id', 'melody.name']]
+        experiment_folder_path = os.path.abspath(self.experiment_folder_path)
+        dat_file_name = os.path.basename(self.dat_file_path)
+        run_parameters = None
+        run_report_file_path = self.experiment_folder_path + RUN_REPORT_FILE_NAME
+        if os.path.exists(run_report_file_path):
+            with open(run_report_file_path, 'r') as f:
+                run_parameters = json.load(f).get('parameters')
+        models, k = _read_models_and_k(self.experiment_folder_path, run_parameters)
+        parameters = None if run_parameters is None else json.dumps(run_parameters, default=str)
+
+        connection = sqlite3.connect(db_path)
+        try:
+            with connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS experiments (experiment_id INTEGER PRIMARY KEY, '
+                                   'experiment_folder_path TEXT UNIQUE, dat_file_name TEXT, models TEXT, k TEXT, '
+                                   'parameters TEXT, exported TEXT)')
+                connection.execute('CREATE TABLE IF NOT EXISTS melodies (melody_key INTEGER PRIMARY KEY, '
+                                   'experiment_id INTEGER REFERENCES experiments, melody_id INTEGER, '
+                                   'melody_name TEXT, n_notes INTEGER)')
+                connection.execute('CREATE TABLE IF NOT EXISTS notes (melody_key INTEGER REFERENCES melodies, '
+                                   'note_id INTEGER)')
+                connection.execute('CREATE INDEX IF NOT EXISTS melodies_experiment_melody '
+                                   'ON melodies (experiment_id, melody_name)')
+                connection.execute('CREATE INDEX IF NOT EXISTS notes_melody_note ON notes (melody_key, note_id)')
+
+                note_columns = [row[1] for row in connection.execute('PRAGMA table_info(notes)')]
+                for keyword in keywords:
+                    if keyword not in note_columns:
+                        sql_type = 'TEXT' if df[keyword].dtype == object else \
+                            'INTEGER' if np.issubdtype(df[keyword].dtype, np.integer) else 'REAL'
+                        connection.execute(f'ALTER TABLE notes ADD COLUMN {_sql_name(keyword)} {sql_type}')
+                for keyword in indexed_keywords:
+                    if keyword in keywords:
+                        connection.execute(f'CREATE INDEX IF NOT EXISTS {_sql_name("notes_" + keyword)} '
+                                           f'ON notes ({_sql_name(keyword)})')
+
+                connection.execute('INSERT OR IGNORE INTO experiments (experiment_folder_path) VALUES (?)',
+                                   (experiment_folder_path,))
+                connection.execute('UPDATE experiments SET dat_file_name = ?, models = ?, k = ?, parameters = ?, '
+                                   'exported = ? WHERE experiment_folder_path = ?',
+                                   (dat_file_name, models, k, parameters,
+                                    datetime.datetime.now().isoformat(timespec='seconds'), experiment_folder_path))
+                experiment_id = connection.execute('SELECT experiment_id FROM experiments '
+                                                   'WHERE experiment_folder_path = ?', (experiment_folder_path,)).fetchone()[0]
+                stored_melody_names = {row[0] for row in connection.execute(
+                    'SELECT melody_name FROM melodies WHERE experiment_id = ?', (experiment_id,))}
+                df = df[~df['melody.name'].isin(stored_melody_names)]
+
+                melody_starts = np.flatnonzero(np.r_[True, df['melody.id'].values[1:] != df['melody.id'].values[:-1]]) \
+                    if len(df) else np.array([], dtype=np.int64)
+                melody_lengths = np.diff(np.r_[melody_starts, len(df)])
+                connection.executemany('INSERT INTO melodies (experiment_id, melody_id, melody_name, n_notes) '
+                                       'VALUES (?, ?, ?, ?)',
+                                       zip([experiment_id] * len(melody_starts),
+                                           df['melody.id'].values[melody_starts].tolist(),
+                                           [str(melody_name) for melody_name in df['melody.name'].values[melody_starts]],
+                                           melody_lengths.tolist()))
+                melody_keys = dict(connection.execute('SELECT melody_name, melody_key FROM melodies '
+                                                      'WHERE experiment_id = ?', (experiment_id,)).fetchall())
+
+                insert_columns = ', '.join(['melody_key', 'note_id'] + [_sql_name(keyword) for keyword in keywords])
+                insert = f'INSERT INTO notes ({insert_columns}) VALUES ({", ".join(["?"] * (len(keywords) + 2))})'
+                for start in range(0, len(df), batch_rows):
+                    batch_df = df.iloc[start:start + batch_rows]
+                    columns = [batch_df['melody.name'].map(melody_keys).tolist(), batch_df['note.id'].tolist()]
+                    # tolist converts the numpy values to python ones, and NaN is stored as NULL
+                    columns += [batch_df[keyword].tolist() for keyword in keywords]
+                    connection.executemany(insert, zip(*columns))
+        finally:
+            connection.close()
+
+        print('Exported data to ' + db_path)
+        return db_path
+
+    def export_streaming(self, file_format: Literal['csv', 'mat', 'parquet'] = 'csv', chunk_rows: int = 100000,
+                         float_precision: int = None, compression: str = 'zstd', typed: bool = False) -> str:
+        """
+        This function exports the IDyOM output data of the selected melodies and keywords (all of them by default)
+        while reading the output file in chunks of rows (see extract.iter_melody_blocks), writing each block of
+        whole melodies as soon as it is read, so that the memory used does not grow with the size of the experiment.
+        Only the selected columns are parsed, and the melodies are not built as MelodyInfo.
+
+        The files are written to the outputs_in_<file_format> folder of the experiment:
+        one csv file per melody (in the format of export2csv, with the same typed option), one mat file per melody
+        with a variable per keyword
+        (named as in export2mat, e.g., information_content), or one Parquet file (as export2parquet,
+        with a row group per block, which needs the pyarrow package).
+
+        :param file_format: 'csv', 'mat' or 'parquet', defaults to 'csv'.
+        :type file_format: str
+
+        :param chunk_rows: the number of rows read at once, defaults to 100000.
+        :type chunk_rows: int
+
+        :param float_precision: the number of decimal places of the values in the csv files, defaults to None (no rounding).
+        :type float_precision: int
+
+        :param compression: the compression codec of the Parquet file, defaults to 'zstd'.
+        :type compression: str
+
+        :param typed: whether to write the values of the csv files as parsed by pandas rather than as in MelodyInfo
+            (see export2csv), defaults to False.
+        :type typed: bool
+
+        :return: the path to the export folder (or to the Parquet file).
+        :rtype: str
+
+        :raises ValueError: if the file format is not supported.
+        :raises ImportError: if the file format is 'parquet' and pyarrow is not installed.
+        """
+        if file_format not in ['csv', 'mat', 'parquet']:
+            raise ValueError(f'Invalid file format \'{file_format}\'. Please use \'csv\', \'mat\' or \'parquet\'.')
+        with open(self.dat_file_path, 'r') as f:
+            columns = self._selected_columns(f.readline().split())
+        if file_format == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as error:
+                raise ImportError('Exporting to Parquet requires the pyarrow package (pip install pyarrow).') from error
+        if self.melody_names:  # checked from the melody.name column only, before anything is written
+            self._check_melody_names([melody.strip('"') for melody in get_melody_names(self.dat_file_path)])
+
+        export_folder_path = self._generate_export_folder(export_folder_name='outputs_in_' + file_format)
+        output_path = export_folder_path + 'outputs.parquet' if file_format == 'parquet' else export_folder_path
+        melody_names = set(self._unquoted_melody_names()) if self.melody_names else None
+        writer = None
+        # the csv files are written as by export2csv, from the values as in MelodyInfo unless typed
+        as_text = file_format == 'csv' and not typed
+        try:
+            for block_df in iter_melody_blocks(self.dat_file_path, columns=columns, chunk_rows=chunk_rows,
+                                               as_text=as_text):
+                if melody_names is not None:
+                    block_melody_names = block_df['melody.name'].str.strip('"') if as_text else block_df['melody.name']
+                    block_df = block_df[block_melody_names.isin(melody_names).values]
+                if not len(block_df):
+                    continue
+                if file_format == 'csv':
+                    _write_melody_csv_files(_melody_info_values(block_df.copy()) if as_text else block_df,
+                                            export_folder_path, float_precision)
+                elif file_format == 'mat':
+                    _write_melody_mat_files(block_df, export_folder_path)
+                else:
+                    block_df = block_df.astype({'melody.name': 'category'})
+                    table = pa.Table.from_pandas(block_df, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(output_path, table.schema, compression=compression,
+                                                  use_dictionary=['melody.name'])
+                    # the categories of melody.name differ from one block to the next
+                    writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+
+        print('Exported data to ' + output_path)
+        return output_path
+
+    def export2mat_file(self, layout: Literal['offsets', 'struct'] = 'offsets',
+                        mat_version: Literal['auto', '5', '7.3'] = 'auto', file_name: str = 'outputs.mat') -> str:
+        """
+        This function exports the IDyOM output data of the selected melodies and keywords (all of them by default)
+        to a single mat file, with the native numeric types of the outputs (e.g., int64 for cpitch, double for
+        information.content) instead of cell arrays.
+
+        With layout='offsets', the file has a column vector per keyword with the values of all the notes one melody after
+        the other (e.g., information_content), melody_offsets (the notes of melody i are
+        melody_offsets(i)+1:melody_offsets(i+1) in MATLAB), melody_names (a cell array) and melody_ids.
+        With layout='struct', the file has a struct array melodies, with a field per keyword and melody_name.
+        The variable names are the keywords with '.' replaced by '_' and '-' by 'm' (e.g., cpint_m2 for cpint.-2).
+
+        MAT files of version 5 cannot hold variables larger than 2 GB: with mat_version='auto', outputs with a keyword
+        larger than that are written to an HDF5-based version 7.3 file (which needs the h5py package and the offsets layout).
+        Keywords with non-numeric values (e.g., NIL) are written as cell arrays, as in version 5 files.
+
+        :param layout: 'offsets' or 'struct', defaults to 'offsets'.
+        :type layout: str
+
+        :param mat_version: '5', '7.3' or 'auto', defaults to 'auto'.
+        :type mat_version: str
+
+        :param file_name: the name of the mat file in the outputs_in_mat folder, defaults to 'outputs.mat'.
+        :type file_name: str
+
+        :return: the path to the mat file.
+        :rtype: str
+
+        :raises ValueError: if the layout or version is not supported, the struct layout is written to a version 7.3 file,
+            or a keyword has values which cannot be written to a version 7.3 file.
+        """
+        if layout not in ['offsets', 'struct']:
+            raise ValueError(f'Invalid layout \'{layout}\'. Please use \'offsets\' or \'struct\'.')
+        if mat_version not in ['auto', '5', '7.3']:
+            raise ValueError(f'Invalid mat_version \'{mat_version}\'. Please use \'5\', \'7.3\' or \'auto\'.')
+        df = self._get_selected_outputs_df()
+        keywords = [keyword for keyword in df.columns if keyword != 'melody.name']
+        if mat_version == 'auto':
+            # the limit of version 5 holds for each variable, i.e., for each keyword
+            mat_version = '7.3' if len(keywords) and \
+                df[keywords].memory_usage(index=False, deep=True).max() >= MAT_V5_MAX_BYTES else '5'
+        if mat_version == '7.3' and layout == 'struct':
+            raise ValueError('Version 7.3 mat files are written with the offsets layout only.')
+
+        melody_starts = np.flatnonzero(np.r_[True, df['melody.id'].values[1:] != df['melody.id'].values[:-1]]) \
+            if len(df) else np.array([], dtype=np.int64)
+        melody_ends = np.r_[melody_starts[1:], len(df)]
+        melody_names = [str(melody_name) for melody_name in df['melody.name'].values[melody_starts]]
+        output_path = self._generate_export_folder(export_folder_name='outputs_in_mat') + file_name
+        if layout == 'struct':
+            fields = ['melody_name'] + [_mat_variable_name(keyword) for keyword in keywords]
+            melodies = np.empty(len(melody_starts), dtype=[(field, object) for field in fields])
+            for index, (start, end) in enumerate(zip(melody_starts, melody_ends)):
+                melodies[index] = tuple([melody_names[index]] + [df[keyword].values[start:end, np.newaxis]
+                                                                 for keyword in keywords])
+            scipy.io.savemat(output_path, mdict={'melodies': melodies})
+        else:
+            variables = {_mat_variable_name(keyword): df[keyword].values for keyword in keywords}
+            variables['melody_offsets'] = np.r_[0, melody_ends].astype(np.int64)
+            variables['melody_ids'] = df['melody.id'].values[melody_starts]
+            variables['melody_names'] = melody_names
+            if mat_version == '5':
+                scipy.io.savemat(output_path, mdict={name: value[:, np.newaxis] if isinstance(value, np.ndarray)
+                                                     else np.array(value, dtype=object)[:, np.newaxis]
+                                                     for name, value in variables.items()})
+            else:
+                _savemat_v73(output_path, variables)
+
+        print('Exported data to ' + output_path)
+        return output_path
+
+    def export2npy(self, export_folder_name: str = 'outputs_in_npy') -> str:
+        """
+        This function exports the IDyOM output data of the selected melodies and keywords (all of them by default)
+        to .npy files holding contiguous arrays, to be memory-mapped by NpyOutputs (e.g., by the data loaders of
+        a machine learning model):
+
+        - a flat array per keyword with the values of all the notes one melody after the other
+          (e.g., information.content.npy), as fixed-width strings for the keywords with non-numeric values (e.g., NIL),
+        - a 2D array (notes x symbols) per predicted viewpoint with the elements of its distributions
+          (e.g., cpitch.distribution.npy for cpitch.60, cpitch.62, ...),
+        - melody_offsets.npy (the notes of melody i are melody_offsets[i]:melody_offsets[i + 1]),
+        - melody_names.json, and keywords.json with the keywords and the symbols of the distributions.
+
+        :param export_folder_name: the name of the folder in the experiment folder, defaults to 'outputs_in_npy'.
+        :type export_folder_name: str
+
+        :return: the path to the export folder.
+        :rtype: str
+        """
+        df = self._get_selected_outputs_df()
+        export_folder_path = self._generate_export_folder(export_folder_name=export_folder_name)
+
+        melody_starts = np.flatnonzero(np.r_[True, df['melody.id'].values[1:] != df['melody.id'].values[:-1]]) \
+            if len(df) else np.array([], dtype=np.int64)
+        np.save(export_folder_path + 'melody_offsets.npy', np.r_[melody_starts, len(df)].astype(np.int64))
+        with open(export_folder_path + 'melody_names.json', 'w') as f:
+            json.dump([str(melody_name) for melody_name in df['melody.name'].values[melody_starts]], f)
+
+        keywords = []
+        distributions = {}
+        for keyword in df.columns:
+            if keyword == 'melody.name':
+                continue
+            viewpoint, _, element = keyword.rpartition('.')
+            if viewpoint and element.lstrip('-').isdigit():
+                distributions.setdefault(viewpoint, []).append(keyword)
+            else:
+                keywords.append(keyword)
+                values = df[keyword].values
+                if values.dtype == object:  # e.g., NIL values, which could not be memory-mapped as python objects
+                    values = values.astype(str)
+                np.save(export_folder_path + keyword + '.npy', np.ascontiguousarray(values))
+        for viewpoint, distribution_keys in distributions.items():
+            np.save(export_folder_path + viewpoint + '.distribution.npy',
+                    np.ascontiguousarray(df[distribution_keys].to_numpy(dtype=np.float64)))
+        with open(export_folder_path + 'keywords.json', 'w') as f:
+            json.dump({'keywords': keywords,
+                       'distributions': {viewpoint: [int(key.rpartition('.')[2]) for key in distribution_keys]
+                                         for viewpoint, distribution_keys in distributions.items()}}, f)
+
+        print('Exported data to ' + export_folder_path)
+        return export_folder_path
+
+    def export_sparse(self, distribution_format: Literal['csr', 'topk'] = 'csr', threshold: float = 1e-4,
+                      top_k: int = 8, viewpoints: List[str] = None, pianorolls: bool = True,
+                      export_folder_name: str = 'outputs_sparse') -> str:
+        """
+        This function exports the predictive distributions of the selected melodies (all of them by default),
+        which are mostly near-zero probabilities for wide alphabets, in a sparse format, and the pianorolls
+        as a table of note intervals instead of arrays (notes x time steps):
+
+        - with distribution_format='csr', the probabilities of at least threshold of each predicted viewpoint as a
+          scipy.sparse CSR matrix (notes x symbols, e.g., cpitch.distribution.npz, read by scipy.sparse.load_npz),
+        - with distribution_format='topk', the top_k probabilities of each note and the indices of their symbols
+          (values and indices of e.g., cpitch.topk.npz),
+        - the symbols of the distributions (e.g., cpitch.alphabet.npy) and the probability mass of each note which is
+          not exported (e.g., cpitch.residual.npy),
+        - melody_offsets.npy (the notes of melody i are melody_offsets[i]:melody_offsets[i + 1]) and melody_names.json,
+        - with pianorolls, pianoroll_intervals.csv with the cpitch, onset and dur of each note, and its columns
+          pianoroll_start:pianoroll_end in the pianorolls of MelodyInfo (see pianoroll_from_intervals).
+
+        The distributions are read back by read_sparse_distribution.
+
+        :param distribution_format: 'csr' or 'topk', defaults to 'csr'.
+        :type distribution_format: str
+
+        :param threshold: the smallest probability in the CSR matrices, defaults to 1e-4.
+        :type threshold: float
+
+        :param top_k: the number of probabilities of each note with the 'topk' format, defaults to 8.
+        :type top_k: int
+
+        :param viewpoints: the predicted viewpoints of which the distributions are exported (e.g., ['cpitch']),
+            defaults to all of them.
+        :type viewpoints: typing.List[str]
+
+        :param pianorolls: whether to export the note intervals of the pianorolls, defaults to True.
+        :type pianorolls: bool
+
+        :param export_folder_name: the name of the folder in the experiment folder, defaults to 'outputs_sparse'.
+        :type export_folder_name: str
+
+        :return: the path to the export folder.
+        :rtype: str
+
+        :raises ValueError: if the format is not supported.
+        :raises KeyError: if a viewpoint has no distribution in the outputs (they are written with detail 3).
+        """
+        if distribution_format not in ['csr', 'topk']:
+            raise ValueError(f'Invalid distribution_format \'{distribution_format}\'. Please use \'csr\' or \'topk\'.')
+        df = self._get_selected_melodies_df()
+        distributions = {}
+        for keyword in df.columns:
+            viewpoint, _, element = keyword.rpartition('.')
+            if viewpoint and element.lstrip('-').isdigit():
+                distributions.setdefault(viewpoint, []).append(keyword)
+        for viewpoint in viewpoints or []:
+            if viewpoint not in distributions:
+                raise KeyError(f'Viewpoint \'{viewpoint}\' has no distribution in the outputs. '
+                               f'Valid viewpoints are: {list(distributions)}')
+        export_folder_path = self._generate_export_folder(export_folder_name=export_folder_name)
+
+        melody_starts = np.flatnonzero(np.r_[True, df['melody.id'].values[1:] != df['melody.id'].values[:-1]]) \
+            if len(df) else np.array([], dtype=np.int64)
+        np.save(export_folder_path + 'melody_offsets.npy', np.r_[melody_starts, len(df)].astype(np.int64))
+        with open(export_folder_path + 'melody_names.json', 'w') as f:
+            json.dump([str(melody_name) for melody_name in df['melody.name'].values[melody_starts]], f)
+
+        for viewpoint in viewpoints or list(distributions):
+            distribution_keys = distributions[viewpoint]
+            probabilities = df[distribution_keys].to_numpy(dtype=np.float64)
+            np.save(export_folder_path + viewpoint + '.alphabet.npy',
+                    np.array([int(key.rpartition('.')[2]) for key in distribution_keys]))
+            if distribution_format == 'csr':
+                probabilities[probabilities < threshold] = 0
+                matrix = scipy.sparse.csr_matrix(probabilities)
+                scipy.sparse.save_npz(export_folder_path + viewpoint + '.distribution.npz', matrix)
+                exported_mass = np.asarray(matrix.sum(axis=1)).ravel()
+            else:
+                k = min(top_k, len(distribution_keys))
+                indices = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+                values = np.take_along_axis(probabilities, indices, axis=1)
+                order = np.argsort(-values, axis=1, kind='stable')
+                indices = np.take_along_axis(indices, order, axis=1)
+                values = np.take_along_axis(values, order, axis=1)
+                np.savez_compressed(export_folder_path + viewpoint + '.topk.npz', values=values,
+                                    indices=indices.astype(np.min_scalar_type(len(distribution_keys))))
+                exported_mass = values.sum(axis=1)
+            np.save(export_folder_path + viewpoint + '.residual.npy', np.clip(1 - exported_mass, 0, None))
+
+        if pianorolls:
+            for keyword in ['cpitch', 'onset', 'dur']:
+                if keyword not in df.columns:
+                    raise KeyError(f'The pianorolls need the IDyOM output keyword \'{keyword}\'.')
+            intervals_df = df[['melody.name', 'note.id', 'cpitch', 'onset', 'dur']].reset_index(drop=True)
+            durations = intervals_df['dur'].to_numpy(dtype=np.int64)
+            # the pianorolls of MelodyInfo are the notes one after the other, each lasting its duration
+            melody_offsets = np.repeat(np.r_[0, np.cumsum(durations)][melody_starts],
+                                       np.diff(np.r_[melody_starts, len(df)]))
+            intervals_df['pianoroll_end'] = np.cumsum(durations) - melody_offsets
+            intervals_df['pianoroll_start'] = intervals_df['pianoroll_end'] - durations
+            intervals_df.to_csv(export_folder_path + 'pianoroll_intervals.csv', index=False)
 
         print('Exported data to ' + export_folder_path)
+        return export_folder_path
+
+
+def _read_models_and_k(experiment_folder_path: str, run_parameters: dict = None) -> tuple:
+    """
+    The models and k of an experiment, from the parameters of its run report or else from the idyom:idyom command
+    of its compute.lisp.
+
+    :return: the models (e.g., ':both+') and k (e.g., '10' or 'full').
+    :rtype: tuple
+
+    :raises ValueError: if neither the run report nor the compute.lisp sets the models and k.
+    """
+    parameters = {key: value for key, value in (run_parameters or {}).items() if value is not None}
+    lisp_file_path = experiment_folder_path + 'compute.lisp'
+    if not {'models', 'k'} <= parameters.keys() and os.path.exists(lisp_file_path):
+        with open(lisp_file_path, 'r') as f:
+            idyom_command = next((line for line in f if line.startswith('(idyom:idyom ')), '')
+        for key in ['models', 'k']:
+            match = re.search(f'\\s:{key} ([^\\s)]+)', idyom_command)
+            if match and key not in parameters:
+                parameters[key] = match.group(1)
+    missing_keys = [key for key in ['models', 'k'] if key not in parameters]
+    if missing_keys:
+        raise ValueError(f'The {" and ".join(missing_keys)} of the experiment {experiment_folder_path} '
+                         f'are set neither in its run report nor in its compute.lisp')
+    return parameters['models'], str(parameters['k']).strip(':')
+
+
+def _sql_name(name: str) -> str:
+    """Quote a keyword (e.g., information.content) to use it as the name of a column in SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _mat_variable_name(keyword: str) -> str:
+    return keyword.replace('.', '_').replace('-', 'm')
+
+
+def _savemat_v73(mat_file_path: str, variables: dict):
+    """
+    Write column vectors (numpy arrays) and cell arrays (lists or object arrays of strings and numbers)
+    to a version 7.3 mat file: an HDF5 file after a 512-byte header, with the dimensions of the arrays in reverse order
+    and their MATLAB class in attributes, and the elements of the cell arrays in the #refs# group.
+
+    :raises ValueError: if an array has a type which cannot be written to a mat file (e.g., datetime64).
+    """
+    try:
+        import h5py
+    except ImportError as error:
+        raise ImportError('Exporting to version 7.3 mat files requires the h5py package (pip install h5py).') from error
+
+    with h5py.File(mat_file_path, 'w', userblock_size=512) as f:
+        references = f.create_group('#refs#')
+        for name, value in variables.items():
+            if isinstance(value, np.ndarray) and value.dtype.name in MATLAB_CLASSES:
+                dataset = f.create_dataset(name, data=value[np.newaxis, :])
+                dataset.attrs['MATLAB_class'] = np.bytes_(MATLAB_CLASSES[value.dtype.name])
+            elif isinstance(value, np.ndarray) and value.dtype.kind not in 'OU':
+                raise ValueError(f'Cannot write {name} to a version 7.3 mat file: '
+                                 f'values of type {value.dtype.name} are not supported.')
+            else:
+                cells = np.empty((1, len(value)), dtype=h5py.ref_dtype)
+                for index, element in enumerate(value):
+                    if isinstance(element, str):
+                        cell = references.create_dataset(f'{name}_{index}',
+                                                         data=np.frombuffer(element.encode('utf-16-le'),
+                                                                            dtype=np.uint16)[:, np.newaxis])
+                        cell.attrs['MATLAB_class'] = np.bytes_('char')
+                        cell.attrs['MATLAB_int_decode'] = np.int32(2)
+                    elif isinstance(element, (bool, int, float, np.number, np.bool_)):
+                        cell = references.create_dataset(f'{name}_{index}', data=np.array([[element]], dtype=float))
+                        cell.attrs['MATLAB_class'] = np.bytes_('double')
+                    else:
+                        raise ValueError(f'Cannot write {name} to a version 7.3 mat file: '
+                                         f'values of type {type(element).__name__} are not supported.')
+                    cells[0, index] = cell.ref
+                dataset = f.create_dataset(name, data=cells)
+                dataset.attrs['MATLAB_class'] = np.bytes_('cell')
+
+    header = (f'MATLAB 7.3 MAT-file, Platform: {sys.platform}, '
+              f'Created on: {datetime.datetime.now():%a %b %d %H:%M:%S %Y} HDF5 schema 1.00 .').encode()
+    with open(mat_file_path, 'r+b') as f:
+        f.write(header.ljust(116) + b'\x00' * 8 + b'\x00\x02' + b'IM')
+
+
+def _write_melody_mat_files(df: pd.DataFrame, output_path: str):
+    """Write the rows of each melody of a DataFrame to the mat file named after the melody, with a variable per column."""
+    melody_starts = np.flatnonzero(np.r_[True, df['melody.id'].values[1:] != df['melody.id'].values[:-1]])
+    for start, end in zip(melody_starts, np.r_[melody_starts[1:], len(df)]):
+        melody_df = df.iloc[start:end]
+        melody_name = str(melody_df['melody.name'].values[0]).replace('"', '').replace('-', '')
+        mdict = {keyword.replace('.', '_').replace('-', ''): melody_df[keyword].values
+                 for keyword in melody_df.columns if keyword != 'melody.name'}
+        mdict['melody_name'] = str(melody_df['melody.name'].values[0])
+        scipy.io.savemat(output_path + melody_name + '.mat', mdict=mdict)
+
+
+def _melody_info_values(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the values of IDyOM outputs read as text as in MelodyInfo (see extract.to_float):
+    the numbers to floats, the other values (e.g., NA, the quoted melody names) kept as they are.
+    """
+    for column in df.columns:
+        values = pd.to_numeric(df[column], errors='coerce').astype(float)
+        is_number = values.notna() | df[column].str.lower().isin(['nan', '+nan', '-nan'])
+        df[column] = values if is_number.all() else df[column].astype(object).where(~is_number, values)
+    return df
+
+
+def _round_floats(values: pd.Series, decimals: int) -> pd.Series:
+    """Round the floats of a column, including those of a column mixing numbers and text (e.g., NA)."""
+    if values.dtype == object:
+        return values.map(lambda value: round(value, decimals) if isinstance(value, float) else value)
+    return values.round(decimals)
+
+
+def _write_melody_csv_files(df: pd.DataFrame, output_path: str, float_precision: int = None) -> dict:
+    """
+    Write the rows of each melody of a DataFrame to the csv file named after the melody,
+    formatting the rows of all the melodies in one call.
+
+    :return: the sha256 of each file written, by file name.
+    :rtype: dict
+    """
+    if float_precision is not None:
+        df = df.apply(functools.partial(_round_floats, decimals=float_precision))
+    # to_csv ends the lines with os.linesep
+    lines = df.to_csv(index=False, header=False).split(os.linesep)
+    header = ','.join(df.columns) + '\n'
+    melody_starts = np.flatnonzero(np.r_[True, df['melody.id'].values[1:] != df['melody.id'].values[:-1]])
+    checksums = {}
+    for start, end in zip(melody_starts, np.r_[melody_starts[1:], len(df)]):
+        file_name = str(df['melody.name'].values[start]).replace('"', '') + '.csv'
+        content = (header + ''.join(line + '\n' for line in lines[start:end])).encode()
+        with open(output_path + file_name, 'wb') as f:
+            f.write(content)
+        checksums[file_name] = hashlib.sha256(content).hexdigest()
+    return checksums
+
+
+def _append_to_hdf5_dataset(dataset, values):
+    """Append values to a resizable one-dimensional HDF5 dataset."""
+    values = np.asarray(values)
+    if len(values) == 0:
+        return
+    size = dataset.shape[0]
+    dataset.resize((size + len(values),))
+    dataset[size:] = values
+
+
+def read_hdf5_outputs(store_path: str, idyom_output_keywords: List[str] = None,
+                      melody_names: List[str] = None) -> pd.DataFrame:
+    """
+    Read the IDyOM outputs of an HDF5 store written by Export.export2hdf5, reading only the selected
+    keywords of the selected melodies from the file.
+
+    :param store_path: the path to the HDF5 file.
+    :type store_path: str
+
+    :param idyom_output_keywords: the keywords to read, defaults to all the keywords of the store.
+    :type idyom_output_keywords: typing.List[str]
+
+    :param melody_names: the names of the melodies to read (with or without quotes), defaults to all the melodies.
+    :type melody_names: list(str)
+
+    :return: a dataframe with the experiment folder path, melody.id and melody.name of the notes, and the keywords.
+    :rtype: pd.DataFrame
+
+    :raises KeyError: if a keyword is not in the store.
+    """
+    import h5py
+
+    with h5py.File(store_path, 'r') as store:
+        valid_keys = list(store.attrs['keywords'])
+        keywords = valid_keys if idyom_output_keywords is None else idyom_output_keywords
+        for keyword in keywords:
+            if keyword not in valid_keys:
+                raise KeyError(f'IDyOM output keyword \'{keyword}\' is invalid. Valid IDyOM output keys are: {valid_keys}')
+        offsets = store['melody.offsets'][:]
+        stored_melody_names = store['melody.name'].asstr()[:]
+        if melody_names is None:
+            melody_indices = np.arange(len(stored_melody_names))
+        else:
+            melody_indices = np.flatnonzero(np.isin(stored_melody_names, [melody.strip('"') for melody in melody_names]))
+        melody_lengths = offsets[melody_indices + 1] - offsets[melody_indices]
+        data = {
+            'experiment': np.repeat(store['experiments'].asstr()[:][store['melody.experiment'][:][melody_indices]],
+                                    melody_lengths),
+            'melody.id': np.repeat(store['melody.id'][:][melody_indices], melody_lengths),
+            'melody.name': np.repeat(stored_melody_names[melody_indices], melody_lengths),
+        }
+        # the consecutive melodies are read in one slice
+        run_starts = np.flatnonzero(np.r_[True, np.diff(melody_indices) != 1]) if len(melody_indices) else []
+        runs = [(offsets[melody_indices[start]], offsets[melody_indices[end - 1] + 1])
+                for start, end in zip(run_starts, np.r_[run_starts[1:], len(melody_indices)])]
+        for keyword in keywords:
+            dataset = store[keyword]
+            if h5py.check_string_dtype(dataset.dtype) is not None:
+                dataset = dataset.asstr()
+            data[keyword] = np.concatenate([dataset[start:end] for start, end in runs]) if runs else []
+    return pd.DataFrame(data)
+
+
+@dataclass
+class NpyOutputs:
+    """
+    The IDyOM outputs written by Export.export2npy, memory-mapped: the arrays are read from the files when they are
+    accessed, and the outputs of a melody are views of them (no copy), so that opening even a large export is
+    immediate.
+
+    :param export_folder_path: the path to the folder written by Export.export2npy.
+    :type export_folder_path: str
+
+    :param idyom_output_keywords: the keywords and distributions (e.g., 'cpitch.distribution') to open,
+        defaults to all of them.
+    :type idyom_output_keywords: typing.List[str]
+
+    :raises KeyError: if a keyword is not in the export.
+    """
+
+    export_folder_path: str
+    idyom_output_keywords: List[str] = None
+
+    def __post_init__(self):
+        if not self.export_folder_path.endswith('/'):
+            self.export_folder_path += '/'
+        with open(self.export_folder_path + 'keywords.json', 'r') as f:
+            index = json.load(f)
+        with open(self.export_folder_path + 'melody_names.json', 'r') as f:
+            self.melody_names = json.load(f)
+        self.melody_offsets = np.load(self.export_folder_path + 'melody_offsets.npy')
+        self.alphabets = {viewpoint: np.array(symbols) for viewpoint, symbols in index['distributions'].items()}
+        valid_keys = index['keywords'] + [viewpoint + '.distribution' for viewpoint in index['distributions']]
+        keywords = valid_keys if self.idyom_output_keywords is None else self.idyom_output_keywords
+        for keyword in keywords:
+            if keyword not in valid_keys:
+                raise KeyError(f'IDyOM output keyword \'{keyword}\' is invalid. Valid IDyOM output keys are: {valid_keys}')
+        self.arrays = {keyword: np.load(self.export_folder_path + keyword + '.npy', mmap_mode='r')
+                       for keyword in keywords}
+        self._melody_indices = {melody_name: index for index, melody_name in enumerate(self.melody_names)}
+
+    def __len__(self) -> int:
+        return len(self.melody_names)
+
+    def __getitem__(self, melody) -> dict:
+        """
+        Get the outputs of a melody, by index or by name (with or without quotes).
+
+        :return: the views of the arrays for the notes of the melody, by keyword.
+        :rtype: dict
+        """
+        index = self._melody_indices[melody.strip('"')] if isinstance(melody, str) else range(len(self))[melody]
+        start, end = self.melody_offsets[index], self.melody_offsets[index + 1]
+        return {keyword: array[start:end] for keyword, array in self.arrays.items()}
+
+
+def read_sparse_distribution(export_folder_path: str, viewpoint: str) -> tuple:
+    """
+    Read the distributions of a predicted viewpoint written by Export.export_sparse, in either format.
+
+    :param export_folder_path: the path to the folder written by Export.export_sparse.
+    :type export_folder_path: str
+
+    :param viewpoint: the predicted viewpoint (e.g., 'cpitch').
+    :type viewpoint: str
+
+    :return: the probabilities (a CSR matrix, notes x symbols), the symbols, and the probability mass of each note
+        which is not in the matrix.
+    :rtype: (scipy.sparse.csr_matrix, np.ndarray, np.ndarray)
+    """
+    if not export_folder_path.endswith('/'):
+        export_folder_path += '/'
+    alphabet = np.load(export_folder_path + viewpoint + '.alphabet.npy')
+    residual = np.load(export_folder_path + viewpoint + '.residual.npy')
+    if os.path.exists(export_folder_path + viewpoint + '.distribution.npz'):
+        matrix = scipy.sparse.load_npz(export_folder_path + viewpoint + '.distribution.npz').tocsr()
+    else:
+        with np.load(export_folder_path + viewpoint + '.topk.npz') as topk:
+            values, indices = topk['values'], topk['indices'].astype(np.int64)
+        n_notes, k = values.shape
+        matrix = scipy.sparse.csr_matrix((values.ravel(), indices.ravel(), np.arange(0, n_notes * k + 1, k)),
+                                         shape=(n_notes, len(alphabet)))
+    return matrix, alphabet, residual
+
+
+def pianoroll_from_intervals(intervals_df: pd.DataFrame, pitch_range: tuple) -> np.ndarray:
+    """
+    Get the pianoroll (pitches x time steps) of a melody from its rows of the pianoroll_intervals.csv file
+    written by Export.export_sparse, as the pianoroll of MelodyInfo.
+
+    :param intervals_df: the note intervals of the melody.
+    :type intervals_df: pd.DataFrame
+
+    :param pitch_range: the lowest and highest (excluded) pitches of the pianoroll.
+    :type pitch_range: tuple
+
+    :rtype: np.ndarray
+    """
+    pitches = np.arange(*pitch_range)
+    piano_roll = np.zeros((len(pitches), intervals_df['pianoroll_end'].max() if len(intervals_df) else 0), dtype=bool)
+    for cpitch, start, end in intervals_df[['cpitch', 'pianoroll_start', 'pianoroll_end']].itertuples(index=False):
+        piano_roll[pitches == cpitch, start:end] = True
+    return piano_roll
@@ -1,3 +1,4 @@
+import csv
 import typing
 from dataclasses import dataclass
 from glob import glob
@@ -5,6 +6,8 @@ from glob import glob
 import numpy as np
 import pandas as pd
 
+from py2lispIDyOM.viewpoints import derive_viewpoints
+
 
 def to_float(f):
     try:
@@ -13,20 +16,30 @@ def to_float(f):
         return f
 
 
-def get_dictionary(file: str) -> dict:
+def get_dictionary(file: str, melody_names: typing.List[str] = None) -> dict:
     """
     Read the file line by line, split each line into n fields, then create the dictionary:
     :param: file
+    :param: melody_names: the names (with quotes) of the melodies to read, defaults to all of them
     :return: dict
     """
 
-    dict = {}
     # f = open(file, "r")
     with open(file, 'r') as f:
         lines = f.readlines()
+    return _get_dictionary_of_lines(lines, melody_names=melody_names)
+
+
+def _get_dictionary_of_lines(lines: typing.List[str], melody_names: typing.List[str] = None) -> dict:
+    # the lines of an IDyOM output file, starting with its header
+    dict = {}
     keys = lines[0].split()
+    melody_name_index = keys.index('melody.name') if melody_names is not None else None
+    melody_names = set(melody_names) if melody_names is not None else None
     for i in range(1, len(lines)):
         fields = lines[i].split()
+        if melody_names is not None and fields[melody_name_index] not in melody_names:
+            continue
 
         if fields[1] not in dict:
             dict[fields[1]] = {}  # create dict for each melody
@@ -54,6 +67,219 @@ def getDataFrame(file: str) -> pd.DataFrame:
     return df
 
 
+def get_melody_names(dat_file_path: str) -> typing.List[str]:
+    """
+    Get the names of the melodies of an IDyOM output file in their order, with quotes as the keys of
+    ExperimentInfo.melodies_dict, reading only the melody.name column.
+
+    :rtype: typing.List[str]
+    """
+    melody_names = pd.read_csv(dat_file_path, sep=r'\s+', usecols=['melody.name'], quoting=csv.QUOTE_NONE)
+    return list(melody_names['melody.name'].unique())
+
+
+def index_melody_byte_ranges(dat_file_path: str) -> typing.Dict[str, typing.Tuple[int, int]]:
+    """
+    Get the byte range of the lines of each melody of an IDyOM output file (which writes the melodies one after
+    the other), by name with quotes and in their order, reading the file once and splitting each line
+    only up to the melody.name field, so that the lines of some melodies can then be read without the others.
+
+    :rtype: typed dict -> {melody_name: (start, end)}
+    """
+    byte_ranges = {}
+    with open(dat_file_path, 'rb') as f:
+        header = f.readline()
+        melody_name_index = header.split().index(b'melody.name')
+        position = len(header)
+        melody_name, start = None, position
+        for line in f:
+            fields = line.split(None, melody_name_index + 1)
+            if len(fields) > melody_name_index and fields[melody_name_index].decode() != melody_name:
+                if melody_name is not None:
+                    byte_ranges[melody_name] = (start, position)
+                melody_name, start = fields[melody_name_index].decode(), position
+            position += len(line)
+        if melody_name is not None:
+            byte_ranges[melody_name] = (start, position)
+    return byte_ranges
+
+
+def load_melodies(experiment_folder_path: str, melody_names: typing.List[str],
+                  byte_ranges: typing.Dict[str, typing.Tuple[int, int]] = None) -> typing.Dict[str, 'MelodyInfo']:
+    """
+    Get the MelodyInfo of some melodies of an experiment, without building the others (e.g., to share the melodies
+    of a large experiment between processes). Their parent_experiment is None.
+
+    :param experiment_folder_path: the path to the experiment folder.
+    :type experiment_folder_path: str
+
+    :param melody_names: the names of the melodies, with quotes (e.g., '"chor-001"').
+    :type melody_names: typing.List[str]
+
+    :param byte_ranges: the byte ranges of the melodies in the IDyOM output file (see index_melody_byte_ranges),
+        to read only their lines, defaults to None (the whole file is read).
+    :type byte_ranges: typed dict -> {melody_name: (start, end)}
+
+    :rtype: typed dict -> {melody_name: MelodyInfo}
+    """
+    dat_file_path = get_dat_file_path(experiment_folder_path)
+    if byte_ranges is None:
+        with open(dat_file_path, 'r') as f:
+            header = f.readline()
+        melodies_dict = get_dictionary(dat_file_path, melody_names=melody_names)
+    else:
+        with open(dat_file_path, 'rb') as f:
+            header = f.readline().decode()
+            lines = [header]
+            for melody_name in melody_names:
+                start, end = byte_ranges[melody_name]
+                f.seek(start)
+                lines.extend(f.read(end - start).decode().splitlines(keepends=True))
+        melodies_dict = _get_dictionary_of_lines(lines)
+    exp_pitch_element_list = get_cpitch_elements(header.split())
+    melodies = {}
+    for value in melodies_dict.values():
+        melody_info = MelodyInfo(data=value, parent_experiment=None, exp_pitch_element_list=exp_pitch_element_list)
+        melodies[melody_info['melody.name'][0]] = melody_info
+    return melodies
+
+
+def get_cpitch_elements(keys: typing.List[str]) -> np.ndarray:
+    """
+    Get the cpitch elements of the distributions of an IDyOM output file from its keys (e.g., 'cpitch.60').
+
+    :rtype: np.ndarray
+    """
+    cpitch_keys = [keyword for keyword in keys if 'cpitch' in keyword]
+    cpitch_num_keys = [item for item in cpitch_keys if any([char.isdigit() for char in item])]
+    pitch_element_list = [item.replace('cpitch.', '') for item in cpitch_num_keys]
+    return np.int_(pitch_element_list)
+
+
+def get_dat_file_path(experiment_folder_path: str) -> str:
+    """
+    Get the path to the IDyOM output (.dat) file of an experiment.
+
+    :param experiment_folder_path: the path to the experiment folder.
+    :type experiment_folder_path: str
+
+    :rtype: str
+
+    :raises FileNotFoundError: if the experiment has no output file.
+    """
+    dat_file_paths = sorted(glob(experiment_folder_path + 'experiment_output_data_folder/*.dat'))
+    if not dat_file_paths:
+        raise FileNotFoundError(f'No output file in {experiment_folder_path}experiment_output_data_folder/')
+    return dat_file_paths[0]
+
+
+def iter_melody_blocks(dat_file_path: str, columns: typing.List[str] = None,
+                       chunk_rows: int = 100000, as_text: bool = False) -> typing.Iterator[pd.DataFrame]:
+    """
+    Read an IDyOM output file in chunks of rows, and yield the rows of the whole melodies of each chunk
+    (a melody split between two chunks is yielded with the next one), so that the memory used does not grow
+    with the size of the file.
+
+    :param dat_file_path: the path to the IDyOM output (.dat) file.
+    :type dat_file_path: str
+
+    :param columns: the columns to read, which must include melody.id, defaults to all the columns.
+    :type columns: typing.List[str]
+
+    :param chunk_rows: the number of rows read at once, defaults to 100000.
+    :type chunk_rows: int
+
+    :param as_text: whether to read the values as they are written in the file (e.g., NA, the quoted melody names)
+        instead of parsing them, defaults to False.
+    :type as_text: bool
+
+    :return: an iterator of DataFrames, each holding the rows of one or more whole melodies.
+    :rtype: typing.Iterator[pd.DataFrame]
+    """
+
+    text_options = dict(dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE) if as_text else {}
+    pending = None
+    for chunk in pd.read_csv(dat_file_path, sep=r'\s+', usecols=columns, chunksize=chunk_rows, **text_options):
+        if columns is not None:
+            chunk = chunk[columns]
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        melody_ids = chunk['melody.id'].values
+        last_melody_start = np.flatnonzero(np.r_[True, melody_ids[1:] != melody_ids[:-1]])[-1]
+        if last_melody_start > 0:
+            yield chunk.iloc[:last_melody_start]
+        pending = chunk.iloc[last_melody_start:]
+    if pending is not None and len(pending):
+        yield pending
+
+
+def get_summary_metrics(dat_file_path: str) -> dict:
+    """
+    Summarize an IDyOM output file: the number of melodies and notes, and the mean of every
+    information content and entropy output (e.g., 'information.content', 'cpitch.entropy') across all notes.
+
+    :param dat_file_path: the path to the IDyOM output (.dat) file.
+    :type dat_file_path: str
+
+    :return: a dictionary of summary metrics.
+    :rtype: dict
+    """
+
+    df = getDataFrame(dat_file_path)
+    summary_metrics = {'n_melodies': int(df['melody.id'].nunique()) if 'melody.id' in df else None,
+                       'n_notes': len(df)}
+    for keyword in df.keys():
+        if keyword.endswith('information.content') or keyword.endswith('entropy'):
+            summary_metrics['mean.' + keyword] = float(pd.to_numeric(df[keyword], errors='coerce').mean())
+    return summary_metrics
+
+
+def merge_dat_files(dat_file_paths: typing.List[str], output_file_path: str):
+    """
+    Merge IDyOM output files holding different melodies of the same experiment (e.g., one file per cross-validation fold)
+    into one output file, with the rows sorted by melody and note IDs as IDyOM writes them.
+
+    Distribution columns missing from some files (e.g., a pitch never predicted in one fold) are filled with 0,
+    other missing values with NA.
+
+    :param dat_file_paths: the paths to the IDyOM output files to merge.
+    :type dat_file_paths: typing.List[str]
+
+    :param output_file_path: the path to the merged output file.
+    :type output_file_path: str
+    """
+
+    headers = []
+    rows = []
+    for dat_file_path in dat_file_paths:
+        with open(dat_file_path, 'r') as f:
+            headers.append(f.readline().split())
+            rows.extend(line if line.endswith('\n') else line + '\n' for line in f if line.strip())
+
+    header = headers[0]
+    sort_keys = [key for key in ['melody.id', 'note.id'] if key in header]
+    if all(other_header == header for other_header in headers):
+        key_indices = [header.index(key) for key in sort_keys]
+        rows.sort(key=lambda line: [int(float(line.split(maxsplit=max(key_indices) + 1)[i])) for i in key_indices])
+        with open(output_file_path, 'w') as f:
+            f.write(' '.join(header) + '\n')
+            f.writelines(rows)
+    else:
+        merged_header = []
+        for other_header in headers:
+            for position, key in enumerate(other_header):
+                if key not in merged_header:
+                    previous_keys = [k for k in other_header[:position] if k in merged_header]
+                    index = merged_header.index(previous_keys[-1]) + 1 if previous_keys else 0
+                    merged_header.insert(index, key)
+        dfs = [pd.read_csv(dat_file_path, sep=r'\s+', quoting=csv.QUOTE_NONE) for dat_file_path in dat_file_paths]
+        df = pd.concat(dfs, ignore_index=True, sort=False)[merged_header]
+        distribution_keys = [key for key in merged_header if key.rsplit('.', 1)[-1].lstrip('-').isdigit()]
+        df[distribution_keys] = df[distribution_keys].fillna(0)
+        df = df.sort_values(sort_keys, kind='stable')
+        df.to_csv(output_file_path, sep=' ', index=False, na_rep='NA', quoting=csv.QUOTE_NONE)
+
+
 class MelodyInfo(pd.DataFrame):
     """
     A melody object (pd.DataFrame) that contains all data in a single melody inherit from the parent Experiment.
@@ -204,7 +430,7 @@ class ExperimentInfo:
     experiment_folder_path: str
 
     def __post_init__(self):
-        self.dat_file_path = sorted(glob(self.experiment_folder_path + 'experiment_output_data_folder/*'))[0]
+        self.dat_file_path = get_dat_file_path(self.experiment_folder_path)
         self.df = pd.read_table(self.dat_file_path, delim_whitespace=True)
         self.exp_pitch_element_list = self._get_datasetwise_cpitch_elements()
         self.melodies_dict = self.melody_dictionary()
@@ -257,6 +483,22 @@ class ExperimentInfo:
 
         return selected_melodies
 
+    def get_derived_viewpoints(self, viewpoints: typing.List[str]) -> pd.DataFrame:
+        """
+        Compute derived viewpoints (e.g., cpint, contour, ioi, posinbar) for all the notes of the experiment,
+        from the basic viewpoints in its output file (cpitch, onset, bioi, dur, keysig, barlength, ...),
+        instead of running IDyOM again with the derived viewpoints printed.
+
+        :param viewpoints: the viewpoints to compute (see configuration.SingleViewpoint).
+        :type viewpoints: list(str)
+
+        :return: a dataframe with the melody.id, note.id and melody.name of the notes, and a column for each viewpoint
+            (NaN where the viewpoint is undefined, e.g., cpint for the first note of a melody).
+        :rtype: pd.DataFrame
+        """
+
+        return pd.concat([self.df[['melody.id', 'note.id', 'melody.name']], derive_viewpoints(self.df, viewpoints)], axis=1)
+
     def _get_datasetwise_cpitch_elements(self):
         """
         Get the list of cpitch (full cpitch distribution elements used in IDyOM)
@@ -265,10 +507,4 @@ class ExperimentInfo:
         """
         # find the cpitches in idyom output keys such as 'cpitch.
 
-        df_all_keys = self.df.keys().to_list()
-        cpitch_keys = [keyword for keyword in df_all_keys if 'cpitch' in keyword]
-        cpitch_num_keys = [item for item in cpitch_keys if any([char.isdigit() for char in item])]
-        pitch_element_list = [item.replace('cpitch.', '') for item in cpitch_num_keys]
-        pitch_element_list = np.int_(pitch_element_list)
-
-        return pitch_element_list
+        return get_cpitch_elements(self.df.keys().to_list())
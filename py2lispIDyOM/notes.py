@@ -0,0 +1,205 @@
+"""
+This module implements minimal readers of the melodies of MIDI and kern files, without any dependency,
+with the times in IDyOM basic time units (a quarter note is 24 units, the first note starts at 0) and the attributes
+IDyOM uses (tempo in microseconds per quarter note, bar length, pulses, key signature and mode).
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+TIME_UNITS_PER_QUARTER = 24
+PITCH_CLASSES = {'c': 0, 'd': 2, 'e': 4, 'f': 5, 'g': 7, 'a': 9, 'b': 11}
+
+
+@dataclass
+class Note:
+    onset: int
+    dur: int
+    cpitch: int
+
+
+@dataclass
+class Melody:
+    """
+    The notes of a melody file and its attributes (None if the file does not specify them).
+    """
+
+    name: str
+    notes: List[Note] = field(default_factory=list)
+    tempo: int = None
+    barlength: int = None
+    pulses: int = None
+    keysig: int = None
+    mode: int = None
+
+
+def _read_variable_length_quantity(data: bytes, position: int):
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, position
+
+
+def _start_at_zero(melody: Melody) -> Melody:
+    if melody.notes:
+        first_onset = melody.notes[0].onset
+        for note in melody.notes:
+            note.onset -= first_onset
+    return melody
+
+
+def read_midi_melody(midi_file_path: str) -> Melody:
+    """
+    Read the notes of a standard MIDI file, keeping the highest note of notes starting at the same time
+    (IDyOM models monophonic melodies).
+
+    :rtype: Melody
+    """
+    with open(midi_file_path, 'rb') as f:
+        data = f.read()
+    melody = Melody(name=os.path.splitext(os.path.basename(midi_file_path))[0])
+    ticks_per_quarter = 96
+    notes = []
+    position = 0
+    while position + 8 <= len(data):
+        chunk_type = data[position:position + 4]
+        chunk_length = int.from_bytes(data[position + 4:position + 8], 'big')
+        position += 8
+        if chunk_type == b'MThd':
+            division = int.from_bytes(data[position + 4:position + 6], 'big')
+            if not division & 0x8000:  # otherwise SMPTE time, kept at the default
+                ticks_per_quarter = division
+        elif chunk_type == b'MTrk':
+            track_end = position + chunk_length
+            track_position = position
+            tick = 0
+            running_status = None
+            sounding_notes = {}  # (channel, pitch) -> start tick
+            while track_position < track_end:
+                delta_time, track_position = _read_variable_length_quantity(data, track_position)
+                tick += delta_time
+                status = data[track_position]
+                if status & 0x80:
+                    track_position += 1
+                else:  # running status: the status byte of the previous event is omitted
+                    status = running_status
+                if status == 0xFF:  # meta event
+                    meta_type = data[track_position]
+                    length, track_position = _read_variable_length_quantity(data, track_position + 1)
+                    meta_data = data[track_position:track_position + length]
+                    if meta_type == 0x51 and melody.tempo is None:
+                        melody.tempo = int.from_bytes(meta_data, 'big')
+                    elif meta_type == 0x58 and melody.barlength is None:
+                        melody.pulses = meta_data[0]
+                        melody.barlength = meta_data[0] * 4 * TIME_UNITS_PER_QUARTER // 2 ** meta_data[1]
+                    elif meta_type == 0x59 and melody.keysig is None:
+                        melody.keysig = int.from_bytes(meta_data[:1], 'big', signed=True)
+                        melody.mode = 9 if meta_data[1] else 0
+                    track_position += length
+                elif status in (0xF0, 0xF7):  # system exclusive event
+                    length, track_position = _read_variable_length_quantity(data, track_position)
+                    track_position += length
+                else:
+                    running_status = status
+                    event_type, channel = status & 0xF0, status & 0x0F
+                    if event_type in (0x80, 0x90):
+                        pitch, velocity = data[track_position], data[track_position + 1]
+                        if event_type == 0x90 and velocity > 0:
+                            sounding_notes.setdefault((channel, pitch), tick)
+                        elif (channel, pitch) in sounding_notes:
+                            start_tick = sounding_notes.pop((channel, pitch))
+                            notes.append((start_tick, tick, pitch))
+                    track_position += 1 if event_type in (0xC0, 0xD0) else 2
+        position += chunk_length
+
+    def _to_time_units(ticks):
+        return round(ticks * TIME_UNITS_PER_QUARTER / ticks_per_quarter)
+
+    previous_onset = None
+    for start_tick, end_tick, pitch in sorted(notes, key=lambda note: (note[0], -note[2])):
+        onset = _to_time_units(start_tick)
+        if onset == previous_onset:
+            continue
+        melody.notes.append(Note(onset=onset, dur=max(_to_time_units(end_tick) - onset, 1), cpitch=pitch))
+        previous_onset = onset
+    return _start_at_zero(melody)
+
+
+def _kern_pitch(token: str) -> int:
+    letters = re.search('[a-gA-G]+', token).group()
+    octave = 4 + len(letters) - 1 if letters[0].islower() else 3 - (len(letters) - 1)
+    return 12 * (octave + 1) + PITCH_CLASSES[letters[0].lower()] + token.count('#') - token.count('-')
+
+
+def _kern_duration(token: str) -> int:
+    match = re.search('([0-9]+)(\\.*)', token)
+    if match is None:  # grace note
+        return 0
+    whole_note = 4 * TIME_UNITS_PER_QUARTER
+    duration = whole_note / int(match.group(1)) if int(match.group(1)) else 2 * whole_note  # 0 is a breve
+    return round(duration * (2 - 0.5 ** len(match.group(2))))
+
+
+def read_kern_melody(kern_file_path: str) -> Melody:
+    """
+    Read the notes of the first **kern spine of a humdrum file, merging tied notes.
+
+    :rtype: Melody
+    """
+    melody = Melody(name=os.path.splitext(os.path.basename(kern_file_path))[0])
+    kern_spine = None
+    onset = 0
+    with open(kern_file_path, 'r', errors='replace') as f:
+        for line in f:
+            tokens = line.rstrip('\n').split('\t')
+            if line.startswith('**'):
+                kern_spine = tokens.index('**kern') if '**kern' in tokens else None
+                continue
+            if kern_spine is None or kern_spine >= len(tokens) or line.startswith(('!', '=')) or not line.strip():
+                continue
+            token = tokens[kern_spine].split(' ')[0]
+            if line.startswith('*'):
+                if re.fullmatch('\\*M[0-9]+/[0-9]+', token) and melody.barlength is None:
+                    numerator, denominator = map(int, token[2:].split('/'))
+                    melody.pulses = numerator
+                    melody.barlength = numerator * 4 * TIME_UNITS_PER_QUARTER // denominator
+                elif re.fullmatch('\\*MM[0-9.]+', token) and melody.tempo is None:
+                    melody.tempo = round(60000000 / float(token[3:]))
+                elif re.fullmatch('\\*k\\[.*\\]', token) and melody.keysig is None:
+                    melody.keysig = token.count('#') - token.count('-')
+                elif re.fullmatch('\\*[a-gA-G][#-]?:', token) and melody.mode is None:
+                    melody.mode = 9 if token[1].islower() else 0
+                continue
+            if token == '.':
+                continue
+            duration = _kern_duration(token)
+            if 'r' in token or 'q' in token:
+                onset += duration
+            elif ('_' in token or ']' in token) and melody.notes:  # continuation of a tied note
+                melody.notes[-1].dur += duration
+                onset += duration
+            elif re.search('[a-gA-G]', token):
+                melody.notes.append(Note(onset=onset, dur=duration, cpitch=_kern_pitch(token)))
+                onset += duration
+    return _start_at_zero(melody)
+
+
+def read_melody(file_path: str) -> Melody:
+    """
+    Read the notes of a MIDI (.mid) or kern (.krn) file.
+
+    :rtype: Melody
+
+    :raises ValueError: if the file is neither a MIDI nor a kern file.
+    """
+    extension = os.path.splitext(file_path)[1]
+    if extension == '.mid':
+        return read_midi_melody(file_path)
+    if extension == '.krn':
+        return read_kern_melody(file_path)
+    raise ValueError(f'Music file type unsupported: {file_path}. Please use either midi files or kern files.')
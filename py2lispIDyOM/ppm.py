@@ -0,0 +1,840 @@
+"""
+This module implements the prediction by partial matching (PPM) models of IDyOM in python:
+variable-order Markov models stored in array-backed suffix tries over the symbols of viewpoints (see viewpoints),
+and the entropy-weighted combination of their predictions (see backends.ApproximatePPMBackend, which runs them in place of SBCL).
+PPMModel learns and predicts one symbol at a time; predict_dataset gives the same predictions for all the notes
+of a fold at once (long-term models) or for the n-th notes of all the melodies at once (short-term models),
+from the counts of the (context, symbol) pairs of a ContextTrie.
+"""
+
+import functools
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from py2lispIDyOM.configuration import RunModelConfiguration
+from py2lispIDyOM.viewpoints import PREDICTED_ATTRIBUTES, EventArrays, predicted_viewpoints, viewpoint_values
+
+ESCAPE_METHODS = (':a', ':b', ':c', ':d', ':x')
+
+# the model options IDyOM uses by default
+DEFAULT_MODEL_OPTIONS = {
+    'ltm': {'order_bound': None, 'mixtures': True, 'update_exclusion': False, 'escape': ':c'},
+    'stm': {'order_bound': None, 'mixtures': True, 'update_exclusion': True, 'escape': ':x'},
+}
+# the exponents of the relative entropies weighting the models combined, as IDyOM's *viewpoint-bias* and *ltm-stm-bias*
+VIEWPOINT_BIAS = 2
+LTM_STM_BIAS = 7
+
+
+def get_model_options(run_model_configuration: RunModelConfiguration, model: str) -> dict:
+    """
+    The options of the long-term ('ltm') or short-term ('stm') model, with IDyOM's defaults for the options not set.
+
+    :return: a dictionary with the order_bound, mixtures, update_exclusion and escape of the model.
+    :rtype: dict
+    """
+    statistical_modelling_parameters = run_model_configuration.statistical_modelling_parameters
+    options = getattr(statistical_modelling_parameters, model + 'o_options')
+    return {option: default_value if getattr(options, f'{model}o_{option}') is None
+            else getattr(options, f'{model}o_{option}')
+            for option, default_value in DEFAULT_MODEL_OPTIONS[model].items()}
+
+
+class PPMModel:
+    """
+    A PPM model over the symbols 0, ..., alphabet_size - 1, as the PPM* models of IDyOM.
+
+    The contexts are the nodes of a suffix trie of the training sequences, read backwards from the predicted position,
+    and the number of times each symbol followed a context is a row of a count matrix.
+    A context occurs in the training sequences if a symbol followed it, or a whole sequence ended with it.
+    With an order bound, the prediction starts from the longest context (up to the bound) occurring in the training
+    sequences; without, from the shortest non-empty context followed by one symbol only (a deterministic context),
+    or the longest one if there are none. With mixtures, the distributions of the context and all the shorter contexts
+    are blended (interpolated smoothing), otherwise the model backs off to shorter contexts for the symbols never seen
+    after the context only (backoff smoothing). Both end with the distribution of order -1, which gives
+    1 / (alphabet_size + 1 - the number of symbols seen in the empty context) to each symbol, as in IDyOM,
+    before the distribution is normalised.
+
+    :param alphabet_size: the number of symbols.
+    :type alphabet_size: int
+
+    :param order_bound: the maximum length of the contexts, defaults to None (no bound, PPM*).
+    :type order_bound: int
+
+    :param mixtures: whether to blend the predictions of all orders (interpolated smoothing), defaults to True.
+    :type mixtures: bool
+
+    :param update_exclusion: whether to only update the counts of a symbol in its contexts down to the longest one
+        in which it was seen, defaults to False.
+    :type update_exclusion: bool
+
+    :param escape: the escape method, one of ':a', ':b', ':c', ':d', ':x', defaults to ':c'.
+    :type escape: str
+    """
+
+    def __init__(self, alphabet_size: int, order_bound: int = None, mixtures: bool = True,
+                 update_exclusion: bool = False, escape: str = ':c'):
+        if escape not in ESCAPE_METHODS:
+            raise ValueError(f'Invalid escape method {escape}. Valid escape methods are: {ESCAPE_METHODS}')
+        self.alphabet_size = alphabet_size
+        self.order_bound = order_bound
+        self.mixtures = mixtures
+        self.update_exclusion = update_exclusion
+        self.escape = escape
+        self.counts = np.zeros((64, alphabet_size), dtype=np.int64)
+        self.end_counts = np.zeros(64, dtype=np.int64)  # the number of training sequences ending with each context
+        self.children = {}  # (node, previous symbol) -> node of the context extended by the previous symbol
+        self.n_nodes = 1  # the root, the empty context
+
+    def copy(self) -> 'PPMModel':
+        """
+        :rtype: PPMModel
+        """
+        model = PPMModel(self.alphabet_size, self.order_bound, self.mixtures, self.update_exclusion, self.escape)
+        model.counts = self.counts.copy()
+        model.end_counts = self.end_counts.copy()
+        model.children = self.children.copy()
+        model.n_nodes = self.n_nodes
+        return model
+
+    def _max_order(self, position: int) -> int:
+        return position if self.order_bound is None else min(position, self.order_bound)
+
+    def _context_nodes(self, history: List[int], create: bool = False) -> List[int]:
+        """The nodes of the contexts of the next symbol, by increasing length (the root first)."""
+        nodes = [0]
+        node = 0
+        for order in range(1, self._max_order(len(history)) + 1):
+            key = (node, history[-order])
+            if key not in self.children:
+                if not create:
+                    break
+                if self.n_nodes == len(self.counts):
+                    self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+                    self.end_counts = np.concatenate([self.end_counts, np.zeros_like(self.end_counts)])
+                self.children[key] = self.n_nodes
+                self.n_nodes += 1
+            node = self.children[key]
+            nodes.append(node)
+        return nodes
+
+    def _select_order(self, nodes: List[int]) -> int:
+        totals = self.counts[nodes].sum(axis=1)
+        matched = np.logical_and.accumulate((totals > 0) | (self.end_counts[nodes] > 0))
+        if not matched.any():
+            return 0
+        if self.order_bound is None:
+            # as in IDyOM, the end of a sequence counts as one more symbol after the context
+            n_symbols = (self.counts[nodes] > 0).sum(axis=1) + (self.end_counts[nodes] > 0)
+            deterministic_orders = np.flatnonzero(matched & (n_symbols == 1))
+            deterministic_orders = deterministic_orders[deterministic_orders > 0]
+            if len(deterministic_orders):
+                return int(deterministic_orders[0])
+        return int(matched.sum()) - 1
+
+    def update(self, history: List[int], symbol: int, count: int = 1):
+        """
+        Add an occurrence of the symbol after the history to the counts of its contexts.
+
+        :param history: the previous symbols of the sequence.
+        :type history: List[int]
+
+        :param symbol: the symbol.
+        :type symbol: int
+
+        :param count: the number of occurrences to add (-1 removes one occurrence, without update exclusion only).
+        :type count: int
+        """
+        nodes = self._context_nodes(history, create=True)
+        if not self.update_exclusion:
+            self.counts[nodes, symbol] += count
+            return
+        # the counts of the contexts from the longest one down to the first one in which the symbol was seen
+        for order in range(len(nodes) - 1, -1, -1):
+            seen = self.counts[nodes[order], symbol] > 0
+            self.counts[nodes[order], symbol] += count
+            if seen:
+                break
+
+    def train(self, sequence: List[int]):
+        """
+        Add all the symbols of a sequence to the counts.
+
+        :param sequence: the symbols of the sequence.
+        :type sequence: List[int]
+        """
+        for position, symbol in enumerate(sequence):
+            self.update(sequence[:position], symbol)
+        self.end_sequence(sequence)
+
+    def end_sequence(self, sequence: List[int], count: int = 1):
+        """
+        Add the contexts of the end of a sequence learnt symbol by symbol (see update), which can then start
+        the predictions of other sequences although no symbol followed them.
+
+        :param sequence: the symbols of the sequence.
+        :type sequence: List[int]
+
+        :param count: the number of sequences ending with these contexts to add (-1 removes one).
+        :type count: int
+        """
+        nodes = self._context_nodes(sequence, create=True)  # before indexing, as it may grow end_counts
+        self.end_counts[nodes] += count
+
+    def forget(self, sequence: List[int]):
+        """
+        Remove all the symbols of a sequence from the counts, as if the sequence had not been trained on
+        (e.g., to get the model of a cross-validation fold from the model of the whole dataset).
+
+        :param sequence: the symbols of the sequence.
+        :type sequence: List[int]
+
+        :raises ValueError: with update exclusion, since the counts then depend on the order of the training sequences.
+        """
+        if self.update_exclusion:
+            raise ValueError('The sequences trained with update exclusion cannot be forgotten')
+        for position, symbol in enumerate(sequence):
+            self.update(sequence[:position], symbol, count=-1)
+        self.end_sequence(sequence, count=-1)
+
+    def predict(self, history: List[int], symbols: np.ndarray) -> Tuple[np.ndarray, int]:
+        """
+        Predict the next symbol of a sequence among some symbols.
+
+        :param history: the previous symbols of the sequence.
+        :type history: List[int]
+
+        :param symbols: the symbols which can follow the history.
+        :type symbols: np.ndarray
+
+        :return: the probability of each symbol, and the order of the context the prediction started from.
+        :rtype: Tuple[np.ndarray, int]
+        """
+        nodes = self._context_nodes(history)
+        selected_order = self._select_order(nodes)
+        distribution = np.zeros(len(symbols))
+        remaining = 1.0
+        excluded = np.zeros(len(symbols), dtype=bool)
+        for node in reversed(nodes[:selected_order + 1]):
+            counts = self.counts[node, symbols].astype(float)
+            if not self.mixtures:
+                counts[excluded] = 0
+            total = counts[~excluded].sum()
+            if total == 0:
+                continue
+            n_symbols = np.count_nonzero(counts)
+            if self.escape == ':a':
+                probabilities, escape = counts / (total + 1), 1 / (total + 1)
+            elif self.escape == ':b':
+                probabilities, escape = np.maximum(counts - 1, 0) / total, n_symbols / total
+            elif self.escape == ':c':
+                probabilities, escape = counts / (total + n_symbols), n_symbols / (total + n_symbols)
+            elif self.escape == ':d':
+                probabilities, escape = np.maximum(counts - 0.5, 0) / total, n_symbols / (2 * total)
+            else:  # ':x', with the number of symbols seen once
+                n_singletons = np.count_nonzero(counts == 1)
+                probabilities = counts / (total + n_singletons + 1)
+                escape = (n_singletons + 1) / (total + n_singletons + 1)
+            distribution += remaining * probabilities
+            remaining *= escape
+            excluded |= probabilities > 0
+        root_types = np.count_nonzero(self.counts[0, symbols])
+        uniform = np.ones(len(symbols), dtype=bool) if self.mixtures else ~excluded
+        distribution[uniform] += remaining / (len(symbols) + 1 - root_types)
+        return distribution / distribution.sum(), selected_order
+
+
+class ContextTrie:
+    """
+    The contexts of the positions of many symbol sequences (the previous symbols of the sequence, read backwards,
+    up to the order bound), numbered as the nodes of one suffix trie built order by order with numpy.
+    The counts of a PPM model are then the numbers of (node, symbol) pairs of its training positions.
+
+    A context found at one position only is left out with its longer contexts: it has no count whenever it is
+    the context of a predicted symbol, so it never changes a prediction.
+
+    :param symbols: the symbol of every position, -1 for the positions only predicted (e.g., the end of a melody).
+    :type symbols: np.ndarray
+
+    :param offsets: the offset of every position in its sequence (the length of its context).
+    :type offsets: np.ndarray
+
+    :param roots: the root node (the empty context) of every position, e.g., one per sequence for short-term models.
+    :type roots: np.ndarray
+
+    :param alphabet_size: the number of symbols.
+    :type alphabet_size: int
+
+    :param order_bound: the maximum length of the contexts, defaults to None (no bound).
+    :type order_bound: int
+    """
+
+    def __init__(self, symbols: np.ndarray, offsets: np.ndarray, roots: np.ndarray, alphabet_size: int,
+                 order_bound: int = None):
+        self.symbols = symbols
+        self.key_base = max(alphabet_size, 1)
+        self.n_nodes = int(roots.max(initial=-1)) + 1
+        positions, nodes = np.arange(len(symbols)), roots
+        # the positions with a context of each order, and the nodes of their contexts
+        self.positions, self.nodes = [positions], [nodes]
+        order = 0
+        while len(positions) and (order_bound is None or order < order_bound):
+            order += 1
+            extended = offsets[positions] >= order
+            positions, nodes = positions[extended], nodes[extended]
+            keys = nodes * self.key_base + symbols[positions - order]
+            unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            repeated = counts > 1
+            kept = repeated[inverse]
+            positions, nodes = positions[kept], (self.n_nodes + np.cumsum(repeated) - 1)[inverse[kept]]
+            self.n_nodes += int(repeated.sum())
+            if len(positions):
+                self.positions.append(positions)
+                self.nodes.append(nodes)
+
+    def context_nodes(self, positions: np.ndarray) -> np.ndarray:
+        """
+        The nodes of the contexts of some positions.
+
+        :return: the node of the context of every order (row) of every position (column), -1 if it is left out.
+        :rtype: np.ndarray
+        """
+        context_nodes = np.full((len(self.positions), len(positions)), -1)
+        for order, (order_positions, order_nodes) in enumerate(zip(self.positions, self.nodes)):
+            index = np.minimum(np.searchsorted(order_positions, positions), len(order_positions) - 1)
+            found = order_positions[index] == positions
+            context_nodes[order, found] = order_nodes[index[found]]
+        return context_nodes
+
+    def pair_keys(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The (node, symbol) pairs of every context of the positions with a symbol, as node * alphabet_size + symbol.
+
+        :return: the position and the key of every pair.
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        positions, nodes = np.concatenate(self.positions), np.concatenate(self.nodes)
+        symbols = self.symbols[positions]
+        with_symbol = symbols >= 0
+        return positions[with_symbol], nodes[with_symbol] * self.key_base + symbols[with_symbol]
+
+
+def _lookup_counts(pair_keys: np.ndarray, pair_counts: np.ndarray, nodes: np.ndarray, symbols: np.ndarray,
+                   key_base: int) -> np.ndarray:
+    """The counts of the symbols (a row per node) after the nodes, from the sorted keys of the pairs counted."""
+    keys = nodes[:, None] * key_base + symbols
+    if len(pair_keys) == 0:
+        return np.zeros(keys.shape)
+    index = np.minimum(np.searchsorted(pair_keys, keys), len(pair_keys) - 1)
+    return np.where(pair_keys[index] == keys, pair_counts[index], 0).astype(float)
+
+
+def _select_orders(context_nodes: np.ndarray, totals: np.ndarray, n_symbols: np.ndarray, order_bound: int,
+                   ends: np.ndarray = None):
+    """
+    The order of the context each prediction starts from (see PPMModel), for the context nodes of the predictions
+    (see ContextTrie.context_nodes), given the total count and the number of symbols after every node,
+    and whether a training sequence ended with every node (None if none did).
+
+    :return: the selected order and whether the context of each order was seen, of shape (n_orders, n_predictions).
+    """
+    nodes = np.maximum(context_nodes, 0)
+    ends = np.zeros(len(totals), dtype=bool) if ends is None else ends
+    matched = np.logical_and.accumulate((context_nodes >= 0) & ((totals[nodes] > 0) | ends[nodes]), axis=0)
+    selected = np.maximum(matched.sum(axis=0) - 1, 0)
+    if order_bound is None:
+        deterministic = matched & (n_symbols[nodes] + ends[nodes] == 1)
+        deterministic[0] = False  # the empty context is never deterministic
+        selected = np.where(deterministic.any(axis=0), deterministic.argmax(axis=0), selected)
+    return selected, matched
+
+
+def _mixture_distributions(context_nodes: np.ndarray, selected: np.ndarray, candidate_symbols: np.ndarray,
+                           count_lookup, mixtures: bool, escape: str) -> np.ndarray:
+    """
+    The distributions of PPMModel.predict over the candidate symbols of many predictions at once
+    (a row per prediction, the same symbol sharing its probability between the candidates it stands for),
+    given the counts of the symbols after a node with count_lookup(nodes, symbols).
+
+    :rtype: np.ndarray
+    """
+    n_predictions, n_candidates = candidate_symbols.shape
+    # the candidates sorted by symbol, unless they are already distinct and sorted (e.g., for basic viewpoints)
+    sorted_symbols = bool((candidate_symbols[:, 1:] > candidate_symbols[:, :-1]).all())
+    sorting = None if sorted_symbols else np.argsort(candidate_symbols, axis=1, kind='stable')
+    symbols = candidate_symbols if sorted_symbols else np.take_along_axis(candidate_symbols, sorting, axis=1)
+    first = np.ones(symbols.shape, dtype=bool)  # the first candidate of each symbol
+    first[:, 1:] = symbols[:, 1:] != symbols[:, :-1]
+    distributions = np.zeros(symbols.shape)
+    remaining = np.ones(n_predictions)
+    excluded = np.zeros(symbols.shape, dtype=bool)
+    root_types = np.zeros(n_predictions)
+    for order in range(int(selected.max(initial=-1)), -1, -1):
+        rows = np.flatnonzero(selected >= order)
+        counts = count_lookup(context_nodes[order, rows], symbols[rows]) * first[rows]
+        if order == 0:
+            root_types = np.count_nonzero(counts, axis=1)
+        if not mixtures:
+            counts[excluded[rows]] = 0
+        total = (counts * ~excluded[rows]).sum(axis=1)
+        rows, counts, total = rows[total > 0], counts[total > 0], total[total > 0, None]
+        n_symbols = np.count_nonzero(counts, axis=1)[:, None]
+        if escape == ':a':
+            probabilities, escape_probability = counts / (total + 1), 1 / (total + 1)
+        elif escape == ':b':
+            probabilities, escape_probability = np.maximum(counts - 1, 0) / total, n_symbols / total
+        elif escape == ':c':
+            probabilities, escape_probability = counts / (total + n_symbols), n_symbols / (total + n_symbols)
+        elif escape == ':d':
+            probabilities, escape_probability = np.maximum(counts - 0.5, 0) / total, n_symbols / (2 * total)
+        else:  # ':x', with the number of symbols seen once
+            n_singletons = np.count_nonzero(counts == 1, axis=1)[:, None]
+            probabilities = counts / (total + n_singletons + 1)
+            escape_probability = (n_singletons + 1) / (total + n_singletons + 1)
+        distributions[rows] += remaining[rows, None] * probabilities
+        remaining[rows] *= escape_probability[:, 0]
+        excluded[rows] |= probabilities > 0
+    # the order -1 distribution of IDyOM, which depends on the number of symbols seen in the empty context
+    uniform = first if mixtures else first & ~excluded
+    distributions += uniform * (remaining / (first.sum(axis=1) + 1 - root_types))[:, None]
+    distributions /= distributions.sum(axis=1, keepdims=True)
+    if sorted_symbols:
+        return distributions
+    # the probability of each symbol, shared by its candidates
+    columns = np.arange(n_candidates)
+    group_starts = np.maximum.accumulate(np.where(first, columns, 0), axis=1)
+    next_starts = np.minimum.accumulate(np.where(first, columns, n_candidates)[:, ::-1], axis=1)[:, ::-1]
+    group_ends = np.concatenate([next_starts[:, 1:], np.full((n_predictions, 1), n_candidates)], axis=1)
+    shared = np.take_along_axis(distributions, group_starts, axis=1) / (group_ends - group_starts)
+    candidate_distributions = np.empty(shared.shape)
+    np.put_along_axis(candidate_distributions, sorting, shared, axis=1)
+    return candidate_distributions
+
+
+def entropy(distributions: np.ndarray) -> np.ndarray:
+    """
+    The entropy (in bits) of each distribution (the last axis).
+
+    :rtype: np.ndarray
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return -np.nansum(distributions * np.log2(distributions), axis=-1)
+
+
+def combine_distributions(distributions: List[np.ndarray], bias: float, method: str = 'geometric'):
+    """
+    Combine the distributions of several models over the same alphabet, as IDyOM does, weighting each model
+    by its relative entropy (its entropy divided by the maximum entropy) to the power of -bias,
+    so that the more certain models weigh more.
+
+    :param distributions: the distributions of the models, each of shape (n_events, alphabet_size),
+        with nan for the events a model does not predict.
+    :type distributions: List[np.ndarray]
+
+    :param bias: the exponent of the relative entropies (0 gives equal weights).
+    :type bias: float
+
+    :param method: 'geometric' (weighted geometric mean) or 'arithmetic' (weighted arithmetic mean), defaults to 'geometric'.
+    :type method: str
+
+    :return: the combined distributions and the weights of the models, of shape (n_models, n_events).
+    """
+    stacked = np.stack(distributions)
+    maximum_entropy = np.log2(stacked.shape[-1])
+    relative_entropies = entropy(stacked) / maximum_entropy if maximum_entropy > 0 else np.ones(stacked.shape[:2])
+    weights = np.power(np.maximum(relative_entropies, 1e-12), -float(bias))
+    weights[np.isnan(stacked[..., 0])] = 0
+    weights /= weights.sum(axis=0, keepdims=True)
+    stacked = np.nan_to_num(stacked, nan=1.0)
+    if method == 'geometric':
+        with np.errstate(divide='ignore'):
+            combined = np.exp((weights[..., None] * np.log(stacked)).sum(axis=0))
+    elif method == 'arithmetic':
+        combined = (weights[..., None] * stacked).sum(axis=0)
+    else:
+        raise ValueError(f'Invalid combination method {method}. Please use either \'geometric\' or \'arithmetic\'.')
+    return combined / combined.sum(axis=-1, keepdims=True), weights
+
+
+class ViewpointModel:
+    """
+    The symbols of a viewpoint over the events of the test and pretraining datasets, and for every target viewpoint
+    it predicts, the symbols of the viewpoint for every candidate value of the target, so that the PPM models of the
+    viewpoint can give a distribution over the values of the target (the probability of each viewpoint symbol shared
+    equally by the target values it stands for).
+    """
+
+    def __init__(self, viewpoint, test_events: pd.DataFrame, pretrain_events: pd.DataFrame,
+                 target_alphabets: Dict[str, np.ndarray]):
+        self.viewpoint = viewpoint
+        test_values = viewpoint_values(EventArrays(test_events), viewpoint)[:, 0]
+        pretrain_values = viewpoint_values(EventArrays(pretrain_events), viewpoint)[:, 0] \
+            if pretrain_events is not None else test_values[:0]
+        candidate_values = {target: viewpoint_values(EventArrays(test_events, PREDICTED_ATTRIBUTES.get(target, target),
+                                                                 alphabet), viewpoint)
+                            for target, alphabet in target_alphabets.items()}
+        value_size = test_values.shape[-1] if test_values.ndim > 1 else 1
+        all_values = np.concatenate([values.reshape(-1, value_size) for values in
+                                     [test_values, pretrain_values] + list(candidate_values.values())])
+        all_values = all_values[~np.isnan(all_values).any(axis=1)]
+        # the values as integers, in the lexicographic order of the values
+        column_alphabets = [np.unique(all_values[:, column]) for column in range(value_size)]
+
+        def _codes(values):
+            codes = np.zeros(len(values), dtype=np.int64)
+            for column, column_alphabet in enumerate(column_alphabets):
+                codes = codes * len(column_alphabet) + np.searchsorted(column_alphabet, values[:, column])
+            return codes
+
+        alphabet_codes, alphabet_indices = np.unique(_codes(all_values), return_index=True)
+        self.alphabet = all_values[alphabet_indices]
+
+        def _encode(values):
+            values = values.reshape(-1, value_size)
+            defined = ~np.isnan(values).any(axis=1)
+            symbols = np.full(len(values), -1)
+            symbols[defined] = np.searchsorted(alphabet_codes, _codes(values[defined]))
+            return symbols
+
+        self.test_symbols = _encode(test_values)
+        self.pretrain_symbols = _encode(pretrain_values)
+        self.candidate_symbols = {target: _encode(values).reshape(values.shape[:2])
+                                  for target, values in candidate_values.items()}
+
+    @staticmethod
+    def sequences(symbols: np.ndarray, melody_ids: np.ndarray) -> Dict[int, List[int]]:
+        """
+        The sequence of defined symbols of each melody.
+
+        :rtype: Dict[int, List[int]]
+        """
+        return {melody_id: [int(symbol) for symbol in symbols[melody_ids == melody_id] if symbol >= 0]
+                for melody_id in pd.unique(melody_ids)}
+
+    def target_distribution(self, model: PPMModel, history: List[int], candidate_symbols: np.ndarray):
+        """
+        The distribution of the model over the candidate values of a target, or None if the viewpoint is undefined.
+
+        :return: the distribution and the order of the context of the prediction.
+        """
+        if (candidate_symbols < 0).any():
+            return None, None
+        symbols, inverse, shares = np.unique(candidate_symbols, return_inverse=True, return_counts=True)
+        distribution, order = model.predict(history, symbols)
+        return distribution[inverse] / shares[inverse], order
+
+
+def _sequence_positions(symbols: np.ndarray, melody_ids: np.ndarray, end_positions: bool):
+    """
+    Lay out the defined symbols of every melody (in their order of appearance) as the positions of one array.
+    With end_positions, every melody ends with a position without symbol (-1), whose context is the whole melody.
+
+    :return: the symbol, the offset in its melody and the melody index of every position,
+        and the position whose context is the history of every row.
+    """
+    melody_indices = pd.factorize(melody_ids)[0]
+    rows = np.argsort(melody_indices, kind='stable')
+    row_melodies = melody_indices[rows]
+    defined = symbols[rows] >= 0
+    n_melodies = int(melody_indices.max(initial=-1)) + 1
+    lengths = np.bincount(row_melodies, weights=defined, minlength=n_melodies).astype(np.int64) + end_positions
+    starts = np.cumsum(lengths) - lengths
+    defined_before = np.cumsum(defined) - defined
+    melody_first_rows = np.cumsum(np.bincount(row_melodies, minlength=n_melodies)) - \
+        np.bincount(row_melodies, minlength=n_melodies)
+    row_positions = np.empty(len(symbols), dtype=np.int64)
+    row_positions[rows] = starts[row_melodies] + defined_before - defined_before[melody_first_rows][row_melodies]
+    position_symbols = np.full(int(lengths.sum()), -1)
+    position_symbols[row_positions[rows][defined]] = symbols[rows][defined]
+    position_melodies = np.repeat(np.arange(n_melodies), lengths)
+    offsets = np.arange(len(position_symbols)) - starts[position_melodies]
+    return position_symbols, offsets, position_melodies, row_positions
+
+
+def _empty_predictions(viewpoint_model: ViewpointModel, n_rows: int) -> dict:
+    return {target: (np.full((n_rows, candidate_symbols.shape[1]), np.nan), np.full(n_rows, np.nan))
+            for target, candidate_symbols in viewpoint_model.candidate_symbols.items()}
+
+
+def _predict_rows(predictions: dict, viewpoint_model: ViewpointModel, rows: np.ndarray, context_nodes: np.ndarray,
+                  selected: np.ndarray, count_lookup, options: dict):
+    """Add the distributions and orders of the rows (those the viewpoint predicts) to the predictions of the targets."""
+    for target, candidate_symbols in viewpoint_model.candidate_symbols.items():
+        defined = (candidate_symbols[rows] >= 0).all(axis=1)
+        target_distributions, target_orders = predictions[target]
+        target_distributions[rows[defined]] = _mixture_distributions(
+            context_nodes[:, defined], selected[defined], candidate_symbols[rows[defined]], count_lookup,
+            options['mixtures'], options['escape'])
+        target_orders[rows[defined]] = selected[defined]
+
+
+def _predict_ltm(viewpoint_model: ViewpointModel, melody_ids: np.ndarray, pretrain_melody_ids: np.ndarray,
+                 folds: np.ndarray, resampling_indices: List[int], options: dict) -> dict:
+    """
+    Predict the rows of the folds with the long-term models of the folds, all the rows of a fold at once,
+    from the (node, symbol) pairs of a context trie of the pretraining and test datasets counted once per fold.
+
+    :return: for every target, the distributions and the orders of the contexts of the rows (nan for the rows
+        which are not predicted).
+    :rtype: dict
+    """
+    symbols, offsets, melodies, row_positions = _sequence_positions(viewpoint_model.test_symbols, melody_ids,
+                                                                    end_positions=True)
+    # the fold of every position, from the fold of the first row of its melody
+    position_folds = folds[np.unique(pd.factorize(melody_ids)[0], return_index=True)[1]][melodies]
+    if pretrain_melody_ids is not None:
+        pretrain_symbols, pretrain_offsets, _, _ = _sequence_positions(viewpoint_model.pretrain_symbols,
+                                                                       pretrain_melody_ids, end_positions=True)
+        symbols, offsets = np.concatenate([pretrain_symbols, symbols]), np.concatenate([pretrain_offsets, offsets])
+        row_positions = row_positions + len(pretrain_symbols)
+        position_folds = np.concatenate([np.full(len(pretrain_symbols), -1), position_folds])
+    trie = ContextTrie(symbols, offsets, np.zeros(len(symbols), dtype=np.int64), len(viewpoint_model.alphabet),
+                       options['order_bound'])
+    pair_positions, pair_keys = trie.pair_keys()
+    end_positions = np.flatnonzero(symbols < 0)
+    cross_validated = len(np.unique(folds)) > 1
+
+    predictions = _empty_predictions(viewpoint_model, len(melody_ids))
+    for fold in resampling_indices:
+        # the pretraining dataset and, with cross-validation, the melodies of the other folds
+        training = (position_folds == -1) | (cross_validated & (position_folds != fold))
+        keys, counts = np.unique(pair_keys[training[pair_positions]], return_counts=True)
+        totals = np.bincount(keys // trie.key_base, weights=counts, minlength=trie.n_nodes)
+        n_symbols = np.bincount(keys // trie.key_base, minlength=trie.n_nodes)
+        end_nodes = trie.context_nodes(end_positions[training[end_positions]])
+        ends = np.zeros(trie.n_nodes, dtype=bool)
+        ends[end_nodes[end_nodes >= 0]] = True
+        rows = np.flatnonzero(folds == fold)
+        context_nodes = trie.context_nodes(row_positions[rows])
+        selected, _ = _select_orders(context_nodes, totals, n_symbols, options['order_bound'], ends)
+        count_lookup = functools.partial(_lookup_counts, keys, counts, key_base=trie.key_base)
+        _predict_rows(predictions, viewpoint_model, rows, context_nodes, selected, count_lookup, options)
+    return predictions
+
+
+def _predict_ltm_sequentially(viewpoint_model: ViewpointModel, melody_ids: np.ndarray,
+                              pretrain_melody_ids: np.ndarray, folds: np.ndarray, resampling_indices: List[int],
+                              options: dict, updated: bool) -> dict:
+    """
+    Predict the rows of the folds with the long-term models of the folds note by note, with PPMModel:
+    with update exclusion, the counts depend on the order of the training melodies, and when the model
+    is updated with the test melodies (ltm+), each prediction depends on the previous ones.
+
+    :return: as _predict_ltm.
+    :rtype: dict
+    """
+    alphabet_size = len(viewpoint_model.alphabet)
+    test_sequences = ViewpointModel.sequences(viewpoint_model.test_symbols, melody_ids)
+    cross_validated = len(np.unique(folds)) > 1
+    pretrain_model = PPMModel(alphabet_size, **options)
+    if pretrain_melody_ids is not None:
+        for sequence in ViewpointModel.sequences(viewpoint_model.pretrain_symbols, pretrain_melody_ids).values():
+            pretrain_model.train(sequence)
+    if cross_validated and not options['update_exclusion']:
+        # the model of a fold is the model of the whole dataset without the melodies of the fold
+        for sequence in test_sequences.values():
+            pretrain_model.train(sequence)
+
+    predictions = _empty_predictions(viewpoint_model, len(melody_ids))
+    for fold in resampling_indices:
+        fold_melody_ids = pd.unique(melody_ids[folds == fold])
+        model = pretrain_model.copy()
+        if cross_validated:
+            for melody_id, sequence in test_sequences.items():
+                if melody_id in fold_melody_ids and not options['update_exclusion']:
+                    model.forget(sequence)
+                elif melody_id not in fold_melody_ids and options['update_exclusion']:
+                    model.train(sequence)
+        for melody_id in fold_melody_ids:
+            history = []
+            for row in np.flatnonzero(melody_ids == melody_id):
+                for target, candidate_symbols in viewpoint_model.candidate_symbols.items():
+                    distribution, order = viewpoint_model.target_distribution(model, history, candidate_symbols[row])
+                    if distribution is not None:
+                        predictions[target][0][row] = distribution
+                        predictions[target][1][row] = order
+                symbol = int(viewpoint_model.test_symbols[row])
+                if symbol >= 0:
+                    if updated:
+                        model.update(history, symbol)
+                    history.append(symbol)
+            if updated:
+                model.end_sequence(history)
+    return predictions
+
+
+def _predict_stm(viewpoint_model: ViewpointModel, melody_ids: np.ndarray, predicted: np.ndarray,
+                 options: dict) -> dict:
+    """
+    Predict the rows with the short-term models of their melodies, the n-th notes of all the melodies at once:
+    the (node, symbol) pairs of a context trie with a root per melody are counted as the notes are learnt.
+
+    :return: as _predict_ltm.
+    :rtype: dict
+    """
+    symbols, offsets, melodies, row_positions = _sequence_positions(viewpoint_model.test_symbols, melody_ids,
+                                                                    end_positions=True)
+    trie = ContextTrie(symbols, offsets, melodies, len(viewpoint_model.alphabet), options['order_bound'])
+    keys = np.unique(trie.pair_keys()[1])
+    counts = np.zeros(len(keys))
+    totals = np.zeros(trie.n_nodes)
+    n_symbols = np.zeros(trie.n_nodes)
+    count_lookup = functools.partial(_lookup_counts, keys, counts, key_base=trie.key_base)
+
+    rows = np.flatnonzero(predicted)
+    rows = rows[np.argsort(offsets[row_positions[rows]], kind='stable')]
+    row_offsets = offsets[row_positions[rows]]
+    row_context_nodes = trie.context_nodes(row_positions[rows])
+    # the positions of the predicted melodies with a symbol, learnt after the rows of the same offset are predicted
+    learnt_positions = np.flatnonzero((symbols >= 0) & np.isin(melodies, melodies[row_positions[rows]]))
+    learnt_positions = learnt_positions[np.argsort(offsets[learnt_positions], kind='stable')]
+    learnt_offsets = offsets[learnt_positions]
+    learnt_context_nodes = trie.context_nodes(learnt_positions)
+    learnt_symbols = symbols[learnt_positions]
+
+    predictions = _empty_predictions(viewpoint_model, len(melody_ids))
+    max_offset = int(row_offsets.max(initial=-1))
+    row_bounds = np.searchsorted(row_offsets, np.arange(max_offset + 2))
+    learnt_bounds = np.searchsorted(learnt_offsets, np.arange(max_offset + 2))
+    for offset in range(max_offset + 1):
+        step = slice(row_bounds[offset], row_bounds[offset + 1])
+        if step.start < step.stop:
+            context_nodes = row_context_nodes[:offset + 1, step]
+            selected, _ = _select_orders(context_nodes, totals, n_symbols, options['order_bound'])
+            _predict_rows(predictions, viewpoint_model, rows[step], context_nodes, selected, count_lookup, options)
+        step = slice(learnt_bounds[offset], learnt_bounds[offset + 1])
+        if step.start == step.stop:
+            continue
+        context_nodes = learnt_context_nodes[:offset + 1, step]
+        pair_keys = context_nodes * trie.key_base + learnt_symbols[step]
+        learnt = context_nodes >= 0
+        if options['update_exclusion']:
+            # the counts of the contexts from the longest one down to the first one in which the symbol was seen
+            # (see PPMModel.update)
+            seen = np.zeros(learnt.shape, dtype=bool)
+            seen[learnt] = counts[np.searchsorted(keys, pair_keys[learnt])] > 0
+            orders = np.arange(len(context_nodes))[:, None]
+            stop_orders = np.where(seen.any(axis=0), len(context_nodes) - 1 - seen[::-1].argmax(axis=0), 0)
+            learnt &= orders >= stop_orders
+        index = np.searchsorted(keys, pair_keys[learnt])
+        n_symbols[context_nodes[learnt]] += counts[index] == 0
+        counts[index] += 1
+        totals[context_nodes[learnt]] += 1
+    return predictions
+
+
+def _viewpoint_name(viewpoint) -> str:
+    return viewpoint if type(viewpoint) is str else '_'.join(viewpoint)
+
+
+def predict_dataset(test_events: pd.DataFrame, pretrain_events: pd.DataFrame, folds: np.ndarray,
+                    resampling_indices: List[int], run_model_configuration: RunModelConfiguration) -> List[dict]:
+    """
+    Predict the target viewpoints of the melodies of the test dataset in the folds of the resampling indices,
+    as IDyOM does: for every source viewpoint, a long-term model trained on the pretraining dataset and the melodies
+    of the other folds, and a short-term model trained on the previous notes of the melody,
+    the predictions of the viewpoints of each model being combined, then the ones of the two models.
+
+    The notes are predicted in batches (see the module description), except by the long-term models with update
+    exclusion or updated with the test melodies (models=':ltm+' or ':both+'), which learn and predict note by note.
+
+    :param test_events: the events of the test dataset (melody.id, note.id and the event attributes).
+    :type test_events: pd.DataFrame
+
+    :param pretrain_events: the events of the pretraining dataset, or None.
+    :type pretrain_events: pd.DataFrame
+
+    :param folds: the cross-validation fold of every event of the test dataset (all 0 for k=1, without cross-validation).
+    :type folds: np.ndarray
+
+    :param resampling_indices: the folds to predict.
+    :type resampling_indices: List[int]
+
+    :param run_model_configuration: the configuration of the model.
+    :type run_model_configuration: RunModelConfiguration
+
+    :return: for every target viewpoint, a dictionary with the 'target', the 'alphabet' of the predicted attribute,
+        the predictive 'distributions' over the alphabet of the predicted events (in the order of the test dataset)
+        and the 'columns' with the orders of the predictions and the weights of the models.
+    :rtype: List[dict]
+
+    :raises ValueError: if a viewpoint is not supported, or no source viewpoint predicts a target viewpoint.
+    """
+    required_parameters = run_model_configuration.required_parameters
+    targets = required_parameters.target_viewpoints
+    sources = targets if required_parameters.source_viewpoints == ':select' else required_parameters.source_viewpoints
+    models = (run_model_configuration.statistical_modelling_parameters.models or ':both').strip(':')
+    model_names = ['ltm', 'stm'] if models.strip('+') == 'both' else [models.strip('+')]
+    ltm_updated = models.endswith('+')
+    model_options = {model: get_model_options(run_model_configuration, model) for model in model_names}
+
+    target_alphabets = {}
+    for target in targets:
+        values = np.concatenate([pd.to_numeric(events[PREDICTED_ATTRIBUTES.get(target, target)],
+                                               errors='coerce').to_numpy(dtype=float)
+                                 for events in [test_events, pretrain_events] if events is not None])
+        target_alphabets[target] = np.unique(values[~np.isnan(values)])
+    target_sources = {target: [source for source in sources if target in predicted_viewpoints(source)]
+                      for target in targets}
+    for target, target_source_list in target_sources.items():
+        if not target_source_list:
+            raise ValueError(f'None of the source viewpoints {sources} predicts the target viewpoint {target}')
+    viewpoint_models = {}
+    for source in dict.fromkeys(source for target in targets for source in target_sources[target]):
+        predicted_targets = {target: alphabet for target, alphabet in target_alphabets.items()
+                             if source in target_sources[target]}
+        viewpoint_models[source] = ViewpointModel(source, test_events, pretrain_events, predicted_targets)
+
+    melody_ids = test_events['melody.id'].to_numpy()
+    predicted = np.isin(folds, resampling_indices)
+    n_predicted = int(predicted.sum())
+    distributions, orders = {}, {}
+    pretrain_melody_ids = pretrain_events['melody.id'].to_numpy() if pretrain_events is not None else None
+    for source, viewpoint_model in viewpoint_models.items():
+        model_predictions = {}
+        if 'ltm' in model_names:
+            if ltm_updated or model_options['ltm']['update_exclusion']:
+                model_predictions['ltm'] = _predict_ltm_sequentially(viewpoint_model, melody_ids, pretrain_melody_ids,
+                                                                     folds, resampling_indices, model_options['ltm'],
+                                                                     updated=ltm_updated)
+            else:
+                model_predictions['ltm'] = _predict_ltm(viewpoint_model, melody_ids, pretrain_melody_ids, folds,
+                                                        resampling_indices, model_options['ltm'])
+        if 'stm' in model_names:
+            model_predictions['stm'] = _predict_stm(viewpoint_model, melody_ids, predicted, model_options['stm'])
+        for model_name, predictions in model_predictions.items():
+            for target, (target_distributions, target_orders) in predictions.items():
+                distributions[target, model_name, source] = target_distributions[predicted]
+                orders[target, model_name, source] = target_orders[predicted]
+
+    target_predictions = []
+    for target in targets:
+        alphabet_size = len(target_alphabets[target])
+        columns = {}
+        for model in model_names:
+            for source in target_sources[target]:
+                columns[f'{target}.order.{model}.{_viewpoint_name(source)}'] = orders[target, model, source]
+        model_distributions = []
+        viewpoint_weights = {}
+        for model in model_names:
+            combined, weights = combine_distributions([distributions[target, model, source]
+                                                       for source in target_sources[target]], bias=VIEWPOINT_BIAS)
+            # the events which no viewpoint predicts (e.g., the first note for the pitch interval) get the uniform distribution
+            undefined = np.isnan(combined).any(axis=1)
+            combined[undefined] = 1 / alphabet_size
+            model_distributions.append(combined)
+            viewpoint_weights[model] = np.nan_to_num(weights)
+        if len(model_names) == 2:
+            combined, model_weights = combine_distributions(model_distributions, bias=LTM_STM_BIAS)
+        else:
+            combined, model_weights = model_distributions[0], np.ones((1, n_predicted))
+        for model, weights in zip(model_names, model_weights):
+            columns[f'{target}.weight.{model}'] = weights
+        for model in model_names:
+            for source, weights in zip(target_sources[target], viewpoint_weights[model]):
+                columns[f'{target}.weight.{model}.{_viewpoint_name(source)}'] = weights
+        target_predictions.append({'target': target, 'alphabet': target_alphabets[target], 'distributions': combined,
+                                   'columns': columns})
+    return target_predictions
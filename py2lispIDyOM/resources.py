@@ -0,0 +1,266 @@
+"""
+This module implements the memory sizing of the SBCL processes running IDyOM and a budget of memory and CPUs
+shared by the SBCL processes of a python process: the size of the SBCL heap (--dynamic-space-size) is estimated
+from the number of notes of the datasets, the source viewpoints and the order bound of the long-term models,
+and the runs which do not fit in the budget wait until the running ones have finished.
+"""
+
+import contextlib
+import os
+import threading
+
+from py2lispIDyOM.cache import hash_dataset_folder
+from py2lispIDyOM.telemetry import get_dataset_size
+
+MEGABYTE = 1 << 20
+# the heap used by SBCL with IDyOM and its dependencies loaded
+IDYOM_IMAGE_BYTES = 512 * MEGABYTE
+# the database objects of an imported event (its attributes and the CLSQL records)
+BYTES_PER_EVENT = 2048
+# the fewest bytes of a note in a MIDI file (its note on and note off events) or a kern file, to estimate the notes
+# of a dataset with a file which cannot be read
+MUSIC_FILE_BYTES_PER_NOTE = 6
+# a node of the suffix trees of the PPM models (its branches, counts and hash table entries)
+BYTES_PER_MODEL_NODE = 320
+# the context depth assumed for the models without order bound
+UNBOUNDED_ORDER_DEPTH = 10
+# the number of viewpoint models assumed for the viewpoint selection (source_viewpoints=':select')
+SELECTION_VIEWPOINTS = 10
+# the garbage collector of SBCL copies the live objects, and needs free space as large as them
+GC_HEADROOM_FACTOR = 2
+MINIMUM_DYNAMIC_SPACE_SIZE_MB = 1024
+DYNAMIC_SPACE_SIZE_STEP_MB = 256
+# the default nursery of SBCL (bytes-consed-between-gcs) is about 53 MB, which makes big LTMs collect very often
+NURSERY_FRACTION = 0.05
+DEFAULT_BYTES_CONSED_BETWEEN_GCS = 53687091
+# the fraction of the physical memory in the default budget, leaving room for the python processes and the system
+DEFAULT_MEMORY_BUDGET_FRACTION = 0.8
+
+
+def get_physical_memory_bytes() -> int:
+    """
+    Get the physical memory of the machine, or None where os.sysconf cannot tell (e.g., on Windows).
+
+    :rtype: int
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_default_memory_budget_bytes() -> int:
+    """
+    Get the memory of the default budget: 80% of the physical memory, or None (no limit) where it is unknown.
+
+    :rtype: int
+    """
+    physical_memory_bytes = get_physical_memory_bytes()
+    if physical_memory_bytes is None:
+        return None
+    return int(DEFAULT_MEMORY_BUDGET_FRACTION * physical_memory_bytes)
+
+
+_dataset_sizes = {}  # hash of the dataset folder -> its size (see telemetry.get_dataset_size)
+_dataset_sizes_lock = threading.Lock()
+
+
+def _get_cached_dataset_size(dataset_folder_path: str) -> dict:
+    """
+    Get the size of a dataset folder, parsing its music files only the first time a dataset with these files is sized
+    by this python process (e.g., the staged copies of the same dataset in the experiments of a sweep).
+    The number of notes is None if a music file cannot be read (e.g., a malformed MIDI file,
+    which is left to IDyOM to import or reject).
+    """
+    if dataset_folder_path is None or not os.path.exists(dataset_folder_path):
+        return None
+    dataset_hash = hash_dataset_folder(dataset_folder_path)
+    with _dataset_sizes_lock:
+        if dataset_hash in _dataset_sizes:
+            return _dataset_sizes[dataset_hash]
+    try:
+        dataset_size = get_dataset_size(dataset_folder_path)
+    except Exception:
+        dataset_size = {'n_files': len(_get_music_file_paths(dataset_folder_path)), 'n_notes': None}
+    with _dataset_sizes_lock:
+        _dataset_sizes[dataset_hash] = dataset_size
+    return dataset_size
+
+
+def _get_music_file_paths(dataset_folder_path: str) -> list:
+    return [os.path.join(dataset_folder_path, file_name) for file_name in os.listdir(dataset_folder_path)
+            if file_name.endswith(('.mid', '.krn'))]
+
+
+def _get_n_events(dataset_folder_path: str) -> int:
+    """
+    Get the number of notes of a dataset folder, estimated from the size of its music files if one cannot be read.
+    """
+    dataset_size = _get_cached_dataset_size(dataset_folder_path)
+    if dataset_size is None:
+        return 0
+    if dataset_size['n_notes'] is None:
+        file_bytes = sum(os.path.getsize(path) for path in _get_music_file_paths(dataset_folder_path))
+        return file_bytes // MUSIC_FILE_BYTES_PER_NOTE
+    return dataset_size['n_notes']
+
+
+def estimate_sbcl_memory(experiment, run_model_configuration=None) -> int:
+    """
+    Estimate the memory used by the SBCL process of an experiment: the IDyOM image, the imported events,
+    and the nodes of the long-term and short-term models of every source viewpoint
+    (one node per event and context order, up to the order bound), with room for the garbage collector.
+    The notes of a dataset with a music file which cannot be read are estimated from the size of its files.
+
+    :param experiment: the experiment, with its datasets staged.
+    :type experiment: IDyOMExperiment
+
+    :param run_model_configuration: the model configuration run by the script, None if it does not run the model
+        (e.g., a script importing the datasets), defaults to None.
+    :type run_model_configuration: RunModelConfiguration
+
+    :return: the estimated memory in bytes.
+    :rtype: int
+    """
+    n_test_events = _get_n_events(experiment.logger.test_dataset_exp_folder)
+    n_pretrain_events = _get_n_events(experiment.logger.train_dataset_exp_folder)
+    memory_bytes = (n_test_events + n_pretrain_events) * BYTES_PER_EVENT
+    if run_model_configuration is not None:
+        source_viewpoints = run_model_configuration.required_parameters.source_viewpoints
+        n_viewpoints = len(source_viewpoints) if type(source_viewpoints) is list else SELECTION_VIEWPOINTS
+        statistical_modelling_parameters = run_model_configuration.statistical_modelling_parameters
+        models = statistical_modelling_parameters.models or ':both'
+        ltm_events = 0 if models == ':stm' else n_test_events + n_pretrain_events
+        order_bound = statistical_modelling_parameters.ltmo_options.ltmo_order_bound
+        depth = (order_bound if order_bound is not None else UNBOUNDED_ORDER_DEPTH) + 1
+        memory_bytes += n_viewpoints * ltm_events * depth * BYTES_PER_MODEL_NODE
+    return IDYOM_IMAGE_BYTES + GC_HEADROOM_FACTOR * memory_bytes
+
+
+def get_dynamic_space_size(memory_bytes: int) -> int:
+    """
+    Get the --dynamic-space-size of SBCL (in megabytes) fitting the estimated memory: rounded up to 256 MB,
+    at least 1024 MB, and at most the physical memory of the machine.
+
+    :rtype: int
+    """
+    size_mb = -(-memory_bytes // (DYNAMIC_SPACE_SIZE_STEP_MB * MEGABYTE)) * DYNAMIC_SPACE_SIZE_STEP_MB
+    size_mb = max(size_mb, MINIMUM_DYNAMIC_SPACE_SIZE_MB)
+    physical_memory_bytes = get_physical_memory_bytes()
+    if physical_memory_bytes is not None:
+        size_mb = min(size_mb, physical_memory_bytes // MEGABYTE)
+    return int(size_mb)
+
+
+def get_bytes_consed_between_gcs(dynamic_space_size: int) -> int:
+    """
+    Get the nursery size of the SBCL garbage collector for a dynamic space size (in megabytes):
+    5% of the dynamic space, and not less than the default of SBCL.
+
+    :rtype: int
+    """
+    return max(int(dynamic_space_size * MEGABYTE * NURSERY_FRACTION), DEFAULT_BYTES_CONSED_BETWEEN_GCS)
+
+
+class ResourceGovernor:
+    """
+    A budget of memory and CPUs shared by the SBCL processes, so that the runs side by side
+    (e.g., in a parameter sweep, a viewpoint selection or fold shards) do not oversubscribe the machine.
+    A run reserves its memory and one CPU before starting and waits while they do not fit in what the running ones
+    left; a run larger than the whole budget runs alone.
+
+    :param memory_budget_bytes: the memory shared by the runs, defaults to None (no limit).
+    :type memory_budget_bytes: int
+
+    :param cpu_budget: the number of runs at the same time, defaults to None (no limit).
+    :type cpu_budget: int
+    """
+
+    def __init__(self, memory_budget_bytes: int = None, cpu_budget: int = None):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.cpu_budget = cpu_budget
+        self.reserved_memory_bytes = 0
+        self.reserved_cpus = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, memory_bytes: int, cpus: int) -> bool:
+        if self.reserved_cpus == 0:
+            return True
+        memory_fits = self.memory_budget_bytes is None \
+            or self.reserved_memory_bytes + memory_bytes <= self.memory_budget_bytes
+        cpus_fit = self.cpu_budget is None or self.reserved_cpus + cpus <= self.cpu_budget
+        return memory_fits and cpus_fit
+
+    def try_reserve(self, memory_bytes: int, cpus: int = 1) -> bool:
+        """
+        Reserve memory and CPUs if they fit in the budget, without waiting.
+
+        :return: whether they have been reserved.
+        :rtype: bool
+        """
+        with self._condition:
+            if not self._fits(memory_bytes, cpus):
+                return False
+            self.reserved_memory_bytes += memory_bytes
+            self.reserved_cpus += cpus
+            return True
+
+    def release(self, memory_bytes: int, cpus: int = 1):
+        """
+        Release memory and CPUs reserved by try_reserve, and wake up the runs waiting for them.
+        """
+        with self._condition:
+            self.reserved_memory_bytes -= memory_bytes
+            self.reserved_cpus -= cpus
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def reserve(self, memory_bytes: int, cpus: int = 1):
+        """
+        Reserve memory and CPUs for the time of the with block, waiting until they fit in the budget.
+        """
+        with self._condition:
+            if not self._fits(memory_bytes, cpus):
+                print(f'** waiting for {memory_bytes / MEGABYTE:.0f} MB of memory and {cpus} CPU in the budget **')
+            self._condition.wait_for(lambda: self._fits(memory_bytes, cpus))
+            self.reserved_memory_bytes += memory_bytes
+            self.reserved_cpus += cpus
+        try:
+            yield
+        finally:
+            self.release(memory_bytes, cpus)
+
+    def set_budget(self, memory_budget_bytes: int = None, cpu_budget: int = None):
+        """
+        Change the budget, which applies to the runs waiting and to the next runs.
+        """
+        with self._condition:
+            self.memory_budget_bytes = memory_budget_bytes
+            self.cpu_budget = cpu_budget
+            self._condition.notify_all()
+
+
+_resource_governor = ResourceGovernor(memory_budget_bytes=get_default_memory_budget_bytes(), cpu_budget=os.cpu_count())
+
+
+def get_resource_governor() -> ResourceGovernor:
+    """
+    Get the resource governor shared by all the SBCL processes run by this python process.
+
+    :rtype: ResourceGovernor
+    """
+    return _resource_governor
+
+
+def set_resource_budget(memory_budget_bytes: int = None, cpu_budget: int = None):
+    """
+    Set the memory and CPU budget shared by all the SBCL processes run by this python process (None for no limit).
+    The default budget is 80% of the physical memory (see get_default_memory_budget_bytes) and os.cpu_count() runs.
+
+    :param memory_budget_bytes: the memory shared by the runs, e.g., 0.8 * get_physical_memory_bytes().
+    :type memory_budget_bytes: int
+
+    :param cpu_budget: the number of runs at the same time, e.g., os.cpu_count().
+    :type cpu_budget: int
+    """
+    _resource_governor.set_budget(memory_budget_bytes=memory_budget_bytes, cpu_budget=cpu_budget)
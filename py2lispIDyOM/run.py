@@ -2,9 +2,88 @@
 This module implements a class to configure and run the IDyOM model.
 """
 
+import asyncio
+import contextlib
+import copy
+import csv
+import functools
+import json
 import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import field, dataclass
+from glob import glob
+from typing import Callable, List, Iterable, Dict
+
+import pandas as pd
+from natsort import natsorted
+
+from py2lispIDyOM.backends import Backend, SBCLBackend, InProcessBackend
+from py2lispIDyOM.cache import ResultCache, LTMCache, hash_dataset_folder
 from py2lispIDyOM.configuration import get_timestamp, IDyOMConfiguration, ExperimentLogger
+from py2lispIDyOM.extract import merge_dat_files
+from py2lispIDyOM.resources import estimate_sbcl_memory, get_resource_governor
+from py2lispIDyOM.telemetry import PHASE_TIMINGS_FILE_NAME, RUN_REPORT_FILE_NAME, time_lisp_command, read_phase_timings, \
+    write_run_report
+
+_issued_dataset_ids = weakref.WeakValueDictionary()  # dataset ID -> the experiment it was issued to
+_issued_dataset_ids_lock = threading.Lock()
+# the dataset IDs reserved by all the processes of this machine (e.g., several spool workers sharing the IDyOM database)
+DATASET_ID_RESERVATIONS_FOLDER_PATH = os.path.join(tempfile.gettempdir(), 'py2lispIDyOM_dataset_ids') + '/'
+DATASET_ID_RESERVATION_MAX_AGE = 24 * 3600  # seconds
+_pruned_dataset_id_reservations = False
+
+
+def _prune_dataset_id_reservations():
+    # the IDs are timestamps, which are not issued again once they are past
+    now = time.time()
+    for file_name in os.listdir(DATASET_ID_RESERVATIONS_FOLDER_PATH):
+        with contextlib.suppress(OSError):
+            if now - os.path.getmtime(DATASET_ID_RESERVATIONS_FOLDER_PATH + file_name) > DATASET_ID_RESERVATION_MAX_AGE:
+                os.remove(DATASET_ID_RESERVATIONS_FOLDER_PATH + file_name)
+
+
+def _reserve_dataset_id(dataset_id: str) -> bool:
+    """
+    Reserve a dataset ID for this process by creating its reservation file, which fails if another process did first.
+    """
+    global _pruned_dataset_id_reservations
+    os.makedirs(DATASET_ID_RESERVATIONS_FOLDER_PATH, exist_ok=True)
+    if not _pruned_dataset_id_reservations:
+        _prune_dataset_id_reservations()
+        _pruned_dataset_id_reservations = True
+    try:
+        file_descriptor = os.open(DATASET_ID_RESERVATIONS_FOLDER_PATH + dataset_id,
+                                  os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.write(file_descriptor, str(os.getpid()).encode())
+    os.close(file_descriptor)
+    return True
+
+
+def _issue_dataset_id(prefix: str, experiment) -> str:
+    """
+    Get a timestamp-based dataset ID which is not used by another experiment of this process nor reserved by
+    another process, so that experiments created within the same second (e.g., in a parameter sweep or by several
+    spool workers) import their datasets under different IDs.
+    """
+    with _issued_dataset_ids_lock:
+        moment = int(get_timestamp())
+        while True:
+            dataset_id = prefix + str(moment).zfill(12)
+            issued_experiment = _issued_dataset_ids.get(dataset_id)
+            if issued_experiment is experiment:
+                return dataset_id
+            if issued_experiment is None and _reserve_dataset_id(dataset_id):
+                _issued_dataset_ids[dataset_id] = experiment
+                return dataset_id
+            moment += 1
 
 
 @dataclass
@@ -24,6 +103,15 @@ class IDyOMExperiment:
     :param experiment_logger_name: the name of the experiment logger for the current experiment, defaults to the current timestamp.
     :type experiment_logger_name: str
 
+    :param result_cache: a cache of IDyOM outputs to reuse the outputs of an identical configuration on identical datasets, defaults to None.
+    :type result_cache: ResultCache
+
+    :param ltm_cache: a cache of long-term models shared by the experiments with the same datasets and LTM options, defaults to None.
+    :type ltm_cache: LTMCache
+
+    :param backend: the backend running the lisp scripts, defaults to SBCLBackend() (see backends.SimulatorBackend to run without SBCL).
+    :type backend: Backend
+
     """
 
     test_dataset_path: str
@@ -31,6 +119,9 @@ class IDyOMExperiment:
     experiment_history_folder_path: str = None
     experiment_logger_name: str = None
     idyom_config: IDyOMConfiguration = field(default_factory=IDyOMConfiguration)
+    result_cache: ResultCache = None
+    ltm_cache: LTMCache = None
+    backend: Backend = field(default_factory=SBCLBackend)
 
     def __post_init__(self):
         self.logger = ExperimentLogger(pretrain_dataset_path=self.pretrain_dataset_path,
@@ -41,6 +132,8 @@ class IDyOMExperiment:
     def _update_idyom_config(self):
         test_dataset_id = self._generate_test_dataset_id()
         train_dataset_id = self._generate_train_dataset_id()
+        if self.ltm_cache is not None:
+            test_dataset_id, train_dataset_id = self._apply_ltm_cache_entry(test_dataset_id, train_dataset_id)
         self.idyom_config.run_model_configuration.required_parameters.dataset_id = test_dataset_id
         self.idyom_config.run_model_configuration.training_parameters.pretraining_id = train_dataset_id
 
@@ -49,17 +142,54 @@ class IDyOMExperiment:
         self.idyom_config.database_configuration.pretrain_dataset_id = train_dataset_id
         self.idyom_config.run_model_configuration.output_parameters.output_path = self.logger.output_data_exp_folder
 
-    @staticmethod
-    def _generate_test_dataset_id() -> str:
-        moment = get_timestamp()
-        dataset_id = '66' + moment
+    def _apply_ltm_cache_entry(self, test_dataset_id, train_dataset_id):
+        """
+        Point IDyOM to the directories of the LTM cache entry of this experiment.
+        If the entry was populated by a previous run, its dataset IDs are reused, so that IDyOM finds the cached models
+        (the datasets are then deleted from the database and imported again under those IDs).
+        """
+        entry = self.ltm_cache.lookup(self)
+        self._ltm_cache_entry = entry
+        if entry.test_dataset_id is not None:
+            test_dataset_id, train_dataset_id = entry.test_dataset_id, entry.pretrain_dataset_id
+        self.idyom_config.cache_directory_configuration.model_dir = entry.model_dir
+        self.idyom_config.cache_directory_configuration.resampling_dir = entry.resampling_dir
+        self.idyom_config.database_configuration.replace_existing_datasets = True
+        caching_parameters = self.idyom_config.run_model_configuration.caching_parameters
+        if caching_parameters.use_ltms_cache is None:
+            caching_parameters.use_ltms_cache = True
+        if caching_parameters.use_resampling_set_cache is None:
+            caching_parameters.use_resampling_set_cache = True
+        return test_dataset_id, train_dataset_id
+
+    @contextlib.contextmanager
+    def _ltm_cache_lock(self):
+        """
+        Hold the lock of the LTM cache entry of this experiment (if any) while running SBCL, record the hit or miss,
+        then evict the least recently used entries.
+        The lisp script has to be generated after acquiring the lock, to use the entry as left by the previous holder.
+        """
+        if self.ltm_cache is None:
+            yield
+            return
+        with self.ltm_cache.lookup(self).lock():
+            yield
+        self.ltm_cache.evict()
+
+    def _record_ltm_cache_use(self):
+        if self.ltm_cache is not None:
+            self.ltm_cache.record_use(self._ltm_cache_entry,
+                                      test_dataset_id=self.idyom_config.database_configuration.test_dataset_id,
+                                      pretrain_dataset_id=self.idyom_config.database_configuration.pretrain_dataset_id)
+
+    def _generate_test_dataset_id(self) -> str:
+        dataset_id = _issue_dataset_id(prefix='66', experiment=self)
         return dataset_id
 
     def _generate_train_dataset_id(self):
         # only generate an ID if pretrain_dataset_path is not None
         if self.pretrain_dataset_path:
-            moment = get_timestamp()
-            dataset_id = '99' + moment
+            dataset_id = _issue_dataset_id(prefix='99', experiment=self)
             return dataset_id
         else:
             pass
@@ -71,16 +201,7 @@ class IDyOMExperiment:
         :param kwargs: see the API reference (the section below) for a complete list of valid parameters (keyword arguments).
 
         """
-        configuration = self.idyom_config.run_model_configuration
-        surface_dict: dict = configuration.get_surface_dict()
-        # print(f'{surface_dict=}')
-        kw2hide_in_errormsg = ['output_path', 'dataset_id', 'pretraining_id', 'stmo_options', 'ltmo_options']
-        kw2show = list(surface_dict.keys())
-        kw2show = [ele for ele in kw2show if ele not in kw2hide_in_errormsg]
-        for key, value in kwargs.items():
-            if key not in surface_dict:
-                raise KeyError(f'parameter \'{key}\' is invalid. Valid parameters are: {kw2show}')
-            configuration.recursive_set_attr(key=key, value=value)
+        self.idyom_config.run_model_configuration.set_parameters(**kwargs)
 
     def _generate_lisp_commands(self):
         """
@@ -104,22 +225,625 @@ class IDyOMExperiment:
         self._update_idyom_config()
         path_to_file = self.logger.this_exp_folder
         lisp_file_path = path_to_file + 'compute.lisp'
-        lisp_command = self.idyom_config.to_lisp_command()
+        lisp_command = self.idyom_config.to_lisp_command(timings_file_path=path_to_file + PHASE_TIMINGS_FILE_NAME)
         if write:
             with open(lisp_file_path, "w") as f:
                 f.write(lisp_command)
         return str(lisp_file_path)
 
-    def run(self):
-        """
-        Run the IDyOM model.
-        """
-
+    def _check_run_condition(self):
         run_condition = all([
             self.idyom_config.run_model_configuration.required_parameters.is_complete()
         ])
         assert run_condition
-        print('** running lisp script **')
-        os.system("sbcl --noinform --load " + self.generate_lisp_script())
+
+    def _remove_phase_timings(self):
+        # the timed lisp commands append to the file, which must not keep the timings of a previous run
+        for timings_file_path in glob(self.logger.this_exp_folder + '**/' + PHASE_TIMINGS_FILE_NAME, recursive=True):
+            os.remove(timings_file_path)
+
+    def run(self):
+        """
+        Run the IDyOM model, then write the run report of the experiment (see telemetry.write_run_report)
+        in its folder.
+
+        :raises subprocess.CalledProcessError: if SBCL exits with a non-zero code.
+        """
+
+        start_time = time.time()
+        self._check_run_condition()
+        self._remove_phase_timings()
+        with self._ltm_cache_lock():
+            lisp_script_path = self.generate_lisp_script()
+            if self._fetch_cached_outputs():
+                write_run_report(self, 'run', start_time, resource_usages=[], result_cache_hit=True)
+                return
+            self._record_ltm_cache_use()
+            print('** running lisp script **')
+            resource_usage = self.backend.run_script(self, lisp_script_path, self.idyom_config.run_model_configuration)
+        self._store_outputs_in_cache()
+        write_run_report(self, 'run', start_time, resource_usages=[resource_usage])
+        print(' ')
+        print('** Finished! **')
+
+    def run_fold_shards(self, n_jobs: int = None, max_workers: int = None):
+        """
+        Run a cross-validation with the k folds split across several SBCL processes running in parallel,
+        then merge the outputs of all folds into the experiment output folder.
+
+        The datasets are imported and the resampling sets created once, in a first SBCL process,
+        so that all processes share the same folds. The outputs and the SBCL log of each process are kept in
+        the fold_shards folder of the experiment, and the run report has the phases and resources of every process.
+
+        :param n_jobs: the number of SBCL processes to split the folds into, defaults to one process per fold.
+        :type n_jobs: int
+
+        :param max_workers: the maximum number of SBCL processes running at the same time, defaults to n_jobs.
+        :type max_workers: int
+
+        :raises ValueError: if k is not a number of folds, or the resampling set cache is disabled.
+        :raises subprocess.CalledProcessError: if an SBCL process exits with a non-zero code.
+        """
+
+        self._check_run_condition()
+        run_model_configuration = self.idyom_config.run_model_configuration
+        k = run_model_configuration.training_parameters.k
+        if type(k) is not int or k < 2:
+            raise ValueError(f'Running folds in parallel requires k to be a number of folds, not {k}')
+        if run_model_configuration.caching_parameters.use_resampling_set_cache is False:
+            raise ValueError('Running folds in parallel requires the resampling set cache, '
+                             'so that all processes share the same folds')
+        resampling_indices = run_model_configuration.training_parameters.resampling_indices
+        if resampling_indices is None:
+            resampling_indices = list(range(k))
+        n_jobs = min(n_jobs or len(resampling_indices), len(resampling_indices))
+        shards = [resampling_indices[job::n_jobs] for job in range(n_jobs)]
+
+        def _run_shard(shard_folder, shard_configuration):
+            with open(shard_folder + 'sbcl.log', 'w') as log:
+                return self.backend.run_script(self, shard_folder + 'compute.lisp', shard_configuration,
+                                               stdout=log, stderr=subprocess.STDOUT)
+
+        start_time = time.time()
+        self._remove_phase_timings()
+        with self._ltm_cache_lock():
+            prepare_lisp_file_path, shard_folders, shard_configurations = self._write_fold_shard_scripts(shards)
+            self._record_ltm_cache_use()
+            print('** importing datasets and creating the resampling sets **')
+            prepare_resource_usage = self.backend.run_script(self, prepare_lisp_file_path)
+            print(f'** running {len(resampling_indices)} folds in {n_jobs} SBCL processes **')
+            shards_start_time = time.time()
+            with ThreadPoolExecutor(max_workers=max_workers or n_jobs) as executor:
+                shard_resource_usages = list(executor.map(_run_shard, shard_folders, shard_configurations))
+            shards_wall_time = round(time.time() - shards_start_time, 3)
+
+        shard_dat_file_paths = [sorted(glob(shard_folder + '*.dat'))[0] for shard_folder in shard_folders]
+        # named after the configuration of the experiment, as the output file of a single run
+        output_file_name_backend = self.backend if isinstance(self.backend, InProcessBackend) else InProcessBackend
+        merged_dat_file_path = self.logger.output_data_exp_folder + output_file_name_backend.output_file_name(
+            self.idyom_config.run_model_configuration)
+        merge_dat_files(shard_dat_file_paths, merged_dat_file_path)
+        shard_reports = [{'resampling_indices': shard,
+                          'phases': read_phase_timings(shard_folder + PHASE_TIMINGS_FILE_NAME),
+                          'sbcl': resource_usage}
+                         for shard, shard_folder, resource_usage in zip(shards, shard_folders, shard_resource_usages)]
+        write_run_report(self, 'run_fold_shards', start_time,
+                         resource_usages=[prepare_resource_usage] + shard_resource_usages,
+                         shards_wall_time=shards_wall_time, shards=shard_reports)
+        print(' ')
+        print('** Finished! **')
+
+    def _write_fold_shard_scripts(self, shards: List[List[int]]):
+        """
+        Write the lisp script importing the datasets and creating the resampling sets,
+        and one lisp script per shard of resampling indices.
+
+        :return: the path to the first script, the list of shard folders (each with its compute.lisp)
+            and the list of their model configurations.
+        """
+        self._update_idyom_config()
+        prepare_lisp_file_path = self.logger.this_exp_folder + 'prepare.lisp'
+        timings_file_path = self.logger.this_exp_folder + PHASE_TIMINGS_FILE_NAME
+        prepare_commands = [
+            time_lisp_command('start_idyom', self.idyom_config.start_idyom_command(), timings_file_path),
+            self.idyom_config.cache_directory_command(),
+            time_lisp_command('import_datasets', self.idyom_config.import_datasets_command(), timings_file_path),
+            time_lisp_command('prepare_resampling_sets', self.idyom_config.prepare_resampling_sets_command(),
+                              timings_file_path),
+            self.idyom_config.quit_command(),
+        ]
+        with open(prepare_lisp_file_path, 'w') as f:
+            f.write('\n'.join(command for command in prepare_commands if command))
+
+        shard_folders = []
+        shard_configurations = []
+        for job, shard in enumerate(shards):
+            shard_folder = self.logger.this_exp_folder + 'fold_shards/shard_' + str(job) + '/'
+            os.makedirs(shard_folder, exist_ok=True)
+            shard_configuration = copy.deepcopy(self.idyom_config.run_model_configuration)
+            shard_configuration.training_parameters.resampling_indices = shard
+            shard_configuration.output_parameters.output_path = shard_folder
+            shard_timings_file_path = shard_folder + PHASE_TIMINGS_FILE_NAME
+            shard_commands = [
+                time_lisp_command('start_idyom', self.idyom_config.start_idyom_command(), shard_timings_file_path),
+                self.idyom_config.cache_directory_command(),
+                time_lisp_command('run_model', shard_configuration.to_lisp_command(), shard_timings_file_path),
+                self.idyom_config.quit_command(),
+            ]
+            with open(shard_folder + 'compute.lisp', 'w') as f:
+                f.write('\n'.join(command for command in shard_commands if command))
+            shard_folders.append(shard_folder)
+            shard_configurations.append(shard_configuration)
+
+        return prepare_lisp_file_path, shard_folders, shard_configurations
+
+    async def run_async(self, line_callback: Callable[[str], None] = print, timeout: float = None):
+        """
+        Run the IDyOM model in an asyncio subprocess.
+
+        The SBCL output (stdout and stderr) is streamed line by line to the line_callback.
+        If the timeout expires or the calling task is cancelled, the SBCL process is killed before the error propagates.
+        The run report is written as by run, without the memory and CPU time of SBCL.
+        Backends other than SBCLBackend run in a thread of the event loop's executor, without output to stream.
+        Such a thread cannot be stopped: if the timeout expires or the task is cancelled, the error propagates
+        once the thread has finished the run.
+
+        :param line_callback: a function called with each line of the SBCL output, defaults to print.
+        :type line_callback: Callable[[str], None]
+
+        :param timeout: the maximum time (in seconds) for the run, defaults to None (no limit).
+        :type timeout: float
+
+        :raises subprocess.CalledProcessError: if SBCL exits with a non-zero code.
+        :raises asyncio.TimeoutError: if the run takes longer than the timeout.
+        """
+
+        start_time = time.time()
+        self._check_run_condition()
+        self._remove_phase_timings()
+        async with self._ltm_cache_lock_async():
+            lisp_script_path = self.generate_lisp_script()
+            if self._fetch_cached_outputs():
+                write_run_report(self, 'run_async', start_time, resource_usages=[], result_cache_hit=True)
+                return
+            self._record_ltm_cache_use()
+            if not isinstance(self.backend, SBCLBackend):
+                run_script = functools.partial(self.backend.run_script, self, lisp_script_path,
+                                               self.idyom_config.run_model_configuration)
+                future = asyncio.get_running_loop().run_in_executor(None, run_script)
+                try:
+                    resource_usage = await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+                except BaseException:
+                    # the thread cannot be stopped: wait for it to end before releasing the LTM cache entry
+                    await asyncio.wait([future])
+                    raise
+                self._store_outputs_in_cache()
+                write_run_report(self, 'run_async', start_time, resource_usages=[resource_usage])
+                return
+            backend, memory_bytes = self.backend.sized_for(self, self.idyom_config.run_model_configuration)
+            command = backend.sbcl_command(lisp_script_path)
+            async with _reserve_resources_async(memory_bytes):
+                process = await asyncio.create_subprocess_exec(*command,
+                                                               stdin=asyncio.subprocess.DEVNULL,
+                                                               stdout=asyncio.subprocess.PIPE,
+                                                               stderr=asyncio.subprocess.STDOUT)
+                try:
+                    await asyncio.wait_for(_stream_process_output(process, line_callback), timeout=timeout)
+                except BaseException:
+                    await _kill_process(process)
+                    raise
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(returncode=process.returncode, cmd=command)
+        self._store_outputs_in_cache()
+        # the asyncio child watcher reaps the process, so its resource usage cannot be measured
+        write_run_report(self, 'run_async', start_time, resource_usages=[{}])
+
+    def append_melodies(self, new_dataset_path: str) -> str:
+        """
+        Predict the melodies of a folder which are not in the test dataset of this experiment yet,
+        and add their rows to the output of the experiment, instead of running the whole experiment again
+        (see append_melodies, whose outputs can differ from the ones of a full run as the alphabets are not the same).
+
+        :param new_dataset_path: the path to the folder with the new melodies (files already in the test dataset are skipped).
+        :type new_dataset_path: str
+
+        :return: the path to the output file with the appended melodies, or None if there are no new melodies.
+        :rtype: str
+        """
+        return append_melodies(experiment_folder_path=self.logger.this_exp_folder, new_dataset_path=new_dataset_path,
+                               parameters=self.idyom_config.run_model_configuration.canonical_parameters(),
+                               backend=self.backend, ltm_cache=self.ltm_cache)
+
+    @contextlib.asynccontextmanager
+    async def _ltm_cache_lock_async(self, poll_interval: float = 0.5):
+        """Same as _ltm_cache_lock, waiting for the lock without blocking the event loop."""
+        if self.ltm_cache is None:
+            yield
+            return
+        entry_lock = self.ltm_cache.lookup(self).lock()
+        while not entry_lock.acquire(blocking=False):
+            await asyncio.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            entry_lock.release()
+        self.ltm_cache.evict()
+
+    def _fetch_cached_outputs(self) -> bool:
+        """Put the cached outputs of an identical run in the output folder, if there are any in the result cache."""
+        if self.result_cache is None:
+            return False
+        self._result_cache_key = self.result_cache.get_key(self)
+        fetched = self.result_cache.fetch(self._result_cache_key, self.logger.output_data_exp_folder)
+        if fetched:
+            print('** Outputs of an identical run found in the result cache. **')
+        return fetched
+
+    def _store_outputs_in_cache(self):
+        if self.result_cache is not None:
+            self.result_cache.store(self._result_cache_key, self.logger.output_data_exp_folder)
+
+
+@contextlib.asynccontextmanager
+async def _reserve_resources_async(memory_bytes: int, poll_interval: float = 0.5):
+    """Same as ResourceGovernor.reserve, waiting for the resources without blocking the event loop."""
+    resource_governor = get_resource_governor()
+    while not resource_governor.try_reserve(memory_bytes):
+        await asyncio.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        resource_governor.release(memory_bytes)
+
+
+async def _stream_process_output(process: asyncio.subprocess.Process, line_callback: Callable[[str], None]):
+    """Pass every output line of the process to the callback, then wait for the process to exit."""
+    while True:
+        line = await process.stdout.readline()
+        if not line:
+            break
+        if line_callback is not None:
+            line_callback(line.decode(errors='replace').rstrip('\n'))
+    return await process.wait()
+
+
+async def _kill_process(process: asyncio.subprocess.Process, grace_period: float = 5):
+    """Terminate the process, and kill it if it has not exited after the grace period."""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), timeout=grace_period)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+    except ProcessLookupError:
+        pass
+
+
+async def run_experiments_async(experiments: Iterable[IDyOMExperiment],
+                                max_concurrent_runs: int = None,
+                                line_callback: Callable[[IDyOMExperiment, str], None] = None,
+                                timeout: float = None,
+                                return_exceptions: bool = False) -> list:
+    """
+    Run several IDyOM experiments concurrently in one event loop.
+
+    :param experiments: the experiments to run.
+    :type experiments: Iterable[IDyOMExperiment]
+
+    :param max_concurrent_runs: the maximum number of SBCL processes running at the same time, defaults to None (no limit).
+    :type max_concurrent_runs: int
+
+    :param line_callback: a function called with the experiment and each line of its SBCL output, defaults to None (output discarded).
+    :type line_callback: Callable[[IDyOMExperiment, str], None]
+
+    :param timeout: the maximum time (in seconds) for each run, defaults to None (no limit).
+    :type timeout: float
+
+    :param return_exceptions: whether to return the errors of the failed runs instead of raising the first one, defaults to False.
+    :type return_exceptions: bool
+
+    :return: a list with one entry per experiment, which is None for a successful run or the raised error if return_exceptions is True.
+    :rtype: list
+    """
+
+    semaphore = asyncio.Semaphore(max_concurrent_runs) if max_concurrent_runs else None
+
+    async def _run_one(experiment: IDyOMExperiment):
+        callback = (lambda line: line_callback(experiment, line)) if line_callback is not None else None
+        if semaphore is None:
+            return await experiment.run_async(line_callback=callback, timeout=timeout)
+        async with semaphore:
+            return await experiment.run_async(line_callback=callback, timeout=timeout)
+
+    return await asyncio.gather(*[_run_one(experiment) for experiment in experiments],
+                                return_exceptions=return_exceptions)
+
+
+def append_melodies(experiment_folder_path: str, new_dataset_path: str, parameters: dict = None,
+                    backend: Backend = None, ltm_cache: LTMCache = None) -> str:
+    """
+    Predict the melodies of a folder which are not in the test dataset of an experiment which has already run,
+    and add their rows to its output file, with the melody IDs following the ones of the existing melodies.
+
+    The new melodies run in an experiment of their own, in the appends folder of the experiment,
+    with the same model parameters and pretraining dataset.
+    This requires every melody to be predicted independently of the other test melodies,
+    i.e., without cross-validation (k=1) and without updating the LTM ('+' models).
+
+    The outputs are not exactly the ones of a run on the whole test dataset: IDyOM builds the alphabet of each viewpoint
+    from the imported datasets, so the new melodies are predicted over the alphabet of the pretraining dataset and
+    the new melodies only, and the probabilities (and information contents) can differ from the ones of a full run.
+    The distribution columns of symbols missing from the outputs of the new melodies are filled with 0
+    when the output files are merged (see merge_dat_files), and symbols only in the new melodies add columns
+    which are filled with 0 for the existing melodies.
+
+    :param experiment_folder_path: the path to the folder of the experiment.
+    :type experiment_folder_path: str
+
+    :param new_dataset_path: the path to the folder with the new melodies (files already in the test dataset are skipped).
+    :type new_dataset_path: str
+
+    :param parameters: the model parameters of the experiment, defaults to the ones in its run report.
+    :type parameters: dict
+
+    :param backend: the backend running the lisp script, defaults to SBCLBackend().
+    :type backend: Backend
+
+    :param ltm_cache: a cache of long-term models, to reuse the LTM of the pretraining dataset, defaults to None.
+    :type ltm_cache: LTMCache
+
+    :return: the path to the output file with the appended melodies, or None if there are no new melodies.
+    :rtype: str
+
+    :raises ValueError: if the melodies are not predicted independently of each other.
+    :raises FileNotFoundError: if the experiment has no output file (or no run report to read the parameters from).
+    """
+    if parameters is None:
+        with open(experiment_folder_path + RUN_REPORT_FILE_NAME, 'r') as f:
+            parameters = json.load(f)['parameters']
+    if parameters.get('k') != 1 or str(parameters.get('models')).endswith('+'):
+        raise ValueError(f'Appending melodies requires every melody to be predicted independently of the others, '
+                         f'i.e., k=1 and models without \'+\', not k={parameters.get("k")} '
+                         f'and models={parameters.get("models")}')
+    dat_file_paths = sorted(glob(experiment_folder_path + 'experiment_output_data_folder/*.dat'))
+    if not dat_file_paths:
+        raise FileNotFoundError(f'No output file in {experiment_folder_path}experiment_output_data_folder/')
+    output_file_path = dat_file_paths[0]
+
+    test_dataset_folder = experiment_folder_path + 'experiment_input_data_folder/test_dataset/'
+    pretrain_dataset_folder = experiment_folder_path + 'experiment_input_data_folder/pretrain_dataset/'
+    new_file_paths = [file_path for file_path in natsorted(glob(os.path.join(new_dataset_path, '*')))
+                      if os.path.splitext(file_path)[1] in ['.mid', '.krn']
+                      and not os.path.exists(test_dataset_folder + os.path.basename(file_path))]
+    if not new_file_paths:
+        print('** No new melodies to append. **')
+        return None
+
+    appends_folder = experiment_folder_path + 'appends/'
+    append_name = 'append_' + str(len(glob(appends_folder + 'append_*')) + 1)
+    with tempfile.TemporaryDirectory() as new_dataset_folder:
+        for file_path in new_file_paths:
+            shutil.copy(file_path, new_dataset_folder)
+        experiment = IDyOMExperiment(test_dataset_path=new_dataset_folder + '/',
+                                     pretrain_dataset_path=pretrain_dataset_folder
+                                     if os.path.exists(pretrain_dataset_folder) else None,
+                                     experiment_history_folder_path=appends_folder,
+                                     experiment_logger_name=append_name,
+                                     ltm_cache=ltm_cache,
+                                     backend=backend if backend is not None else SBCLBackend())
+    experiment.set_parameters(**{key: value for key, value in parameters.items() if value is not None})
+    print(f'** Appending {len(new_file_paths)} melodies **')
+    experiment.run()
+
+    # read every value as text, so that the rows are written back unchanged but for their IDs
+    existing_df = pd.read_csv(output_file_path, sep=r'\s+', quoting=csv.QUOTE_NONE, dtype=str, keep_default_na=False)
+    new_dat_file_path = sorted(glob(experiment.logger.output_data_exp_folder + '*.dat'))[0]
+    new_df = pd.read_csv(new_dat_file_path, sep=r'\s+', quoting=csv.QUOTE_NONE, dtype=str, keep_default_na=False)
+    new_df['melody.id'] = (new_df['melody.id'].astype(int) + existing_df['melody.id'].astype(int).max()).astype(str)
+    if 'dataset.id' in new_df:
+        new_df['dataset.id'] = existing_df['dataset.id'].iloc[0]
+    renumbered_dat_file_path = experiment.logger.this_exp_folder + 'renumbered_' + os.path.basename(new_dat_file_path)
+    new_df.to_csv(renumbered_dat_file_path, sep=' ', index=False, quoting=csv.QUOTE_NONE)
+
+    merged_file_path = output_file_path + '.tmp'
+    merge_dat_files([output_file_path, renumbered_dat_file_path], merged_file_path)
+    os.replace(merged_file_path, output_file_path)
+    for file_path in new_file_paths:
+        shutil.copy(file_path, test_dataset_folder)
+    print('** Finished! **')
+    return output_file_path
+
+
+BATCH_ERROR_FILE_NAME = 'batch_error.log'
+
+
+def _batch_lisp_command(command: str, log_file_path: str, error_file_path: str) -> str:
+    """
+    Wrap lisp commands so that their output goes to the log file, and an error is written to the error file
+    instead of stopping SBCL, so that the next commands of the script still run.
+    """
+    return (f'(handler-case\n'
+            f'  (with-open-file (py2lispidyom-log "{log_file_path}" :direction :output :if-exists :supersede :if-does-not-exist :create)\n'
+            f'    (let ((*standard-output* py2lispidyom-log) (*error-output* py2lispidyom-log))\n'
+            f'{command}))\n'
+            f'  (error (condition)\n'
+            f'    (with-open-file (errors "{error_file_path}" :direction :output :if-exists :supersede :if-does-not-exist :create)\n'
+            f'      (format errors "~a~%" condition))))')
+
+
+@dataclass
+class IDyOMBatch:
+    """
+    A class to run several IDyOM experiments in one SBCL process, which loads IDyOM once, imports every distinct dataset
+    once (the experiments with identical datasets share their dataset IDs), and runs the models one after the other,
+    so that the start-up of SBCL and IDyOM and the imports are paid once for the whole batch.
+
+    Each model run writes its outputs to the folder of its experiment, with its IDyOM output in idyom.log.
+    A lisp error in one run is written to batch_error.log in the folder of the experiment and does not stop the others.
+    The batch script, its SBCL log and the timings of the shared phases are in the batch folder.
+
+    :param experiments: the experiments to run, with their parameters set.
+    :type experiments: List[IDyOMExperiment]
+
+    :param batch_folder_path: the path to the folder of the batch script and SBCL log,
+        defaults to 'experiment_history/batch_' followed by the current timestamp.
+    :type batch_folder_path: str
+
+    :param backend: the backend running the batch script, which replaces the backends of the experiments,
+        defaults to SBCLBackend(). The in-process backends (e.g., SimulatorBackend) run the model of each experiment in turn.
+    :type backend: Backend
+    """
+
+    experiments: List[IDyOMExperiment]
+    batch_folder_path: str = None
+    backend: Backend = field(default_factory=SBCLBackend)
+
+    def __post_init__(self):
+        for experiment in self.experiments:
+            if experiment.ltm_cache is not None:
+                raise ValueError('The experiments of a batch cannot use an LTM cache, '
+                                 'whose entries are locked by one SBCL process at a time')
+            experiment.backend = self.backend
+        if self.batch_folder_path is None:
+            self.batch_folder_path = 'experiment_history/batch_' + get_timestamp() + '/'
+        if not os.path.exists(self.batch_folder_path):
+            os.makedirs(self.batch_folder_path)
+
+    def _share_dataset_ids(self, experiments: List[IDyOMExperiment]) -> List[str]:
+        """
+        Give the experiments with identical datasets the dataset IDs of the first of them.
+
+        :return: the lisp commands importing every distinct dataset.
+        :rtype: List[str]
+        """
+        dataset_ids = {}  # the hash of a dataset folder -> its dataset ID
+        import_commands = []
+        for experiment in experiments:
+            experiment._update_idyom_config()
+            database_configuration = experiment.idyom_config.database_configuration
+            run_model_configuration = experiment.idyom_config.run_model_configuration
+
+            test_dataset_hash = hash_dataset_folder(experiment.logger.test_dataset_exp_folder)
+            if test_dataset_hash in dataset_ids:
+                database_configuration.test_dataset_id = dataset_ids[test_dataset_hash]
+                run_model_configuration.required_parameters.dataset_id = dataset_ids[test_dataset_hash]
+            else:
+                dataset_ids[test_dataset_hash] = database_configuration.test_dataset_id
+                import_commands.append(experiment.idyom_config.import_test_dataset_command())
+
+            if experiment.pretrain_dataset_path:
+                pretrain_dataset_hash = hash_dataset_folder(experiment.logger.train_dataset_exp_folder)
+                if pretrain_dataset_hash in dataset_ids:
+                    database_configuration.pretrain_dataset_id = dataset_ids[pretrain_dataset_hash]
+                    run_model_configuration.training_parameters.pretraining_id = dataset_ids[pretrain_dataset_hash]
+                else:
+                    dataset_ids[pretrain_dataset_hash] = database_configuration.pretrain_dataset_id
+                    import_commands.append(experiment.idyom_config.import_train_dataset_command())
+        return import_commands
+
+    def generate_lisp_script(self, experiments: List[IDyOMExperiment] = None) -> str:
+        """
+        Generate the lisp script of the batch.
+
+        :param experiments: the experiments run by the script, defaults to all the experiments of the batch.
+        :type experiments: List[IDyOMExperiment]
+
+        :return: the path to the lisp script file.
+        :rtype: str
+        """
+        experiments = self.experiments if experiments is None else experiments
+        import_commands = self._share_dataset_ids(experiments)
+        timings_file_path = self.batch_folder_path + PHASE_TIMINGS_FILE_NAME
+        commands = [
+            time_lisp_command('start_idyom', self.experiments[0].idyom_config.start_idyom_command(), timings_file_path),
+            time_lisp_command('import_datasets', '\n'.join(import_commands), timings_file_path),
+        ]
+        for experiment in experiments:
+            experiment_folder = experiment.logger.this_exp_folder
+            model_commands = [
+                experiment.idyom_config.cache_directory_command(),
+                time_lisp_command('run_model', experiment.idyom_config.run_model_command(),
+                                  experiment_folder + PHASE_TIMINGS_FILE_NAME),
+            ]
+            commands.append(_batch_lisp_command('\n'.join(command for command in model_commands if command),
+                                                log_file_path=experiment_folder + 'idyom.log',
+                                                error_file_path=experiment_folder + BATCH_ERROR_FILE_NAME))
+        commands.append(self.experiments[0].idyom_config.quit_command())
+        lisp_file_path = self.batch_folder_path + 'batch.lisp'
+        with open(lisp_file_path, 'w') as f:
+            f.write('\n'.join(commands))
+        return lisp_file_path
+
+    def _run_in_process(self, experiments: List[IDyOMExperiment]) -> dict:
+        for experiment in experiments:
+            try:
+                self.backend.run_script(experiment, experiment.logger.this_exp_folder + 'compute.lisp',
+                                        experiment.idyom_config.run_model_configuration)
+            except Exception as error:
+                with open(experiment.logger.this_exp_folder + BATCH_ERROR_FILE_NAME, 'w') as f:
+                    f.write(f'{error}\n')
+        return {}
+
+    def run(self) -> Dict[str, str]:
+        """
+        Run the experiments of the batch (taking the outputs of the result cache of an experiment if it has them),
+        then write the run report of every experiment (see telemetry.write_run_report), with the resource usage
+        of the whole SBCL process, the timings of the shared phases (batch_phases) and the error of the run (batch_error).
+
+        :return: the errors of the failed runs, by experiment folder path.
+        :rtype: Dict[str, str]
+
+        :raises subprocess.CalledProcessError: if SBCL exits with a non-zero code (e.g., if IDyOM cannot be loaded).
+        """
+        start_time = time.time()
+        experiments_to_run = []
+        cache_hits = set()
+        for experiment in self.experiments:
+            experiment._check_run_condition()
+            experiment._remove_phase_timings()
+            error_file_path = experiment.logger.this_exp_folder + BATCH_ERROR_FILE_NAME
+            if os.path.exists(error_file_path):
+                os.remove(error_file_path)
+            if experiment._fetch_cached_outputs():
+                cache_hits.add(id(experiment))
+            else:
+                experiments_to_run.append(experiment)
+
+        resource_usage = {}
+        if experiments_to_run:
+            lisp_script_path = self.generate_lisp_script(experiments_to_run)
+            print(f'** running {len(experiments_to_run)} experiments in one batch **')
+            if isinstance(self.backend, InProcessBackend):
+                resource_usage = self._run_in_process(experiments_to_run)
+            else:
+                # the SBCL process is sized for the largest model of the batch
+                largest_experiment = max(experiments_to_run, key=lambda experiment: estimate_sbcl_memory(
+                    experiment, experiment.idyom_config.run_model_configuration))
+                with open(self.batch_folder_path + 'sbcl.log', 'w') as log:
+                    resource_usage = self.backend.run_script(largest_experiment, lisp_script_path,
+                                                             largest_experiment.idyom_config.run_model_configuration,
+                                                             stdout=log, stderr=subprocess.STDOUT)
+
+        batch_phases = read_phase_timings(self.batch_folder_path + PHASE_TIMINGS_FILE_NAME)
+        errors = {}
+        for experiment in self.experiments:
+            cache_hit = id(experiment) in cache_hits
+            error_file_path = experiment.logger.this_exp_folder + BATCH_ERROR_FILE_NAME
+            error = None
+            if os.path.exists(error_file_path):
+                with open(error_file_path, 'r') as f:
+                    error = f.read().strip()
+                errors[experiment.logger.this_exp_folder] = error
+            elif not cache_hit:
+                experiment._store_outputs_in_cache()
+            write_run_report(experiment, 'batch', start_time, resource_usages=[] if cache_hit else [resource_usage],
+                             result_cache_hit=cache_hit, batch_folder_path=self.batch_folder_path,
+                             batch_phases=batch_phases, batch_error=error)
         print(' ')
+        if errors:
+            print(f'** {len(errors)} of {len(self.experiments)} runs failed, see {BATCH_ERROR_FILE_NAME} '
+                  f'in their experiment folders **')
         print('** Finished! **')
+        return errors
@@ -0,0 +1,266 @@
+"""
+This module implements the viewpoint selection of IDyOM (source_viewpoints=':select') driven from python:
+at each step of the hill-climbing search, the candidate viewpoint systems are evaluated side by side,
+each in an IDyOM experiment of its own, instead of one after the other in one lisp process.
+"""
+
+import itertools
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from glob import glob
+from typing import List, Tuple, Union
+
+from py2lispIDyOM.backends import Backend, SBCLBackend
+from py2lispIDyOM.cache import ResultCache, LTMCache
+from py2lispIDyOM.configuration import SingleViewpoint, BasisOption
+from py2lispIDyOM.extract import getDataFrame
+from py2lispIDyOM.viewpoints import predicted_viewpoints
+from py2lispIDyOM.run import IDyOMExperiment
+from py2lispIDyOM.sweep import get_config_key, get_datasets_key
+
+# the viewpoints of the predefined bases of IDyOM
+BASES = {
+    ':pitch-full': ['cpitch', 'cpitch-class', 'cpint', 'cpint-size', 'contour', 'newcontour', 'cpintfip', 'cpintfref',
+                    'cpcint', 'cpcint-size', 'cpintfiph', 'cpintfb', 'inscale'],
+    ':pitch-short': ['cpitch', 'cpint', 'cpintfref', 'contour'],
+    ':bioi': ['bioi', 'bioi-contour'],
+    ':onset': ['onset', 'ioi', 'ioi-ratio', 'ioi-contour', 'posinbar'],
+}
+SELECTION_PARAMETERS = ('basis', 'dp', 'max_links', 'min_links', 'viewpoint_selection_output')
+SELECTION_TRACE_FILE_NAME = 'viewpoint_selection_output.txt'
+
+ViewpointSystem = Tuple[Union[SingleViewpoint, Tuple[SingleViewpoint]], ...]
+
+
+def _viewpoint_to_lisp(viewpoint) -> str:
+    return viewpoint if type(viewpoint) is str else f'({" ".join(viewpoint)})'
+
+
+def _system_to_lisp(system: ViewpointSystem) -> str:
+    return f'({" ".join(_viewpoint_to_lisp(viewpoint) for viewpoint in system)})'
+
+
+def mean_information_content(dat_file_path: str) -> float:
+    """
+    The score of a viewpoint system in the viewpoint selection of IDyOM:
+    the mean across melodies of the mean information content of their notes.
+
+    :rtype: float
+    """
+    df = getDataFrame(dat_file_path)
+    column = 'information.content' if 'information.content' in df else 'mean.information.content'
+    return float(df.groupby('melody.id')[column].mean().mean())
+
+
+@dataclass
+class ViewpointSelection:
+    """
+    A class to select the source viewpoints of the IDyOM model, as IDyOM does with source_viewpoints=':select'.
+
+    The search starts from the empty viewpoint system. At each step, every system obtained by adding one candidate
+    viewpoint to the current system or removing one viewpoint from it is evaluated (max_workers at the same time),
+    and the system with the lowest mean information content replaces the current one if it is lower than
+    the mean information content of the current one (both rounded to dp decimal places).
+    The search stops when no neighbouring system is better.
+
+    The scores are saved in the selection folder as soon as each system is evaluated, so that running an interrupted
+    selection again, or a selection with another basis, only evaluates the systems which have not been evaluated yet
+    on the same datasets.
+
+    :param test_dataset_path: the path to your test dataset (required)
+    :type test_dataset_path: str
+
+    :param pretrain_dataset_path: the path to your pretrain dataset
+    :type pretrain_dataset_path: str
+
+    :param selection_folder_path: the path to which you want to save the experiment folders, scores and trace of the selection.
+    :type selection_folder_path: str
+
+    :param parameters: the parameters of the IDyOM model (e.g., target_viewpoints, models), with source_viewpoints
+        left out or set to ':select', and the viewpoint selection parameters:
+        basis (a list of viewpoints, or one of ':pitch-full', ':pitch-short', ':bioi', ':onset', ':auto', defaults to ':auto',
+        given as such or wrapped in a BasisOption as IDyOMExperiment.set_parameters takes it),
+        dp (the number of decimal places of the scores compared, defaults to no rounding),
+        min_links and max_links (the numbers of basis viewpoints linked in the candidate viewpoints, default to 1 and 2),
+        viewpoint_selection_output (a file path to which the trace is copied).
+    :type parameters: dict
+
+    :param max_workers: the maximum number of viewpoint systems evaluated at the same time, defaults to 1.
+    :type max_workers: int
+
+    :param backend: the backend running the experiments, defaults to SBCLBackend().
+    :type backend: Backend
+
+    :param result_cache: a cache of IDyOM outputs shared by the experiments, defaults to None.
+    :type result_cache: ResultCache
+
+    :param ltm_cache: a cache of long-term models shared by the experiments, defaults to None.
+    :type ltm_cache: LTMCache
+    """
+
+    test_dataset_path: str
+    pretrain_dataset_path: str = None
+    selection_folder_path: str = 'experiment_history/viewpoint_selection/'
+    parameters: dict = field(default_factory=dict)
+    max_workers: int = 1
+    backend: Backend = field(default_factory=SBCLBackend)
+    result_cache: ResultCache = None
+    ltm_cache: LTMCache = None
+
+    def __post_init__(self):
+        if not os.path.exists(self.selection_folder_path):
+            os.makedirs(self.selection_folder_path)
+        self.scores_file_path = self.selection_folder_path + 'viewpoint_selection_scores.json'
+        self.trace_file_path = self.selection_folder_path + SELECTION_TRACE_FILE_NAME
+        self._lock = threading.Lock()
+        self.scores = self._load_scores()
+        self.datasets_key = get_datasets_key(self.test_dataset_path, self.pretrain_dataset_path)
+
+        selection_parameters = {key: self.parameters.get(key) for key in SELECTION_PARAMETERS}
+        basis = selection_parameters['basis']
+        if isinstance(basis, BasisOption):
+            basis = basis.basis
+        self.basis = basis if basis is not None else ':auto'
+        self.dp = selection_parameters['dp']
+        self.min_links = selection_parameters['min_links'] if selection_parameters['min_links'] is not None else 1
+        self.max_links = selection_parameters['max_links'] if selection_parameters['max_links'] is not None else 2
+        self.viewpoint_selection_output = selection_parameters['viewpoint_selection_output']
+        if self.parameters.get('source_viewpoints', ':select') != ':select':
+            raise ValueError(f'source_viewpoints must be \':select\' or left out, '
+                             f'got {self.parameters["source_viewpoints"]}')
+        self.model_parameters = {key: value for key, value in self.parameters.items()
+                                 if key not in SELECTION_PARAMETERS and key != 'source_viewpoints'}
+        self.candidate_viewpoints = self.get_candidate_viewpoints()
+        # check the model parameters before running anything
+        get_config_key({**self.model_parameters, 'source_viewpoints': list(self.candidate_viewpoints[:1])})
+
+    def get_basis(self) -> List[str]:
+        """
+        Get the viewpoints of the basis: the viewpoints of the list or predefined basis, or with basis ':auto',
+        all the viewpoints predicting one of the target viewpoints.
+
+        :rtype: List[str]
+
+        :raises ValueError: if the basis is not a list nor a predefined basis.
+        """
+        if type(self.basis) in [list, tuple]:
+            return list(self.basis)
+        if self.basis in BASES:
+            return BASES[self.basis]
+        if self.basis == ':auto':
+            targets = set(self.model_parameters.get('target_viewpoints') or [])
+            return [viewpoint for viewpoint in SingleViewpoint.__args__ if predicted_viewpoints(viewpoint) & targets]
+        raise ValueError(f'Invalid basis {self.basis}. Please use a list of viewpoints or one of {list(BASES)} or \':auto\'.')
+
+    def get_candidate_viewpoints(self) -> list:
+        """
+        Get the viewpoints which can be added to a viewpoint system: the basis viewpoints (if min_links is 1)
+        and the viewpoints linking min_links to max_links basis viewpoints.
+
+        :rtype: list
+        """
+        basis = self.get_basis()
+        candidates = []
+        for n_links in range(max(self.min_links, 1), self.max_links + 1):
+            for linked_viewpoints in itertools.combinations(basis, n_links):
+                candidates.append(linked_viewpoints[0] if n_links == 1 else linked_viewpoints)
+        return candidates
+
+    def _load_scores(self) -> dict:
+        if os.path.exists(self.scores_file_path):
+            with open(self.scores_file_path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _save_score(self, config_key: str, system: ViewpointSystem, score: float):
+        with self._lock:
+            self.scores[config_key] = {'source_viewpoints': _system_to_lisp(system), 'score': score}
+            temporary_file_path = self.scores_file_path + '.tmp'
+            with open(temporary_file_path, 'w') as f:
+                json.dump(self.scores, f, indent=2)
+            os.replace(temporary_file_path, self.scores_file_path)
+
+    def _config_key(self, system: ViewpointSystem) -> str:
+        return get_config_key({**self.model_parameters, 'source_viewpoints': list(system)}, self.datasets_key)
+
+    def _evaluate(self, system: ViewpointSystem) -> float:
+        config_key = self._config_key(system)
+        if config_key in self.scores:
+            return self.scores[config_key]['score']
+        experiment_logger_name = 'system_' + config_key[:12]
+        experiment_folder_path = self.selection_folder_path + experiment_logger_name + '/'
+        if os.path.exists(experiment_folder_path):  # left over by an interrupted run
+            shutil.rmtree(experiment_folder_path)
+        experiment = IDyOMExperiment(test_dataset_path=self.test_dataset_path,
+                                     pretrain_dataset_path=self.pretrain_dataset_path,
+                                     experiment_history_folder_path=self.selection_folder_path,
+                                     experiment_logger_name=experiment_logger_name,
+                                     result_cache=self.result_cache,
+                                     ltm_cache=self.ltm_cache,
+                                     backend=self.backend)
+        experiment.set_parameters(**self.model_parameters, source_viewpoints=list(system))
+        experiment.run()
+        score = mean_information_content(glob(experiment.logger.output_data_exp_folder + '*.dat')[0])
+        self._save_score(config_key, system, score)
+        return score
+
+    def _rounded(self, score: float) -> float:
+        return score if self.dp is None else round(score, self.dp)
+
+    def neighbours(self, system: ViewpointSystem) -> List[ViewpointSystem]:
+        """
+        Get the viewpoint systems obtained by adding one candidate viewpoint to the system
+        or removing one viewpoint from it (keeping at least one viewpoint).
+
+        :rtype: List[ViewpointSystem]
+        """
+        added = [self._sorted(system + (viewpoint,)) for viewpoint in self.candidate_viewpoints if viewpoint not in system]
+        removed = [system[:index] + system[index + 1:] for index in range(len(system))] if len(system) > 1 else []
+        return added + removed
+
+    def _sorted(self, system: ViewpointSystem) -> ViewpointSystem:
+        # the order of the viewpoints does not change the model, so that each system has one order only
+        return tuple(sorted(system, key=self.candidate_viewpoints.index))
+
+    def run(self) -> list:
+        """
+        Run the viewpoint selection and write its trace (one line per viewpoint system considered, with its step,
+        score and whether it was selected) to viewpoint_selection_output.txt in the selection folder.
+
+        :return: the selected source viewpoints, which can be passed to IDyOMExperiment.set_parameters.
+        :rtype: list
+        """
+        current_system, current_score = (), float('inf')
+        trace = []
+        step = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                step += 1
+                neighbours = self.neighbours(current_system)
+                if not neighbours:  # the current system holds every candidate viewpoint
+                    break
+                print(f'** Viewpoint selection step {step}: evaluating {len(neighbours)} viewpoint systems **')
+                scores = list(executor.map(self._evaluate, neighbours))
+                best_index = min(range(len(neighbours)), key=lambda index: self._rounded(scores[index]))
+                accepted = self._rounded(scores[best_index]) < self._rounded(current_score)
+                trace.extend((step, system, score, accepted and index == best_index)
+                             for index, (system, score) in enumerate(zip(neighbours, scores)))
+                if not accepted:
+                    break
+                current_system, current_score = neighbours[best_index], scores[best_index]
+                print(f'** Selected {_system_to_lisp(current_system)} (mean information content {current_score:.4f}) **')
+
+        self._write_trace(trace)
+        return list(current_system)
+
+    def _write_trace(self, trace: list):
+        with open(self.trace_file_path, 'w') as f:
+            f.write('step\tsource.viewpoints\tmean.information.content\tselected\n')
+            for step, system, score, selected in trace:
+                f.write(f'{step}\t{_system_to_lisp(system)}\t{score:.8g}\t{"t" if selected else "nil"}\n')
+        if self.viewpoint_selection_output:
+            shutil.copy(self.trace_file_path, self.viewpoint_selection_output)
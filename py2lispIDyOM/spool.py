@@ -0,0 +1,383 @@
+"""
+This module implements a file-based job queue, so that IDyOM experiments submitted from several scripts or notebooks
+run on one machine with a limit on the number of SBCL processes running at the same time.
+
+A spool folder holds one JSON file per job in the sub-folder of its state (pending, running, finished, failed).
+Workers claim a job by renaming its file from pending/ to running/, which only one worker can do,
+so that several workers (e.g., ``py2lispidyom worker`` daemons on several machines) can share a spool folder
+on a shared file system without a broker.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from glob import glob
+from typing import List
+
+from py2lispIDyOM.backends import Backend, get_backend
+from py2lispIDyOM.cache import ResultCache, LTMCache
+from py2lispIDyOM.configuration import RunModelConfiguration
+from py2lispIDyOM.run import IDyOMExperiment
+
+JOB_STATES = ('pending', 'running', 'finished', 'failed')
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def _write_json_atomic(file_path: str, content: dict):
+    temporary_file_path = f'{file_path}.{uuid.uuid4().hex}.tmp'
+    with open(temporary_file_path, 'w') as f:
+        json.dump(content, f, indent=2)
+    os.replace(temporary_file_path, file_path)
+
+
+def _absolute_folder_path(folder_path: str) -> str:
+    return os.path.abspath(folder_path) + '/' if folder_path is not None else None
+
+
+@dataclass
+class JobQueue:
+    """
+    A spool folder of IDyOM experiments waiting to be run by workers (see SpoolWorker).
+
+    :param spool_folder_path: the path to the spool folder shared by the submitters and the workers.
+    :type spool_folder_path: str
+    """
+
+    spool_folder_path: str = 'experiment_history/spool/'
+
+    def __post_init__(self):
+        for folder_name in JOB_STATES + ('status',):
+            os.makedirs(self.spool_folder_path + folder_name, exist_ok=True)
+
+    def _job_file_path(self, state: str, job_id: str) -> str:
+        return f'{self.spool_folder_path}{state}/{job_id}.json'
+
+    def _status_file_path(self, job_id: str) -> str:
+        return f'{self.spool_folder_path}status/{job_id}.json'
+
+    def submit(self, test_dataset_path: str, pretrain_dataset_path: str = None,
+               experiment_history_folder_path: str = None, experiment_logger_name: str = None,
+               result_cache: ResultCache = None, ltm_cache: LTMCache = None, backend: Backend = None,
+               max_retries: int = 2, **parameters) -> str:
+        """
+        Add an IDyOM experiment to the queue.
+        The arguments are those of IDyOMExperiment and of IDyOMExperiment.set_parameters,
+        the paths are made absolute so that workers started from other folders find them.
+
+        :param max_retries: the number of times the experiment is run again after a transient failure (see SpoolWorker), defaults to 2.
+        :type max_retries: int
+
+        :return: the ID of the job.
+        :rtype: str
+
+        :raises KeyError, TypeError: if the parameters are invalid (see IDyOMExperiment.set_parameters).
+        :raises AssertionError: if the required parameters are missing.
+        """
+        configuration = RunModelConfiguration()
+        configuration.set_parameters(**parameters)
+        if not configuration.required_parameters.is_complete():
+            raise AssertionError(f'{parameters} Missing required argument')
+
+        job_id = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:8]
+        job = {
+            'job_id': job_id,
+            'test_dataset_path': _absolute_folder_path(test_dataset_path),
+            'pretrain_dataset_path': _absolute_folder_path(pretrain_dataset_path),
+            'experiment_history_folder_path': _absolute_folder_path(experiment_history_folder_path or 'experiment_history/'),
+            'experiment_logger_name': experiment_logger_name or job_id,
+            'result_cache': None if result_cache is None else {
+                'cache_folder_path': _absolute_folder_path(result_cache.cache_folder_path),
+                'max_size_bytes': result_cache.max_size_bytes},
+            'ltm_cache': None if ltm_cache is None else {
+                'cache_folder_path': _absolute_folder_path(ltm_cache.cache_folder_path),
+                'max_size_bytes': ltm_cache.max_size_bytes},
+            'backend': None if backend is None else backend.to_dict(),
+            'parameters': parameters,
+            'max_retries': max_retries,
+            'attempts': 0,
+            'not_before': 0,
+        }
+        _write_json_atomic(self._status_file_path(job_id), {'job_id': job_id, 'state': 'pending', 'submitted': _now()})
+        _write_json_atomic(self._job_file_path('pending', job_id), job)
+        print(f'** Submitted job {job_id} **')
+        return job_id
+
+    def status(self, job_id: str) -> dict:
+        """
+        Get the status of a job: its state, number of attempts, worker, start and finish times, last error
+        and experiment folder.
+
+        :rtype: dict
+        """
+        with open(self._status_file_path(job_id), 'r') as f:
+            return json.load(f)
+
+    def _update_status(self, job_id: str, **entries):
+        status = self.status(job_id)
+        status.update(entries)
+        _write_json_atomic(self._status_file_path(job_id), status)
+
+    def jobs(self, state: str = None) -> List[str]:
+        """
+        Get the IDs of the jobs in a state (one of 'pending', 'running', 'finished', 'failed'), or of all the jobs,
+        sorted by submission time.
+
+        :rtype: List[str]
+        """
+        states = JOB_STATES if state is None else (state,)
+        job_file_paths = [path for state in states for path in glob(f'{self.spool_folder_path}{state}/*.json')]
+        return sorted(os.path.basename(path)[:-len('.json')] for path in job_file_paths)
+
+    def wait(self, job_ids: List[str], poll_interval: float = 1, timeout: float = None) -> List[dict]:
+        """
+        Wait until the jobs are finished or failed.
+
+        :return: the status of every job.
+        :rtype: List[dict]
+
+        :raises TimeoutError: if the jobs are not done after timeout seconds.
+        """
+        start_time = time.monotonic()
+        done_job_ids = set(self.jobs('finished') + self.jobs('failed'))
+        while not set(job_ids) <= done_job_ids:
+            if timeout is not None and time.monotonic() - start_time > timeout:
+                raise TimeoutError(f'Jobs {sorted(set(job_ids) - done_job_ids)} are not done after {timeout} seconds')
+            time.sleep(poll_interval)
+            done_job_ids = set(self.jobs('finished') + self.jobs('failed'))
+        return [self.status(job_id) for job_id in job_ids]
+
+    def _claim(self, job_id: str) -> bool:
+        """
+        Move the job from pending/ to running/. The rename is atomic, so only one of the workers trying succeeds.
+        The job is then given a new claim token, which tells its worker whether it still owns the job when it is done
+        (see _move), and its attempt is counted in the job file, so that it counts even if the worker dies.
+        """
+        try:
+            # the rename keeps the modification time, which is the heartbeat of the running job: set it to now first,
+            # so that a job which waited in pending/ longer than stale_after is not requeued as soon as it is claimed
+            os.utime(self._job_file_path('pending', job_id))
+            os.rename(self._job_file_path('pending', job_id), self._job_file_path('running', job_id))
+        except FileNotFoundError:
+            return False
+        job = self._load_job('running', job_id)
+        job['claim_token'] = uuid.uuid4().hex
+        job['attempts'] += 1
+        _write_json_atomic(self._job_file_path('running', job_id), job)
+        return True
+
+    def _move(self, job: dict, from_state: str, to_state: str) -> bool:
+        """
+        Move the job to another state, if the job file in from_state is still the one claimed with the token of the job.
+        A job requeued as stale (and possibly claimed by another worker) is left as is.
+
+        :return: whether the job was moved.
+        :rtype: bool
+        """
+        from_file_path = self._job_file_path(from_state, job['job_id'])
+        # take the job file out of the folder first, so that it cannot be requeued while its owner is checked
+        moving_file_path = f'{from_file_path}.{job["claim_token"]}.moving'
+        try:
+            os.rename(from_file_path, moving_file_path)
+        except FileNotFoundError:  # requeued, and possibly finished by another worker
+            return False
+        with open(moving_file_path, 'r') as f:
+            claim_token = json.load(f).get('claim_token')
+        if claim_token != job['claim_token']:  # requeued and claimed by another worker
+            os.rename(moving_file_path, from_file_path)
+            return False
+        _write_json_atomic(moving_file_path, job)
+        os.rename(moving_file_path, self._job_file_path(to_state, job['job_id']))
+        return True
+
+    def _load_job(self, state: str, job_id: str) -> dict:
+        with open(self._job_file_path(state, job_id), 'r') as f:
+            return json.load(f)
+
+    def requeue_stale_jobs(self, stale_after: float) -> List[str]:
+        """
+        Move back to pending/ the running jobs whose worker stopped sending heartbeats (e.g., after a crash)
+        more than stale_after seconds ago, or to failed/ those which have no retries left.
+
+        :return: the IDs of the requeued (or failed) jobs.
+        :rtype: List[str]
+        """
+        requeued_job_ids = []
+        for job_id in self.jobs('running'):
+            try:
+                heartbeat_age = time.time() - os.path.getmtime(self._job_file_path('running', job_id))
+                if heartbeat_age <= stale_after:
+                    continue
+                job = self._load_job('running', job_id)
+                to_state = 'pending' if job['attempts'] <= job['max_retries'] else 'failed'
+                os.rename(self._job_file_path('running', job_id), self._job_file_path(to_state, job_id))
+            except FileNotFoundError:  # finished or requeued by another worker meanwhile
+                continue
+            error = f'no heartbeat for {heartbeat_age:.0f} seconds'
+            if to_state == 'pending':
+                self._update_status(job_id, state='pending', error=f'requeued after {error}')
+                print(f'** Requeued stale job {job_id} **')
+            else:
+                self._update_status(job_id, state='failed', finished=_now(),
+                                    error=f'{error} after {job["attempts"]} attempts')
+                print(f'** Stale job {job_id} failed after {job["attempts"]} attempts **')
+            requeued_job_ids.append(job_id)
+        return requeued_job_ids
+
+
+@dataclass
+class SpoolWorker:
+    """
+    A worker running the jobs of a spool folder, with at most max_concurrent_runs experiments at the same time.
+
+    A failed job is run again (after retry_delay seconds, doubled at every attempt) if its error is one of
+    transient_errors and it has retries left, otherwise it is moved to failed/.
+    A running job whose worker stopped sending heartbeats for stale_after seconds is requeued by the other workers.
+
+    :param spool_folder_path: the path to the spool folder.
+    :type spool_folder_path: str
+
+    :param max_concurrent_runs: the maximum number of experiments running at the same time, defaults to 1.
+    :type max_concurrent_runs: int
+
+    :param poll_interval: the number of seconds between two scans of the spool folder, defaults to 2.
+    :type poll_interval: float
+
+    :param retry_delay: the number of seconds before the first retry of a failed job, defaults to 30.
+    :type retry_delay: float
+
+    :param heartbeat_interval: the number of seconds between two heartbeats of the running jobs, defaults to 30.
+    :type heartbeat_interval: float
+
+    :param stale_after: the number of seconds without heartbeat after which a running job is requeued, defaults to 300.
+    :type stale_after: float
+    """
+
+    spool_folder_path: str = 'experiment_history/spool/'
+    max_concurrent_runs: int = 1
+    poll_interval: float = 2
+    retry_delay: float = 30
+    heartbeat_interval: float = 30
+    stale_after: float = 300
+
+    # the errors worth running the experiment again for (e.g., SBCL crashing or running out of memory)
+    transient_errors = (subprocess.CalledProcessError, subprocess.TimeoutExpired, ConnectionError, TimeoutError)
+
+    def __post_init__(self):
+        self.queue = JobQueue(self.spool_folder_path)
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self._active_job_ids = set()
+        self._active_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._heartbeat_stop_event = threading.Event()
+
+    def stop(self):
+        """
+        Stop claiming new jobs. The running experiments are finished before run returns.
+        """
+        self._stop_event.set()
+
+    def _next_claimable_job_id(self):
+        for job_id in self.queue.jobs('pending'):
+            try:
+                job = self.queue._load_job('pending', job_id)
+            except FileNotFoundError:  # claimed by another worker meanwhile
+                continue
+            if job['not_before'] <= time.time() and self.queue._claim(job_id):
+                return job_id
+        return None
+
+    def _heartbeat(self):
+        # the modification time of the job files in running/ tells the other workers that their worker is alive
+        while not self._heartbeat_stop_event.wait(self.heartbeat_interval):
+            with self._active_lock:
+                active_job_ids = list(self._active_job_ids)
+            for job_id in active_job_ids:
+                try:
+                    os.utime(self.queue._job_file_path('running', job_id))
+                except FileNotFoundError:
+                    pass
+
+    def _run_job(self, job_id: str):
+        job = self.queue._load_job('running', job_id)  # with its attempt counted by _claim
+        experiment_folder_path = job['experiment_history_folder_path'] + job['experiment_logger_name'] + '/'
+        self.queue._update_status(job_id, state='running', attempts=job['attempts'], worker=self.worker_id,
+                                  started=_now(), experiment_folder_path=experiment_folder_path)
+        print(f'** Worker {self.worker_id} running job {job_id} (attempt {job["attempts"]}) **')
+        try:
+            if job['attempts'] > 1 and os.path.exists(experiment_folder_path):  # left over by the previous attempt
+                shutil.rmtree(experiment_folder_path)
+            experiment = IDyOMExperiment(
+                test_dataset_path=job['test_dataset_path'],
+                pretrain_dataset_path=job['pretrain_dataset_path'],
+                experiment_history_folder_path=job['experiment_history_folder_path'],
+                experiment_logger_name=job['experiment_logger_name'],
+                result_cache=ResultCache(**job['result_cache']) if job['result_cache'] else None,
+                ltm_cache=LTMCache(**job['ltm_cache']) if job['ltm_cache'] else None)
+            if job.get('backend'):
+                experiment.backend = get_backend(**job['backend'])
+            experiment.set_parameters(**job['parameters'])
+            experiment.run()
+        except Exception as error:
+            self._handle_failure(job, error)
+        else:
+            if self.queue._move(job, 'running', 'finished'):
+                self.queue._update_status(job_id, state='finished', finished=_now(), error=None)
+                print(f'** Job {job_id} finished **')
+            else:
+                print(f'** Job {job_id} was requeued meanwhile, dropping its result **')
+        finally:
+            with self._active_lock:
+                self._active_job_ids.discard(job_id)
+
+    def _handle_failure(self, job: dict, error: Exception):
+        job_id = job['job_id']
+        retry = isinstance(error, self.transient_errors) and job['attempts'] <= job['max_retries']
+        if retry:
+            job['not_before'] = time.time() + self.retry_delay * 2 ** (job['attempts'] - 1)
+        if not self.queue._move(job, 'running', 'pending' if retry else 'failed'):
+            print(f'** Job {job_id} was requeued meanwhile, dropping its error {error!r} **')
+        elif retry:
+            self.queue._update_status(job_id, state='pending', error=repr(error))
+            print(f'** Job {job_id} failed with {error!r}, retrying **')
+        else:
+            self.queue._update_status(job_id, state='failed', finished=_now(), error=repr(error))
+            print(f'** Job {job_id} failed with {error!r} **')
+
+    def run(self, exit_when_empty: bool = False):
+        """
+        Claim and run the jobs of the spool folder until stop is called.
+
+        :param exit_when_empty: return once no job is pending (or waiting for a retry) and no job is running, defaults to False.
+        :type exit_when_empty: bool
+        """
+        print(f'** Worker {self.worker_id} watching {self.spool_folder_path} **')
+        self._stop_event.clear()
+        self._heartbeat_stop_event.clear()
+        heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat_thread.start()
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_runs) as executor:
+            while not self._stop_event.is_set():
+                self.queue.requeue_stale_jobs(self.stale_after)
+                while len(self._active_job_ids) < self.max_concurrent_runs:
+                    job_id = self._next_claimable_job_id()
+                    if job_id is None:
+                        break
+                    with self._active_lock:
+                        self._active_job_ids.add(job_id)
+                    executor.submit(self._run_job, job_id)
+                if exit_when_empty and not self._active_job_ids and not self.queue.jobs('pending'):
+                    break
+                self._stop_event.wait(self.poll_interval)
+        self._heartbeat_stop_event.set()
+        print(f'** Worker {self.worker_id} stopped **')
@@ -0,0 +1,277 @@
+"""
+This module implements a class to sweep the IDyOM model parameters over a grid or random samples,
+and collect the summary metrics of every configuration in one table.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import random
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from glob import glob
+from typing import Dict, List
+
+import pandas as pd
+
+from py2lispIDyOM.backends import Backend, SBCLBackend
+from py2lispIDyOM.cache import ResultCache, LTMCache, hash_dataset_folder
+from py2lispIDyOM.configuration import RunModelConfiguration, to_plain_data
+from py2lispIDyOM.extract import get_summary_metrics
+from py2lispIDyOM.run import IDyOMExperiment
+
+
+def get_config_key(parameters: dict, datasets_key: str = None) -> str:
+    """
+    Get a key identifying the configuration resulting from the parameters, so that equivalent configurations
+    (e.g., one setting a parameter to its default value and one leaving it out) have the same key.
+    With datasets_key (see get_datasets_key), the key also identifies the datasets the configuration is run on.
+
+    :raises KeyError, TypeError: if the parameters are invalid (see IDyOMExperiment.set_parameters).
+    :raises AssertionError: if the required parameters are missing.
+    """
+    configuration = RunModelConfiguration()
+    configuration.set_parameters(**parameters)
+    if not configuration.required_parameters.is_complete():
+        raise AssertionError(f'{parameters} Missing required argument')
+    canonical_json = json.dumps(configuration.canonical_parameters(), sort_keys=True)
+    if datasets_key is not None:
+        canonical_json += datasets_key
+    return hashlib.sha1(canonical_json.encode()).hexdigest()
+
+
+def get_datasets_key(test_dataset_path: str, pretrain_dataset_path: str = None) -> str:
+    """
+    Get a key identifying the contents of the test and pretraining datasets (see cache.hash_dataset_folder),
+    so that the results of a configuration on some datasets are not taken for its results on others.
+    """
+    dataset_hashes = [hash_dataset_folder(None if path is None else os.path.join(path, ''))
+                      for path in (test_dataset_path, pretrain_dataset_path)]
+    return hashlib.sha1(' '.join(dataset_hashes).encode()).hexdigest()
+
+
+@dataclass
+class ParameterSweep:
+    """
+    A class to run one IDyOM experiment for each point of a parameter sweep.
+
+    Every point is validated before any experiment is run, and points leading to the same configuration are only run once.
+    The progress is saved in the sweep folder after each run, so that running an interrupted sweep again
+    only runs the configurations which have not finished yet on the same datasets.
+
+    :param test_dataset_path: the path to your test dataset (required)
+    :type test_dataset_path: str
+
+    :param pretrain_dataset_path: the path to your pretrain dataset
+    :type pretrain_dataset_path: str
+
+    :param sweep_folder_path: the path to which you want to save the experiment folders and the progress of the sweep.
+    :type sweep_folder_path: str
+
+    :param fixed_parameters: the parameters shared by all points of the sweep (e.g., target_viewpoints).
+    :type fixed_parameters: dict
+
+    :param max_workers: the maximum number of experiments running at the same time, defaults to 1.
+    :type max_workers: int
+
+    :param backend: the backend running the experiments, defaults to SBCLBackend().
+    :type backend: Backend
+
+    :param result_cache: a cache of IDyOM outputs shared by the experiments, defaults to None.
+    :type result_cache: ResultCache
+
+    :param ltm_cache: a cache of long-term models shared by the experiments, defaults to None.
+    :type ltm_cache: LTMCache
+    """
+
+    test_dataset_path: str
+    pretrain_dataset_path: str = None
+    sweep_folder_path: str = 'experiment_history/sweep/'
+    fixed_parameters: dict = field(default_factory=dict)
+    max_workers: int = 1
+    backend: Backend = field(default_factory=SBCLBackend)
+    result_cache: ResultCache = None
+    ltm_cache: LTMCache = None
+
+    def __post_init__(self):
+        if not os.path.exists(self.sweep_folder_path):
+            os.makedirs(self.sweep_folder_path)
+        self.progress_file_path = self.sweep_folder_path + 'sweep_progress.json'
+        self.datasets_key = get_datasets_key(self.test_dataset_path, self.pretrain_dataset_path)
+        self._lock = threading.Lock()
+        self.progress = self._load_progress()
+
+    @staticmethod
+    def grid(parameter_grid: Dict[str, list]) -> List[dict]:
+        """
+        Get all the combinations of the parameter values.
+
+        :param parameter_grid: a dictionary of parameter names and the list of values to sweep over.
+        :type parameter_grid: Dict[str, list]
+
+        :return: a list of parameter dictionaries.
+        :rtype: List[dict]
+        """
+        names = list(parameter_grid.keys())
+        return [dict(zip(names, values)) for values in itertools.product(*parameter_grid.values())]
+
+    @staticmethod
+    def random_samples(parameter_space: Dict[str, list], n_samples: int, seed: int = None) -> List[dict]:
+        """
+        Draw each parameter value uniformly at random from its list of values.
+
+        :param parameter_space: a dictionary of parameter names and the list of possible values.
+        :type parameter_space: Dict[str, list]
+
+        :param n_samples: the number of points to draw.
+        :type n_samples: int
+
+        :param seed: the seed of the random generator, defaults to None.
+        :type seed: int
+
+        :return: a list of parameter dictionaries.
+        :rtype: List[dict]
+        """
+        rng = random.Random(seed)
+        return [{name: rng.choice(values) for name, values in parameter_space.items()} for _ in range(n_samples)]
+
+    @staticmethod
+    def latin_hypercube_samples(parameter_space: Dict[str, list], n_samples: int, seed: int = None) -> List[dict]:
+        """
+        Draw a Latin hypercube sample: for each parameter, the n_samples points fall into n_samples equal strata
+        of its list of values, so that every value is covered as evenly as possible.
+
+        :param parameter_space: a dictionary of parameter names and the list of possible values.
+        :type parameter_space: Dict[str, list]
+
+        :param n_samples: the number of points to draw.
+        :type n_samples: int
+
+        :param seed: the seed of the random generator, defaults to None.
+        :type seed: int
+
+        :return: a list of parameter dictionaries.
+        :rtype: List[dict]
+        """
+        rng = random.Random(seed)
+        samples = [{} for _ in range(n_samples)]
+        for name, values in parameter_space.items():
+            strata = list(range(n_samples))
+            rng.shuffle(strata)
+            for sample, stratum in zip(samples, strata):
+                position = (stratum + rng.random()) / n_samples
+                sample[name] = values[int(position * len(values))]
+        return samples
+
+    def _load_progress(self) -> dict:
+        if os.path.exists(self.progress_file_path):
+            with open(self.progress_file_path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _save_progress(self):
+        temporary_file_path = self.progress_file_path + '.tmp'
+        with open(temporary_file_path, 'w') as f:
+            json.dump(self.progress, f, indent=2)
+        os.replace(temporary_file_path, self.progress_file_path)
+
+    def _update_progress(self, config_key, **entries):
+        with self._lock:
+            self.progress[config_key].update(entries)
+            self._save_progress()
+
+    def validate(self, points: List[dict]) -> Dict[str, dict]:
+        """
+        Check every point of the sweep and remove the duplicated configurations.
+
+        :param points: a list of parameter dictionaries (e.g., from grid, random_samples or latin_hypercube_samples).
+        :type points: List[dict]
+
+        :return: a dictionary of the configuration keys and the parameters of the unique configurations.
+        :rtype: Dict[str, dict]
+
+        :raises ValueError: if a point is invalid, with the reason and the index of the point.
+        """
+        unique_points = {}
+        for index, point in enumerate(points):
+            parameters = {**self.fixed_parameters, **point}
+            try:
+                config_key = get_config_key(parameters, self.datasets_key)
+            except (KeyError, TypeError, AssertionError) as error:
+                raise ValueError(f'Point {index} of the sweep {point} is invalid: {error}') from error
+            unique_points.setdefault(config_key, parameters)
+        return unique_points
+
+    def _run_point(self, config_key: str, parameters: dict):
+        experiment_logger_name = 'point_' + config_key[:12]
+        experiment_folder_path = self.sweep_folder_path + experiment_logger_name + '/'
+        if os.path.exists(experiment_folder_path):  # left over by an interrupted run
+            shutil.rmtree(experiment_folder_path)
+        self._update_progress(config_key, status='running', experiment_folder_path=experiment_folder_path)
+        experiment = IDyOMExperiment(test_dataset_path=self.test_dataset_path,
+                                     pretrain_dataset_path=self.pretrain_dataset_path,
+                                     experiment_history_folder_path=self.sweep_folder_path,
+                                     experiment_logger_name=experiment_logger_name,
+                                     result_cache=self.result_cache,
+                                     ltm_cache=self.ltm_cache,
+                                     backend=self.backend)
+        experiment.set_parameters(**parameters)
+        experiment.run()
+
+    def run(self, points: List[dict]):
+        """
+        Run the experiments of all the points which have not finished in a previous call.
+
+        :param points: a list of parameter dictionaries (e.g., from grid, random_samples or latin_hypercube_samples).
+        :type points: List[dict]
+
+        :return: the results table (see results_table).
+        :rtype: pd.DataFrame
+        """
+        unique_points = self.validate(points)
+        pending_points = {}
+        for config_key, parameters in unique_points.items():
+            plain_parameters = {key: to_plain_data(value) for key, value in parameters.items()}
+            entry = self.progress.setdefault(config_key, {'parameters': plain_parameters, 'status': 'pending',
+                                                          'datasets_key': self.datasets_key})
+            if entry['status'] != 'finished':
+                pending_points[config_key] = parameters
+        self._save_progress()
+        print(f'** {len(unique_points)} unique configurations, {len(pending_points)} to run **')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._run_point, config_key, parameters): config_key
+                       for config_key, parameters in pending_points.items()}
+            for future in as_completed(futures):
+                config_key = futures[future]
+                error = future.exception()
+                if error is None:
+                    self._update_progress(config_key, status='finished', error=None)
+                else:
+                    self._update_progress(config_key, status='failed', error=repr(error))
+                    print(f'** Configuration {config_key[:12]} failed: {error!r} **')
+
+        return self.results_table()
+
+    def results_table(self) -> pd.DataFrame:
+        """
+        Get a table with one row per configuration of the sweep run on its datasets, joining its parameters,
+        status and summary metrics (see extract.get_summary_metrics).
+
+        :rtype: pd.DataFrame
+        """
+        rows = []
+        for config_key, entry in self.progress.items():
+            if entry.get('datasets_key') != self.datasets_key:  # run on other datasets in the same sweep folder
+                continue
+            row = {'config_key': config_key, **entry['parameters'], 'status': entry['status'],
+                   'experiment_folder_path': entry.get('experiment_folder_path')}
+            if entry['status'] == 'finished':
+                dat_file_paths = glob(entry['experiment_folder_path'] + 'experiment_output_data_folder/*.dat')
+                if dat_file_paths:
+                    row.update(get_summary_metrics(dat_file_paths[0]))
+            rows.append(row)
+        return pd.DataFrame(rows)
@@ -0,0 +1,189 @@
+"""
+This module implements the run reports of IDyOM experiments: the wall time of every phase of the lisp script,
+the peak memory and CPU time of the SBCL process, the size of the datasets and of the outputs.
+Every run writes a run_report.json file in its experiment folder, and aggregate_run_reports collects them in one table.
+"""
+
+import datetime
+import json
+import os
+import subprocess
+import time
+from glob import glob
+from typing import List
+
+import pandas as pd
+
+from py2lispIDyOM.notes import read_melody
+
+PHASE_TIMINGS_FILE_NAME = 'phase_timings.txt'
+RUN_REPORT_FILE_NAME = 'run_report.json'
+
+
+def time_lisp_command(phase: str, command: str, timings_file_path: str) -> str:
+    """
+    Wrap lisp commands in a form appending the name of the phase and its wall time (in seconds)
+    to the timings file once they are evaluated.
+    """
+    return (f'(let ((py2lispidyom-phase-start (get-internal-real-time)))\n'
+            f'{command}\n'
+            f'(with-open-file (timings "{timings_file_path}" :direction :output :if-exists :append :if-does-not-exist :create)\n'
+            f'  (format timings "~a ~,3f~%" "{phase}" '
+            f'(/ (- (get-internal-real-time) py2lispidyom-phase-start) internal-time-units-per-second))))')
+
+
+def read_phase_timings(timings_file_path: str) -> dict:
+    """
+    Read the wall time of every phase written by the timed lisp commands, summing the phases run several times.
+
+    :rtype: dict
+    """
+    phase_timings = {}
+    if os.path.exists(timings_file_path):
+        with open(timings_file_path, 'r') as f:
+            for line in f:
+                phase, seconds = line.split()
+                phase_timings[phase] = round(phase_timings.get(phase, 0) + float(seconds), 3)
+    return phase_timings
+
+
+def run_with_resource_usage(command: List[str], **popen_kwargs) -> dict:
+    """
+    Run a command like subprocess.run(command, check=True), and measure the peak resident memory and the CPU time
+    of the process (None where os.wait4 is not available, e.g., on Windows).
+
+    :return: a dictionary with the peak_rss_bytes, user_cpu_time and system_cpu_time of the process.
+    :rtype: dict
+
+    :raises subprocess.CalledProcessError: if the process exits with a non-zero code.
+    """
+    process = subprocess.Popen(command, **popen_kwargs)
+    try:
+        if hasattr(os, 'wait4'):
+            _, wait_status, resource_usage = os.wait4(process.pid, 0)
+            returncode = os.waitstatus_to_exitcode(wait_status)
+            process.returncode = returncode
+        else:
+            returncode, resource_usage = process.wait(), None
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode=returncode, cmd=command)
+    if resource_usage is None:
+        return {'peak_rss_bytes': None, 'user_cpu_time': None, 'system_cpu_time': None}
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    rss_unit = 1 if os.uname().sysname == 'Darwin' else 1024
+    return {'peak_rss_bytes': resource_usage.ru_maxrss * rss_unit,
+            'user_cpu_time': round(resource_usage.ru_utime, 3),
+            'system_cpu_time': round(resource_usage.ru_stime, 3)}
+
+
+def get_dataset_size(dataset_folder_path: str) -> dict:
+    """
+    Get the number of music files of a dataset folder and their total number of notes.
+
+    :rtype: dict
+    """
+    if dataset_folder_path is None or not os.path.exists(dataset_folder_path):
+        return None
+    music_file_paths = glob(os.path.join(dataset_folder_path, '*.mid')) + glob(os.path.join(dataset_folder_path, '*.krn'))
+    n_notes = sum(len(read_melody(path).notes) for path in music_file_paths)
+    return {'n_files': len(music_file_paths), 'n_notes': n_notes}
+
+
+def get_output_size(output_folder_path: str) -> dict:
+    """
+    Get the number of output files of an experiment and their total size in bytes.
+
+    :rtype: dict
+    """
+    file_paths = [path for path in glob(os.path.join(output_folder_path, '*')) if os.path.isfile(path)]
+    return {'n_files': len(file_paths), 'size_bytes': sum(os.path.getsize(path) for path in file_paths)}
+
+
+def combine_resource_usages(resource_usages: List[dict]) -> dict:
+    """
+    Combine the resource usages of SBCL processes run side by side: the largest peak memory and the total CPU times.
+
+    :rtype: dict
+    """
+
+    def _combine(key, function):
+        values = [usage[key] for usage in resource_usages if usage.get(key) is not None]
+        return function(values) if values else None
+
+    return {'peak_rss_bytes': _combine('peak_rss_bytes', max),
+            'user_cpu_time': _combine('user_cpu_time', lambda values: round(sum(values), 3)),
+            'system_cpu_time': _combine('system_cpu_time', lambda values: round(sum(values), 3)),
+            'n_processes': len(resource_usages)}
+
+
+def write_run_report(experiment, run_mode: str, start_time: float, resource_usages: List[dict],
+                     result_cache_hit: bool = False, **extra_entries) -> dict:
+    """
+    Write the run_report.json file of an experiment after its run.
+
+    :param experiment: the experiment which has just run.
+    :type experiment: IDyOMExperiment
+
+    :param run_mode: the method which ran the experiment ('run', 'run_async', 'run_fold_shards').
+    :type run_mode: str
+
+    :param start_time: the time.time() at the start of the run.
+    :type start_time: float
+
+    :param resource_usages: the resource usages of the SBCL processes (see run_with_resource_usage).
+    :type resource_usages: List[dict]
+
+    :param result_cache_hit: whether the outputs were taken from the result cache instead of running SBCL.
+    :type result_cache_hit: bool
+
+    :return: the content of the report.
+    :rtype: dict
+    """
+    # the sizes of the datasets are parsed once per python process (and the number of notes is None if a music file
+    # cannot be read), imported here since resources imports this module
+    from py2lispIDyOM.resources import _get_cached_dataset_size
+
+    logger = experiment.logger
+    finish_time = time.time()
+    run_report = {
+        'experiment_folder_path': logger.this_exp_folder,
+        'run_mode': run_mode,
+        'started': datetime.datetime.fromtimestamp(start_time).isoformat(timespec='seconds'),
+        'finished': datetime.datetime.fromtimestamp(finish_time).isoformat(timespec='seconds'),
+        'wall_time': round(finish_time - start_time, 3),
+        'phases': read_phase_timings(logger.this_exp_folder + PHASE_TIMINGS_FILE_NAME),
+        'sbcl': combine_resource_usages(resource_usages),
+        'result_cache_hit': result_cache_hit,
+        'test_dataset': _get_cached_dataset_size(logger.test_dataset_exp_folder),
+        'pretrain_dataset': _get_cached_dataset_size(logger.train_dataset_exp_folder),
+        'outputs': get_output_size(logger.output_data_exp_folder),
+        'parameters': experiment.idyom_config.run_model_configuration.canonical_parameters(),
+        **extra_entries,
+    }
+    with open(logger.this_exp_folder + RUN_REPORT_FILE_NAME, 'w') as f:
+        json.dump(run_report, f, indent=2, default=str)
+    return run_report
+
+
+def aggregate_run_reports(experiment_history_folder_path: str = 'experiment_history/') -> pd.DataFrame:
+    """
+    Collect the run reports of all the experiments in a folder (searched recursively) in one table,
+    with one row per run and the nested entries flattened (e.g., 'phases.run_model', 'sbcl.peak_rss_bytes').
+
+    :param experiment_history_folder_path: the folder to search the run_report.json files in, defaults to 'experiment_history/'.
+    :type experiment_history_folder_path: str
+
+    :rtype: pd.DataFrame
+    """
+    run_reports = []
+    for report_file_path in sorted(glob(os.path.join(experiment_history_folder_path, '**', RUN_REPORT_FILE_NAME),
+                                        recursive=True)):
+        with open(report_file_path, 'r') as f:
+            run_report = json.load(f)
+        run_report.pop('shards', None)
+        run_reports.append(run_report)
+    return pd.json_normalize(run_reports)
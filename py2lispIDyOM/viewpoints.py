@@ -0,0 +1,291 @@
+"""
+This module computes the derived viewpoints of IDyOM (configuration.SingleViewpoint) from the basic event attributes
+(cpitch, onset, bioi, dur, keysig, mode, barlength, pulses, phrase, mpitch, ...), vectorized across all the melodies
+of a dataset, e.g., to add a derived viewpoint column next to the outputs of an experiment without running IDyOM again.
+The python PPM models (ppm module) model the same viewpoints.
+"""
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# the basic viewpoint predicted by the derived viewpoints (the others predict the basic viewpoint of the same name)
+DERIVED_VIEWPOINT_BASES = {
+    **{viewpoint: 'onset' for viewpoint in ['ioi', 'posinbar', 'ioi-ratio', 'ioi-contour', 'metaccent', 'bioi-contour']},
+    **{viewpoint: 'cpitch' for viewpoint in [
+        'cpint', 'contour', 'cpitch-class', 'cpcint', 'cpintfref', 'cpintfip', 'cpintfiph', 'cpintfb', 'inscale',
+        'cpint-size', 'newcontour', 'cpcint-size', 'cpcint-2', 'cpcint-3', 'cpcint-4', 'cpcint-5', 'cpcint-6', 'octave',
+        'tessitura', 'registral-direction', 'intervallic-difference', 'registral-return', 'proximity', 'closure']},
+    'dur-ratio': 'dur', 'referent': 'keysig', 'lphrase': 'phrase', 'mpitch-class': 'mpitch',
+}
+
+# the event attribute predicted for a target viewpoint, as IDyOM predicts the onset from the inter-onset interval
+PREDICTED_ATTRIBUTES = {'onset': 'bioi'}
+
+
+def predicted_viewpoints(source_viewpoint) -> set:
+    """
+    The basic viewpoints a (derived or linked) source viewpoint predicts.
+
+    :rtype: set
+    """
+    viewpoints = [source_viewpoint] if type(source_viewpoint) is str else source_viewpoint
+    return {DERIVED_VIEWPOINT_BASES.get(viewpoint, viewpoint) for viewpoint in viewpoints}
+
+
+class EventArrays:
+    """
+    The event attributes of a dataset (one row per note, the notes of each melody in a row, in order)
+    with one attribute replaced by candidate values, to compute the values of the viewpoints for every candidate value
+    of a predicted attribute at once. The attributes of the current events are arrays of shape (n_events, n_candidates),
+    or (n_events, 1) for the attributes which are not predicted, the attributes of the previous events have shape (n_events, 1).
+    """
+
+    def __init__(self, events: pd.DataFrame, predicted_attribute: str = None, candidates: np.ndarray = None):
+        self.events = events
+        self.predicted_attribute = predicted_attribute
+        self.candidates = candidates
+        self.note_positions = events['note.id'].to_numpy() - 1
+        self.melody_indices = np.cumsum(self.note_positions == 0)
+
+    def _actual(self, attribute: str) -> np.ndarray:
+        return pd.to_numeric(self.events[attribute], errors='coerce').to_numpy(dtype=float)
+
+    def __getitem__(self, attribute: str) -> np.ndarray:
+        if attribute == self.predicted_attribute:
+            return np.broadcast_to(self.candidates[None, :], (len(self.events), len(self.candidates)))
+        return self._actual(attribute)[:, None]
+
+    def previous(self, attribute: str, lag: int = 1) -> np.ndarray:
+        values = np.roll(self._actual(attribute), lag)
+        values[self.note_positions < lag] = np.nan
+        return values[:, None]
+
+    def first(self, attribute: str) -> np.ndarray:
+        values = self._actual(attribute)
+        first_values = values[np.arange(len(values)) - self.note_positions]
+        first_values[self.note_positions == 0] = np.nan
+        return first_values[:, None]
+
+    def last(self, attribute: str, condition: np.ndarray) -> np.ndarray:
+        """The value of the attribute at the last previous note of the melody meeting the condition."""
+        values = pd.Series(np.where(condition, self._actual(attribute), np.nan))
+        return values.groupby(self.melody_indices).transform(lambda melody: melody.ffill().shift()).to_numpy()[:, None]
+
+    def previous_mean_and_std(self, attribute: str):
+        """The mean and standard deviation of the attribute over the previous notes of the melody."""
+        values = pd.Series(self._actual(attribute)).groupby(self.melody_indices)
+        mean = values.transform(lambda melody: melody.expanding().mean().shift())
+        std = values.transform(lambda melody: melody.expanding().std(ddof=0).shift())
+        return mean.to_numpy()[:, None], std.to_numpy()[:, None]
+
+
+def _referent(events: EventArrays) -> np.ndarray:
+    # the pitch class of the tonic, from the number of sharps (or flats, if negative) and the mode (9 for minor)
+    return np.mod(events['keysig'] * 7 + np.nan_to_num(events['mode']), 12)
+
+
+def _inscale(events: EventArrays) -> np.ndarray:
+    # the tonic of a minor key is the 6th degree of its relative major scale; undefined without a key signature
+    referent = _referent(events)
+    scale_degree = np.mod(events['cpitch'] - np.nan_to_num(referent) + np.nan_to_num(events['mode']), 12)
+    return np.where(np.isnan(referent), np.nan, np.isin(scale_degree, MAJOR_SCALE))
+
+
+def _sign(values: np.ndarray) -> np.ndarray:
+    return np.sign(values)
+
+
+def _ratio(values: np.ndarray, previous_values: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous_values > 0, values / previous_values, np.nan)
+
+
+def _cpint(events: EventArrays) -> np.ndarray:
+    return events['cpitch'] - events.previous('cpitch')
+
+
+def _previous_cpint(events: EventArrays) -> np.ndarray:
+    return events.previous('cpitch') - events.previous('cpitch', 2)
+
+
+def _cpcint(events: EventArrays) -> np.ndarray:
+    # the pitch interval within an octave, with the sign of the pitch interval
+    cpint = _cpint(events)
+    return np.sign(cpint) * np.mod(np.abs(cpint), 12)
+
+
+def _ioi(events: EventArrays) -> np.ndarray:
+    # the inter-onset interval, undefined for the first note (unlike bioi)
+    return np.where(np.isnan(events.previous('onset')), np.nan, events['bioi'])
+
+
+def _previous_ioi(events: EventArrays) -> np.ndarray:
+    return np.where(np.isnan(events.previous('onset', 2)), np.nan, events.previous('bioi'))
+
+
+def _onset(events: EventArrays) -> np.ndarray:
+    # the bioi of the first note of a melody is its onset
+    return np.nan_to_num(events.previous('onset')) + events['bioi']
+
+
+def _phrase_start(events: EventArrays, attribute: str) -> np.ndarray:
+    # the attribute of the first note of the phrase (phrase is 1 at the first note of a phrase, and melodies start phrases)
+    starts = (events._actual('phrase') == 1) | (events.note_positions == 0)
+    return np.where(starts[:, None], events[attribute], events.last(attribute, starts))
+
+
+def _bar_start_pitch(events: EventArrays) -> np.ndarray:
+    onsets, barlengths = events._actual('onset'), events._actual('barlength')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bars = np.where(barlengths > 0, np.floor(onsets / barlengths), np.nan)
+    starts = (bars != np.roll(bars, 1)) | (events.note_positions == 0)
+    pitches = np.where(starts[:, None], events['cpitch'], events.last('cpitch', starts))
+    return np.where(np.isnan(bars)[:, None], np.nan, pitches)
+
+
+def _metaccent(events: EventArrays) -> np.ndarray:
+    # 3 on the first beat of the bar, 2 in the middle of bars of an even number of beats, 1 on the other beats, 0 off-beat
+    onsets, barlengths, pulses = _onset(events), events['barlength'], events['pulses']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beat_length = np.where((barlengths > 0) & (pulses > 0), barlengths / pulses, np.nan)
+        positions = np.mod(onsets, barlengths)
+        return np.where(np.isnan(beat_length), np.nan,
+                        np.select([positions == 0, (np.mod(pulses, 2) == 0) & (positions == barlengths / 2),
+                                   np.mod(positions, beat_length) == 0], [3, 2, 1], 0))
+
+
+def _tessitura(events: EventArrays) -> np.ndarray:
+    # -1 below, 1 above, 0 within one standard deviation of the mean pitch of the previous notes (von Hippel, 2000)
+    mean, std = events.previous_mean_and_std('cpitch')
+    pitches = events['cpitch']
+    return np.where(np.isnan(std) | (events.note_positions < 2)[:, None], np.nan,
+                    np.select([pitches < mean - std, pitches > mean + std], [-1, 1], 0))
+
+
+# the principles of the implication-realization model of Narmour, as quantified by Schellenberg (1997):
+# the implicative interval (between the two previous notes) is large above a tritone
+def _implication(events: EventArrays):
+    implicative, realized = _previous_cpint(events), _cpint(events)
+    return implicative, realized, np.abs(implicative) > 6, np.sign(implicative) != np.sign(realized)
+
+
+def _registral_direction(events: EventArrays) -> np.ndarray:
+    implicative, realized, large, direction_change = _implication(events)
+    return np.where(np.isnan(implicative) | np.isnan(realized), np.nan, (large & direction_change).astype(float))
+
+
+def _intervallic_difference(events: EventArrays) -> np.ndarray:
+    implicative, realized, large, direction_change = _implication(events)
+    margin = np.where(direction_change, 2, 3)
+    similar = np.abs(np.abs(realized) - np.abs(implicative)) <= margin
+    smaller = np.abs(realized) <= np.abs(implicative) - margin
+    return np.where(np.isnan(implicative) | np.isnan(realized), np.nan, np.where(large, smaller, similar).astype(float))
+
+
+def _registral_return(events: EventArrays) -> np.ndarray:
+    implicative, realized, _, direction_change = _implication(events)
+    distance = np.abs(implicative + realized)  # from the first note of the implicative interval
+    returned = direction_change & (implicative != 0) & (realized != 0) & (distance <= 2)
+    return np.where(np.isnan(implicative) | np.isnan(realized), np.nan, np.where(returned, 3 - distance, 0))
+
+
+def _closure(events: EventArrays) -> np.ndarray:
+    implicative, realized, _, direction_change = _implication(events)
+    smaller = np.abs(realized) <= np.abs(implicative) - 3
+    return np.where(np.isnan(implicative) | np.isnan(realized), np.nan,
+                    direction_change.astype(float) + smaller.astype(float))
+
+
+MAJOR_SCALE = np.array([0, 2, 4, 5, 7, 9, 11])
+
+# the viewpoints derived from the event attributes (nan where a viewpoint is undefined)
+DERIVED_VIEWPOINT_FUNCTIONS = {
+    'onset': _onset,
+    'cpint': _cpint,
+    'contour': lambda e: _sign(_cpint(e)),
+    'newcontour': lambda e: np.where(np.isnan(_previous_cpint(e)) | np.isnan(_cpint(e)), np.nan,
+                                     _sign(_cpint(e)) != _sign(_previous_cpint(e))),
+    'cpitch-class': lambda e: np.mod(e['cpitch'], 12),
+    'cpcint': _cpcint,
+    'cpcint-size': lambda e: np.abs(_cpcint(e)),
+    **{f'cpcint-{n}': (lambda n: lambda e: np.mod(_cpcint(e), n))(n) for n in range(2, 7)},
+    'cpint-size': lambda e: np.abs(_cpint(e)),
+    'referent': _referent,
+    'cpintfref': lambda e: np.mod(e['cpitch'] - _referent(e), 12),
+    'cpintfip': lambda e: e['cpitch'] - e.first('cpitch'),
+    'cpintfiph': lambda e: e['cpitch'] - _phrase_start(e, 'cpitch'),
+    'cpintfb': lambda e: e['cpitch'] - _bar_start_pitch(e),
+    'octave': lambda e: np.floor_divide(e['cpitch'], 12),
+    'tessitura': _tessitura,
+    'inscale': _inscale,
+    'mpitch-class': lambda e: np.mod(e['mpitch'], 7),
+    'ioi': _ioi,
+    'ioi-ratio': lambda e: _ratio(_ioi(e), _previous_ioi(e)),
+    'ioi-contour': lambda e: _sign(_ioi(e) - _previous_ioi(e)),
+    'bioi-contour': lambda e: _sign(e['bioi'] - e.previous('bioi')),
+    'posinbar': lambda e: np.mod(_onset(e), e['barlength']),
+    'metaccent': _metaccent,
+    'dur-ratio': lambda e: _ratio(e['dur'], e.previous('dur')),
+    'lphrase': lambda e: _onset(e) - _phrase_start(e, 'onset'),
+    'registral-direction': _registral_direction,
+    'intervallic-difference': _intervallic_difference,
+    'registral-return': _registral_return,
+    'proximity': lambda e: np.maximum(6 - np.abs(_cpint(e)), 0),
+    'closure': _closure,
+}
+
+
+def viewpoint_values(events: EventArrays, viewpoint) -> np.ndarray:
+    """
+    The values of a basic, derived or linked viewpoint (a tuple of viewpoints) for the events, of shape
+    (n_events, n_candidates), with nan where the viewpoint is undefined
+    (and an extra last axis with the values of the components for a linked viewpoint).
+
+    :rtype: np.ndarray
+
+    :raises ValueError: if the viewpoint is not supported.
+    """
+    if type(viewpoint) is tuple:
+        components = [viewpoint_values(events, component) for component in viewpoint]
+        shape = np.broadcast_shapes(*[component.shape for component in components])
+        return np.stack([np.broadcast_to(component, shape) for component in components], axis=-1)
+    if viewpoint in DERIVED_VIEWPOINT_FUNCTIONS:
+        return DERIVED_VIEWPOINT_FUNCTIONS[viewpoint](events).astype(float)
+    attribute = PREDICTED_ATTRIBUTES.get(viewpoint, viewpoint)
+    if attribute not in events.events:
+        raise ValueError(f'The viewpoint {viewpoint} is not supported. Supported viewpoints are '
+                         f'the event attributes and {list(DERIVED_VIEWPOINT_FUNCTIONS)}')
+    return events[attribute].astype(float)
+
+
+def derive_viewpoints(events: pd.DataFrame, viewpoints: List[str]) -> pd.DataFrame:
+    """
+    Compute viewpoints for every note of a dataset, e.g., of the outputs of an experiment (see ExperimentInfo.df).
+    The basic viewpoints are the columns of the events.
+
+    :param events: the notes of the melodies (melody.id, note.id and the basic event attributes),
+        the notes of each melody in a row, in order.
+    :type events: pd.DataFrame
+
+    :param viewpoints: the viewpoints to compute (e.g., ['cpint', 'contour', 'ioi']).
+    :type viewpoints: List[str]
+
+    :return: a dataframe with the index of the events and a column for each viewpoint, NaN where it is undefined.
+    :rtype: pd.DataFrame
+
+    :raises ValueError: if a viewpoint is not supported, or an event attribute it is derived from is missing.
+    """
+    event_arrays = EventArrays(events)
+    columns = {}
+    for viewpoint in viewpoints:
+        if viewpoint in events and viewpoint not in DERIVED_VIEWPOINT_BASES:
+            columns[viewpoint] = pd.to_numeric(events[viewpoint], errors='coerce').to_numpy(dtype=float)
+            continue
+        try:
+            columns[viewpoint] = viewpoint_values(event_arrays, viewpoint)[:, 0]
+        except KeyError as error:
+            raise ValueError(f'The viewpoint {viewpoint} is derived from the event attribute {error}, '
+                             f'which is not in the events') from None
+    return pd.DataFrame(columns, index=events.index)
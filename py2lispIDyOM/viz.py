@@ -1,11 +1,16 @@
+import functools
+import multiprocessing
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 import matplotlib
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import numpy as np
 
-from py2lispIDyOM.extract import MelodyInfo, ExperimentInfo
+from py2lispIDyOM.extract import MelodyInfo, ExperimentInfo, get_dat_file_path, index_melody_byte_ranges, \
+    load_melodies
 
 # style customization:
 
@@ -277,6 +282,24 @@ class BasicAxsGeneration:
         return ax
 
 
+def _plot_melodies_in_process(plot_method_func, experiment_folder_path: str, melody_byte_ranges: dict,
+                              save_options: dict) -> int:
+    """
+    Plot and save the figures of some melodies of a batch, in a worker process of batch_melodies_plots
+    which reads only the lines of these melodies (at their byte ranges in the output file).
+    """
+    plt.switch_backend('Agg')
+    melody_names = list(melody_byte_ranges)
+    melodies = load_melodies(experiment_folder_path, melody_names, byte_ranges=melody_byte_ranges)
+    for melody in melody_names:
+        melody_info = melodies[melody]
+        fig = plot_method_func(melody_info)
+        Auxiliary.save_one_fig(experiment_folder_path=experiment_folder_path,
+                               melody_name_pprint=melody_info._get_melody_name_pprint(), fig=fig, **save_options)
+        plt.close(fig)
+    return len(melody_names)
+
+
 class Auxiliary:
 
     @staticmethod
@@ -289,14 +312,67 @@ class Auxiliary:
                              starting_index: int = None,
                              ending_index: int = None,
                              savefig: bool = True,
+                             workers: int = 1,
                              ):
+        """
+        Plot the selected melodies of an experiment (all of them by default) with plot_method_func, and save the figures.
+        With workers > 1, the melodies are plotted and saved by a pool of processes with the Agg backend, each reading
+        only the lines of the melodies it plots from the output file, indexed once beforehand. The processes are
+        started with the 'spawn' method on every platform (forking a process which has imported matplotlib is unsafe
+        on macOS), so plot_method_func must be picklable (a module-level function, or functools.partial of one),
+        and the scripts using several workers must call them under if __name__ == '__main__'.
 
-        experiment_info = ExperimentInfo(experiment_folder_path=experiment_folder_path)
-        all_melody_names = list(experiment_info.melodies_dict.keys())
+        :param workers: the number of processes plotting the melodies, default = 1.
+        :type workers: int
+
+        :raises ValueError: if workers > 1 and the figures are not saved, or plot_method_func is not picklable.
+        """
+        if workers > 1:
+            if savefig is not True:
+                raise ValueError('The figures plotted by several processes are only saved, please use savefig=True.')
+            try:
+                pickle.dumps(plot_method_func)
+            except (pickle.PicklingError, AttributeError, TypeError) as error:
+                raise ValueError('The plot function must be picklable to plot in several processes '
+                                 '(a module-level function, or functools.partial of one).') from error
+            # the output file is indexed once, and each process reads the lines of its melodies only
+            byte_ranges = index_melody_byte_ranges(get_dat_file_path(experiment_folder_path))
+            all_melody_names = list(byte_ranges)
+        else:
+            experiment_info = ExperimentInfo(experiment_folder_path=experiment_folder_path)
+            all_melody_names = list(experiment_info.melodies_dict.keys())
         print(plot_type_folder_name)
         saved_msg = str('Plots saved in ' + experiment_folder_path + 'plots/' + str(plot_type_folder_name) + '/')
 
-        def _common_batch_actions():
+        if melody_names:
+            selected_melody_names = melody_names
+        elif starting_index or ending_index:
+            selected_melody_names = all_melody_names[starting_index:ending_index]
+        else:
+            selected_melody_names = all_melody_names
+
+        if workers > 1:
+            invalid_melody_names = [melody for melody in selected_melody_names if melody not in all_melody_names]
+            if invalid_melody_names:
+                raise KeyError(f'Melodies {invalid_melody_names} are not in the experiment. '
+                               f'Valid melody names are: {all_melody_names}')
+            os.makedirs(experiment_folder_path + 'plots/' + plot_type_folder_name + '/', exist_ok=True)
+            save_options = dict(plot_type_folder_name=plot_type_folder_name, fig_format=fig_format, dpi=dpi)
+            # a few tasks per process, so that the processes finishing first take the remaining melodies
+            melodies_per_task = max(1, -(-len(selected_melody_names) // (4 * workers)))
+            tasks = [{melody: byte_ranges[melody] for melody in selected_melody_names[i:i + melodies_per_task]}
+                     for i in range(0, len(selected_melody_names), melodies_per_task)]
+            n_plotted = 0
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                futures = [executor.submit(_plot_melodies_in_process, plot_method_func, experiment_folder_path, task,
+                                           save_options) for task in tasks]
+                for future in futures:
+                    n_plotted += future.result()
+                    print(f'** plotted {n_plotted}/{len(selected_melody_names)} melodies **')
+            print(saved_msg)
+            return
+
+        for index, melody in enumerate(selected_melody_names):
             melody_info = experiment_info.melodies_dict[melody]
             melody_name_pprint = melody_info._get_melody_name_pprint()
             fig = plot_method_func(melody_info)
@@ -309,18 +385,6 @@ class Auxiliary:
                                        dpi=dpi)
                 print(saved_msg)
 
-        if melody_names:
-            for index, melody in enumerate(melody_names):
-                _common_batch_actions()
-
-        elif starting_index or ending_index:
-            for index, melody in enumerate(all_melody_names[starting_index:ending_index]):
-                _common_batch_actions()
-
-        else:
-            for index, melody in enumerate(all_melody_names):
-                _common_batch_actions()
-
     @staticmethod
     def save_one_fig(plot_type_folder_name: str,
                      experiment_folder_path: str,
@@ -329,11 +393,242 @@ class Auxiliary:
                      fig_format: str,
                      dpi: float):
         output_path = experiment_folder_path + 'plots/' + plot_type_folder_name + '/'
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
+        os.makedirs(output_path, exist_ok=True)
         fig.savefig(fname=output_path + str(melody_name_pprint) + '.' + fig_format, format=fig_format, dpi=dpi)
 
 
+# the plot functions of BasicPlot, at the module level so that the worker processes of batch_melodies_plots
+# can receive them (bound to their options with functools.partial)
+
+
+def _pianoroll_pitch_prediction_groundtruth(melody_info: MelodyInfo,
+                                            show_single_fig: bool,
+                                            probability_colorbar: bool,
+                                            figsize: tuple,
+                                            dpi: float,
+                                            nrows: int,
+                                            ncols: int) -> plt.Figure:
+
+    melody_name_pprint = melody_info._get_melody_name_pprint()
+
+    fig, (ax_distribution, ax_groundtruth) = plt.subplots(nrows=nrows, ncols=ncols, figsize=figsize, dpi=dpi)
+    fig.subplots_adjust(wspace=0.03)
+    fig.suptitle('IDyOM Pitch prediction vs Ground truth \n\n Melody name: ' + melody_name_pprint)
+
+    distribution = BasicAxsGeneration.pianoroll_pitch_distribution(ax_distribution, melody_info=melody_info)
+    groundtruth = BasicAxsGeneration.pianoroll(ax_groundtruth, melody_info=melody_info)
+
+    if probability_colorbar is True:
+        distribution_divider = make_axes_locatable(ax_distribution)
+        ax_surprise = distribution_divider.append_axes("right", size="3%", pad=0.1)
+        cb_surprisal = fig.colorbar(distribution, cax=ax_surprise)
+        cb_surprisal.set_label('Probabilities of predicted pitches')
+
+        truth_divider = make_axes_locatable(ax_groundtruth)
+        ax_blank = truth_divider.append_axes("right", size="3%", pad=0.1)
+        # cb_blank = fig.colorbar(groundtruth, cax=ax_blank)
+        ax_blank.axis('off')
+    else:
+        pass
+
+    fig.supxlabel("Time in quarter note")
+    plt.tight_layout()
+
+    if show_single_fig is True:
+        plt.show()
+    else:
+        pass
+    return fig
+
+
+def _pianoroll_groundtruth_surprisal(melody_info: MelodyInfo,
+                                     show_single_fig: bool,
+                                     figsize: tuple,
+                                     dpi: float) -> plt.Figure:
+
+    melody_name_pprint = melody_info._get_melody_name_pprint()
+
+    fig, (ax_pianoroll, ax_surprisal) = plt.subplots(2, 1, figsize=figsize, dpi=dpi, sharex='col')
+    fig.subplots_adjust(wspace=0.03)
+    fig.suptitle('IDyOM Information Content (Surprisal) \n\n Melody: ' + melody_name_pprint)
+
+    BasicAxsGeneration.pianoroll(ax_pianoroll, melody_info=melody_info)
+    BasicAxsGeneration.surprisal_continuous(ax_surprisal, melody_info=melody_info)
+
+    fig.supxlabel("Time in quarter note")
+    plt.tight_layout()
+
+    if show_single_fig is True:
+        plt.show()
+    else:
+        pass
+    return fig
+
+
+def _generic_property_along_time(melody_info: MelodyInfo,
+                                 selected_idyom_output: str,
+                                 show_single_fig: bool,
+                                 grid: bool,
+                                 ggplot: bool,
+                                 figsize: tuple,
+                                 dpi: float) -> plt.Figure:
+
+    if ggplot is True:
+        plt.style.use('ggplot')
+    else:
+        pass
+
+    melody_name_pprint = melody_info._get_melody_name_pprint()
+    fig, (ax_generic_property) = plt.subplots(nrows=1, ncols=1, figsize=figsize, dpi=dpi, sharex='col')
+
+    fig.suptitle('Selected IDyOM outputs: ' + selected_idyom_output + '\n\n Melody: ' + melody_name_pprint)
+    BasicAxsGeneration.generic_idyom_output_along_time(ax_generic_property,
+                                                       melody_info=melody_info,
+                                                       selected_idyom_output=selected_idyom_output,
+                                                       grid=grid)
+    plt.tight_layout()
+    if show_single_fig is True:
+        plt.show()
+    else:
+        pass
+    return fig
+
+
+def _selected_surprisal_entropy(melody_info: MelodyInfo,
+                                ic_source: str,
+                                entropy_source: str,
+                                show_single_fig: bool,
+                                grid: bool,
+                                ggplot: bool,
+                                figsize: tuple) -> plt.Figure:
+
+    if ggplot is True:
+        plt.style.use('ggplot')
+    else:
+        pass
+    melody_name_pprint = melody_info._get_melody_name_pprint()
+    fig, ax = plt.subplots(figsize=figsize)
+    fig.suptitle('IDyOM Information Content (Surprisal) and Entropy \n\n Melody: ' + melody_name_pprint)
+
+    BasicAxsGeneration.selected_ic_entropy_along_onsets(ax=ax,
+                                                        melody_info=melody_info,
+                                                        ic_source=ic_source,
+                                                        entropy_source=entropy_source,
+                                                        ic_color='C0',
+                                                        entropy_color='C1',
+                                                        grid=grid)
+    fig.supxlabel('Time in quarter note')
+    fig.supylabel('Surprisal or entropy values')
+    plt.tight_layout()
+
+    if show_single_fig is True:
+        plt.show()
+    else:
+        pass
+    return fig
+
+
+def _all_surprisal_plots(melody_info: MelodyInfo,
+                         grid: bool,
+                         show_single_fig: bool,
+                         figsize: tuple,
+                         dpi: float,
+                         ggplot: bool) -> plt.Figure:
+
+    if ggplot is True:
+        plt.style.use('ggplot')
+    else:
+        pass
+
+    melody_name_pprint = melody_info._get_melody_name_pprint()
+
+    valid_keywords_list = melody_info.get_idyom_output_keyword_list()
+    all_surprisal_sources = [keyword for keyword in valid_keywords_list if 'information.content' in keyword]
+
+    num_of_surprisal_subplots = len(all_surprisal_sources)
+    # to get the same y-range for all plots (0, max_surprisal across all surprisals)
+    max_surprisals = []
+    for idx, surprisal_source in enumerate(all_surprisal_sources):
+        surprisals = np.amax(melody_info.get_idyom_output_nparray(surprisal_source))
+        max_surprisals.append(surprisals)
+    yticks = np.arange(0, max(max_surprisals))
+
+    # plot a number of surprisal plots stacked one on top of each other, shared x, y
+    # add every single subplot to the figure with a for loop
+    fig, axs = plt.subplots(num_of_surprisal_subplots, figsize=figsize, dpi=dpi, sharex='col', sharey='row')
+    fig.subplots_adjust(wspace=0.03)
+    fig.suptitle('IDyOM Information Content (Surprisal) \n\n Melody: ' + melody_name_pprint)
+
+    for idx, surprisal_type in enumerate(all_surprisal_sources):
+        BasicAxsGeneration.one_ic_along_onsets(ax=axs[idx],
+                                               melody_info=melody_info,
+                                               chosen_ic=surprisal_type,
+                                               grid=grid,
+                                               color=str('C' + str(idx)),
+                                               yticks=yticks)
+
+    fig.supxlabel("Time in quarter note")
+    fig.supylabel(t='Information Content (Surprisal)\n-log(P)', x=0.04, ha='center')
+
+    plt.tight_layout()
+    plt.style.use('ggplot')
+
+    if show_single_fig is True:
+        plt.show()
+    else:
+        pass
+    return fig
+
+
+def _all_entropy_plots(melody_info: MelodyInfo,
+                       grid: bool,
+                       show_single_fig: bool,
+                       figsize: tuple,
+                       dpi: float,
+                       ggplot: bool) -> plt.Figure:
+
+    if ggplot is True:
+        plt.style.use('ggplot')
+    else:
+        pass
+
+    melody_name_pprint = melody_info._get_melody_name_pprint()
+
+    valid_keywords_list = melody_info.get_idyom_output_keyword_list()
+    all_entropy_sources = [keyword for keyword in valid_keywords_list if 'entropy' in keyword]
+
+    num_of_surprisal_subplots = len(all_entropy_sources)
+    # to get the same y-range for all plots (0, max_surprisal across all surprisals)
+    max_entropys = []
+    for idx, entropy_source in enumerate(all_entropy_sources):
+        entropys = np.amax(melody_info.get_idyom_output_nparray(entropy_source))
+        max_entropys.append(entropys)
+    yticks = np.arange(0, max(max_entropys))
+
+    # plot a number of entropy plots stacked one on top of each other, shared x, y
+    # add every single subplot to the figure with a for loop
+    fig, axs = plt.subplots(num_of_surprisal_subplots, figsize=figsize, dpi=dpi, sharex='col', sharey='row')
+    fig.suptitle('IDyOM Entropy \n\n Melody: ' + melody_name_pprint)
+
+    for idx, entropy_type in enumerate(all_entropy_sources):
+        BasicAxsGeneration.one_entropy_along_onsets(ax=axs[idx],
+                                                    melody_info=melody_info,
+                                                    chosen_entropy=entropy_type,
+                                                    grid=grid,
+                                                    color=str('C' + str(idx)),
+                                                    yticks=yticks)
+
+    plt.xlabel("Time in quarter note")
+    plt.tight_layout()
+    plt.style.use('ggplot')
+
+    if show_single_fig is True:
+        plt.show()
+    else:
+        pass
+    return fig
+
+
 class BasicPlot:
     """ BasicPlot for selected IDyOM outputs in an experiment. """
 
@@ -349,7 +644,8 @@ class BasicPlot:
                                                figsize: tuple = (10, 10),
                                                nrows: int = 2,
                                                ncols: int = 1,
-                                               probability_colorbar: bool = False):
+                                               probability_colorbar: bool = False,
+                                               workers: int = 1):
 
         """
         Generate a pair of figures (the predicted pitch distribution and the ground truth) side by side.
@@ -368,46 +664,16 @@ class BasicPlot:
         :param ncols: (optional), the number of columns of the figure. By default, ncols = 2, nrows = 1, figures are shown side-by-side.
         :param nrows: (optional), the number of columns of the figure. By default, ncols = 2, nrows = 1, figures are shown side-by-side.
         :param probability_colorbar: (optional) whether to show the color bar for the probabilities of the predict pitch or not.
+        :param workers: (optional), the number of processes plotting and saving the figures, default = 1.
         """
 
         plot_type_folder_name = 'pianoroll_pitch_prediction_groundtruth'
 
-        def _pianoroll_pitch_prediction_groundtruth(melody_info: MelodyInfo,
-                                                    show_single_fig: bool = showfig,
-                                                    probability_colorbar: bool = probability_colorbar) -> plt.Figure:
-
-            melody_name_pprint = melody_info._get_melody_name_pprint()
-
-            fig, (ax_distribution, ax_groundtruth) = plt.subplots(nrows=nrows, ncols=ncols, figsize=figsize, dpi=dpi)
-            fig.subplots_adjust(wspace=0.03)
-            fig.suptitle('IDyOM Pitch prediction vs Ground truth \n\n Melody name: ' + melody_name_pprint)
-
-            distribution = BasicAxsGeneration.pianoroll_pitch_distribution(ax_distribution, melody_info=melody_info)
-            groundtruth = BasicAxsGeneration.pianoroll(ax_groundtruth, melody_info=melody_info)
-
-            if probability_colorbar is True:
-                distribution_divider = make_axes_locatable(ax_distribution)
-                ax_surprise = distribution_divider.append_axes("right", size="3%", pad=0.1)
-                cb_surprisal = fig.colorbar(distribution, cax=ax_surprise)
-                cb_surprisal.set_label('Probabilities of predicted pitches')
-
-                truth_divider = make_axes_locatable(ax_groundtruth)
-                ax_blank = truth_divider.append_axes("right", size="3%", pad=0.1)
-                # cb_blank = fig.colorbar(groundtruth, cax=ax_blank)
-                ax_blank.axis('off')
-            else:
-                pass
-
-            fig.supxlabel("Time in quarter note")
-            plt.tight_layout()
-
-            if show_single_fig is True:
-                plt.show()
-            else:
-                pass
-            return fig
-
-        Auxiliary.batch_melodies_plots(plot_method_func=_pianoroll_pitch_prediction_groundtruth,
+        Auxiliary.batch_melodies_plots(plot_method_func=functools.partial(_pianoroll_pitch_prediction_groundtruth,
+                                                                          show_single_fig=showfig,
+                                                                          probability_colorbar=probability_colorbar,
+                                                                          figsize=figsize, dpi=dpi, nrows=nrows,
+                                                                          ncols=ncols),
                                        plot_type_folder_name=plot_type_folder_name,
                                        experiment_folder_path=experiment_folder_path,
                                        melody_names=melody_names,
@@ -415,7 +681,8 @@ class BasicPlot:
                                        ending_index=ending_index,
                                        savefig=savefig,
                                        fig_format=fig_format,
-                                       dpi=dpi
+                                       dpi=dpi,
+                                       workers=workers
                                        )
 
     @staticmethod
@@ -427,7 +694,8 @@ class BasicPlot:
                                                 showfig: bool = False,
                                                 fig_format: str = 'png',
                                                 dpi: float = 400,
-                                                figsize: tuple = (10, 6)):
+                                                figsize: tuple = (10, 6),
+                                                workers: int = 1):
         """
         Generate a pair of figures: ground truth piano roll on the top and the surprisal line plot on the bottom.
 
@@ -440,33 +708,15 @@ class BasicPlot:
         :param fig_format: (optional), default = 'png'
         :param dpi: (optional), default = 400
         :param figsize: (optional), default is (10,5)
+        :param workers: (optional), the number of processes plotting and saving the figures, default = 1.
 
         """
 
         plot_type_folder_name = 'pianoroll_groundtruth_surprisal'
 
-        def _pianoroll_groundtruth_surprisal(melody_info: MelodyInfo,
-                                             show_single_fig: bool = showfig) -> plt.Figure:
-
-            melody_name_pprint = melody_info._get_melody_name_pprint()
-
-            fig, (ax_pianoroll, ax_surprisal) = plt.subplots(2, 1, figsize=figsize, dpi=dpi, sharex='col')
-            fig.subplots_adjust(wspace=0.03)
-            fig.suptitle('IDyOM Information Content (Surprisal) \n\n Melody: ' + melody_name_pprint)
-
-            BasicAxsGeneration.pianoroll(ax_pianoroll, melody_info=melody_info)
-            BasicAxsGeneration.surprisal_continuous(ax_surprisal, melody_info=melody_info)
-
-            fig.supxlabel("Time in quarter note")
-            plt.tight_layout()
-
-            if show_single_fig is True:
-                plt.show()
-            else:
-                pass
-            return fig
-
-        Auxiliary.batch_melodies_plots(plot_method_func=_pianoroll_groundtruth_surprisal,
+        Auxiliary.batch_melodies_plots(plot_method_func=functools.partial(_pianoroll_groundtruth_surprisal,
+                                                                          show_single_fig=showfig, figsize=figsize,
+                                                                          dpi=dpi),
                                        plot_type_folder_name=plot_type_folder_name,
                                        experiment_folder_path=experiment_folder_path,
                                        melody_names=melody_names,
@@ -474,7 +724,8 @@ class BasicPlot:
                                        ending_index=ending_index,
                                        savefig=savefig,
                                        fig_format=fig_format,
-                                       dpi=dpi)
+                                       dpi=dpi,
+                                       workers=workers)
 
     @staticmethod
     def simple_plot(selected_idyom_output: str,
@@ -488,7 +739,8 @@ class BasicPlot:
                     dpi: float = 400,
                     figsize: tuple = (10, 5),
                     grid: bool = True,
-                    ggplot: bool = True):
+                    ggplot: bool = True,
+                    workers: int = 1):
         """
         Generate a simple line plot with time (in quarter note) on the x-axis, and selected IDyOM output on the y-axis.
 
@@ -504,37 +756,16 @@ class BasicPlot:
         :param figsize: optional, default is (10,5)
         :param grid: whether to show grid or not.
         :param ggplot: whether to use ggplot or not.
+        :param workers: the number of processes plotting and saving the figures, default = 1.
 
         """
         plot_type_folder_name = 'simple_plot_' + selected_idyom_output
 
-        def _generic_property_along_time(melody_info: MelodyInfo,
-                                         show_single_fig: bool = showfig,
-                                         grid: bool = grid,
-                                         ggplot: bool = ggplot) -> plt.Figure:
-
-            if ggplot is True:
-                plt.style.use('ggplot')
-            else:
-                pass
-
-            melody_name_pprint = melody_info._get_melody_name_pprint()
-            fig, (ax_generic_property) = plt.subplots(nrows=1, ncols=1, figsize=figsize, dpi=dpi, sharex='col')
-
-            fig.suptitle('Selected IDyOM outputs: ' + selected_idyom_output + '\n\n Melody: ' + melody_name_pprint)
-            BasicAxsGeneration.generic_idyom_output_along_time(ax_generic_property,
-                                                               melody_info=melody_info,
-                                                               selected_idyom_output=selected_idyom_output,
-                                                               grid=grid)
-            plt.tight_layout()
-            if show_single_fig is True:
-                plt.show()
-            else:
-                pass
-            return fig
-
         # Plot batch according to user inputs:
-        Auxiliary.batch_melodies_plots(plot_method_func=_generic_property_along_time,
+        Auxiliary.batch_melodies_plots(plot_method_func=functools.partial(_generic_property_along_time,
+                                                                          selected_idyom_output=selected_idyom_output,
+                                                                          show_single_fig=showfig, grid=grid,
+                                                                          ggplot=ggplot, figsize=figsize, dpi=dpi),
                                        plot_type_folder_name=plot_type_folder_name,
                                        experiment_folder_path=experiment_folder_path,
                                        melody_names=melody_names,
@@ -542,7 +773,8 @@ class BasicPlot:
                                        ending_index=ending_index,
                                        savefig=savefig,
                                        fig_format=fig_format,
-                                       dpi=dpi)
+                                       dpi=dpi,
+                                       workers=workers)
 
     @staticmethod
     def selected_surprisal_entropy(experiment_folder_path: str,
@@ -557,7 +789,8 @@ class BasicPlot:
                                    dpi: float = 400,
                                    figsize: tuple = (10, 6),
                                    grid: bool = True,
-                                   ggplot: bool = True):
+                                   ggplot: bool = True,
+                                   workers: int = 1):
         """
         Generate a figure that shows the selected entropy and information content.
 
@@ -574,44 +807,17 @@ class BasicPlot:
         :param figsize: default is (10,5)
         :param grid: whether to show grid or not.
         :param ggplot: whether to use ggplot or not.
+        :param workers: the number of processes plotting and saving the figures, default = 1.
 
         """
 
         plot_type_folder_name = 'selected_surprisal_entropy'
 
-        def _selected_surprisal_entropy(melody_info: MelodyInfo,
-                                        ic_source: str = ic_source,
-                                        entropy_source: str = entropy_source,
-                                        show_single_fig: bool = showfig,
-                                        grid: bool = grid,
-                                        ggplot: bool = ggplot) -> plt.Figure:
-
-            if ggplot is True:
-                plt.style.use('ggplot')
-            else:
-                pass
-            melody_name_pprint = melody_info._get_melody_name_pprint()
-            fig, ax = plt.subplots(figsize=figsize)
-            fig.suptitle('IDyOM Information Content (Surprisal) and Entropy \n\n Melody: ' + melody_name_pprint)
-
-            BasicAxsGeneration.selected_ic_entropy_along_onsets(ax=ax,
-                                                                melody_info=melody_info,
-                                                                ic_source=ic_source,
-                                                                entropy_source=entropy_source,
-                                                                ic_color='C0',
-                                                                entropy_color='C1',
-                                                                grid=grid)
-            fig.supxlabel('Time in quarter note')
-            fig.supylabel('Surprisal or entropy values')
-            plt.tight_layout()
-
-            if show_single_fig is True:
-                plt.show()
-            else:
-                pass
-            return fig
-
-        Auxiliary.batch_melodies_plots(plot_method_func=_selected_surprisal_entropy,
+        Auxiliary.batch_melodies_plots(plot_method_func=functools.partial(_selected_surprisal_entropy,
+                                                                          ic_source=ic_source,
+                                                                          entropy_source=entropy_source,
+                                                                          show_single_fig=showfig, grid=grid,
+                                                                          ggplot=ggplot, figsize=figsize),
                                        plot_type_folder_name=plot_type_folder_name,
                                        experiment_folder_path=experiment_folder_path,
                                        melody_names=melody_names,
@@ -619,7 +825,8 @@ class BasicPlot:
                                        ending_index=ending_index,
                                        savefig=savefig,
                                        fig_format=fig_format,
-                                       dpi=dpi)
+                                       dpi=dpi,
+                                       workers=workers)
 
     @staticmethod
     def all_surprisal(experiment_folder_path: str,
@@ -632,7 +839,8 @@ class BasicPlot:
                       dpi: float = 400,
                       figsize: tuple = (10, 8),
                       grid: bool = True,
-                      ggplot: bool = True):
+                      ggplot: bool = True,
+                      workers: int = 1):
         """
         Generate subplots of all available surprisal outputs.
 
@@ -647,63 +855,15 @@ class BasicPlot:
         :param figsize: default is (10,5)
         :param grid: whether to show grid or not.
         :param ggplot: whether to use ggplot or not.
+        :param workers: the number of processes plotting and saving the figures, default = 1.
 
         """
 
         plot_type_folder_name = 'surprisals_plots'
 
-        def _all_surprisal_plots(melody_info: MelodyInfo,
-                                 grid: bool = grid,
-                                 show_single_fig: bool = showfig,
-                                 figsize: tuple = figsize,
-                                 dpi: float = dpi,
-                                 ggplot: bool = ggplot) -> plt.Figure:
-
-            if ggplot is True:
-                plt.style.use('ggplot')
-            else:
-                pass
-
-            melody_name_pprint = melody_info._get_melody_name_pprint()
-
-            valid_keywords_list = melody_info.get_idyom_output_keyword_list()
-            all_surprisal_sources = [keyword for keyword in valid_keywords_list if 'information.content' in keyword]
-
-            num_of_surprisal_subplots = len(all_surprisal_sources)
-            # to get the same y-range for all plots (0, max_surprisal across all surprisals)
-            max_surprisals = []
-            for idx, surprisal_source in enumerate(all_surprisal_sources):
-                surprisals = np.amax(melody_info.get_idyom_output_nparray(surprisal_source))
-                max_surprisals.append(surprisals)
-            yticks = np.arange(0, max(max_surprisals))
-
-            # plot a number of surprisal plots stacked one on top of each other, shared x, y
-            # add every single subplot to the figure with a for loop
-            fig, axs = plt.subplots(num_of_surprisal_subplots, figsize=figsize, dpi=dpi, sharex='col', sharey='row')
-            fig.subplots_adjust(wspace=0.03)
-            fig.suptitle('IDyOM Information Content (Surprisal) \n\n Melody: ' + melody_name_pprint)
-
-            for idx, surprisal_type in enumerate(all_surprisal_sources):
-                BasicAxsGeneration.one_ic_along_onsets(ax=axs[idx],
-                                                       melody_info=melody_info,
-                                                       chosen_ic=surprisal_type,
-                                                       grid=grid,
-                                                       color=str('C' + str(idx)),
-                                                       yticks=yticks)
-
-            fig.supxlabel("Time in quarter note")
-            fig.supylabel(t='Information Content (Surprisal)\n-log(P)', x=0.04, ha='center')
-
-            plt.tight_layout()
-            plt.style.use('ggplot')
-
-            if show_single_fig is True:
-                plt.show()
-            else:
-                pass
-            return fig
-
-        Auxiliary.batch_melodies_plots(plot_method_func=_all_surprisal_plots,
+        Auxiliary.batch_melodies_plots(plot_method_func=functools.partial(_all_surprisal_plots, grid=grid,
+                                                                          show_single_fig=showfig, figsize=figsize,
+                                                                          dpi=dpi, ggplot=ggplot),
                                        plot_type_folder_name=plot_type_folder_name,
                                        experiment_folder_path=experiment_folder_path,
                                        melody_names=melody_names,
@@ -711,7 +871,8 @@ class BasicPlot:
                                        ending_index=ending_index,
                                        savefig=savefig,
                                        fig_format=fig_format,
-                                       dpi=dpi)
+                                       dpi=dpi,
+                                       workers=workers)
 
     @staticmethod
     def all_entropy(experiment_folder_path: str,
@@ -724,7 +885,8 @@ class BasicPlot:
                     dpi: float = 400,
                     figsize: tuple = (10, 8),
                     grid: bool = True,
-                    ggplot: bool = True):
+                    ggplot: bool = True,
+                    workers: int = 1):
         """
         Generate subplots that show all available entropy outputs.
 
@@ -739,60 +901,15 @@ class BasicPlot:
         :param figsize: default is (10,5)
         :param grid: whether to show grid or not.
         :param ggplot: whether to use ggplot or not.
+        :param workers: the number of processes plotting and saving the figures, default = 1.
 
         """
 
         plot_type_folder_name = 'entropy_plots'
 
-        def _all_entropy_plots(melody_info: MelodyInfo,
-                               grid: bool = grid,
-                               show_single_fig: bool = showfig,
-                               figsize: tuple = figsize,
-                               dpi: float = dpi,
-                               ggplot: bool = ggplot) -> plt.Figure:
-
-            if ggplot is True:
-                plt.style.use('ggplot')
-            else:
-                pass
-
-            melody_name_pprint = melody_info._get_melody_name_pprint()
-
-            valid_keywords_list = melody_info.get_idyom_output_keyword_list()
-            all_entropy_sources = [keyword for keyword in valid_keywords_list if 'entropy' in keyword]
-
-            num_of_surprisal_subplots = len(all_entropy_sources)
-            # to get the same y-range for all plots (0, max_surprisal across all surprisals)
-            max_entropys = []
-            for idx, entropy_source in enumerate(all_entropy_sources):
-                entropys = np.amax(melody_info.get_idyom_output_nparray(entropy_source))
-                max_entropys.append(entropys)
-            yticks = np.arange(0, max(max_entropys))
-
-            # plot a number of entropy plots stacked one on top of each other, shared x, y
-            # add every single subplot to the figure with a for loop
-            fig, axs = plt.subplots(num_of_surprisal_subplots, figsize=figsize, dpi=dpi, sharex='col', sharey='row')
-            fig.suptitle('IDyOM Entropy \n\n Melody: ' + melody_name_pprint)
-
-            for idx, entropy_type in enumerate(all_entropy_sources):
-                BasicAxsGeneration.one_entropy_along_onsets(ax=axs[idx],
-                                                            melody_info=melody_info,
-                                                            chosen_entropy=entropy_type,
-                                                            grid=grid,
-                                                            color=str('C' + str(idx)),
-                                                            yticks=yticks)
-
-            plt.xlabel("Time in quarter note")
-            plt.tight_layout()
-            plt.style.use('ggplot')
-
-            if show_single_fig is True:
-                plt.show()
-            else:
-                pass
-            return fig
-
-        Auxiliary.batch_melodies_plots(plot_method_func=_all_entropy_plots,
+        Auxiliary.batch_melodies_plots(plot_method_func=functools.partial(_all_entropy_plots, grid=grid,
+                                                                          show_single_fig=showfig, figsize=figsize,
+                                                                          dpi=dpi, ggplot=ggplot),
                                        plot_type_folder_name=plot_type_folder_name,
                                        experiment_folder_path=experiment_folder_path,
                                        melody_names=melody_names,
@@ -800,4 +917,5 @@ class BasicPlot:
                                        ending_index=ending_index,
                                        savefig=savefig,
                                        fig_format=fig_format,
-                                       dpi=dpi)
+                                       dpi=dpi,
+                                       workers=workers)
@@ -18,7 +18,13 @@ setuptools.setup(
     url="https://github.com/xinyiguan/py2lispIDyOM",
     packages=setuptools.find_packages(exclude=['tests']),
     install_requires=install_requires,
+    extras_require={
+        'export': ['pyarrow', 'h5py'],
+    },
     include_package_data=True,
+    entry_points={
+        'console_scripts': ['py2lispidyom=py2lispIDyOM.cli:main'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,124 @@
+"""
+This test script concerns the simulator backend, compared with the outputs of IDyOM in the experiment "25-05-22_14.10.29".
+"""
+import asyncio
+import os
+import shutil
+from glob import glob
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from py2lispIDyOM.backends import SimulatorBackend, SBCLBackend, get_backend
+from py2lispIDyOM.extract import ExperimentInfo, getDataFrame
+from py2lispIDyOM.run import IDyOMExperiment
+
+
+class TestSimulatorBackend(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    idyom_dat_file_path = './tests/experiment_history/25-05-22_14.10.29/experiment_output_data_folder/' \
+                          '66052522141029-cpitch_onset-cpitch_onset-99052522141029-nil-melody-nil-full-both-8-t-nil-c-nil-t-t-x-3.dat'
+    experiment_history_folder_path = 'experiment_history/TestSimulatorBackend/'
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        os.makedirs(self.experiment_history_folder_path)
+
+    def _make_experiment(self, name, **parameters):
+        experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset,
+                                     pretrain_dataset_path=self.shanx_dataset,
+                                     experiment_history_folder_path=self.experiment_history_folder_path,
+                                     experiment_logger_name=name,
+                                     backend=SimulatorBackend())
+        # the configuration of the experiment "25-05-22_14.10.29"
+        default_parameters = dict(target_viewpoints=['cpitch', 'onset'], source_viewpoints=['cpitch', 'onset'],
+                                  models=':both', ltmo=':ltmo', ltmo_order_bound=8, k=':full')
+        parameters = {**default_parameters, **parameters}
+        experiment.set_parameters(**{key: value for key, value in parameters.items() if value is not None})
+        return experiment
+
+    def _output_file_path(self, experiment):
+        return glob(experiment.logger.output_data_exp_folder + '*.dat')[0]
+
+    def test_outputs_shaped_as_idyom_outputs(self):
+        experiment = self._make_experiment('run1')
+        experiment.run()
+
+        dat_file_path = self._output_file_path(experiment)
+        test_dataset_id = experiment.idyom_config.database_configuration.test_dataset_id
+        pretrain_dataset_id = experiment.idyom_config.database_configuration.pretrain_dataset_id
+        self.assertEqual(os.path.basename(dat_file_path),
+                         os.path.basename(self.idyom_dat_file_path).replace('66052522141029', test_dataset_id)
+                         .replace('99052522141029', pretrain_dataset_id))
+        simulated_df = getDataFrame(dat_file_path)
+        idyom_df = getDataFrame(self.idyom_dat_file_path)
+        self.assertEqual(list(simulated_df.columns), list(idyom_df.columns))
+        pd.testing.assert_frame_equal(simulated_df[['melody.id', 'note.id', 'melody.name', 'cpitch', 'dur', 'onset']],
+                                      idyom_df[['melody.id', 'note.id', 'melody.name', 'cpitch', 'dur', 'onset']])
+        cpitch_distribution = simulated_df[[column for column in simulated_df if column.startswith('cpitch.')
+                                            and column.split('.')[1].isdigit()]]
+        np.testing.assert_allclose(cpitch_distribution.sum(axis=1), 1, rtol=1e-6)
+        np.testing.assert_allclose(simulated_df['information.content'], -np.log2(simulated_df['probability']), rtol=1e-5)
+
+        experiment_info = ExperimentInfo(experiment_folder_path=experiment.logger.this_exp_folder)
+        self.assertEqual(len(experiment_info.melodies_dict), 15)
+
+    def test_outputs_are_deterministic(self):
+        experiment1 = self._make_experiment('run1')
+        experiment1.run()
+        experiment2 = self._make_experiment('run2')
+        experiment2.run()
+        experiment3 = self._make_experiment('run3', stmo=':stmo', stmo_order_bound=2)
+        experiment3.run()
+        outputs = [getDataFrame(self._output_file_path(experiment)).drop(columns='dataset.id')
+                   for experiment in [experiment1, experiment2, experiment3]]
+        pd.testing.assert_frame_equal(outputs[0], outputs[1])
+        self.assertFalse(outputs[0].equals(outputs[2]))
+
+    def test_detail_and_sources(self):
+        experiment = self._make_experiment('detail1', detail=1)
+        experiment.run()
+        self.assertEqual(list(getDataFrame(self._output_file_path(experiment)).columns),
+                         ['dataset.id', 'melody.id', 'melody.name', 'mean.information.content'])
+
+        experiment = self._make_experiment('detail2', detail=2, target_viewpoints=['cpitch'], models=':stm',
+                                           source_viewpoints=[('cpint', 'dur'), 'ioi'], ltmo=None)
+        experiment.run()
+        columns = list(getDataFrame(self._output_file_path(experiment)).columns)
+        self.assertEqual(columns[columns.index('onset') + 1:],
+                         ['cpitch.probability', 'cpitch.information.content', 'cpitch.entropy',
+                          'probability', 'information.content', 'entropy', 'information.gain'])
+
+        experiment = self._make_experiment('detail3', target_viewpoints=['cpitch'], models=':stm',
+                                           source_viewpoints=[('cpint', 'dur'), 'ioi'], ltmo=None)
+        experiment.run()
+        columns = list(getDataFrame(self._output_file_path(experiment)).columns)
+        self.assertIn('cpitch.order.stm.cpint_dur', columns)
+        self.assertNotIn('cpitch.order.stm.ioi', columns)
+
+    def test_unsupported_target(self):
+        experiment = self._make_experiment('run1', target_viewpoints=['cpint'])
+        with self.assertRaises(ValueError):
+            experiment.run()
+
+    def test_run_fold_shards_and_run_async(self):
+        experiment = self._make_experiment('shards', k=3)
+        experiment.run_fold_shards(n_jobs=2)
+        merged_df = getDataFrame(self._output_file_path(experiment))
+        self.assertEqual(len(merged_df), 699)
+        self.assertEqual(list(merged_df['melody.id'].unique()), list(range(1, 16)))
+
+        experiment = self._make_experiment('async')
+        asyncio.run(experiment.run_async(line_callback=None))
+        self.assertEqual(len(getDataFrame(self._output_file_path(experiment))), 699)
+
+    def test_get_backend(self):
+        backend = get_backend(**SimulatorBackend(seed=3).to_dict())
+        self.assertEqual(backend, SimulatorBackend(seed=3))
+        self.assertEqual(get_backend('sbcl', {'sbcl_path': '/opt/sbcl'}).sbcl_command('a.lisp')[0], '/opt/sbcl')
+        self.assertIsInstance(IDyOMExperiment.__dataclass_fields__['backend'].default_factory(), SBCLBackend)
+        with self.assertRaises(KeyError):
+            get_backend('clisp')
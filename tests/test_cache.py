@@ -0,0 +1,149 @@
+"""
+This test script concerns the result cache and the LTM cache.
+The SBCL runs are replaced by copying the IDyOM outputs from the experiment "25-05-22_14.10.29".
+"""
+import os
+import re
+import shutil
+import sys
+import time
+from glob import glob
+from unittest import TestCase
+from unittest.mock import patch
+
+from py2lispIDyOM.backends import SBCLBackend
+from py2lispIDyOM.cache import ResultCache, LTMCache
+from py2lispIDyOM.configuration import BasisOption
+from py2lispIDyOM.run import IDyOMExperiment
+
+
+class TestResultCache(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    dat_file_path = glob('./tests/experiment_history/25-05-22_14.10.29/experiment_output_data_folder/*.dat')[0]
+    experiment_history_folder_path = 'experiment_history/TestResultCache/'
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        os.makedirs(self.experiment_history_folder_path)
+        self.sbcl_runs = []
+
+    def _fake_sbcl(self):
+        def sbcl_command(lisp_script_path):
+            self.sbcl_runs.append(lisp_script_path)
+            output_folder = os.path.dirname(lisp_script_path) + '/experiment_output_data_folder/'
+            return [sys.executable, '-c', f'import shutil; shutil.copy({self.dat_file_path!r}, {output_folder!r})']
+
+        return patch.object(SBCLBackend, 'sbcl_command', staticmethod(sbcl_command))
+
+    def _run_experiment(self, name, result_cache, pretrain_dataset_path=None, **parameters):
+        experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset,
+                                     pretrain_dataset_path=pretrain_dataset_path,
+                                     experiment_history_folder_path=self.experiment_history_folder_path,
+                                     experiment_logger_name=name,
+                                     result_cache=result_cache)
+        experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], **parameters)
+        with self._fake_sbcl():
+            experiment.run()
+        return glob(experiment.logger.output_data_exp_folder + '*.dat')
+
+    def test_cache_hit_and_miss(self):
+        result_cache = ResultCache(cache_folder_path=self.experiment_history_folder_path + 'cache/')
+        self._run_experiment('run1', result_cache, models=':stm')
+        outputs = self._run_experiment('run2', result_cache, models=':stm')
+        self.assertEqual(len(self.sbcl_runs), 1)
+        self.assertEqual(len(outputs), 1)
+
+        self._run_experiment('run3', result_cache, models=':stm', overwrite=True)  # volatile parameter
+        self.assertEqual(len(self.sbcl_runs), 1)
+        self._run_experiment('run4', result_cache, models=':both')
+        self._run_experiment('run5', result_cache, pretrain_dataset_path=self.shanx_dataset, models=':stm')
+        self.assertEqual(len(self.sbcl_runs), 3)
+
+    def test_cache_hit_with_basis_and_volatile_caching_parameters(self):
+        result_cache = ResultCache(cache_folder_path=self.experiment_history_folder_path + 'cache/')
+        self._run_experiment('run1', result_cache, models=':stm', basis=BasisOption(basis=['cpitch', 'cpint']),
+                             viewpoint_selection_output=self.experiment_history_folder_path + 'trace1.txt')
+        self._run_experiment('run2', result_cache, models=':stm', basis=BasisOption(basis=['cpitch', 'cpint']),
+                             viewpoint_selection_output=self.experiment_history_folder_path + 'trace2.txt',
+                             use_ltms_cache=False, use_resampling_set_cache=False)
+        self.assertEqual(len(self.sbcl_runs), 1)
+        self._run_experiment('run3', result_cache, models=':stm', basis=BasisOption(basis=':bioi'))
+        self.assertEqual(len(self.sbcl_runs), 2)
+
+    def test_lru_eviction(self):
+        dat_size = os.path.getsize(self.dat_file_path)
+        result_cache = ResultCache(cache_folder_path=self.experiment_history_folder_path + 'cache/',
+                                   max_size_bytes=2 * dat_size)
+        self._run_experiment('run1', result_cache, models=':stm')
+        time.sleep(0.01)
+        self._run_experiment('run2', result_cache, models=':ltm')
+        time.sleep(0.01)
+        self._run_experiment('run3', result_cache, models=':stm')  # hit: ':stm' becomes the most recently used
+        time.sleep(0.01)
+        self._run_experiment('run4', result_cache, models=':both')  # evicts ':ltm'
+        self.assertEqual(len(self.sbcl_runs), 3)
+        self.assertLessEqual(result_cache.size(), 2 * dat_size)
+        self._run_experiment('run5', result_cache, models=':stm')
+        self.assertEqual(len(self.sbcl_runs), 3)
+        self._run_experiment('run6', result_cache, models=':ltm')
+        self.assertEqual(len(self.sbcl_runs), 4)
+
+
+class TestLTMCache(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    experiment_history_folder_path = 'experiment_history/TestLTMCache/'
+
+    # writes a fake long-term model in the model directory set by the lisp script
+    fake_sbcl_code = '''
+import re, sys
+script = open(sys.argv[1]).read()
+model_dir = re.search(r'\\*model-dir\\* \\(ensure-directories-exist "([^"]+)"\\)', script).group(1)
+with open(model_dir + 'ltm.model', 'w') as f:
+    f.write('x' * 1000)
+'''
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        os.makedirs(self.experiment_history_folder_path)
+
+    def _run_experiment(self, name, ltm_cache, **parameters):
+        experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset,
+                                     pretrain_dataset_path=self.shanx_dataset,
+                                     experiment_history_folder_path=self.experiment_history_folder_path,
+                                     experiment_logger_name=name,
+                                     ltm_cache=ltm_cache)
+        experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], models=':both',
+                                  ltmo=':ltmo', stmo=':stmo', **parameters)
+        fake_sbcl = staticmethod(lambda lisp_script_path: [sys.executable, '-c', self.fake_sbcl_code, lisp_script_path])
+        with patch.object(SBCLBackend, 'sbcl_command', fake_sbcl):
+            experiment.run()
+        with open(experiment.logger.this_exp_folder + 'compute.lisp') as f:
+            return f.read()
+
+    def test_ltm_cache_shared_across_stm_options(self):
+        ltm_cache = LTMCache(cache_folder_path=self.experiment_history_folder_path + 'ltm_cache/')
+        script1 = self._run_experiment('run1', ltm_cache, ltmo_order_bound=3, stmo_order_bound=2)
+        script2 = self._run_experiment('run2', ltm_cache, ltmo_order_bound=3, stmo_order_bound=5)
+        self._run_experiment('run3', ltm_cache, ltmo_order_bound=4, stmo_order_bound=2)
+
+        dataset_ids1 = re.findall(r'"TEST_DATASET" (\d+)\)', script1) + re.findall(r'"PRETRAIN_DATASET" (\d+)\)', script1)
+        dataset_ids2 = re.findall(r'"TEST_DATASET" (\d+)\)', script2) + re.findall(r'"PRETRAIN_DATASET" (\d+)\)', script2)
+        self.assertEqual(dataset_ids1, dataset_ids2)
+        self.assertIn(f'(ignore-errors (idyom-db:delete-dataset {dataset_ids2[0]}))', script2)
+        self.assertIn(':use-resampling-set-cache t :use-ltms-cache t', script2.replace('_', '-'))
+        stats = ltm_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 2, 2))
+
+    def test_ltm_cache_eviction(self):
+        ltm_cache = LTMCache(cache_folder_path=self.experiment_history_folder_path + 'ltm_cache/',
+                             max_size_bytes=2500)
+        for order_bound in [2, 3, 4]:
+            self._run_experiment(f'run{order_bound}', ltm_cache, ltmo_order_bound=order_bound)
+            time.sleep(0.01)
+        self.assertEqual(ltm_cache.stats()['entries'], 2)
+        self._run_experiment('run5', ltm_cache, ltmo_order_bound=2)  # evicted
+        self.assertEqual(ltm_cache.stats()['hits'], 0)
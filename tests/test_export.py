@@ -2,8 +2,16 @@
 This test script concerns the export functionality.
 We will use the IDyOM outputs from the experiment "25-05-22_14.10.29"
 """
-from unittest import TestCase
-from py2lispIDyOM.export import Export
+import glob
+import importlib.util
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+from py2lispIDyOM.export import MANIFEST_FILE_NAME, Export, NpyOutputs, pianoroll_from_intervals, \
+    read_hdf5_outputs, read_sparse_distribution
 from py2lispIDyOM.extract import ExperimentInfo
 import numpy as np
 import scipy.io
@@ -13,28 +21,71 @@ import pandas as pd
 class TestExport(TestCase):
     experiment_folder_path = './tests/experiment_history/25-05-22_14.10.29/'
 
+    def _copy_experiment(self, temporary_folder_path: str) -> str:
+        """Copy the experiment without its exported files, so that the tests do not write in the tracked experiment."""
+        experiment_folder_path = temporary_folder_path + '/experiment/'
+        shutil.copytree(self.experiment_folder_path, experiment_folder_path,
+                        ignore=shutil.ignore_patterns('outputs_in_*'))
+        return experiment_folder_path
 
     def test_export_mat_files(self):
-        experiment_folder_path = self.experiment_folder_path
         idyom_output_keywords = ['cpitch', 'onset', 'information.content', 'cpitch.entropy']
-        Export(experiment_folder_path=experiment_folder_path,
-               idyom_output_keywords=idyom_output_keywords,
-               melody_names=['"chor-001"', '"chor-002"']).export2mat()
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            Export(experiment_folder_path=self._copy_experiment(temporary_folder_path),
+                   idyom_output_keywords=idyom_output_keywords,
+                   melody_names=['"chor-001"', '"chor-002"']).export2mat()
 
     def test_export_mat_files_v2(self):
-        experiment_folder_path = self.experiment_folder_path
         idyom_output_keywords = ['cpitch', 'cpitch.entropy']
-        Export(experiment_folder_path=experiment_folder_path,
-               idyom_output_keywords=idyom_output_keywords).export2mat()
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            Export(experiment_folder_path=self._copy_experiment(temporary_folder_path),
+                   idyom_output_keywords=idyom_output_keywords).export2mat()
 
     def test_export_csv_files(self):
-        experiment_folder_path = self.experiment_folder_path
-        Export(experiment_folder_path=experiment_folder_path,
-               melody_names=['"chor-003"', '"chor-004"']).export2csv()
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            Export(experiment_folder_path=self._copy_experiment(temporary_folder_path),
+                   melody_names=['"chor-003"', '"chor-004"']).export2csv()
 
     def test_export_csv_files_v2(self):
-        experiment_folder_path = self.experiment_folder_path
-        Export(experiment_folder_path=experiment_folder_path).export2csv()
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            Export(experiment_folder_path=experiment_folder_path).export2csv()
+            # the files are the ones of the tracked experiment
+            for file_name in os.listdir(self.experiment_folder_path + 'outputs_in_csv/'):
+                with open(self.experiment_folder_path + 'outputs_in_csv/' + file_name, 'rb') as expected_file, \
+                        open(experiment_folder_path + 'outputs_in_csv/' + file_name, 'rb') as f:
+                    self.assertEqual(f.read(), expected_file.read())
+
+    def test_export_csv_files_selected_keywords(self):
+        experiment_df = ExperimentInfo(experiment_folder_path=self.experiment_folder_path).df
+        melody_names = [f'"chor-{index:03}"' for index in range(5, 11)]
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            Export(experiment_folder_path=experiment_folder_path,
+                   idyom_output_keywords=['cpitch', 'information.content'],
+                   melody_names=melody_names).export2csv(max_workers=2, float_precision=3, melodies_per_task=2)
+            chor005_df = pd.read_csv(experiment_folder_path + 'outputs_in_csv/chor-005.csv')
+            self.assertEqual(list(chor005_df.columns),
+                             ['melody.id', 'note.id', 'melody.name', 'cpitch', 'information.content'])
+            expected_df = experiment_df[experiment_df['melody.name'] == 'chor-005'].reset_index(drop=True)
+            np.testing.assert_array_equal(chor005_df['cpitch'], expected_df['cpitch'])
+            np.testing.assert_allclose(chor005_df['information.content'], expected_df['information.content'],
+                                       atol=5e-4)
+            for melody_name in melody_names:
+                self.assertTrue(os.path.exists(experiment_folder_path + 'outputs_in_csv/' +
+                                               melody_name.strip('"') + '.csv'))
+
+    def test_export_csv_files_typed(self):
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            export = Export(experiment_folder_path=experiment_folder_path, melody_names=['"chor-001"'],
+                            idyom_output_keywords=['vertint12', 'cpitch'])
+            export.export2csv()
+            with open(experiment_folder_path + 'outputs_in_csv/chor-001.csv') as f:
+                self.assertEqual(f.readlines()[1], '1.0,1.0,"""chor-001""",NA,73.0\n')
+            export.export2csv(typed=True)
+            with open(experiment_folder_path + 'outputs_in_csv/chor-001.csv') as f:
+                self.assertEqual(f.readlines()[1], '1,1,chor-001,,73\n')
 
     def test_mat_file_check(self):
         experiment_folder_path = self.experiment_folder_path
@@ -122,9 +173,359 @@ class TestExport(TestCase):
             # supposed to raise ValueError (export-134)
             Export(experiment_folder_path=experiment_folder_path).export2mat()
 
-        with self.assertRaises(ValueError):
-            # supposed to raise ValueError (export-152)
-            Export(experiment_folder_path=experiment_folder_path,
-                   idyom_output_keywords=['cpitch']).export2csv()
-
 
+    def test_incremental_export(self):
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            keywords = ['cpitch', 'information.content']
+            Export(experiment_folder_path=experiment_folder_path, idyom_output_keywords=keywords).export2csv()
+            Export(experiment_folder_path=experiment_folder_path, idyom_output_keywords=keywords).export2mat()
+            csv_folder_path = experiment_folder_path + 'outputs_in_csv/'
+            mat_folder_path = experiment_folder_path + 'outputs_in_mat/'
+            self.assertTrue(os.path.exists(csv_folder_path + MANIFEST_FILE_NAME))
+            modification_times = {file_path: os.stat(file_path).st_mtime_ns
+                                  for file_path in [csv_folder_path + 'chor-001.csv', csv_folder_path + 'chor-002.csv',
+                                                    mat_folder_path + 'cpitch.mat',
+                                                    mat_folder_path + 'information_content.mat']}
+
+            # the same exports from the same output file are skipped without parsing or hashing it
+            with patch.object(Export, '_get_selected_outputs_df', side_effect=AssertionError('parsed')), \
+                    patch('py2lispIDyOM.export.getDataFrame', side_effect=AssertionError('parsed')), \
+                    patch('py2lispIDyOM.export._hash_file', side_effect=AssertionError('hashed')):
+                Export(experiment_folder_path=experiment_folder_path, idyom_output_keywords=keywords).export2csv()
+                Export(experiment_folder_path=experiment_folder_path, idyom_output_keywords=keywords).export2mat()
+
+            # the files which are up to date are not written again, the changed or deleted ones are
+            export = Export(experiment_folder_path=experiment_folder_path, idyom_output_keywords=keywords)
+            export.export2mat()
+            self.assertNotIn('experiment_info', export.__dict__)  # the melodies are not built as MelodyInfo
+            with open(csv_folder_path + 'chor-001.csv', 'a') as f:
+                f.write('edited\n')
+            os.remove(mat_folder_path + 'cpitch.mat')
+            export.export2csv()
+            export.export2mat()
+            self.assertEqual(os.stat(csv_folder_path + 'chor-002.csv').st_mtime_ns,
+                             modification_times[csv_folder_path + 'chor-002.csv'])
+            self.assertEqual(os.stat(mat_folder_path + 'information_content.mat').st_mtime_ns,
+                             modification_times[mat_folder_path + 'information_content.mat'])
+            self.assertNotIn('edited', open(csv_folder_path + 'chor-001.csv').read())
+            self.assertTrue(os.path.exists(mat_folder_path + 'cpitch.mat'))
+
+            # other options write the files again
+            Export(experiment_folder_path=experiment_folder_path, idyom_output_keywords=keywords).export2csv(
+                float_precision=2)
+            self.assertNotEqual(os.stat(csv_folder_path + 'chor-002.csv').st_mtime_ns,
+                                modification_times[csv_folder_path + 'chor-002.csv'])
+            chor002_df = pd.read_csv(csv_folder_path + 'chor-002.csv')
+            self.assertEqual(list(chor002_df.columns), ['melody.id', 'note.id', 'melody.name'] + keywords)
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_export_parquet(self):
+        import pyarrow.parquet as pq
+
+        experiment_df = ExperimentInfo(experiment_folder_path=self.experiment_folder_path).df
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            parquet_file_path = Export(experiment_folder_path=experiment_folder_path,
+                                       idyom_output_keywords=['cpitch', 'information.content']).export2parquet(
+                row_group_size=1)
+            parquet_file = pq.ParquetFile(parquet_file_path)
+            self.assertEqual(parquet_file.num_row_groups, experiment_df['melody.id'].nunique())
+            parquet_df = pd.read_parquet(parquet_file_path, columns=['melody.name', 'information.content'],
+                                         filters=[('melody.name', '==', 'chor-003')])
+            chor003_df = experiment_df[experiment_df['melody.name'] == 'chor-003']
+            np.testing.assert_array_equal(parquet_df['information.content'], chor003_df['information.content'])
+
+            dataset_path = Export(experiment_folder_path=experiment_folder_path,
+                                  melody_names=['"chor-001"', '"chor-002"']).export2parquet(partition_by_melody=True)
+            parquet_df = pd.read_parquet(dataset_path)
+            self.assertEqual(sorted(parquet_df['melody.name'].unique()), ['chor-001', 'chor-002'])
+            self.assertEqual(len(parquet_df.columns), len(experiment_df.columns))
+
+    def test_invalid_selection(self):
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            with self.assertRaises(KeyError):
+                Export(experiment_folder_path=experiment_folder_path,
+                       idyom_output_keywords=['cpitch', 'information-content']).export2parquet()
+            with self.assertRaises(KeyError):
+                Export(experiment_folder_path=experiment_folder_path,
+                       melody_names=['"chor-999"']).export2parquet()
+
+    @skipUnless(importlib.util.find_spec('h5py'), 'h5py is not installed')
+    def test_export_hdf5_append(self):
+        experiment_df = ExperimentInfo(experiment_folder_path=self.experiment_folder_path).df
+        keywords = ['cpitch', 'information.content']
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            store_path = Export(experiment_folder_path=experiment_folder_path, idyom_output_keywords=keywords,
+                                melody_names=['"chor-001"', '"chor-002"']).export2hdf5()
+            self.assertEqual(list(read_hdf5_outputs(store_path)['melody.name'].unique()), ['chor-001', 'chor-002'])
+
+            # the melodies already in the store are skipped
+            Export(experiment_folder_path=experiment_folder_path, idyom_output_keywords=keywords).export2hdf5(
+                append=True)
+            hdf5_df = read_hdf5_outputs(store_path)
+            self.assertEqual(len(hdf5_df), len(experiment_df))
+            hdf5_df = hdf5_df.sort_values(['melody.id', 'note.id']).reset_index(drop=True)
+            pd.testing.assert_frame_equal(hdf5_df[['melody.id', 'note.id', 'melody.name'] + keywords],
+                                          experiment_df[['melody.id', 'note.id', 'melody.name'] + keywords])
+
+            chor003_df = read_hdf5_outputs(store_path, idyom_output_keywords=['information.content'],
+                                           melody_names=['"chor-003"'])
+            self.assertEqual(list(chor003_df.columns),
+                             ['experiment', 'melody.id', 'melody.name', 'information.content'])
+            np.testing.assert_array_equal(
+                chor003_df['information.content'],
+                experiment_df[experiment_df['melody.name'] == 'chor-003']['information.content'])
+
+            with self.assertRaises(ValueError):
+                Export(experiment_folder_path=experiment_folder_path, idyom_output_keywords=['cpitch']).export2hdf5(
+                    store_path=store_path, append=True)
+
+    def test_export_streaming(self):
+        experiment_df = ExperimentInfo(experiment_folder_path=self.experiment_folder_path).df
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            with self.assertRaises(KeyError):
+                Export(experiment_folder_path=experiment_folder_path,
+                       melody_names=['"chor-001"', '"chor-999"']).export_streaming()
+            self.assertFalse(os.path.exists(experiment_folder_path + 'outputs_in_csv/'))  # nothing is written
+            export = Export(experiment_folder_path=experiment_folder_path,
+                            idyom_output_keywords=['cpitch', 'information.content'],
+                            melody_names=['"chor-011"', '"chor-012"'])
+            export.export_streaming('csv', chunk_rows=50)
+            export.export_streaming('mat', chunk_rows=50)
+            self.assertNotIn('experiment_info', export.__dict__)  # the melodies are not built as MelodyInfo
+            chor012_df = experiment_df[experiment_df['melody.name'] == 'chor-012']
+            csv_df = pd.read_csv(experiment_folder_path + 'outputs_in_csv/chor-012.csv')
+            np.testing.assert_array_equal(csv_df['information.content'], chor012_df['information.content'])
+            mat = scipy.io.loadmat(experiment_folder_path + 'outputs_in_mat/chor012.mat')
+            np.testing.assert_array_equal(mat['cpitch'].flatten(), chor012_df['cpitch'])
+            self.assertEqual(mat['cpitch'].dtype, np.int64)
+
+            with self.assertRaises(KeyError):
+                Export(experiment_folder_path=experiment_folder_path, melody_names=['"chor-999"']).export_streaming()
+            with self.assertRaises(ValueError):
+                Export(experiment_folder_path=experiment_folder_path).export_streaming('xlsx')
+
+    def test_export_streaming_csv_files(self):
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            Export(experiment_folder_path=experiment_folder_path).export_streaming('csv', chunk_rows=50)
+            # the files are the ones of the tracked experiment, as written by export2csv
+            for file_name in os.listdir(self.experiment_folder_path + 'outputs_in_csv/'):
+                with open(self.experiment_folder_path + 'outputs_in_csv/' + file_name, 'rb') as expected_file, \
+                        open(experiment_folder_path + 'outputs_in_csv/' + file_name, 'rb') as f:
+                    self.assertEqual(f.read(), expected_file.read())
+
+            export = Export(experiment_folder_path=experiment_folder_path, melody_names=['"chor-001"'],
+                            idyom_output_keywords=['vertint12', 'cpitch'])
+            export.export_streaming('csv', typed=True)
+            with open(experiment_folder_path + 'outputs_in_csv/chor-001.csv', 'r') as f:
+                streaming_lines = f.readlines()
+            export.export2csv(typed=True)
+            with open(experiment_folder_path + 'outputs_in_csv/chor-001.csv', 'r') as f:
+                self.assertEqual(streaming_lines, f.readlines())
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_export_streaming_parquet(self):
+        experiment_df = ExperimentInfo(experiment_folder_path=self.experiment_folder_path).df
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            parquet_file_path = Export(experiment_folder_path=self._copy_experiment(temporary_folder_path)
+                                       ).export_streaming('parquet', chunk_rows=100)
+            parquet_df = pd.read_parquet(parquet_file_path)
+        parquet_df['melody.name'] = parquet_df['melody.name'].astype(str)
+        pd.testing.assert_frame_equal(parquet_df, experiment_df)
+
+    def test_export_mat_file(self):
+        experiment_df = ExperimentInfo(experiment_folder_path=self.experiment_folder_path).df
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            export = Export(experiment_folder_path=self._copy_experiment(temporary_folder_path),
+                            idyom_output_keywords=['cpitch', 'information.content', 'cpitch.entropy'])
+            mat = scipy.io.loadmat(export.export2mat_file(file_name='offsets.mat'))
+            self.assertEqual(mat['cpitch'].dtype, np.int64)
+            self.assertEqual(mat['information_content'].shape, (len(experiment_df), 1))
+            offsets = mat['melody_offsets'].flatten()
+            chor003_index = [melody_name[0] for melody_name in mat['melody_names'].flatten()].index('chor-003')
+            np.testing.assert_array_equal(
+                mat['cpitch_entropy'][offsets[chor003_index]:offsets[chor003_index + 1], 0],
+                experiment_df[experiment_df['melody.name'] == 'chor-003']['cpitch.entropy'])
+
+            mat = scipy.io.loadmat(export.export2mat_file(layout='struct', file_name='struct.mat'))
+            chor003 = mat['melodies'][0, chor003_index]
+            self.assertEqual(chor003['melody_name'][0], 'chor-003')
+            np.testing.assert_array_equal(chor003['cpitch'].flatten(),
+                                          experiment_df[experiment_df['melody.name'] == 'chor-003']['cpitch'])
+
+            with self.assertRaises(ValueError):
+                export.export2mat_file(layout='struct', mat_version='7.3')
+            with self.assertRaises(ValueError):
+                export.export2mat_file(layout='cells')
+
+    @skipUnless(importlib.util.find_spec('h5py'), 'h5py is not installed')
+    def test_export_mat_file_v73(self):
+        import h5py
+
+        experiment_df = ExperimentInfo(experiment_folder_path=self.experiment_folder_path).df
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            mat_file_path = Export(experiment_folder_path=self._copy_experiment(temporary_folder_path)
+                                   ).export2mat_file(mat_version='7.3', file_name='outputs_v73.mat')
+            with self.assertRaises(NotImplementedError):  # scipy recognizes the header of a version 7.3 file
+                scipy.io.loadmat(mat_file_path)
+            with h5py.File(mat_file_path, 'r') as f:
+                self.assertEqual(f['information_content'].attrs['MATLAB_class'], b'double')
+                np.testing.assert_array_equal(f['information_content'][0], experiment_df['information.content'])
+                melody_name = f[f['melody_names'][0, 2]][:].flatten().tobytes().decode('utf-16-le')
+                self.assertEqual(melody_name, 'chor-003')
+                self.assertEqual(f['melody_offsets'][0, -1], len(experiment_df))
+
+    @skipUnless(importlib.util.find_spec('h5py'), 'h5py is not installed')
+    def test_export_mat_file_v73_cells(self):
+        import h5py
+
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            dat_file_path = glob.glob(experiment_folder_path + 'experiment_output_data_folder/*.dat')[0]
+            with open(dat_file_path, 'r') as f:
+                lines = f.readlines()
+            ornament_index = lines[0].split().index('ornament')
+            values = lines[1].split()
+            values[ornament_index] = 'NIL'
+            lines[1] = ' '.join(values) + '\n'
+            with open(dat_file_path, 'w') as f:
+                f.writelines(lines)
+
+            mat_file_path = Export(experiment_folder_path=experiment_folder_path,
+                                   idyom_output_keywords=['ornament', 'information.content']
+                                   ).export2mat_file(mat_version='7.3')
+            with h5py.File(mat_file_path, 'r') as f:
+                self.assertEqual(f['ornament'].attrs['MATLAB_class'], b'cell')
+                self.assertEqual(f[f['ornament'][0, 0]][:].flatten().tobytes().decode('utf-16-le'), 'NIL')
+                self.assertEqual(f[f['ornament'][0, 1]][:].flatten().tobytes().decode('utf-16-le'), '0')
+                self.assertEqual(f['information_content'].attrs['MATLAB_class'], b'double')
+
+    def test_export_mat_file_auto_version(self):
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            export = Export(experiment_folder_path=self._copy_experiment(temporary_folder_path))
+            keywords_df = export._get_selected_outputs_df().drop(columns='melody.name')
+            column_bytes = keywords_df.memory_usage(index=False, deep=True)
+            # the outputs are larger than the limit, but each of their keywords is smaller
+            with patch('py2lispIDyOM.export.MAT_V5_MAX_BYTES', column_bytes.max() + 1):
+                self.assertGreater(column_bytes.sum(), column_bytes.max() + 1)
+                scipy.io.loadmat(export.export2mat_file())  # a version 7.3 file would not load
+
+    def test_export_npy(self):
+        experiment_df = ExperimentInfo(experiment_folder_path=self.experiment_folder_path).df
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            export_folder_path = Export(experiment_folder_path=self._copy_experiment(temporary_folder_path)
+                                        ).export2npy()
+            outputs = NpyOutputs(export_folder_path)
+            self.assertEqual(len(outputs), experiment_df['melody.id'].nunique())
+            self.assertIsInstance(outputs.arrays['information.content'], np.memmap)
+            self.assertEqual(outputs.arrays['cpitch'].dtype, np.int64)
+            chor003_df = experiment_df[experiment_df['melody.name'] == 'chor-003']
+            chor003 = outputs['"chor-003"']
+            self.assertIsInstance(chor003['information.content'], np.memmap)  # a view, not a copy
+            np.testing.assert_array_equal(chor003['information.content'], chor003_df['information.content'])
+            cpitch_keys = ['cpitch.' + str(symbol) for symbol in outputs.alphabets['cpitch']]
+            np.testing.assert_array_equal(chor003['cpitch.distribution'], chor003_df[cpitch_keys].values)
+            np.testing.assert_array_equal(outputs[2]['cpitch'], chor003['cpitch'])
+
+            outputs = NpyOutputs(export_folder_path, idyom_output_keywords=['cpitch.distribution'])
+            self.assertEqual(list(outputs[-1]), ['cpitch.distribution'])
+            with self.assertRaises(KeyError):
+                NpyOutputs(export_folder_path, idyom_output_keywords=['cpitch.60'])
+            del outputs, chor003  # close the memory maps before the folder is removed
+
+    def test_export_npy_non_numeric_keyword(self):
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            dat_file_path = glob.glob(experiment_folder_path + 'experiment_output_data_folder/*.dat')[0]
+            with open(dat_file_path, 'r') as f:
+                lines = f.readlines()
+            ornament_index = lines[0].split().index('ornament')
+            values = lines[1].split()
+            values[ornament_index] = 'NIL'
+            lines[1] = ' '.join(values) + '\n'
+            with open(dat_file_path, 'w') as f:
+                f.writelines(lines)
+
+            export_folder_path = Export(experiment_folder_path=experiment_folder_path,
+                                        idyom_output_keywords=['ornament', 'information.content']).export2npy()
+            outputs = NpyOutputs(export_folder_path)
+            self.assertIsInstance(outputs.arrays['ornament'], np.memmap)
+            self.assertEqual(outputs.arrays['ornament'].dtype.kind, 'U')
+            self.assertEqual(list(outputs[0]['ornament'][:2]), ['NIL', '0'])
+            self.assertEqual(outputs.arrays['information.content'].dtype, np.float64)
+            del outputs  # close the memory maps before the folder is removed
+
+    def test_export_sqlite(self):
+        experiment_df = ExperimentInfo(experiment_folder_path=self.experiment_folder_path).df
+        keywords = ['cpitch', 'information.content']
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            db_path = temporary_folder_path + '/outputs.sqlite'
+            Export(experiment_folder_path=self.experiment_folder_path, idyom_output_keywords=keywords,
+                   melody_names=['"chor-001"', '"chor-002"']).export2sqlite(db_path)
+            # the melodies already in the database are skipped, and the new keywords are added as columns
+            Export(experiment_folder_path=self.experiment_folder_path,
+                   idyom_output_keywords=keywords + ['entropy']).export2sqlite(db_path)
+
+            connection = sqlite3.connect(db_path)
+            try:
+                self.assertEqual(connection.execute('SELECT models, k FROM experiments').fetchall(), [(':both', 'full')])
+                self.assertEqual(connection.execute('SELECT COUNT(*) FROM notes').fetchone()[0], len(experiment_df))
+                query_df = pd.read_sql_query(
+                    'SELECT melody_name, note_id, "information.content" FROM notes '
+                    'JOIN melodies USING (melody_key) JOIN experiments USING (experiment_id) '
+                    'WHERE "information.content" > 10 AND models = \':both\' ORDER BY melody_id, note_id', connection)
+                expected_df = experiment_df[experiment_df['information.content'] > 10]
+                self.assertEqual(list(query_df['melody_name']), list(expected_df['melody.name']))
+                np.testing.assert_array_equal(query_df['information.content'], expected_df['information.content'])
+                entropy_nulls = connection.execute('SELECT COUNT(*) FROM notes WHERE entropy IS NULL').fetchone()[0]
+                self.assertEqual(entropy_nulls, (experiment_df['melody.name'].isin(['chor-001', 'chor-002'])).sum())
+                query_plan = connection.execute('EXPLAIN QUERY PLAN SELECT * FROM notes '
+                                                'WHERE "information.content" > 10').fetchall()
+                self.assertIn('notes_information.content', str(query_plan))
+            finally:
+                connection.close()
+
+    def test_export_sqlite_without_models_and_k(self):
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            experiment_folder_path = self._copy_experiment(temporary_folder_path)
+            os.remove(experiment_folder_path + 'compute.lisp')
+            with self.assertRaises(ValueError):
+                Export(experiment_folder_path=experiment_folder_path).export2sqlite(
+                    temporary_folder_path + '/outputs.sqlite')
+
+    def test_export_sparse(self):
+        experiment_info = ExperimentInfo(experiment_folder_path=self.experiment_folder_path)
+        experiment_df = experiment_info.df
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            export = Export(experiment_folder_path=self._copy_experiment(temporary_folder_path))
+            export_folder_path = export.export_sparse(threshold=1e-3, export_folder_name='outputs_sparse_csr')
+            matrix, alphabet, residual = read_sparse_distribution(export_folder_path, 'cpitch')
+            dense = experiment_df[['cpitch.' + str(symbol) for symbol in alphabet]].to_numpy()
+            np.testing.assert_array_equal(matrix.toarray(), np.where(dense >= 1e-3, dense, 0))
+            np.testing.assert_allclose(matrix.sum(axis=1).A1 + residual, 1, atol=1e-6)
+
+            export_folder_path = export.export_sparse('topk', top_k=3, viewpoints=['cpitch'],
+                                                      export_folder_name='outputs_sparse_topk')
+            self.assertFalse(os.path.exists(export_folder_path + 'onset.topk.npz'))
+            matrix, alphabet, residual = read_sparse_distribution(export_folder_path, 'cpitch')
+            self.assertTrue((matrix.getnnz(axis=1) == 3).all())
+            np.testing.assert_allclose(matrix.max(axis=1).toarray().ravel(), dense.max(axis=1))
+            np.testing.assert_allclose(matrix.sum(axis=1).A1 + residual, 1, atol=1e-6)
+
+            # the pianorolls of the melodies from their note intervals
+            intervals_df = pd.read_csv(export_folder_path + 'pianoroll_intervals.csv')
+            chor003 = experiment_info.melodies_dict['"chor-003"']
+            pitch_range = (np.amin(chor003.exp_pitch_element_list), np.amax(chor003.exp_pitch_element_list))
+            np.testing.assert_array_equal(
+                pianoroll_from_intervals(intervals_df[intervals_df['melody.name'] == 'chor-003'], pitch_range),
+                chor003._get_pianoroll_original())
+
+            with self.assertRaises(KeyError):
+                export.export_sparse(viewpoints=['cpint'])
+            with self.assertRaises(ValueError):
+                export.export_sparse('coo')
@@ -2,13 +2,17 @@
 This test script concerns the extract functionality.
 We will use the IDyOM outputs from the experiment "25-05-22_14.10.29"
 """
+import tempfile
+from glob import glob
+
 import numpy as np
 from unittest import TestCase
 
 import pandas as pd
 
 from py2lispIDyOM.extract import MelodyInfo, ExperimentInfo
-from py2lispIDyOM.extract import get_song_dict_of_interest, get_all_song_dict
+from py2lispIDyOM.extract import get_song_dict_of_interest, get_all_song_dict, getDataFrame, merge_dat_files, \
+    get_dat_file_path, get_melody_names, index_melody_byte_ranges, iter_melody_blocks, load_melodies
 
 
 class TestExtract(TestCase):
@@ -99,4 +103,52 @@ class TestExtract(TestCase):
         melody = my_exp.melodies_dict['"chor-001"']
         result = melody._get_surprisal_array()
         self.assertIs(type(result), np.ndarray)
-        self.assertEqual(result.shape, (889,))
\ No newline at end of file
+        self.assertEqual(result.shape, (889,))
+
+    def test_merge_dat_files_with_different_columns(self):
+        dat_file_path = glob(self.experiment_folder_path + 'experiment_output_data_folder/*.dat')[0]
+        original_df = getDataFrame(dat_file_path)
+        odd_melodies = original_df['melody.id'] % 2 == 1
+        with tempfile.TemporaryDirectory() as temporary_folder_path:
+            output_folder = temporary_folder_path + '/'
+            original_df[odd_melodies].drop(columns=['cpitch.55']).to_csv(output_folder + 'fold_1.dat', sep=' ',
+                                                                         index=False, na_rep='NA')
+            original_df[~odd_melodies].to_csv(output_folder + 'fold_2.dat', sep=' ', index=False, na_rep='NA')
+
+            merge_dat_files([output_folder + 'fold_1.dat', output_folder + 'fold_2.dat'], output_folder + 'merged.dat')
+            merged_df = getDataFrame(output_folder + 'merged.dat')
+        self.assertEqual(list(merged_df['melody.id']), list(original_df['melody.id']))
+        self.assertEqual(merged_df['cpitch.55'][odd_melodies.values].sum(), 0)
+        np.testing.assert_allclose(merged_df['information.content'], original_df['information.content'])
+
+    def test_iter_melody_blocks(self):
+        dat_file_path = get_dat_file_path(self.experiment_folder_path)
+        original_df = getDataFrame(dat_file_path)
+        columns = ['melody.id', 'note.id', 'melody.name', 'information.content']
+        blocks = list(iter_melody_blocks(dat_file_path, columns=columns, chunk_rows=40))
+        self.assertGreater(len(blocks), 1)
+        for block_df, next_block_df in zip(blocks[:-1], blocks[1:]):
+            self.assertEqual(list(block_df.columns), columns)
+            self.assertLess(block_df['melody.id'].max(), next_block_df['melody.id'].min())
+        pd.testing.assert_frame_equal(pd.concat(blocks, ignore_index=True), original_df[columns])
+        with self.assertRaises(FileNotFoundError):
+            get_dat_file_path('./tests/dataset/')
+
+    def test_load_melodies(self):
+        experiment_info = ExperimentInfo(experiment_folder_path=self.experiment_folder_path)
+        self.assertEqual(get_melody_names(experiment_info.dat_file_path), list(experiment_info.melodies_dict))
+        melodies = load_melodies(self.experiment_folder_path, ['"chor-005"', '"chor-002"'])
+        self.assertEqual(sorted(melodies), ['"chor-002"', '"chor-005"'])
+        pd.testing.assert_frame_equal(pd.DataFrame(melodies['"chor-005"']),
+                                      pd.DataFrame(experiment_info.melodies_dict['"chor-005"']))
+        np.testing.assert_array_equal(melodies['"chor-005"']._get_pianoroll_original(),
+                                      experiment_info.melodies_dict['"chor-005"']._get_pianoroll_original())
+
+        byte_ranges = index_melody_byte_ranges(experiment_info.dat_file_path)
+        self.assertEqual(list(byte_ranges), list(experiment_info.melodies_dict))
+        indexed_melodies = load_melodies(self.experiment_folder_path, ['"chor-005"', '"chor-002"'],
+                                         byte_ranges=byte_ranges)
+        self.assertEqual(list(indexed_melodies), ['"chor-005"', '"chor-002"'])
+        for melody_name in ['"chor-005"', '"chor-002"']:
+            pd.testing.assert_frame_equal(pd.DataFrame(indexed_melodies[melody_name]),
+                                          pd.DataFrame(experiment_info.melodies_dict[melody_name]))
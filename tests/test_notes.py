@@ -0,0 +1,44 @@
+"""
+This test script concerns the MIDI and kern readers.
+"""
+import os
+import shutil
+from glob import glob
+from unittest import TestCase
+
+import numpy as np
+from natsort import natsorted
+
+from py2lispIDyOM.extract import getDataFrame
+from py2lispIDyOM.notes import read_melody, read_kern_melody
+
+
+class TestNotes(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    dat_file_path = './tests/experiment_history/25-05-22_14.10.29/experiment_output_data_folder/' \
+                    '66052522141029-cpitch_onset-cpitch_onset-99052522141029-nil-melody-nil-full-both-8-t-nil-c-nil-t-t-x-3.dat'
+    experiment_history_folder_path = 'experiment_history/TestNotes/'
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        os.makedirs(self.experiment_history_folder_path)
+
+    def test_midi_notes_as_imported_by_idyom(self):
+        melodies = [read_melody(path) for path in natsorted(glob(self.bach_dataset + '*.mid'))]
+        notes = np.array([(note.onset, note.dur, note.cpitch) for melody in melodies for note in melody.notes])
+        idyom_df = getDataFrame(self.dat_file_path)
+        np.testing.assert_array_equal(notes, idyom_df[['onset', 'dur', 'cpitch']].to_numpy())
+        self.assertEqual(melodies[0].name, 'chor-001')
+        self.assertEqual(melodies[0].tempo, 600000)
+
+    def test_kern_notes(self):
+        # a pickup rest, a tied note, a chord (only its first note is read) and a dotted note
+        kern_file_path = self.experiment_history_folder_path + 'melody.krn'
+        with open(kern_file_path, 'w') as f:
+            f.write('!!!COM: test\n**kern\t**silbe\n*M3/4\t*\n*k[f#]\t*\n*G:\t*\n=1\t=1\n4r\t.\n[4g\tla\n'
+                    '=2\t=2\n4g]\t.\n8f# 8a\tla\n4.cc\tla\n*-\t*-\n')
+        melody = read_kern_melody(kern_file_path)
+        self.assertEqual([(note.onset, note.dur, note.cpitch) for note in melody.notes],
+                         [(0, 48, 67), (48, 12, 66), (60, 36, 72)])
+        self.assertEqual((melody.barlength, melody.pulses, melody.keysig, melody.mode), (72, 3, 1, 0))
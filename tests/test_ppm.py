@@ -0,0 +1,217 @@
+"""
+This test script concerns the python PPM models and the PPM backend, compared with the outputs of IDyOM
+in the experiment "25-05-22_14.10.29".
+"""
+import itertools
+import os
+import shutil
+from glob import glob
+from unittest import TestCase
+
+import numpy as np
+
+from py2lispIDyOM.backends import APPROXIMATE_PPM_FILE_PREFIX, ApproximatePPMBackend, InProcessBackend, get_backend
+from py2lispIDyOM.extract import getDataFrame
+from py2lispIDyOM.ppm import ESCAPE_METHODS, PPMModel, ViewpointModel, _predict_ltm, _predict_ltm_sequentially, \
+    _predict_stm, combine_distributions
+from py2lispIDyOM.run import IDyOMExperiment
+
+
+class TestPPMModel(TestCase):
+    sequences = [[0, 1, 2, 0, 1, 3], [0, 1, 2, 2, 1, 0, 1], [3, 3, 0, 1]]
+
+    def _trained_model(self, sequences=None, **options):
+        model = PPMModel(alphabet_size=4, **options)
+        for sequence in sequences if sequences is not None else self.sequences:
+            model.train(sequence)
+        return model
+
+    def test_distributions(self):
+        symbols = np.arange(4)
+        for escape in ESCAPE_METHODS:
+            for mixtures in [True, False]:
+                for update_exclusion in [True, False]:
+                    model = self._trained_model(escape=escape, mixtures=mixtures, update_exclusion=update_exclusion)
+                    for history in [[], [0], [0, 1], [2, 1, 0], [3, 3, 3]]:
+                        distribution, _ = model.predict(history, symbols)
+                        self.assertAlmostEqual(distribution.sum(), 1)
+                        self.assertTrue((distribution > 0).all())
+        with self.assertRaises(ValueError):
+            PPMModel(alphabet_size=4, escape=':e')
+
+    def test_orders(self):
+        symbols = np.arange(4)
+        # the longest context followed by a symbol, up to the order bound
+        self.assertEqual(self._trained_model(order_bound=2).predict([2, 0, 1], symbols)[1], 2)
+        self.assertEqual(self._trained_model(order_bound=1).predict([2, 0, 1], symbols)[1], 1)
+        self.assertEqual(self._trained_model(order_bound=2).predict([3, 2], symbols)[1], 1)
+        # without a bound, the shortest deterministic context: 0 is always followed by 1
+        self.assertEqual(self._trained_model().predict([2, 0], symbols)[1], 1)
+        self.assertEqual(self._trained_model().predict([], symbols)[1], 0)
+
+    def test_forget(self):
+        model = self._trained_model()
+        model.forget(self.sequences[1])
+        other_model = self._trained_model([self.sequences[0], self.sequences[2]])
+        for history in [[], [0], [0, 1], [1, 2]]:
+            np.testing.assert_allclose(model.predict(history, np.arange(4))[0],
+                                       other_model.predict(history, np.arange(4))[0])
+        with self.assertRaises(ValueError):
+            self._trained_model(update_exclusion=True).forget(self.sequences[0])
+
+    def test_combine_distributions(self):
+        certain = np.array([[0.97, 0.01, 0.01, 0.01]])
+        uniform = np.full((1, 4), 0.25)
+        combined, weights = combine_distributions([certain, uniform], bias=2)
+        self.assertGreater(weights[0, 0], weights[1, 0])
+        self.assertAlmostEqual(combined.sum(), 1)
+        combined, weights = combine_distributions([certain, np.full((1, 4), np.nan)], bias=2, method='arithmetic')
+        np.testing.assert_allclose(combined, certain)
+        np.testing.assert_allclose(weights[:, 0], [1, 0])
+
+
+class TestBatchedPredictions(TestCase):
+    events = InProcessBackend._read_events_of_folder('./tests/dataset/bach_dataset/')
+    events = events[events['melody.id'] <= 6].reset_index(drop=True)
+    pretrain_events = InProcessBackend._read_events_of_folder('./tests/dataset/shanx_dataset/')
+
+    def _viewpoint_models(self):
+        target_alphabets = {'cpitch': np.unique(np.r_[self.events['cpitch'], self.pretrain_events['cpitch']])}
+        return [ViewpointModel(viewpoint, self.events, self.pretrain_events, target_alphabets)
+                for viewpoint in ['cpitch', ('cpint', 'dur'), 'contour']]
+
+    @staticmethod
+    def _assert_predictions_equal(predictions, expected_predictions):
+        for target, (distributions, orders) in predictions.items():
+            np.testing.assert_allclose(distributions, expected_predictions[target][0], rtol=1e-9)
+            np.testing.assert_array_equal(orders, expected_predictions[target][1])
+
+    def test_stm(self):
+        # the short-term models of all the melodies, predicted note by note with PPMModel
+        melody_ids = self.events['melody.id'].to_numpy()
+        for viewpoint_model in self._viewpoint_models():
+            for escape, mixtures, update_exclusion, order_bound in itertools.product(
+                    ESCAPE_METHODS, [True, False], [True, False], [None, 2]):
+                options = dict(order_bound=order_bound, mixtures=mixtures, update_exclusion=update_exclusion,
+                               escape=escape)
+                predictions = _predict_stm(viewpoint_model, melody_ids, np.ones(len(melody_ids), dtype=bool), options)
+                expected_predictions = {target: (np.full(distributions.shape, np.nan), np.full(orders.shape, np.nan))
+                                        for target, (distributions, orders) in predictions.items()}
+                for melody_id in np.unique(melody_ids):
+                    model = PPMModel(len(viewpoint_model.alphabet), **options)
+                    history = []
+                    for row in np.flatnonzero(melody_ids == melody_id):
+                        for target, candidate_symbols in viewpoint_model.candidate_symbols.items():
+                            distribution, order = viewpoint_model.target_distribution(model, history,
+                                                                                      candidate_symbols[row])
+                            if distribution is not None:
+                                expected_predictions[target][0][row] = distribution
+                                expected_predictions[target][1][row] = order
+                        if viewpoint_model.test_symbols[row] >= 0:
+                            model.update(history, int(viewpoint_model.test_symbols[row]))
+                            history.append(int(viewpoint_model.test_symbols[row]))
+                self._assert_predictions_equal(predictions, expected_predictions)
+
+    def test_ltm(self):
+        melody_ids = self.events['melody.id'].to_numpy()
+        pretrain_melody_ids = self.pretrain_events['melody.id'].to_numpy()
+        for viewpoint_model in self._viewpoint_models():
+            for escape, mixtures, order_bound, k in itertools.product(ESCAPE_METHODS, [True, False], [None, 3], [1, 3]):
+                options = dict(order_bound=order_bound, mixtures=mixtures, update_exclusion=False, escape=escape)
+                folds = melody_ids % k
+                resampling_indices = list(range(k))
+                self._assert_predictions_equal(
+                    _predict_ltm(viewpoint_model, melody_ids, pretrain_melody_ids, folds, resampling_indices, options),
+                    _predict_ltm_sequentially(viewpoint_model, melody_ids, pretrain_melody_ids, folds,
+                                              resampling_indices, options, updated=False))
+
+
+class TestApproximatePPMBackend(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    idyom_dat_file_path = './tests/experiment_history/25-05-22_14.10.29/experiment_output_data_folder/' \
+                          '66052522141029-cpitch_onset-cpitch_onset-99052522141029-nil-melody-nil-full-both-8-t-nil-c-nil-t-t-x-3.dat'
+    tutorial_experiment_folder = './tutorials/experiment_history/21-05-22_17.05.05/'
+    experiment_history_folder_path = 'experiment_history/TestApproximatePPMBackend/'
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        os.makedirs(self.experiment_history_folder_path)
+
+    def _run(self, name, **parameters):
+        experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset,
+                                     pretrain_dataset_path=self.shanx_dataset,
+                                     experiment_history_folder_path=self.experiment_history_folder_path,
+                                     experiment_logger_name=name,
+                                     backend=ApproximatePPMBackend())
+        # the configuration of the experiment "25-05-22_14.10.29"
+        default_parameters = dict(target_viewpoints=['cpitch', 'onset'], source_viewpoints=['cpitch', 'onset'],
+                                  models=':both', ltmo=':ltmo', ltmo_order_bound=8, k=':full')
+        parameters = {**default_parameters, **parameters}
+        experiment.set_parameters(**{key: value for key, value in parameters.items() if value is not None})
+        experiment.run()
+        return getDataFrame(glob(experiment.logger.output_data_exp_folder + '*.dat')[0])
+
+    def test_compared_with_idyom(self):
+        ppm_df = self._run('run1')
+        idyom_df = getDataFrame(self.idyom_dat_file_path)
+        self.assertEqual(list(ppm_df.columns), list(idyom_df.columns))
+        # the orders of the contexts match, the probabilities differ by the short-term update exclusion of IDyOM only
+        for column in ['cpitch.order.ltm.cpitch', 'cpitch.order.stm.cpitch', 'onset.order.ltm.onset',
+                       'onset.order.stm.onset']:
+            np.testing.assert_array_equal(ppm_df[column], idyom_df[column])
+        self.assertGreater(np.corrcoef(ppm_df['cpitch.probability'], idyom_df['cpitch.probability'])[0, 1], 0.99)
+        self.assertGreater(np.corrcoef(ppm_df['onset.probability'], idyom_df['onset.probability'])[0, 1], 0.9999)
+        self.assertGreater(np.corrcoef(ppm_df['cpitch.weight.ltm'], idyom_df['cpitch.weight.ltm'])[0, 1], 0.98)
+        self.assertLess(abs(ppm_df['information.content'].mean() - idyom_df['information.content'].mean()), 0.01)
+        cpitch_distribution = ppm_df[[column for column in ppm_df if column.startswith('cpitch.')
+                                      and column.split('.')[1].isdigit()]]
+        np.testing.assert_allclose(cpitch_distribution.sum(axis=1), 1, rtol=1e-6)
+
+    def test_validated_on_tutorial_experiment(self):
+        # a configuration that does not depend on the folds: k = 1 with a pretrained long-term model
+        experiment = IDyOMExperiment(
+            test_dataset_path=self.tutorial_experiment_folder + 'experiment_input_data_folder/test_dataset/',
+            pretrain_dataset_path=self.tutorial_experiment_folder + 'experiment_input_data_folder/pretrain_dataset/',
+            experiment_history_folder_path=self.experiment_history_folder_path,
+            experiment_logger_name='tutorial',
+            backend=ApproximatePPMBackend())
+        experiment.set_parameters(target_viewpoints=['cpitch', 'onset'], source_viewpoints=['cpitch', 'onset'],
+                                  models=':both', k=1)
+        experiment.run()
+        ppm_df = getDataFrame(glob(experiment.logger.output_data_exp_folder + '*.dat')[0])
+        idyom_df = getDataFrame(glob(self.tutorial_experiment_folder + 'experiment_output_data_folder/*.dat')[0])
+        for column in ['cpitch.order.ltm.cpitch', 'cpitch.order.stm.cpitch', 'onset.order.ltm.onset',
+                       'onset.order.stm.onset']:
+            np.testing.assert_array_equal(ppm_df[column], idyom_df[column])
+        for target in ['cpitch', 'onset']:
+            columns = [column for column in idyom_df if column.startswith(target + '.')
+                       and column.split('.')[1].isdigit()]
+            # the distributions of IDyOM do not always sum to 1 because of its rounding
+            idyom_distributions = idyom_df[columns].values / idyom_df[columns].values.sum(axis=1, keepdims=True)
+            exact = np.isclose(ppm_df[columns].values, idyom_distributions, rtol=0, atol=1e-5).all(axis=1)
+            if target == 'onset':
+                self.assertTrue(exact.all())
+            else:
+                # the rest differ by the counts that IDyOM keeps for update exclusion in its short-term model
+                self.assertGreater(exact.mean(), 0.96)
+
+    def test_approximate_outputs(self):
+        self._run('run1')
+        dat_file_names = [os.path.basename(file_path) for file_path in
+                          glob(self.experiment_history_folder_path + '*/experiment_output_data_folder/*.dat')]
+        self.assertEqual(len(dat_file_names), 1)
+        self.assertTrue(dat_file_names[0].startswith(APPROXIMATE_PPM_FILE_PREFIX))
+        self.assertIsInstance(get_backend('ppm-approximate'), ApproximatePPMBackend)
+
+    def test_models_and_folds(self):
+        stm_df = self._run('stm', target_viewpoints=['cpitch'], source_viewpoints=[('cpint', 'dur'), 'cpitch'],
+                           models=':stm', ltmo=None, k=1)
+        self.assertTrue((stm_df['cpitch.order.stm.cpint_dur'].isna() == (stm_df['note.id'] == 1)).all())
+        self.assertTrue(np.isfinite(stm_df['information.content']).all())
+
+        folds_df = self._run('folds', k=3, ltmo_update_exclusion=True, ltmo_escape=':a')
+        full_df = self._run('full', k=3, models=':ltm+', ltmo_escape=':a')
+        self.assertEqual(len(folds_df), len(full_df))
+        self.assertFalse(np.allclose(folds_df['information.content'], full_df['information.content']))
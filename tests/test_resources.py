@@ -0,0 +1,142 @@
+"""
+This test script concerns the memory sizing of the SBCL processes and the budget of memory and CPUs they share.
+"""
+import os
+import shutil
+import struct
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from py2lispIDyOM.backends import SBCLBackend, get_backend
+from py2lispIDyOM.resources import MEGABYTE, ResourceGovernor, estimate_sbcl_memory, get_default_memory_budget_bytes, \
+    get_dynamic_space_size, get_resource_governor
+from py2lispIDyOM.run import IDyOMExperiment
+from py2lispIDyOM.telemetry import get_dataset_size
+
+
+class TestMemorySizing(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    experiment_history_folder_path = 'experiment_history/TestMemorySizing/'
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        self.experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset, pretrain_dataset_path=self.shanx_dataset,
+                                          experiment_history_folder_path=self.experiment_history_folder_path,
+                                          experiment_logger_name='experiment')
+
+    def _estimate(self, **parameters):
+        self.experiment.set_parameters(**{**dict(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'],
+                                                 models=':both', ltmo_order_bound=2), **parameters})
+        return estimate_sbcl_memory(self.experiment, self.experiment.idyom_config.run_model_configuration)
+
+    def test_estimate_sbcl_memory(self):
+        import_memory = estimate_sbcl_memory(self.experiment)
+        memory = self._estimate()
+        self.assertGreater(memory, import_memory)
+        self.assertGreater(self._estimate(source_viewpoints=['cpitch', ('cpint', 'dur')]), memory)
+        self.assertGreater(self._estimate(ltmo_order_bound=8), memory)
+        self.assertLess(self._estimate(models=':stm'), memory)
+
+    def test_dataset_size_cache(self):
+        estimate_sbcl_memory(self.experiment)
+        with patch('py2lispIDyOM.resources.get_dataset_size') as get_dataset_size:
+            estimate_sbcl_memory(self.experiment)  # the datasets are not parsed again
+            get_dataset_size.assert_not_called()
+            shutil.copy(self.bach_dataset + os.listdir(self.bach_dataset)[0],
+                        self.experiment.logger.train_dataset_exp_folder + 'added.mid')
+            get_dataset_size.return_value = {'n_files': 1, 'n_notes': 10}
+            estimate_sbcl_memory(self.experiment)  # but a changed dataset is
+            get_dataset_size.assert_called_once_with(self.experiment.logger.train_dataset_exp_folder)
+
+    def test_malformed_music_file(self):
+        # a MIDI track declared 10 bytes longer than it is
+        track = bytes([0x00, 0x90, 60, 64, 0x60, 0x80, 60, 0, 0x00, 0xff, 0x2f, 0x00])
+        with open(self.experiment.logger.test_dataset_exp_folder + 'malformed.mid', 'wb') as f:
+            f.write(b'MThd' + struct.pack('>IHHH', 6, 0, 1, 96) + b'MTrk' + struct.pack('>I', len(track) + 10) + track)
+        self.experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], models=':both')
+        # the notes of the test dataset are estimated from the size of its files instead
+        backend, memory_bytes = SBCLBackend().sized_for(self.experiment,
+                                                        self.experiment.idyom_config.run_model_configuration)
+        self.assertGreaterEqual(backend.dynamic_space_size, get_dynamic_space_size(0))
+        with self.assertRaises(IndexError):
+            get_dataset_size(self.experiment.logger.test_dataset_exp_folder)
+
+    def test_dynamic_space_size(self):
+        self.assertEqual(get_dynamic_space_size(10 * MEGABYTE), 1024)
+        self.assertEqual(get_dynamic_space_size(1100 * MEGABYTE), 1280)
+        self.assertEqual(get_dynamic_space_size(1280 * MEGABYTE), 1280)
+
+    def test_sbcl_command(self):
+        self.assertEqual(SBCLBackend().sbcl_command('a.lisp'),
+                         ['sbcl', '--noinform', '--non-interactive', '--load', 'a.lisp'])
+        self.assertEqual(SBCLBackend(dynamic_space_size=2048, bytes_consed_between_gcs=100000000).sbcl_command('a.lisp'),
+                         ['sbcl', '--dynamic-space-size', '2048MB', '--noinform', '--non-interactive',
+                          '--eval', '(setf (sb-ext:bytes-consed-between-gcs) 100000000)', '--load', 'a.lisp'])
+
+        self.experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], models=':both')
+        self.assertEqual(SBCLBackend().dynamic_space_size, 'auto')
+        self.assertEqual(IDyOMExperiment(test_dataset_path=self.bach_dataset).backend.dynamic_space_size, 'auto')
+        backend, memory_bytes = SBCLBackend().sized_for(
+            self.experiment, self.experiment.idyom_config.run_model_configuration)
+        estimated_memory_bytes = estimate_sbcl_memory(self.experiment,
+                                                      self.experiment.idyom_config.run_model_configuration)
+        self.assertEqual(backend.dynamic_space_size, get_dynamic_space_size(estimated_memory_bytes))
+        self.assertEqual(memory_bytes, backend.dynamic_space_size * MEGABYTE)  # the heap granted is reserved
+        self.assertGreaterEqual(backend.bytes_consed_between_gcs, backend.dynamic_space_size * MEGABYTE // 20)
+        self.assertEqual(SBCLBackend(dynamic_space_size=2048).sized_for(self.experiment)[1], 2048 * MEGABYTE)
+        self.assertEqual(get_backend(**SBCLBackend(dynamic_space_size='auto').to_dict()).dynamic_space_size, 'auto')
+        self.assertEqual(SBCLBackend(dynamic_space_size=None).sbcl_command('a.lisp'),
+                         ['sbcl', '--noinform', '--non-interactive', '--load', 'a.lisp'])
+
+    def test_default_budget(self):
+        self.assertEqual(get_resource_governor().cpu_budget, os.cpu_count())
+        self.assertEqual(get_resource_governor().memory_budget_bytes, get_default_memory_budget_bytes())
+        with patch('py2lispIDyOM.resources.get_physical_memory_bytes', return_value=10 * 1024 * MEGABYTE):
+            self.assertEqual(get_default_memory_budget_bytes(), 8 * 1024 * MEGABYTE)
+        with patch('py2lispIDyOM.resources.get_physical_memory_bytes', return_value=None):
+            self.assertIsNone(get_default_memory_budget_bytes())
+
+
+class TestResourceGovernor(TestCase):
+
+    def _run_side_by_side(self, resource_governor, memory_bytes_list):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def _run(memory_bytes):
+            with resource_governor.reserve(memory_bytes):
+                with lock:
+                    running.append(memory_bytes)
+                    max_running.append(list(running))
+                time.sleep(0.05)
+                with lock:
+                    running.remove(memory_bytes)
+
+        threads = [threading.Thread(target=_run, args=(memory_bytes,)) for memory_bytes in memory_bytes_list]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return max_running
+
+    def test_cpu_budget(self):
+        resource_governor = ResourceGovernor(cpu_budget=2)
+        max_running = self._run_side_by_side(resource_governor, [0] * 6)
+        self.assertEqual(max(len(running) for running in max_running), 2)
+        self.assertEqual(resource_governor.reserved_cpus, 0)
+
+    def test_memory_budget(self):
+        resource_governor = ResourceGovernor(memory_budget_bytes=100)
+        max_running = self._run_side_by_side(resource_governor, [60, 40, 30, 150, 20])
+        self.assertTrue(all(sum(running) <= 100 or running == [150] for running in max_running))
+        self.assertEqual(resource_governor.reserved_memory_bytes, 0)
+
+        self.assertTrue(resource_governor.try_reserve(150))
+        self.assertFalse(resource_governor.try_reserve(10))
+        resource_governor.release(150)
+        self.assertTrue(resource_governor.try_reserve(10))
@@ -1,9 +1,18 @@
 """
 This test script concerns the configuration and run functionality.
 """
-import datetime, os, shutil
+import asyncio, datetime, json, os, shutil, subprocess, sys, tempfile, time
+from glob import glob
 from unittest import TestCase
-from py2lispIDyOM.run import IDyOMExperiment
+from unittest.mock import patch
+
+import pandas as pd
+
+from py2lispIDyOM.backends import InProcessBackend, SBCLBackend, SimulatorBackend
+from py2lispIDyOM.configuration import RunModelConfiguration, get_parameter_schema, render_run_model_commands
+from py2lispIDyOM.extract import ExperimentInfo, getDataFrame
+from py2lispIDyOM.cache import LTMCache
+from py2lispIDyOM.run import IDyOMBatch, IDyOMExperiment, append_melodies, run_experiments_async
 
 
 class Test(TestCase):
@@ -163,6 +172,26 @@ class Test(TestCase):
                             f'(quit)'
         self.assertEqual(generated_commands, expected_commands)
 
+    def test_dataset_id_reserved_by_another_process(self):
+        with tempfile.TemporaryDirectory() as reservations_folder_path, \
+                patch('py2lispIDyOM.run.DATASET_ID_RESERVATIONS_FOLDER_PATH', reservations_folder_path + '/'), \
+                patch('py2lispIDyOM.run.get_timestamp', return_value='101926132209'):
+            with open(reservations_folder_path + '/66101926132209', 'w') as f:
+                f.write('1')  # reserved by another worker in the same second
+            experiment1 = IDyOMExperiment(test_dataset_path=self.bach_dataset,
+                                          experiment_history_folder_path=reservations_folder_path + '/history/',
+                                          experiment_logger_name='experiment1')
+            experiment2 = IDyOMExperiment(test_dataset_path=self.bach_dataset,
+                                          experiment_history_folder_path=reservations_folder_path + '/history/',
+                                          experiment_logger_name='experiment2')
+            test_dataset_id1 = experiment1._generate_test_dataset_id()
+            test_dataset_id2 = experiment2._generate_test_dataset_id()
+            self.assertEqual(test_dataset_id1, '66101926132210')
+            self.assertEqual(test_dataset_id2, '66101926132211')
+            self.assertEqual(experiment1._generate_test_dataset_id(), test_dataset_id1)
+            self.assertEqual(sorted(os.listdir(reservations_folder_path))[:3],
+                             ['66101926132209', '66101926132210', '66101926132211'])
+
     def test_config_command_lines(self):
         test_dataset_path = self.Chabrier_krn
         pretrain_dataset_path = self.Masse_krn
@@ -260,3 +289,313 @@ class Test(TestCase):
             IDyOMExperiment(test_dataset_path=test_dataset_path,
                             pretrain_dataset_path=pretrain_dataset_path,
                             experiment_logger_name=exp_folder_name)
+
+
+class TestParameterSchema(TestCase):
+    parameters = dict(target_viewpoints=['cpitch', 'onset'], source_viewpoints=['cpitch', ('cpint', 'dur')],
+                      models=':both', ltmo=':ltmo', ltmo_order_bound=3, stmo=':stmo', stmo_escape=':a', k=5,
+                      resampling_indices=[0, 2], detail=2, dataset_id='1', output_path='out/', use_ltms_cache=True)
+
+    def test_schema_sets_as_recursive_set_attr(self):
+        configuration = RunModelConfiguration()
+        schema = get_parameter_schema(RunModelConfiguration)
+        self.assertEqual(list(schema), list(configuration.get_surface_dict()))
+        self.assertEqual(schema['ltmo_order_bound'].path, ('statistical_modelling_parameters', 'ltmo_options'))
+
+        configuration.set_parameters(**self.parameters)
+        walked_configuration = RunModelConfiguration()
+        for key, value in self.parameters.items():
+            walked_configuration.recursive_set_attr(key, value)
+        self.assertEqual(configuration.get_surface_dict(), walked_configuration.get_surface_dict())
+        self.assertEqual(configuration.to_lisp_command(), walked_configuration.to_lisp_command())
+        self.assertEqual(configuration.canonical_parameters(),
+                         {key: value for key, value in sorted(configuration.get_surface_dict().items())
+                          if key not in RunModelConfiguration.volatile_parameters})
+
+    def test_render_run_model_commands(self):
+        parameters_list = [{**self.parameters, 'ltmo_order_bound': order_bound} for order_bound in range(4)]
+        commands = render_run_model_commands(parameters_list)
+        for parameters, command in zip(parameters_list, commands):
+            configuration = RunModelConfiguration()
+            configuration.set_parameters(**parameters)
+            self.assertEqual(command, configuration.to_lisp_command())
+        self.assertIn(":ltmo '(:order-bound 2)", commands[2])
+
+        with self.assertRaises(KeyError):
+            render_run_model_commands([self.parameters, {**self.parameters, 'model': ':stm'}])
+        with self.assertRaises(TypeError):
+            render_run_model_commands([{**self.parameters, 'target_viewpoints': 'cpitch'}])
+        with self.assertRaises(AssertionError):
+            render_run_model_commands([{'models': ':stm'}])
+
+
+class TestRunAsync(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    experiment_logger_path = 'experiment_history/'
+
+    def _make_experiment(self, exp_folder_name):
+        experiment_logger_path = self.experiment_logger_path + exp_folder_name + '/'
+        if os.path.exists(experiment_logger_path):
+            shutil.rmtree(experiment_logger_path, ignore_errors=True)
+        idyom_experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset, experiment_logger_name=exp_folder_name)
+        idyom_experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], models=':stm')
+        return idyom_experiment
+
+    @staticmethod
+    def _fake_sbcl(python_code):
+        return patch.object(SBCLBackend, 'sbcl_command',
+                            staticmethod(lambda lisp_script_path: [sys.executable, '-c', python_code]))
+
+    def test_run_async_streams_output(self):
+        idyom_experiment = self._make_experiment('TestCaseAsync1')
+        lines = []
+        with self._fake_sbcl('print("line 1"); print("line 2")'):
+            asyncio.run(idyom_experiment.run_async(line_callback=lines.append))
+        self.assertEqual(lines, ['line 1', 'line 2'])
+        self.assertTrue(os.path.exists(idyom_experiment.logger.this_exp_folder + 'compute.lisp'))
+
+    def test_run_async_raises_on_non_zero_exit(self):
+        idyom_experiment = self._make_experiment('TestCaseAsync2')
+        with self._fake_sbcl('import sys; sys.exit(3)'):
+            with self.assertRaises(subprocess.CalledProcessError):
+                asyncio.run(idyom_experiment.run_async(line_callback=None))
+
+    def test_run_async_timeout(self):
+        idyom_experiment = self._make_experiment('TestCaseAsync3')
+        with self._fake_sbcl('import time; time.sleep(30)'):
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(idyom_experiment.run_async(line_callback=None, timeout=0.5))
+
+    def test_run_async_timeout_in_process_backend(self):
+        idyom_experiment = self._make_experiment('TestCaseAsync4')
+        idyom_experiment.backend = SimulatorBackend()
+        finished_runs = []
+
+        def slow_run_script(*args):
+            time.sleep(1)
+            finished_runs.append(args)
+
+        with patch.object(SimulatorBackend, 'run_script', side_effect=slow_run_script):
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(idyom_experiment.run_async(line_callback=None, timeout=0.1))
+        self.assertEqual(len(finished_runs), 1)  # the error is raised once the run has ended
+
+    def test_run_experiments_async(self):
+        experiments = [self._make_experiment(f'TestCaseAsyncMulti{i}') for i in range(3)]
+        lines = []
+        with self._fake_sbcl('print("done")'):
+            results = asyncio.run(run_experiments_async(experiments, max_concurrent_runs=2,
+                                                        line_callback=lambda exp, line: lines.append(line)))
+        self.assertEqual(results, [None, None, None])
+        self.assertEqual(lines, ['done'] * 3)
+
+
+class TestFoldShards(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    dat_file_path = './tests/experiment_history/25-05-22_14.10.29/experiment_output_data_folder/' \
+                    '66052522141029-cpitch_onset-cpitch_onset-99052522141029-nil-melody-nil-full-both-8-t-nil-c-nil-t-t-x-3.dat'
+    experiment_logger_path = 'experiment_history/'
+
+    # writes the rows of the melodies in the folds of the resampling indices (melody i is in fold i % 3)
+    fake_sbcl_code = '''
+import os, re, sys
+script = open(sys.argv[1]).read()
+match = re.search(r":resampling-indices '\\(([0-9 ]+)\\)", script)
+if match:
+    indices = [int(index) for index in match.group(1).split()]
+    with open(sys.argv[2]) as f:
+        lines = f.readlines()
+    rows = [line for line in lines[1:] if (int(line.split()[1]) - 1) % 3 in indices]
+    with open(os.path.dirname(sys.argv[1]) + '/fold.dat', 'w') as f:
+        f.writelines([lines[0]] + rows)
+'''
+
+    def test_resampling_indices_command(self):
+        exp_folder_name = 'TestCaseResamplingIndices'
+        experiment_logger_path = self.experiment_logger_path + exp_folder_name + '/'
+        if os.path.exists(experiment_logger_path):
+            shutil.rmtree(experiment_logger_path, ignore_errors=True)
+
+        idyom_experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset,
+                                           pretrain_dataset_path=self.shanx_dataset,
+                                           experiment_logger_name=exp_folder_name)
+        idyom_experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], models=':both',
+                                        k=5, resampling_indices=[0, 3])
+        pretrain_dataset_id = idyom_experiment._generate_train_dataset_id()
+        self.assertIn(f':pretraining-ids \'({pretrain_dataset_id}) :k 5 :resampling-indices \'(0 3) :detail 3',
+                      idyom_experiment._generate_lisp_commands())
+
+    def test_run_fold_shards(self):
+        exp_folder_name = 'TestCaseFoldShards'
+        experiment_logger_path = self.experiment_logger_path + exp_folder_name + '/'
+        if os.path.exists(experiment_logger_path):
+            shutil.rmtree(experiment_logger_path, ignore_errors=True)
+
+        idyom_experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset, experiment_logger_name=exp_folder_name)
+        idyom_experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], models=':stm', k=3)
+        fake_sbcl = staticmethod(lambda lisp_script_path: [sys.executable, '-c', self.fake_sbcl_code,
+                                                           lisp_script_path, self.dat_file_path])
+        with patch.object(SBCLBackend, 'sbcl_command', fake_sbcl):
+            idyom_experiment.run_fold_shards(n_jobs=2)
+
+        with open(experiment_logger_path + 'fold_shards/shard_0/compute.lisp') as f:
+            self.assertIn(':k 3 :resampling-indices \'(0 2)', f.read())
+        with open(experiment_logger_path + 'prepare.lisp') as f:
+            self.assertIn('(resampling::get-resampling-sets', f.read())
+        with open(experiment_logger_path + 'run_report.json') as f:
+            run_report = json.load(f)
+        self.assertEqual(run_report['sbcl']['n_processes'], 3)
+        self.assertEqual([shard['resampling_indices'] for shard in run_report['shards']], [[0, 2], [1]])
+
+        # the merged output file is named after the configuration of the experiment, not after the one of a shard
+        merged_dat_file_names = os.listdir(experiment_logger_path + 'experiment_output_data_folder/')
+        self.assertEqual(merged_dat_file_names, [InProcessBackend.output_file_name(
+            idyom_experiment.idyom_config.run_model_configuration)])
+        self.assertIn('-nil-melody-nil-3-stm-', merged_dat_file_names[0])
+        merged_df = ExperimentInfo(experiment_folder_path=experiment_logger_path).df
+        original_df = ExperimentInfo(experiment_folder_path='./tests/experiment_history/25-05-22_14.10.29/').df
+        pd.testing.assert_frame_equal(merged_df, original_df)
+
+        with self.assertRaises(ValueError):
+            idyom_experiment.set_parameters(k=':full')
+            idyom_experiment.run_fold_shards()
+
+
+class TestAppendMelodies(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    experiment_history_folder_path = 'experiment_history/TestAppendMelodies/'
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        # the first 10 melodies of the bach dataset
+        self.first_melodies_path = self.experiment_history_folder_path + 'first_melodies/'
+        os.makedirs(self.first_melodies_path)
+        for file_name in sorted(os.listdir(self.bach_dataset))[:10]:
+            shutil.copy(self.bach_dataset + file_name, self.first_melodies_path)
+
+    def _run_experiment(self, **parameters):
+        experiment = IDyOMExperiment(test_dataset_path=self.first_melodies_path,
+                                     pretrain_dataset_path=self.shanx_dataset,
+                                     experiment_history_folder_path=self.experiment_history_folder_path,
+                                     experiment_logger_name='experiment',
+                                     backend=SimulatorBackend())
+        experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], models=':both',
+                                  ltmo=':ltmo', ltmo_order_bound=3, **parameters)
+        experiment.run()
+        return experiment
+
+    def test_append_melodies(self):
+        experiment = self._run_experiment(k=1)
+        original_df = getDataFrame(glob(experiment.logger.output_data_exp_folder + '*.dat')[0])
+        output_file_path = experiment.append_melodies(self.bach_dataset)
+
+        appended_df = getDataFrame(output_file_path)
+        self.assertEqual(list(appended_df['melody.id'].unique()), list(range(1, 16)))
+        self.assertEqual(len(appended_df), 699)
+        self.assertEqual(appended_df['dataset.id'].nunique(), 1)
+        pd.testing.assert_frame_equal(appended_df.iloc[:len(original_df)], original_df)
+        new_melodies_df = appended_df[appended_df['melody.id'] > 10]
+        appended_experiment_df = getDataFrame(
+            glob(experiment.logger.this_exp_folder + 'appends/append_1/experiment_output_data_folder/*.dat')[0])
+        pd.testing.assert_series_equal(new_melodies_df['information.content'].reset_index(drop=True),
+                                       appended_experiment_df['information.content'])
+        self.assertEqual(len(ExperimentInfo(experiment_folder_path=experiment.logger.this_exp_folder).melodies_dict), 15)
+
+        # from the experiment folder, with the parameters of the run report
+        self.assertIsNone(append_melodies(experiment.logger.this_exp_folder, self.bach_dataset,
+                                          backend=SimulatorBackend()))
+
+    def test_dependent_melodies(self):
+        experiment = self._run_experiment(k=2)
+        with self.assertRaises(ValueError):
+            experiment.append_melodies(self.bach_dataset)
+        with self.assertRaises(ValueError):
+            append_melodies(experiment.logger.this_exp_folder, self.bach_dataset,
+                            parameters={**experiment.idyom_config.run_model_configuration.canonical_parameters(),
+                                        'k': 1, 'models': ':both+'})
+
+
+class TestIDyOMBatch(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    experiment_history_folder_path = 'experiment_history/TestIDyOMBatch/'
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        self.first_melodies_path = self.experiment_history_folder_path + 'first_melodies/'
+        os.makedirs(self.first_melodies_path)
+        for file_name in sorted(os.listdir(self.bach_dataset))[:5]:
+            shutil.copy(self.bach_dataset + file_name, self.first_melodies_path)
+
+    def _make_experiments(self, **experiment_kwargs):
+        experiments = []
+        for name, test_dataset_path, source_viewpoints in [('exp1', self.bach_dataset, ['cpitch']),
+                                                           ('exp2', self.bach_dataset, ['cpint']),
+                                                           ('exp3', self.first_melodies_path, ['cpitch'])]:
+            experiment = IDyOMExperiment(test_dataset_path=test_dataset_path, pretrain_dataset_path=self.shanx_dataset,
+                                         experiment_history_folder_path=self.experiment_history_folder_path,
+                                         experiment_logger_name=name, **experiment_kwargs)
+            experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=source_viewpoints, models=':both')
+            experiments.append(experiment)
+        return experiments
+
+    def test_batch_script(self):
+        experiments = self._make_experiments()
+        batch = IDyOMBatch(experiments, batch_folder_path=self.experiment_history_folder_path + 'batch/')
+        with patch.object(SBCLBackend, 'sbcl_command',
+                          staticmethod(lambda lisp_script_path: [sys.executable, '-c', 'print("done")'])):
+            errors = batch.run()
+        self.assertEqual(errors, {})
+
+        with open(self.experiment_history_folder_path + 'batch/batch.lisp') as f:
+            script = f.read()
+        self.assertEqual(script.count('(start-idyom)'), 1)
+        self.assertEqual(script.count('(quit)'), 1)
+        # the bach, shanx and first_melodies datasets are imported once each
+        self.assertEqual(script.count('(idyom-db:import-data'), 3)
+        self.assertEqual(script.count('(handler-case'), 3)
+        run_model_configurations = [experiment.idyom_config.run_model_configuration for experiment in experiments]
+        self.assertEqual(run_model_configurations[0].required_parameters.dataset_id,
+                         run_model_configurations[1].required_parameters.dataset_id)
+        self.assertNotEqual(run_model_configurations[0].required_parameters.dataset_id,
+                            run_model_configurations[2].required_parameters.dataset_id)
+        self.assertEqual(len({configuration.training_parameters.pretraining_id
+                              for configuration in run_model_configurations}), 1)
+        for experiment in experiments:
+            self.assertIn(f':output-path "{experiment.logger.output_data_exp_folder}"', script)
+            self.assertIn(f'"{experiment.logger.this_exp_folder}idyom.log"', script)
+            with open(experiment.logger.this_exp_folder + 'run_report.json') as f:
+                run_report = json.load(f)
+            self.assertEqual(run_report['run_mode'], 'batch')
+            self.assertIsNone(run_report['batch_error'])
+        with open(self.experiment_history_folder_path + 'batch/sbcl.log') as f:
+            self.assertEqual(f.read().strip(), 'done')
+
+    def test_batch_errors(self):
+        experiments = self._make_experiments()
+        predict_outputs = SimulatorBackend.predict_outputs
+
+        def failing_predict_outputs(backend, events, training_events, run_model_configuration):
+            if run_model_configuration.required_parameters.source_viewpoints == ['cpint']:
+                raise ValueError('simulated error')
+            return predict_outputs(backend, events, training_events, run_model_configuration)
+
+        with patch.object(SimulatorBackend, 'predict_outputs', failing_predict_outputs):
+            errors = IDyOMBatch(experiments, batch_folder_path=self.experiment_history_folder_path + 'batch/',
+                                backend=SimulatorBackend()).run()
+        self.assertEqual(errors, {experiments[1].logger.this_exp_folder: 'simulated error'})
+        self.assertEqual(len(glob(experiments[0].logger.output_data_exp_folder + '*.dat')), 1)
+        self.assertEqual(len(glob(experiments[1].logger.output_data_exp_folder + '*.dat')), 0)
+        self.assertEqual(len(getDataFrame(glob(experiments[2].logger.output_data_exp_folder + '*.dat')[0])
+                             ['melody.id'].unique()), 5)
+
+    def test_ltm_cache(self):
+        experiments = self._make_experiments(
+            ltm_cache=LTMCache(cache_folder_path=self.experiment_history_folder_path + 'ltm_cache/'))
+        with self.assertRaises(ValueError):
+            IDyOMBatch(experiments)
+
@@ -0,0 +1,100 @@
+"""
+This test script concerns the viewpoint selection, run with the simulator backend.
+"""
+import os
+import shutil
+from unittest import TestCase
+from unittest.mock import patch
+
+import pandas as pd
+
+from py2lispIDyOM.backends import SimulatorBackend
+from py2lispIDyOM.configuration import BasisOption
+from py2lispIDyOM.run import IDyOMExperiment
+from py2lispIDyOM.selection import ViewpointSelection
+
+
+class TestViewpointSelection(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    selection_folder_path = 'experiment_history/TestViewpointSelection/'
+    parameters = {'target_viewpoints': ['cpitch'], 'source_viewpoints': ':select', 'models': ':stm',
+                  'basis': ['cpitch', 'cpint', 'contour'], 'max_links': 2, 'dp': 3}
+
+    def setUp(self):
+        if os.path.exists(self.selection_folder_path):
+            shutil.rmtree(self.selection_folder_path, ignore_errors=True)
+
+    def _make_selection(self, **parameters):
+        return ViewpointSelection(test_dataset_path=self.bach_dataset, selection_folder_path=self.selection_folder_path,
+                                  parameters={**self.parameters, **parameters}, max_workers=3,
+                                  backend=SimulatorBackend())
+
+    def test_candidate_viewpoints(self):
+        selection = self._make_selection()
+        self.assertEqual(selection.get_candidate_viewpoints(),
+                         ['cpitch', 'cpint', 'contour', ('cpitch', 'cpint'), ('cpitch', 'contour'), ('cpint', 'contour')])
+        self.assertEqual(self._make_selection(min_links=2).get_candidate_viewpoints(),
+                         [('cpitch', 'cpint'), ('cpitch', 'contour'), ('cpint', 'contour')])
+        self.assertEqual(self._make_selection(basis=BasisOption(basis=['cpitch', 'cpint'])).get_basis(),
+                         ['cpitch', 'cpint'])
+        self.assertEqual(self._make_selection(basis=BasisOption(basis=':bioi')).get_basis(), ['bioi', 'bioi-contour'])
+        auto_basis = self._make_selection(basis=None).get_basis()
+        self.assertIn('cpintfref', auto_basis)
+        self.assertNotIn('ioi', auto_basis)
+        self.assertEqual(self._make_selection().neighbours(('cpint', 'cpitch')),
+                         [('cpitch', 'cpint', 'contour'), ('cpitch', 'cpint', ('cpitch', 'cpint')),
+                          ('cpitch', 'cpint', ('cpitch', 'contour')), ('cpitch', 'cpint', ('cpint', 'contour')),
+                          ('cpitch',), ('cpint',)])
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            self._make_selection(source_viewpoints=['cpitch'])
+        with self.assertRaises(ValueError):
+            self._make_selection(basis=':pitch')
+        with self.assertRaises(TypeError):
+            self._make_selection(stmo_order_bound='3')
+
+    def test_selection_and_resume(self):
+        trace_copy_path = self.selection_folder_path + '../TestViewpointSelection_trace.txt'
+        selection = self._make_selection(viewpoint_selection_output=trace_copy_path)
+        selected_viewpoints = selection.run()
+
+        trace = pd.read_table(selection.trace_file_path)
+        self.assertEqual(list(trace.columns), ['step', 'source.viewpoints', 'mean.information.content', 'selected'])
+        self.assertEqual(list(trace[trace['step'] == 1]['source.viewpoints']),
+                         ['(cpitch)', '(cpint)', '(contour)', '((cpitch cpint))', '((cpitch contour))', '((cpint contour))'])
+        for step, step_trace in trace.groupby('step'):
+            if step < trace['step'].max():
+                self.assertEqual(list(step_trace['selected'] == 't'), list(step_trace['mean.information.content'] ==
+                                                                           step_trace['mean.information.content'].min()))
+        self.assertEqual((trace['selected'] == 't').sum(), trace['step'].max() - 1)
+        self.assertTrue(os.path.exists(trace_copy_path))
+        os.remove(trace_copy_path)
+
+        experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset)
+        experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=selected_viewpoints)
+
+        n_scores = len(selection.scores)
+        with patch.object(IDyOMExperiment, 'run', side_effect=AssertionError('evaluated twice')):
+            self.assertEqual(self._make_selection().run(), selected_viewpoints)
+        self.assertEqual(len(selection.scores), n_scores)
+
+    def test_selection_on_other_datasets(self):
+        self._make_selection(basis=['cpitch'], max_links=1).run()
+        other_selection = ViewpointSelection(test_dataset_path=self.bach_dataset,
+                                             pretrain_dataset_path='./tests/dataset/shanx_dataset/',
+                                             selection_folder_path=self.selection_folder_path,
+                                             parameters={**self.parameters, 'basis': ['cpitch'], 'max_links': 1},
+                                             backend=SimulatorBackend())
+        n_scores = len(other_selection.scores)
+        with patch.object(IDyOMExperiment, 'run', side_effect=AssertionError('evaluated again')):
+            with self.assertRaises(AssertionError):  # the scores on the other datasets are not reused
+                other_selection.run()
+        self.assertEqual(len(other_selection.scores), n_scores)
+
+    def test_single_candidate_selection(self):
+        selection = self._make_selection(basis=['cpitch'], min_links=1, max_links=1)
+        self.assertEqual(selection.run(), ['cpitch'])
+        trace = pd.read_table(selection.trace_file_path)
+        self.assertEqual(list(trace['source.viewpoints']), ['(cpitch)'])
+        self.assertEqual(list(trace['selected']), ['t'])
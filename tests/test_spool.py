@@ -0,0 +1,166 @@
+"""
+This test script concerns the spool-folder job queue.
+The SBCL runs are replaced by a python process writing the lisp script path to a log file.
+"""
+import io
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+from unittest import TestCase
+from unittest.mock import patch
+
+from py2lispIDyOM.backends import SBCLBackend
+from py2lispIDyOM.cli import main
+from py2lispIDyOM.spool import JobQueue, SpoolWorker
+
+
+class TestSpool(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    spool_folder_path = 'experiment_history/TestSpool/spool/'
+    experiment_history_folder_path = 'experiment_history/TestSpool/'
+    runs_log_path = 'experiment_history/TestSpool/runs.log'
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        os.makedirs(self.experiment_history_folder_path)
+        self.queue = JobQueue(self.spool_folder_path)
+
+    def _fake_sbcl(self, python_code=''):
+        runs_log_path = os.path.abspath(self.runs_log_path)
+        code = f'import sys\nwith open({runs_log_path!r}, "a") as f: f.write(sys.argv[1] + "\\n")\n' + python_code
+        return patch.object(SBCLBackend, 'sbcl_command',
+                            staticmethod(lambda lisp_script_path: [sys.executable, '-c', code, lisp_script_path]))
+
+    def _runs(self):
+        with open(self.runs_log_path) as f:
+            return f.read().splitlines()
+
+    def _submit(self, **kwargs):
+        return self.queue.submit(test_dataset_path=self.bach_dataset,
+                                 experiment_history_folder_path=self.experiment_history_folder_path,
+                                 target_viewpoints=['cpitch'], source_viewpoints=[('cpitch', 'onset')], models=':stm',
+                                 **kwargs)
+
+    def test_workers_share_spool(self):
+        job_ids = [self._submit() for _ in range(6)]
+        workers = [SpoolWorker(self.spool_folder_path, max_concurrent_runs=2, poll_interval=0.05) for _ in range(2)]
+        with self._fake_sbcl():
+            threads = [threading.Thread(target=worker.run, kwargs={'exit_when_empty': True}) for worker in workers]
+            for thread in threads:
+                thread.start()
+            statuses = self.queue.wait(job_ids, poll_interval=0.05, timeout=60)
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual([status['state'] for status in statuses], ['finished'] * 6)
+        self.assertEqual(sorted(self.queue.jobs('finished')), sorted(job_ids))
+        # every job ran exactly once
+        self.assertEqual(len(self._runs()), 6)
+        self.assertEqual(len(set(self._runs())), 6)
+        # the linked viewpoint survives the JSON serialization
+        with open(statuses[0]['experiment_folder_path'] + 'compute.lisp') as f:
+            self.assertIn("'((cpitch onset))", f.read())
+
+    def test_transient_failure_is_retried(self):
+        marker_path = os.path.abspath(self.experiment_history_folder_path + 'failed_once')
+        fail_once = f'import os\nif not os.path.exists({marker_path!r}):\n    open({marker_path!r}, "w").close()\n    sys.exit(1)'
+        job_id = self._submit(max_retries=1)
+        worker = SpoolWorker(self.spool_folder_path, poll_interval=0.05, retry_delay=0)
+        with self._fake_sbcl(fail_once):
+            worker.run(exit_when_empty=True)
+
+        status = self.queue.status(job_id)
+        self.assertEqual((status['state'], status['attempts'], status['error']), ('finished', 2, None))
+        self.assertEqual(len(self._runs()), 2)
+
+    def test_failure_without_retries_left(self):
+        job_id = self._submit(max_retries=1)
+        worker = SpoolWorker(self.spool_folder_path, poll_interval=0.05, retry_delay=0)
+        with self._fake_sbcl('sys.exit(1)'):
+            worker.run(exit_when_empty=True)
+
+        status = self.queue.status(job_id)
+        self.assertEqual((status['state'], status['attempts']), ('failed', 2))
+        self.assertIn('CalledProcessError', status['error'])
+        self.assertEqual(self.queue.jobs('failed'), [job_id])
+
+    def test_permanent_failure_is_not_retried(self):
+        empty_dataset = self.experiment_history_folder_path + 'empty_dataset/'
+        os.makedirs(empty_dataset)
+        job_id = self.queue.submit(test_dataset_path=empty_dataset,
+                                   experiment_history_folder_path=self.experiment_history_folder_path,
+                                   target_viewpoints=['cpitch'], source_viewpoints=['cpitch'])
+        worker = SpoolWorker(self.spool_folder_path, poll_interval=0.05, retry_delay=0)
+        with self._fake_sbcl():
+            worker.run(exit_when_empty=True)
+
+        status = self.queue.status(job_id)
+        self.assertEqual((status['state'], status['attempts']), ('failed', 1))
+        self.assertIn('AssertionError', status['error'])
+
+    def test_invalid_job_is_rejected(self):
+        with self.assertRaises(KeyError):
+            self._submit(not_a_parameter=1)
+        with self.assertRaises(AssertionError):
+            self.queue.submit(test_dataset_path=self.bach_dataset, target_viewpoints=['cpitch'])
+        self.assertEqual(self.queue.jobs(), [])
+
+    def test_stale_job_is_requeued(self):
+        job_id = self._submit()
+        self.assertTrue(self.queue._claim(job_id))
+        self.assertFalse(self.queue._claim(job_id))
+        self.assertEqual(self.queue.requeue_stale_jobs(stale_after=60), [])
+        old_time = time.time() - 120
+        os.utime(self.queue._job_file_path('running', job_id), (old_time, old_time))
+        self.assertEqual(self.queue.requeue_stale_jobs(stale_after=60), [job_id])
+        self.assertEqual(self.queue.jobs('pending'), [job_id])
+
+    def test_stale_worker_drops_its_result(self):
+        job_id = self._submit()
+        self.assertTrue(self.queue._claim(job_id))
+        stale_job = self.queue._load_job('running', job_id)
+        old_time = time.time() - 120
+        os.utime(self.queue._job_file_path('running', job_id), (old_time, old_time))
+        self.assertEqual(self.queue.requeue_stale_jobs(stale_after=60), [job_id])
+        self.assertFalse(self.queue._move(stale_job, 'running', 'finished'))  # requeued, not running
+
+        self.assertTrue(self.queue._claim(job_id))  # by another worker
+        self.assertFalse(self.queue._move(stale_job, 'running', 'finished'))
+        self.assertEqual(self.queue.jobs('running'), [job_id])
+        self.assertEqual(self.queue.jobs('finished'), [])
+        job = self.queue._load_job('running', job_id)
+        self.assertTrue(self.queue._move(job, 'running', 'finished'))
+        self.assertEqual(self.queue.jobs('finished'), [job_id])
+
+    def test_crashing_job_fails_after_its_retries(self):
+        job_id = self._submit(max_retries=1)
+        for attempt, state in [(1, 'pending'), (2, 'failed')]:
+            self.assertTrue(self.queue._claim(job_id))
+            self.assertEqual(self.queue._load_job('running', job_id)['attempts'], attempt)
+            # the worker dies without handling the failure, and stops sending heartbeats
+            old_time = time.time() - 120
+            os.utime(self.queue._job_file_path('running', job_id), (old_time, old_time))
+            self.assertEqual(self.queue.requeue_stale_jobs(stale_after=60), [job_id])
+            self.assertEqual(self.queue.jobs(state), [job_id])
+            self.assertEqual(self.queue.status(job_id)['state'], state)
+
+    def test_job_waiting_long_is_not_stale(self):
+        job_id = self._submit()
+        old_time = time.time() - 600
+        os.utime(self.queue._job_file_path('pending', job_id), (old_time, old_time))
+        self.assertTrue(self.queue._claim(job_id))
+        self.assertEqual(self.queue.requeue_stale_jobs(stale_after=60), [])
+        self.assertEqual(self.queue.jobs('running'), [job_id])
+
+    def test_cli(self):
+        job_id = self._submit()
+        with self._fake_sbcl():
+            main(['worker', self.spool_folder_path, '--exit-when-empty', '--poll-interval', '0.05'])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main(['status', self.spool_folder_path, '--state', 'finished'])
+        self.assertIn(f'{job_id}  finished', output.getvalue())
@@ -0,0 +1,119 @@
+"""
+This test script concerns the parameter sweep functionality.
+The SBCL runs are replaced by copying the IDyOM outputs from the experiment "25-05-22_14.10.29".
+"""
+import os
+import shutil
+from glob import glob
+from unittest import TestCase
+from unittest.mock import patch
+
+from py2lispIDyOM.backends import SimulatorBackend
+from py2lispIDyOM.configuration import BasisOption
+from py2lispIDyOM.run import IDyOMExperiment
+from py2lispIDyOM.sweep import ParameterSweep, get_config_key
+
+
+class TestSweep(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    dat_file_path = glob('./tests/experiment_history/25-05-22_14.10.29/experiment_output_data_folder/*.dat')[0]
+    sweep_folder_path = 'experiment_history/TestSweep/'
+    fixed_parameters = {'target_viewpoints': ['cpitch'], 'source_viewpoints': ['cpitch'], 'models': ':stm',
+                        'stmo': ':stmo'}
+
+    def setUp(self):
+        if os.path.exists(self.sweep_folder_path):
+            shutil.rmtree(self.sweep_folder_path, ignore_errors=True)
+        self.runs = []
+
+    def _fake_run(self, failing_order_bound=None):
+        test = self
+
+        def run(experiment):
+            order_bound = experiment.idyom_config.run_model_configuration.statistical_modelling_parameters.stmo_options.stmo_order_bound
+            test.runs.append(order_bound)
+            if order_bound == failing_order_bound:
+                raise RuntimeError('sbcl crashed')
+            shutil.copy(test.dat_file_path, experiment.logger.output_data_exp_folder)
+
+        return patch.object(IDyOMExperiment, 'run', run)
+
+    def test_config_key_equivalence(self):
+        key1 = get_config_key({**self.fixed_parameters, 'k': 10})
+        key2 = get_config_key(self.fixed_parameters)
+        key3 = get_config_key({**self.fixed_parameters, 'k': 2})
+        self.assertEqual(key1, key2)
+        self.assertNotEqual(key1, key3)
+
+    def test_sweep_with_basis(self):
+        selection_parameters = {**self.fixed_parameters, 'source_viewpoints': ':select', 'min_links': 1,
+                                'stmo_order_bound': 2}
+        points = ParameterSweep.grid({'basis': [BasisOption(basis=['cpitch', 'cpint']), BasisOption(basis=':bioi')]})
+        points.append({'basis': BasisOption(basis=['cpitch', 'cpint'])})  # same configuration as the first point
+        sweep = ParameterSweep(test_dataset_path=self.bach_dataset, sweep_folder_path=self.sweep_folder_path,
+                               fixed_parameters=selection_parameters)
+        self.assertEqual(len(sweep.validate(points)), 2)
+        with self._fake_run():
+            results = sweep.run(points)
+        self.assertEqual(list(results['status']), ['finished'] * 2)
+        self.assertEqual(list(results['basis']), [['cpitch', 'cpint'], ':bioi'])
+
+        resumed_sweep = ParameterSweep(test_dataset_path=self.bach_dataset, sweep_folder_path=self.sweep_folder_path,
+                                       fixed_parameters=selection_parameters)
+        self.assertEqual(resumed_sweep.progress.keys(), sweep.progress.keys())
+
+    def test_sweep_on_other_datasets(self):
+        points = ParameterSweep.grid({'stmo_order_bound': [2, 3]})
+        sweep = ParameterSweep(test_dataset_path=self.bach_dataset, sweep_folder_path=self.sweep_folder_path,
+                               fixed_parameters=self.fixed_parameters)
+        with self._fake_run():
+            sweep.run(points)
+        self.runs = []
+        other_sweep = ParameterSweep(test_dataset_path=self.bach_dataset, pretrain_dataset_path=self.shanx_dataset,
+                                     sweep_folder_path=self.sweep_folder_path, fixed_parameters=self.fixed_parameters)
+        with self._fake_run():
+            results = other_sweep.run(points)
+        self.assertEqual(sorted(self.runs), [2, 3])  # the points finished on the other datasets are run again
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len(other_sweep.progress), 4)
+
+    def test_sweep_with_backend(self):
+        sweep = ParameterSweep(test_dataset_path=self.bach_dataset, sweep_folder_path=self.sweep_folder_path,
+                               fixed_parameters=self.fixed_parameters, backend=SimulatorBackend())
+        results = sweep.run(ParameterSweep.grid({'stmo_order_bound': [2, 3]}))
+        self.assertEqual(list(results['status']), ['finished'] * 2)
+        self.assertIn('mean.information.content', results.keys())
+
+    def test_sampling(self):
+        parameter_space = {'stmo_order_bound': [1, 2, 3, 4], 'stmo_escape': [':a', ':c']}
+        self.assertEqual(len(ParameterSweep.grid(parameter_space)), 8)
+        samples = ParameterSweep.latin_hypercube_samples(parameter_space, n_samples=4, seed=0)
+        self.assertEqual(sorted(sample['stmo_order_bound'] for sample in samples), [1, 2, 3, 4])
+        self.assertEqual(ParameterSweep.random_samples(parameter_space, n_samples=5, seed=1),
+                         ParameterSweep.random_samples(parameter_space, n_samples=5, seed=1))
+
+    def test_invalid_point(self):
+        sweep = ParameterSweep(test_dataset_path=self.bach_dataset, sweep_folder_path=self.sweep_folder_path,
+                               fixed_parameters=self.fixed_parameters)
+        with self.assertRaises(ValueError):
+            sweep.validate([{'stmo_order_bound': 2}, {'stmo_order_bound': '3'}])
+
+    def test_sweep_dedupe_and_resume(self):
+        points = ParameterSweep.grid({'stmo_order_bound': [2, 3, 4], 'k': [10]})
+        points.append({'stmo_order_bound': 2})  # same configuration as the first point
+        sweep = ParameterSweep(test_dataset_path=self.bach_dataset, sweep_folder_path=self.sweep_folder_path,
+                               fixed_parameters=self.fixed_parameters, max_workers=2)
+        with self._fake_run(failing_order_bound=3):
+            results = sweep.run(points)
+        self.assertEqual(sorted(self.runs), [2, 3, 4])
+        self.assertEqual(sorted(results['status']), ['failed', 'finished', 'finished'])
+        self.assertIn('mean.information.content', results.keys())
+
+        self.runs = []
+        resumed_sweep = ParameterSweep(test_dataset_path=self.bach_dataset, sweep_folder_path=self.sweep_folder_path,
+                                       fixed_parameters=self.fixed_parameters)
+        with self._fake_run():
+            results = resumed_sweep.run(points)
+        self.assertEqual(self.runs, [3])
+        self.assertEqual(list(results['status']), ['finished'] * 3)
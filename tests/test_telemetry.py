@@ -0,0 +1,103 @@
+"""
+This test script concerns the run reports.
+The SBCL runs are replaced by a python process evaluating the timed phases of the lisp script:
+it appends a timing line for each of them and writes an output file.
+"""
+import json
+import os
+import shutil
+import struct
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+
+from py2lispIDyOM.backends import SBCLBackend
+from py2lispIDyOM.run import IDyOMExperiment
+from py2lispIDyOM.telemetry import aggregate_run_reports, read_phase_timings, time_lisp_command
+
+
+class TestTelemetry(TestCase):
+    bach_dataset = './tests/dataset/bach_dataset/'
+    shanx_dataset = './tests/dataset/shanx_dataset/'
+    experiment_history_folder_path = 'experiment_history/TestTelemetry/'
+
+    fake_sbcl_code = '''
+import re, sys
+script = open(sys.argv[1]).read()
+for timings_file_path, phase in re.findall(r'\\(with-open-file \\(timings "([^"]+)".*\\n.*?"~a ~,3f~%" "([a-z_]+)"', script):
+    with open(timings_file_path, 'a') as f:
+        f.write(f'{phase} 0.5\\n')
+output_path = re.search(r':output-path "([^"]+)"', script).group(1)
+with open(output_path + 'output.dat', 'w') as f:
+    f.write('x' * 100)
+'''
+
+    def setUp(self):
+        if os.path.exists(self.experiment_history_folder_path):
+            shutil.rmtree(self.experiment_history_folder_path, ignore_errors=True)
+        os.makedirs(self.experiment_history_folder_path)
+
+    def _run_experiment(self, name):
+        experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset,
+                                     pretrain_dataset_path=self.shanx_dataset,
+                                     experiment_history_folder_path=self.experiment_history_folder_path,
+                                     experiment_logger_name=name)
+        experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], models=':both', k=2)
+        fake_sbcl = staticmethod(lambda lisp_script_path: [sys.executable, '-c', self.fake_sbcl_code, lisp_script_path])
+        with patch.object(SBCLBackend, 'sbcl_command', fake_sbcl):
+            experiment.run()
+        with open(experiment.logger.this_exp_folder + 'run_report.json') as f:
+            return json.load(f)
+
+    def test_run_report_without_parsing_again(self):
+        self._run_experiment('run1')
+        with patch('py2lispIDyOM.resources.get_dataset_size', side_effect=AssertionError('parsed again')):
+            run_report = self._run_experiment('run2')
+        self.assertEqual(run_report['test_dataset'], {'n_files': 15, 'n_notes': 699})
+
+        # a file which cannot be read does not fail the run
+        self.bach_dataset, bach_dataset = self.experiment_history_folder_path + 'dataset/', self.bach_dataset
+        shutil.copytree(bach_dataset, self.bach_dataset)
+        track = bytes([0x00, 0x90, 60, 64, 0x60, 0x80, 60, 0, 0x00, 0xff, 0x2f, 0x00])
+        with open(self.bach_dataset + 'malformed.mid', 'wb') as f:  # a track declared 10 bytes longer than it is
+            f.write(b'MThd' + struct.pack('>IHHH', 6, 0, 1, 96) + b'MTrk' + struct.pack('>I', len(track) + 10) + track)
+        run_report = self._run_experiment('run3')
+        self.assertEqual(run_report['test_dataset'], {'n_files': 16, 'n_notes': None})
+
+    def test_timed_lisp_command(self):
+        command = time_lisp_command('run_model', '(idyom:idyom 1)', '/tmp/phase_timings.txt')
+        self.assertTrue(command.startswith('(let ((py2lispidyom-phase-start (get-internal-real-time)))\n(idyom:idyom 1)\n'))
+        self.assertIn('(with-open-file (timings "/tmp/phase_timings.txt" :direction :output :if-exists :append', command)
+        self.assertEqual(command.count('('), command.count(')'))
+
+    def test_run_report(self):
+        run_report = self._run_experiment('run1')
+        self.assertEqual(run_report['phases'], {'start_idyom': 0.5, 'import_datasets': 0.5, 'run_model': 0.5})
+        self.assertEqual(run_report['test_dataset'], {'n_files': 15, 'n_notes': 699})
+        self.assertEqual(run_report['pretrain_dataset'], {'n_files': 15, 'n_notes': 389})
+        self.assertEqual(run_report['outputs'], {'n_files': 1, 'size_bytes': 100})
+        self.assertGreater(run_report['sbcl']['peak_rss_bytes'], 0)
+        self.assertGreaterEqual(run_report['sbcl']['user_cpu_time'], 0)
+        self.assertEqual(run_report['parameters']['k'], 2)
+        self.assertFalse(run_report['result_cache_hit'])
+
+    def test_phase_timings_of_a_rerun(self):
+        with patch.object(SBCLBackend, 'sbcl_command',
+                          staticmethod(lambda lisp_script_path: [sys.executable, '-c', self.fake_sbcl_code,
+                                                                 lisp_script_path])):
+            experiment = IDyOMExperiment(test_dataset_path=self.bach_dataset,
+                                         experiment_history_folder_path=self.experiment_history_folder_path,
+                                         experiment_logger_name='run2')
+            experiment.set_parameters(target_viewpoints=['cpitch'], source_viewpoints=['cpitch'], models=':stm')
+            experiment.run()
+            experiment.run()
+        self.assertEqual(read_phase_timings(experiment.logger.this_exp_folder + 'phase_timings.txt')['run_model'], 0.5)
+
+    def test_aggregate_run_reports(self):
+        self._run_experiment('run1')
+        self._run_experiment('run2')
+        run_reports = aggregate_run_reports(self.experiment_history_folder_path)
+        self.assertEqual(len(run_reports), 2)
+        self.assertIn('phases.run_model', run_reports)
+        self.assertIn('sbcl.peak_rss_bytes', run_reports)
+        self.assertEqual(list(run_reports['test_dataset.n_notes']), [699, 699])
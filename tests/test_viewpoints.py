@@ -0,0 +1,83 @@
+"""
+This test script concerns the derived viewpoints computed from the basic viewpoints,
+for toy melodies and for the outputs of IDyOM in the experiment "25-05-22_14.10.29".
+"""
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from py2lispIDyOM.configuration import SingleViewpoint
+from py2lispIDyOM.extract import ExperimentInfo
+from py2lispIDyOM.viewpoints import EventArrays, derive_viewpoints, viewpoint_values
+
+
+class TestViewpointValues(TestCase):
+    events = pd.DataFrame({'melody.id': [1, 1, 1, 1, 2, 2], 'note.id': [1, 2, 3, 4, 1, 2],
+                           'cpitch': [60, 62, 59, 60, 67, 67], 'onset': [0, 24, 36, 48, 0, 12],
+                           'bioi': [0, 24, 12, 12, 0, 12], 'dur': [24, 12, 12, 12, 12, 12],
+                           'barlength': [48, 48, 48, 48, 0, 0], 'pulses': [4, 4, 4, 4, 0, 0],
+                           'phrase': [1, 0, 1, 0, 0, 0]})
+
+    def test_derived_and_linked_viewpoints(self):
+        events = EventArrays(self.events)
+        np.testing.assert_array_equal(viewpoint_values(events, 'cpint')[:, 0], [np.nan, 2, -3, 1, np.nan, 0])
+        np.testing.assert_array_equal(viewpoint_values(events, 'ioi')[:, 0], [np.nan, 24, 12, 12, np.nan, 12])
+        np.testing.assert_array_equal(viewpoint_values(events, 'ioi-ratio')[:, 0],
+                                      [np.nan, np.nan, 0.5, 1, np.nan, np.nan])
+        np.testing.assert_array_equal(viewpoint_values(events, ('cpint', 'dur'))[1, 0], [2, 12])
+        with self.assertRaises(ValueError):
+            viewpoint_values(events, 'cpitch-4')
+
+    def test_candidate_values(self):
+        events = EventArrays(self.events, 'cpitch', np.array([60, 64]))
+        np.testing.assert_array_equal(viewpoint_values(events, 'cpint')[1], [0, 4])
+        events = EventArrays(self.events, 'bioi', np.array([12, 24]))
+        np.testing.assert_array_equal(viewpoint_values(events, 'onset')[2], [36, 48])
+
+    def test_bars_phrases_and_implications(self):
+        viewpoints = derive_viewpoints(self.events, ['posinbar', 'metaccent', 'cpintfb', 'cpintfiph', 'lphrase',
+                                                     'proximity', 'registral-return', 'closure', 'cpcint'])
+        np.testing.assert_array_equal(viewpoints['posinbar'], [0, 24, 36, 0, np.nan, np.nan])
+        np.testing.assert_array_equal(viewpoints['metaccent'], [3, 2, 1, 3, np.nan, np.nan])
+        np.testing.assert_array_equal(viewpoints['cpintfb'], [0, 2, -1, 0, np.nan, np.nan])
+        np.testing.assert_array_equal(viewpoints['cpintfiph'], [0, 2, 0, 1, 0, 0])
+        np.testing.assert_array_equal(viewpoints['lphrase'], [0, 24, 0, 12, 0, 12])
+        np.testing.assert_array_equal(viewpoints['proximity'], [np.nan, 4, 3, 5, np.nan, 6])
+        # 60 -> 62 -> 59 returns to one semitone from 60, and 62 -> 59 -> 60 to two semitones from 62
+        np.testing.assert_array_equal(viewpoints['registral-return'], [np.nan, np.nan, 2, 1, np.nan, np.nan])
+        np.testing.assert_array_equal(viewpoints['closure'], [np.nan, np.nan, 1, 1, np.nan, np.nan])
+        np.testing.assert_array_equal(viewpoints['cpcint'], [np.nan, 2, -3, 1, np.nan, 0])
+        with self.assertRaises(ValueError):
+            derive_viewpoints(self.events.drop(columns='barlength'), ['posinbar'])
+
+    def test_keys(self):
+        # A natural minor (no sharps, mode 9), then D major (2 sharps, mode 0), then no key signature
+        events = pd.DataFrame({'melody.id': [1] * 7 + [2] * 3 + [3], 'note.id': list(range(1, 8)) + [1, 2, 3, 1],
+                               'cpitch': [69, 71, 72, 74, 76, 77, 79, 62, 66, 65, 60],
+                               'keysig': [0] * 7 + [2] * 3 + [np.nan], 'mode': [9] * 7 + [0] * 3 + [np.nan]})
+        viewpoints = derive_viewpoints(events, ['referent', 'cpintfref', 'inscale'])
+        np.testing.assert_array_equal(viewpoints['referent'], [9] * 7 + [2] * 3 + [np.nan])
+        np.testing.assert_array_equal(viewpoints['cpintfref'], [0, 2, 3, 5, 7, 8, 10, 0, 4, 3, np.nan])
+        np.testing.assert_array_equal(viewpoints['inscale'], [1] * 7 + [1, 1, 0, np.nan])
+
+
+class TestExperimentInfoDerivedViewpoints(TestCase):
+    experiment_folder_path = 'tests/experiment_history/25-05-22_14.10.29/'
+
+    def test_derived_viewpoints(self):
+        experiment_info = ExperimentInfo(experiment_folder_path=self.experiment_folder_path)
+        derived_df = experiment_info.get_derived_viewpoints(['cpitch', 'cpint', 'contour', 'ioi', 'cpitch-class'])
+        self.assertEqual(list(derived_df.columns),
+                         ['melody.id', 'note.id', 'melody.name', 'cpitch', 'cpint', 'contour', 'ioi', 'cpitch-class'])
+        self.assertEqual(len(derived_df), len(experiment_info.df))
+        for melody_id, melody_df in derived_df.groupby('melody.id'):
+            melody_onsets = experiment_info.df.loc[melody_df.index, 'onset']
+            np.testing.assert_array_equal(melody_df['cpint'].to_numpy()[1:], np.diff(melody_df['cpitch']))
+            np.testing.assert_array_equal(melody_df['ioi'].to_numpy()[1:], np.diff(melody_onsets))
+            self.assertTrue(np.isnan(melody_df['cpint'].iloc[0]))
+        np.testing.assert_array_equal(derived_df['contour'].dropna(), np.sign(derived_df['cpint'].dropna()))
+
+        # every viewpoint can be derived from the basic viewpoints of the outputs
+        all_viewpoints = experiment_info.get_derived_viewpoints(list(SingleViewpoint.__args__))
+        self.assertEqual(all_viewpoints.shape, (len(experiment_info.df), 3 + len(SingleViewpoint.__args__)))
@@ -1,3 +1,4 @@
+import os
 from unittest import TestCase
 import matplotlib.pyplot as plt
 
@@ -117,6 +118,35 @@ class Test(TestCase):
         except AssertionError:
             self.fail('Test failed.')
 
+    def test_parallel_batch_plots(self):
+        melody_names = ['"chor-013"', '"chor-014"', '"chor-015"']
+        plots_folder_path = self.experiment_folder_path + 'plots/simple_plot_information.content/'
+        for melody_name in melody_names:
+            if os.path.exists(plots_folder_path + melody_name.strip('"') + '.png'):
+                os.remove(plots_folder_path + melody_name.strip('"') + '.png')
+        viz.BasicPlot.simple_plot(experiment_folder_path=self.experiment_folder_path,
+                                  selected_idyom_output='information.content',
+                                  melody_names=melody_names,
+                                  dpi=50,
+                                  workers=2)
+        for melody_name in melody_names:
+            self.assertTrue(os.path.exists(plots_folder_path + melody_name.strip('"') + '.png'))
+
+        with self.assertRaises(ValueError):
+            viz.BasicPlot.simple_plot(experiment_folder_path=self.experiment_folder_path,
+                                      selected_idyom_output='information.content',
+                                      melody_names=['"chor-013"'],
+                                      savefig=False,
+                                      workers=2)
+        with self.assertRaises(ValueError):  # a lambda cannot be sent to the worker processes
+            viz.Auxiliary.batch_melodies_plots(plot_method_func=lambda melody_info: plt.figure(),
+                                               fig_format='png',
+                                               dpi=50,
+                                               plot_type_folder_name='parallel_plots',
+                                               experiment_folder_path=self.experiment_folder_path,
+                                               melody_names=melody_names,
+                                               workers=2)
+
     def test_raised_errors(self):
         with self.assertRaises(ValueError):
             viz.BasicPlot.selected_surprisal_entropy(experiment_folder_path=self.experiment_folder_path,